@@ -14,6 +14,7 @@ import logging
 from logging.handlers import RotatingFileHandler
 from logging.config import dictConfig
 import datetime
+import json
 import pytz
 import socket
 import sys
@@ -21,20 +22,29 @@ import uuid
 from lxml import etree
 from injector import Module, provider, Injector, singleton
 from sqlalchemy.engine import Engine
-from sqlalchemy import create_engine
 import civvy.db.postgis.query as civvy_pg
 import lostservice.configuration as config
 import lostservice.logger.auditlog as auditlog
 import lostservice.logger.transactionaudit as txnaudit
 import lostservice.logger.diagnosticsaudit as diagaudit
 import lostservice.db.gisdb as gisdb
+import lostservice.db.boundaryindex as boundaryindex
+import lostservice.db.connections as connections
+import lostservice.db.civvyexecutor as civvyexecutor
+import lostservice.coverage.base as cov_base
+import lostservice.coverage.civic as cov_civic
+import lostservice.coverage.geodetic as cov_geo
 import lostservice.queryrunner as queryrunner
+import lostservice.caching as caching
+import lostservice.bulk as bulk
+import lostservice.handling.findservice as findservice
 import lostservice.logger.nenalogging as nenalog
 import lostservice.exception as exp
+import lostservice.spatialreference as spatialreference
 from lostservice.configuration import general_logger
 import asyncio
 import functools
-from threading import Thread
+from threading import Thread, Lock, Event
 
 logger = general_logger()
 
@@ -68,30 +78,126 @@ class LostBindingModule(Module):
 
     @singleton
     @provider
-    def provide_pg_query_executor(self, config: config.Configuration) -> civvy_pg.PgQueryExecutor:
+    def provide_pg_query_executor(self, config: config.Configuration,
+                                  router: connections.EngineRouter) -> civvy_pg.PgQueryExecutor:
         """
-        Provider function for a PGQueryExecutor.
+        Provider function for a PGQueryExecutor, the civic address queries take their connections
+        from the same pool as the spatial lookups.
 
         :param config: The config object.
-        :return:
+        :param router: Picks the SQLAlchemy Engine for the civic address queries.
+        :return: The PgQueryExecutor.
+        :rtype: :py:class:`lostservice.db.civvyexecutor.PooledPgQueryExecutor`
         """
         host = config.get('Database', 'host')
         port = config.get('Database', 'port')
         db_name = config.get('Database', 'dbname')
         username = config.get('Database', 'username')
         password = config.get('Database', 'password')
-        return civvy_pg.PgQueryExecutor(host=host, port=port, database=db_name, user=username, password=password)
+        return civvyexecutor.PooledPgQueryExecutor(router.engine_for(connections.LOOKUPS), host=host, port=port,
+                                                   database=db_name, user=username, password=password)
 
     @singleton
     @provider
     def provide_sqlalchemy_engine(self, config: config.Configuration) -> Engine:
         """
-        Provider function for SQLAlchemhy Engine.
+        Provider function for SQLAlchemhy Engine, its connection pool is tuned by the pool settings
+        in the Database section.
 
         :param config:
         :return:
         """
-        return create_engine(config.get_gis_db_connection_string())
+        return connections.create_pooled_engine(config.get_gis_db_connection_string(),
+                                                connections.PoolConfigWrapper(config))
+
+    @singleton
+    @provider
+    def provide_engine_router(self, config: config.Configuration, engine: Engine) -> connections.EngineRouter:
+        """
+        Provider function for the EngineRouter, read-only queries go to the read replicas named in the
+        read_replicas setting of the Database section, when there are any.
+
+        :param config: The config object.
+        :param engine: The SQLAlchemy Engine for the primary.
+        :return: The EngineRouter.
+        :rtype: :py:class:`lostservice.db.connections.EngineRouter`
+        """
+        replica_strings = config.get_gis_db_replica_connection_strings()
+        if not replica_strings:
+            return connections.EngineRouter(engine)
+        settings = connections.PoolConfigWrapper(config)
+        replica = connections.create_replica_engine(config.get_gis_db_connection_string(), replica_strings, settings)
+        return connections.EngineRouter(engine, replica, settings.pinned_to_primary())
+
+    @singleton
+    @provider
+    def provide_gis_db_interface(self, config: config.Configuration,
+                                 router: connections.EngineRouter) -> gisdb.GisDbInterface:
+        """
+        Provider function for the GisDbInterface, picks the implementation based on the
+        spatial_index setting in the Database section.
+
+        :param config: The config object.
+        :param router: Picks the SQLAlchemy Engine for the lookups and the mapping discovery.
+        :return: The GisDbInterface.
+        :rtype: :py:class:`lostservice.db.gisdb.GisDbInterface`
+        """
+        engine = router.engine_for(connections.LOOKUPS)
+        mapping_engine = router.engine_for(connections.MAPPINGS)
+        if boundaryindex.spatial_index_mode(config) == boundaryindex.SpatialIndexModeEnum.InMemory:
+            return boundaryindex.InMemoryGisDbInterface(config, engine, mapping_engine)
+        return gisdb.GisDbInterface(config, engine, mapping_engine)
+
+    @provider
+    def provide_geodetic_coverage_resolver(self, cov_config: cov_base.CoverageConfigWrapper,
+                                           router: connections.EngineRouter) -> cov_geo.GeodeticCoverageResolver:
+        """
+        Provider function for the GeodeticCoverageResolver.
+
+        :param cov_config: Coverage configuration.
+        :param router: Picks the SQLAlchemy Engine for the coverage queries.
+        :return: The GeodeticCoverageResolver.
+        :rtype: :py:class:`lostservice.coverage.geodetic.GeodeticCoverageResolver`
+        """
+        return cov_geo.GeodeticCoverageResolver(cov_config, router.engine_for(connections.COVERAGE))
+
+    @provider
+    def provide_civic_coverage_resolver(self, cov_config: cov_base.CoverageConfigWrapper,
+                                        router: connections.EngineRouter) -> cov_civic.CivicCoverageResolver:
+        """
+        Provider function for the CivicCoverageResolver.
+
+        :param cov_config: Coverage configuration.
+        :param router: Picks the SQLAlchemy Engine for the coverage queries.
+        :return: The CivicCoverageResolver.
+        :rtype: :py:class:`lostservice.coverage.civic.CivicCoverageResolver`
+        """
+        return cov_civic.CivicCoverageResolver(cov_config, router.engine_for(connections.COVERAGE))
+
+    @singleton
+    @provider
+    def provide_boundary_gml_cache(self, config: caching.BoundaryCacheConfigWrapper) -> caching.BoundaryGmlCache:
+        """
+        Provider function for the service boundary GML cache, shared by every handler.
+
+        :param config: The service boundary cache configuration wrapper.
+        :type config: :py:class:`lostservice.caching.BoundaryCacheConfigWrapper`
+        :return: The cache.
+        :rtype: :py:class:`lostservice.caching.BoundaryGmlCache`
+        """
+        return caching.BoundaryGmlCache(config)
+
+    @singleton
+    @provider
+    def provide_nena_log_exporter(self, config: nenalog.NenaLoggingConfigWrapper) -> nenalog.NenaLogExporter:
+        """
+        Provider function for the NENA log exporter.
+
+        :param config: The NENA logging config wrapper.
+        :return: The NenaLogExporter.
+        :rtype: :py:class:`lostservice.logger.nenalogging.NenaLogExporter`
+        """
+        return nenalog.NenaLogExporter(config)
 
 
 class WebRequestContext(object):
@@ -127,10 +233,14 @@ class LostApplication(object):
     The core LoST Application class.
     
     """
-    def __init__(self):
+    def __init__(self, start_worker=True):
         """
         Constructor
 
+        :param start_worker: Whether or not to start the per-process parts of the application (background
+                             logging, audit writers, query runners) right away.  A pre-forking server
+                             passes False and calls :py:meth:`start_worker` in each worker after the fork.
+        :type start_worker: ``bool``
         """
         super(LostApplication, self).__init__()
 
@@ -161,22 +271,173 @@ class LostApplication(object):
         self._converter_template = conf.get('ClassLookupTemplates', 'converter_template')
         self._handler_template = conf.get('ClassLookupTemplates', 'handler_template')
 
-        auditor = self._di_container.get(auditlog.AuditLog)
+        # Query runners are built once per query type and shared across requests.
+        self._runners = {}
+        self._runners_lock = Lock()
+
+        self.response_cache = None
+        if self._di_container.get(caching.ResponseCacheConfigWrapper).enabled():
+            self.response_cache = self._di_container.get(caching.ResponseCache)
+
         self.audit_logging_enabled = conf.get_logging_db_connection_string()
+        self.nena_logging_enabled = conf.get('Logging', 'logging_services')
+        self._nena_exporter = None
+        self._audit_listeners = {}
+        self.loop = None
+        self._loop_thread = None
+        self._precompute_thread = None
+        self._stopping = Event()
+
+        # Reflect the spatial tables up front so requests don't pay for the catalog lookups.
+        # If the database isn't reachable yet the tables get reflected on first use instead.
+        try:
+            self._di_container.get(gisdb.GisDbInterface).preload_tables()
+        except Exception as ex:
+            logger.warning('Unable to preload the spatial tables, they will be loaded on first use: {0}'.format(ex))
+
+        # Build the spatial references and transformations used by the geometry code ahead of the first request.
+        try:
+            spatialreference.cache.warm_up()
+        except Exception as ex:
+            logger.warning('Unable to warm up the spatial reference cache: {0}'.format(ex))
+
+        if start_worker:
+            self.start_worker()
 
-        if conf.get_logging_db_connection_string():
+    def start_worker(self):
+        """
+        Starts the per-process parts of the application: the audit listeners, the NENA log exporter,
+        the query runners, the service boundary precompute, the stats log and the background logging
+        loop.  None of these survive a fork, so a pre-forking server calls this in each worker process.
+        """
+        if self.loop is not None:
+            return
+        conf = self._di_container.get(config.Configuration)
+
+        # Connections pooled before a fork would be shared with the parent, start over with new ones.  The parent
+        # still owns the inherited ones, closing them here would close them for the parent too.
+        self._di_container.get(connections.EngineRouter).discard()
+
+        if self.audit_logging_enabled:
+            auditor = self._di_container.get(auditlog.AuditLog)
             transaction_listener = txnaudit.TransactionAuditListener(conf)
             auditor.register_listener(transaction_listener)
             diagnostic_listener = diagaudit.DiagnosticAuditListener(conf)
             auditor.register_listener(diagnostic_listener)
+            self._audit_listeners = {'transaction_audit': transaction_listener,
+                                     'diagnostic_audit': diagnostic_listener}
 
-        self.nena_logging_enabled = conf.get('Logging', 'logging_services')
+        if self.nena_logging_enabled:
+            self._nena_exporter = self._di_container.get(nenalog.NenaLogExporter)
+
+        try:
+            self.warm_up()
+        except Exception as ex:
+            logger.warning('Unable to warm up the query runners, they will be built on first use: {0}'.format(ex))
+
+        # Render every service boundary ahead of time if asked to.  This needs the database connections and
+        # the findService handler of this process, so it runs here rather than before a fork, and in the
+        # background so the worker takes requests in the meantime.
+        boundary_cache_config = self._di_container.get(caching.BoundaryCacheConfigWrapper)
+        if boundary_cache_config.precompute():
+            self._precompute_thread = Thread(target=self._precompute_service_boundaries,
+                                             args=(boundary_cache_config.ttl() / 2,),
+                                             name='boundary-precompute', daemon=True)
+            self._precompute_thread.start()
+
+        stats_interval = self._stats_interval_seconds()
+        if stats_interval > 0:
+            Thread(target=self._log_stats, args=(stats_interval,), name='stats-log', daemon=True).start()
 
         # setup a loop so logging can happen asynchronously - in order not to interfere with the web.py asyncio loop
         # start it on another thread - see execute_query (call_soon_threadsafe) to see it in action
         self.loop = asyncio.new_event_loop()
-        t = Thread(target=self.start_logging_event_loop, args=(self.loop,))
-        t.start()
+        self._loop_thread = Thread(target=self.start_logging_event_loop, args=(self.loop,))
+        self._loop_thread.start()
+
+    def before_fork(self):
+        """
+        Closes the pooled database connections, a pre-forking server calls this right before each fork
+        so the worker starts without any of the parent's connections.
+        """
+        self._di_container.get(connections.EngineRouter).dispose()
+
+    def shutdown(self, timeout=5.0):
+        """
+        Stops the background logging loop once the logging already queued on it has run.
+
+        :param timeout: The maximum number of seconds to wait for the loop to finish.
+        :type timeout: ``float``
+        """
+        self._stopping.set()
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._loop_thread.join(timeout)
+        if self._nena_exporter is not None:
+            self._nena_exporter.shutdown(wait=True)
+
+    def _precompute_service_boundaries(self, interval):
+        """
+        Renders every service boundary into the boundary cache, then again every interval seconds until
+        shutdown so the entries are replaced before they expire, see
+        :py:meth:`lostservice.handling.findservice.FindServiceInner.precompute_service_boundaries`.
+
+        :param interval: The number of seconds between renders, 0 only renders them once.
+        :type interval: ``float``
+        """
+        while True:
+            try:
+                self._di_container.get(findservice.FindServiceInner).precompute_service_boundaries()
+            except Exception as ex:
+                logger.warning('Unable to precompute the service boundaries, they will be rendered on first use: {0}'
+                               .format(ex))
+            if interval <= 0 or self._stopping.wait(interval):
+                return
+
+    def _stats_interval_seconds(self):
+        """
+        Gets how often the counters of this process are logged.
+
+        :return: The number of seconds, 0 never logs them, defaults to 300.
+        :rtype: ``float``
+        """
+        interval = self._di_container.get(config.Configuration).get('Logging', 'stats_interval_seconds',
+                                                                    as_object=False, required=False)
+        try:
+            return float(interval) if interval is not None else 300.0
+        except (TypeError, ValueError):
+            return 300.0
+
+    def stats(self):
+        """
+        Gets the counters of the database connection pools, the caches, the audit writers and the NENA log
+        exporter of this process.
+
+        :return: The counters of each part that is running, by name.
+        :rtype: ``dict``
+        """
+        stats = {'db_pool': self._di_container.get(connections.EngineRouter).stats(),
+                 'boundary_cache': self._di_container.get(caching.BoundaryGmlCache).stats()}
+        if self.response_cache is not None:
+            stats['response_cache'] = self.response_cache.stats()
+        for name, listener in self._audit_listeners.items():
+            stats[name] = listener.stats()
+        if self._nena_exporter is not None:
+            stats['nena_log'] = self._nena_exporter.stats()
+        return stats
+
+    def _log_stats(self, interval):
+        """
+        Logs :py:meth:`stats` every interval seconds until shutdown.
+
+        :param interval: The number of seconds between log lines.
+        :type interval: ``float``
+        """
+        while not self._stopping.wait(interval):
+            try:
+                logger.info('Stats for process {0}: {1}'.format(os.getpid(), json.dumps(self.stats(), sort_keys=True)))
+            except Exception as ex:
+                logger.warning('Unable to log the stats: {0}'.format(ex))
 
     def start_logging_event_loop(self, loop):
         """
@@ -228,10 +489,39 @@ class LostApplication(object):
         HandlerClass = self._get_class(handler_name)
         handler = self._di_container.get(HandlerClass)
 
-        runner = queryrunner.QueryRunner(converter, handler)
+        # Only findService responses carry an expiration, so those are the only ones cached.
+        cache = self.response_cache if query_name == 'findService' else None
+        runner = queryrunner.QueryRunner(converter, handler, cache)
 
         return runner
 
+    def _get_queryrunner(self, query_name):
+        """
+        Gets the query runner for the given query, building it on first use.
+
+        :param query_name: The name of the query to be executed.
+        :return: :py:class:`lostservice.queryrunner.QueryRunner`
+        """
+        runner = self._runners.get(query_name)
+        if runner is None:
+            with self._runners_lock:
+                runner = self._runners.get(query_name)
+                if runner is None:
+                    runner = self._build_queryrunner(query_name)
+                    self._runners[query_name] = runner
+        return runner
+
+    def warm_up(self, query_names=('findService', 'listServices', 'listServicesByLocation', 'getServiceBoundary')):
+        """
+        Builds the query runners for the given queries ahead of the first request.
+
+        :param query_names: The names of the queries to build runners for.
+        :type query_names: ``tuple`` of ``str``
+        """
+        for query_name in query_names:
+            self._get_queryrunner(query_name)
+        logger.info('Query runners ready for {0}.'.format(', '.join(query_names)))
+
     def _execute_internal(self, queryrunner, data, context):
         """
         Executes a query by calling the query runner.
@@ -256,8 +546,8 @@ class LostApplication(object):
         :rtype: ``str``
         """
 
-        conf = self._di_container.get(config.Configuration)
         parsed_request = None
+        query_name = None
         response = None
         parsed_response = None
         endtime = None
@@ -274,8 +564,8 @@ class LostApplication(object):
             qname = etree.QName(parsed_request)
             query_name = qname.localname
 
-            # 2. call _build_queryrunner to get the runner.
-            runner = self._build_queryrunner(query_name)
+            # 2. call _get_queryrunner to get the runner.
+            runner = self._get_queryrunner(query_name)
 
             # 3. call _execute_internal to process the request.
             parsed_response = self._execute_internal(runner, parsed_request, context)
@@ -295,17 +585,7 @@ class LostApplication(object):
         except Exception as e:
             logger.error(e)
             endtime = datetime.datetime.now(tz=pytz.utc)
-            source_uri = conf.get('Service', 'source_uri', as_object=False, required=False)
-            if isinstance(e, exp.RedirectException):
-                logger.error(f'Redirect Exception: {e}')
-                response = exp.build_redirect_response(e, source_uri)
-            elif isinstance(e, etree.LxmlError):
-                logger.error(f'Malformed XML request: {e} Source URI: {source_uri}')
-                response = exp.build_error_response(exp.BadRequestException('Malformed request xml.', None), source_uri)
-            elif isinstance(e, exp.NotFoundException):
-                response = exp.build_error_response(e, source_uri)
-            else:
-                response = exp.build_error_response(e, source_uri)
+            response = self._build_error_response(e)
             self._audit_diagnostics(activity_id, e)
         finally:
             if parsed_response is None:
@@ -315,24 +595,108 @@ class LostApplication(object):
                                        'latitude': 0.0,
                                        'longitude': 0.0
                     }
-            if self.audit_logging_enabled:
-                logger.debug('Audit Logging: Begin')
-                self.loop.call_soon_threadsafe(functools.partial(self._audit_transaction,
-                                                                 activity_id,
-                                                                 parsed_request,
-                                                                 starttime,
-                                                                 parsed_response['response'],
-                                                                 endtime, context,
-                                                                 parsed_response['latitude'],
-                                                                 parsed_response['longitude']))
-            if self.nena_logging_enabled:
-                self.loop.call_soon_threadsafe(
-                    functools.partial(nenalog.create_NENA_log_events, data, query_name, starttime, response, endtime,
-                                      conf))
-
-            logger.debug('Audit Logging: Complete')
+            self._log_query(activity_id, parsed_request, data, query_name, starttime, parsed_response, endtime,
+                            context)
         return response
 
+    def _log_query(self, activity_id, parsed_request, data, query_name, starttime, parsed_response, endtime,
+                   context):
+        """
+        Queues the transaction and NENA log events of a query.
+
+        :param activity_id: The activity id of the query.
+        :param parsed_request: The request element, None if the request couldn't be parsed.
+        :param data: The request XML.
+        :param query_name: The query type, None if the request couldn't be parsed.
+        :param starttime: UTC
+        :param parsed_response: The response element with the latitude and longitude.
+        :type parsed_response: ``dict``
+        :param endtime: UTC
+        :param context: The request context.
+        """
+        if self.audit_logging_enabled:
+            logger.debug('Audit Logging: Begin')
+            self.loop.call_soon_threadsafe(functools.partial(self._audit_transaction,
+                                                             activity_id,
+                                                             parsed_request,
+                                                             starttime,
+                                                             parsed_response['response'],
+                                                             endtime, context,
+                                                             parsed_response['latitude'],
+                                                             parsed_response['longitude']))
+        if self.nena_logging_enabled:
+            # Hand over the trees we already have, the exporter doesn't need to parse the xml again.
+            self.loop.call_soon_threadsafe(
+                functools.partial(self._nena_exporter.export, parsed_request, data, query_name, starttime,
+                                  parsed_response['response'] if parsed_response is not None else None,
+                                  endtime))
+
+        logger.debug('Audit Logging: Complete')
+
+    def _build_error_response(self, error):
+        """
+        Builds the response for a query that failed.
+
+        :param error: The exception raised executing the query.
+        :type error: ``Exception``
+        :return: The LoST errors (or redirect) response XML.
+        :rtype: ``str``
+        """
+        conf = self._di_container.get(config.Configuration)
+        source_uri = conf.get('Service', 'source_uri', as_object=False, required=False)
+        if isinstance(error, exp.RedirectException):
+            logger.error(f'Redirect Exception: {error}')
+            return exp.build_redirect_response(error, source_uri)
+        elif isinstance(error, etree.LxmlError):
+            logger.error(f'Malformed XML request: {error} Source URI: {source_uri}')
+            return exp.build_error_response(exp.BadRequestException('Malformed request xml.', None), source_uri)
+        return exp.build_error_response(error, source_uri)
+
+    def execute_find_service_batch(self, data, context):
+        """
+        Executes a bulk findService request, see :py:mod:`lostservice.bulk`.  Each item is audited and
+        NENA logged like a single findService request, a summary is logged when the batch is done.
+
+        :param data: The batch request XML.
+        :type data: ``bytes``
+        :param context: The request context.
+        :type context: ``dict``
+        :return: The batch response XML, a piece at a time.
+        :rtype: ``generator`` of ``bytes``
+        """
+        logger.info('Starting bulk findService execution. . .')
+        starttime = datetime.datetime.now(tz=pytz.utc)
+        batch = bulk.FindServiceBatch(self._get_queryrunner('findService'),
+                                      self._di_container.get(gisdb.GisDbInterface),
+                                      self._build_error_response,
+                                      self._di_container.get(bulk.FindServiceBatchConfigWrapper).chunk_size(),
+                                      functools.partial(self._log_batch_item, context))
+        try:
+            yield from batch.execute(data, context)
+        finally:
+            elapsed = datetime.datetime.now(tz=pytz.utc) - starttime
+            logger.info('Finished bulk findService execution, {0} items ({1} errors) in {2:.3f}s.'
+                        .format(batch.item_count, batch.error_count, elapsed.total_seconds()))
+
+    def _log_batch_item(self, context, parsed_request, data, starttime, parsed_response, endtime, error):
+        """
+        Logs an item of a bulk findService request like a single findService request.
+
+        :param context: The request context.
+        :param parsed_request: The findService request element, None if the item has none.
+        :param data: The item XML.
+        :param starttime: UTC
+        :param parsed_response: The response element with the latitude and longitude.
+        :type parsed_response: ``dict``
+        :param endtime: UTC
+        :param error: The exception raised resolving the item, None if it was resolved.
+        """
+        activity_id = str(uuid.uuid4())
+        if error is not None:
+            self._audit_diagnostics(activity_id, error)
+        query_name = etree.QName(parsed_request).localname if parsed_request is not None else None
+        self._log_query(activity_id, parsed_request, data, query_name, starttime, parsed_response, endtime, context)
+
     def _audit_transaction(self, activity_id, parsed_request, start_time, parsed_response, end_time, context,
                            latitude=0, longitude=0):
         """
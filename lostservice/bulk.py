@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. currentmodule:: lostservice.bulk
+.. moduleauthor:: Tom Weitzel <tweitzel@geo-comm.com>
+
+Bulk findService, many findService requests in one HTTP request.
+
+The request wraps ordinary findService requests in items with an id::
+
+    <findServiceBatch>
+        <item id="1"><findService xmlns="urn:ietf:params:xml:ns:lost1">...</findService></item>
+        <item id="2"><findService xmlns="urn:ietf:params:xml:ns:lost1">...</findService></item>
+    </findServiceBatch>
+
+and the response wraps each findService response (or errors) in an item with the same id,
+written out as soon as the item is resolved::
+
+    <findServiceBatchResponse>
+        <item id="1"><findServiceResponse xmlns="urn:ietf:params:xml:ns:lost1">...</findServiceResponse></item>
+        <item id="2"><errors xmlns="urn:ietf:params:xml:ns:lost1">...</errors></item>
+    </findServiceBatchResponse>
+
+Items are resolved a chunk at a time.  The boundaries containing the point locations of a
+chunk are found with one query per service boundary table, then every item runs through
+the findService handler just like a single request would, so the policies, fallback
+searches and default routes are the same.  Items of a chunk asking for different services at
+the same location are resolved together, the location is checked for coverage once.  Each item is handed to the transaction and NENA
+logs on its own, as if it had been sent as a single findService request.
+"""
+
+import contextlib
+import copy
+import datetime
+import io
+import pytz
+from collections import OrderedDict
+from xml.sax.saxutils import quoteattr
+from injector import inject
+from lxml import etree
+from lostservice.configuration import Configuration
+from lostservice.configuration import general_logger
+from lostservice.exception import BadRequestException
+from lostservice.model.geodetic import Point
+from lostservice.model.requests import FindServiceRequest
+logger = general_logger()
+
+#: The local name of the root element of a batch request.
+BATCH_REQUEST = 'findServiceBatch'
+#: The local name of the root element of a batch response.
+BATCH_RESPONSE = 'findServiceBatchResponse'
+#: The local name of the elements holding the requests and responses of a batch.
+BATCH_ITEM = 'item'
+#: The tag of the service element of a findService request.
+_SERVICE_TAG = '{urn:ietf:params:xml:ns:lost1}service'
+
+
+class FindServiceBatchConfigWrapper(object):
+    """
+    A wrapper object for bulk findService configuration.
+    """
+    @inject
+    def __init__(self, config: Configuration):
+        """
+        Constructor.
+
+        :param config: The configuration object.
+        :type config: :py:class:`lostservice.configuration.Configuration`
+        """
+        self._config = config
+
+    def chunk_size(self) -> int:
+        """
+        Gets the number of items resolved together.
+
+        :return: ``int``
+        """
+        chunk_size = None
+        try:
+            chunk_size = self._config.get('Service', 'batch_chunk_size', as_object=False, required=False)
+        except Exception:
+            pass
+        try:
+            chunk_size = int(chunk_size)
+        except (TypeError, ValueError):
+            return 500
+        return max(chunk_size, 1)
+
+
+class FindServiceBatch(object):
+    """
+    Resolves the items of a bulk findService request.
+
+    :param runner: The findService query runner.
+    :type runner: :py:class:`lostservice.queryrunner.QueryRunner`
+    :param db_wrapper: The db wrapper class instance.
+    :type db_wrapper: :py:class:`lostservice.db.gisdb.GisDbInterface`
+    :param error_response: Function building the errors response xml (``str``) for an exception.
+    :type error_response: ``callable``
+    :param chunk_size: The number of items resolved together.
+    :type chunk_size: ``int``
+    :param item_done: Function called with the request element (None if the item has none), the item xml,
+                      the start time, the response (the query runner result, with the latitude and longitude),
+                      the end time and the exception raised, if any, of each item.
+    :type item_done: ``callable``
+    """
+    def __init__(self, runner, db_wrapper, error_response, chunk_size=500, item_done=None):
+        """
+        Constructor.
+        """
+        super(FindServiceBatch, self).__init__()
+        self._runner = runner
+        self._db_wrapper = db_wrapper
+        self._error_response = error_response
+        self._chunk_size = chunk_size
+        self._item_done = item_done
+        self.item_count = 0
+        self.error_count = 0
+
+    def _items(self, data):
+        """
+        Reads the items of a batch request as they are parsed.
+
+        :param data: The batch request XML.
+        :type data: ``bytes``
+        :return: The item elements.
+        :rtype: ``generator``
+        """
+        if isinstance(data, str):
+            data = data.encode()
+        root = None
+        for event, element in etree.iterparse(io.BytesIO(data), events=('start', 'end')):
+            if root is None:
+                root = element
+                if etree.QName(root).localname != BATCH_REQUEST:
+                    raise BadRequestException('Expected a {0} request.'.format(BATCH_REQUEST))
+            elif event == 'end' and element.getparent() is root and etree.QName(element).localname == BATCH_ITEM:
+                yield element
+
+    def _chunks(self, data):
+        """
+        Groups the items of a batch request into chunks.
+
+        :param data: The batch request XML.
+        :type data: ``bytes``
+        :rtype: ``generator`` of ``list``
+        """
+        chunk = []
+        try:
+            for item in self._items(data):
+                chunk.append(item)
+                if len(chunk) >= self._chunk_size:
+                    yield chunk
+                    chunk = []
+        except Exception:
+            # Answer the items read before the request went bad.
+            if chunk:
+                yield chunk
+            raise
+        if chunk:
+            yield chunk
+
+    def _parse(self, item):
+        """
+        Parses the findService request of an item.
+
+        :return: The request, or the exception raised parsing it.
+        """
+        try:
+            if not len(item):
+                raise BadRequestException('The item has no findService request.')
+            return self._runner.parse(item[0])
+        except Exception as ex:
+            return ex
+
+    def _prefetch(self, requests):
+        """
+        Finds the boundaries containing the point locations of a chunk, one query per service boundary table.
+
+        :param requests: The parsed requests of the chunk.
+        :type requests: ``list``
+        :return: The boundary table and containing boundaries for the position of each point request.
+        :rtype: ``dict``
+        """
+        mappings = self._db_wrapper.get_urn_table_mappings()
+        positions_by_table = OrderedDict()
+        for position, request in enumerate(requests):
+            if isinstance(request, FindServiceRequest) and request.location is not None \
+                    and type(request.location.location) is Point:
+                boundary_table = mappings.get(request.service)
+                if boundary_table is not None:
+                    positions_by_table.setdefault(boundary_table, []).append(position)
+
+        prefetched = {}
+        for boundary_table, positions in positions_by_table.items():
+            try:
+                results = self._db_wrapper.get_containing_boundaries_for_points(
+                    [requests[position].location.location for position in positions], boundary_table)
+            except Exception as ex:
+                # The items still get resolved, one query each.
+                logger.warning('Unable to find the boundaries for a batch of points in {0}: {1}'
+                               .format(boundary_table, ex))
+                continue
+            for position, rows in zip(positions, results):
+                prefetched[position] = (boundary_table, rows)
+        return prefetched
+
+    def _group(self, chunk, requests):
+        """
+        Groups the items of a chunk whose requests only differ in the service.
+
+        :param chunk: The item elements of the chunk.
+        :type chunk: ``list``
+        :param requests: The parsed requests of the chunk.
+        :type requests: ``list``
+        :return: The positions of the items in each group asking for more than one service, by the position
+                 of the first.
+        :rtype: ``dict``
+        """
+        positions_by_request = OrderedDict()
+        for position, request in enumerate(requests):
+            if isinstance(request, FindServiceRequest) and request.location is not None:
+                element = chunk[position][0]
+                key = (tuple(sorted(element.attrib.items())), (element.text or '').strip(),
+                       tuple(etree.tostring(child, with_tail=False) for child in element if child.tag != _SERVICE_TAG))
+                positions_by_request.setdefault(key, []).append(position)
+        return {positions[0]: positions for positions in positions_by_request.values()
+                if len(set(requests[position].service for position in positions)) > 1}
+
+    def _run_group(self, requests, positions, prefetched, context):
+        """
+        Resolves the requests of a group of items for the same location in one pass.
+
+        :return: The start time and the query runner result, or the exception raised, by position.
+        :rtype: ``dict``
+        """
+        request = requests[positions[0]]
+        service_urns = list(OrderedDict.fromkeys(requests[position].service for position in positions))
+        starttime = datetime.datetime.now(tz=pytz.utc)
+        try:
+            with contextlib.ExitStack() as stack:
+                # The boundaries found for the chunk answer the lookups of every service in the group.
+                for position in positions:
+                    if prefetched.get(position) is not None:
+                        boundary_table, rows = prefetched[position]
+                        stack.enter_context(self._db_wrapper.prefetched_point_boundaries(
+                            request.location.location, boundary_table, rows))
+                results = self._runner.run_request_for_services(request, service_urns, context)
+        except Exception as ex:
+            results = {service_urn: ex for service_urn in service_urns}
+        return {position: (starttime, results[requests[position].service]) for position in positions}
+
+    def _run(self, request, prefetched, context):
+        """
+        Resolves the request of one item.
+
+        :return: The query runner result, the response element with the latitude and longitude.
+        :rtype: ``dict``
+        """
+        if isinstance(request, Exception):
+            raise request
+        # Batches rarely repeat a location, the items would only push the single requests out of the response cache.
+        if prefetched is None:
+            return self._runner.run_request(request, context, use_cache=False)
+        boundary_table, rows = prefetched
+        with self._db_wrapper.prefetched_point_boundaries(request.location.location, boundary_table, rows):
+            return self._runner.run_request(request, context, use_cache=False)
+
+    def _item_response(self, item, request, prefetched, context, resolved=None):
+        """
+        Resolves one item and serializes its response.
+
+        :param resolved: The start time and result of an item resolved with its group, see :py:meth:`_run_group`.
+        :type resolved: ``tuple``
+        :rtype: ``bytes``
+        """
+        error = None
+        starttime = datetime.datetime.now(tz=pytz.utc) if resolved is None else resolved[0]
+        try:
+            if resolved is None:
+                result = self._run(request, prefetched, context)
+            elif isinstance(resolved[1], Exception):
+                raise resolved[1]
+            else:
+                result = resolved[1]
+            response = etree.tostring(result['response'])
+        except Exception as ex:
+            logger.error(ex)
+            self.error_count += 1
+            error = ex
+            errors = self._error_response(ex)
+            result = {'response': etree.fromstring(errors.encode() if isinstance(errors, str) else errors),
+                      'latitude': 0.0,
+                      'longitude': 0.0}
+            response = etree.tostring(result['response'])
+        endtime = datetime.datetime.now(tz=pytz.utc)
+        self.item_count += 1
+        if self._item_done is not None:
+            # The item is cleared once answered, the logs get a copy of the request.
+            self._item_done(copy.deepcopy(item[0]) if len(item) else None, etree.tostring(item), starttime, result,
+                            endtime, error)
+        return '<{0} id={1}>'.format(BATCH_ITEM, quoteattr(item.get('id', ''))).encode() + response + \
+            '</{0}>'.format(BATCH_ITEM).encode()
+
+    def execute(self, data, context):
+        """
+        Resolves the items of a batch request.
+
+        :param data: The batch request XML.
+        :type data: ``bytes``
+        :param context: The request context, shared by the items.
+        :type context: ``dict``
+        :return: The batch response XML, a piece at a time.
+        :rtype: ``generator`` of ``bytes``
+        """
+        yield '<?xml version="1.0" encoding="UTF-8"?><{0}>'.format(BATCH_RESPONSE).encode()
+        try:
+            for chunk in self._chunks(data):
+                requests = [self._parse(item) for item in chunk]
+                prefetched = self._prefetch(requests)
+                groups = self._group(chunk, requests)
+                resolved = {}
+                for position, item in enumerate(chunk):
+                    if position in groups:
+                        resolved.update(self._run_group(requests, groups[position], prefetched, context))
+                    yield self._item_response(item, requests[position], prefetched.get(position), context,
+                                              resolved.pop(position, None))
+                    # Let go of the items already answered.
+                    item.clear()
+                    while item.getprevious() is not None:
+                        del item.getparent()[0]
+        except Exception as ex:
+            # The rest of the request couldn't be read, the items answered so far stand.
+            logger.error(ex)
+            self.error_count += 1
+            if isinstance(ex, etree.LxmlError):
+                ex = BadRequestException('Malformed request xml.', None)
+            errors = self._error_response(ex)
+            yield etree.tostring(etree.fromstring(errors.encode() if isinstance(errors, str) else errors))
+        yield '</{0}>'.format(BATCH_RESPONSE).encode()
@@ -0,0 +1,486 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. currentmodule:: lostservice.caching
+.. moduleauthor:: Tom Weitzel <tweitzel@geo-comm.com>
+
+Caching support, a generic LRU cache with per entry time-to-live and the
+findService response cache built on top of it.
+"""
+
+import copy
+import datetime
+import threading
+import time
+from collections import OrderedDict
+import isodate
+import pytz
+from injector import inject
+from lxml import etree
+from lostservice.configuration import Configuration
+from lostservice.configuration import general_logger
+from lostservice.model.requests import FindServiceRequest
+import lostservice.model.civic as civic
+import lostservice.model.geodetic as geodetic
+from lostservice.db.spatial import BOUNDARY_REF
+logger = general_logger()
+
+
+class LruCache(object):
+    """
+    A thread-safe least recently used cache with a time-to-live per entry.
+
+    :param max_entries: The maximum number of entries to hold.
+    :type max_entries: ``int``
+    :param ttl: The default time-to-live of an entry in seconds, None for no expiration.
+    :type ttl: ``float``
+    :param clock: Function returning the current time in seconds.
+    :type clock: ``callable``
+    """
+    def __init__(self, max_entries=1000, ttl=None, clock=time.monotonic):
+        """
+        Constructor.
+        """
+        super(LruCache, self).__init__()
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        Gets the value for a key, expired entries are treated as missing.
+
+        :param key: The key.
+        :param default: The value to return if there is no entry for the key.
+        :return: The cached value or the default.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value, ttl=None):
+        """
+        Adds or replaces an entry.
+
+        :param key: The key.
+        :param value: The value.
+        :param ttl: The time-to-live in seconds, defaults to the cache's time-to-live.
+        :type ttl: ``float``
+        """
+        if ttl is None:
+            ttl = self._ttl
+        elif self._ttl is not None:
+            ttl = min(ttl, self._ttl)
+        expires = self._clock() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, predicate=None):
+        """
+        Removes entries from the cache.
+
+        :param predicate: Function taking a key, entries it returns True for are removed.
+                          If None all entries are removed.
+        :type predicate: ``callable``
+        """
+        with self._lock:
+            if predicate is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries.keys() if predicate(key)]:
+                    del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Gets the cache counters.
+
+        :return: The hit, miss and eviction counts and the current size.
+        :rtype: ``dict``
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self)}
+
+
+class ResponseCacheConfigWrapper(object):
+    """
+    A wrapper object for response cache configuration.
+    """
+    @inject
+    def __init__(self, config: Configuration):
+        """
+        Constructor.
+
+        :param config: The configuration object.
+        :type config: :py:class:`lostservice.configuration.Configuration`
+        """
+        self._config = config
+
+    def enabled(self) -> bool:
+        """
+        Gets whether or not responses are cached.
+
+        :return: ``bool``
+        """
+        enabled = self._config.get('ResponseCache', 'enabled', as_object=True, required=False)
+        return enabled is True
+
+    def max_entries(self) -> int:
+        """
+        Gets the maximum number of cached responses.
+
+        :return: ``int``
+        """
+        max_entries = self._config.get('ResponseCache', 'max_entries', as_object=False, required=False)
+        if max_entries is None:
+            max_entries = 10000
+        return int(max_entries)
+
+    def max_ttl(self) -> float:
+        """
+        Gets the maximum number of seconds a response is cached, this is what NO-EXPIRATION responses get.
+
+        :return: ``float``
+        """
+        ttl = self._config.get('ResponseCache', 'max_ttl_seconds', as_object=False, required=False)
+        if ttl is None:
+            ttl = 300
+        return float(ttl)
+
+    def coordinate_precision(self) -> int:
+        """
+        Gets the number of decimal places location values are rounded to when building the cache key.
+
+        :return: ``int``
+        """
+        precision = self._config.get('ResponseCache', 'coordinate_precision', as_object=False, required=False)
+        if precision is None:
+            precision = 6
+        return int(precision)
+
+
+#: The public fields of each location type that make up the location part of a response cache key.
+LOCATION_KEY_FIELDS = {
+    geodetic.Point: ('spatial_ref', 'latitude', 'longitude'),
+    geodetic.Circle: ('spatial_ref', 'latitude', 'longitude', 'radius', 'uom'),
+    geodetic.Ellipse: ('spatial_ref', 'latitude', 'longitude', 'majorAxis', 'majorAxisuom', 'minorAxis',
+                       'minorAxisuom', 'orientation', 'orientationuom'),
+    geodetic.Arcband: ('spatial_ref', 'latitude', 'longitude', 'inner_radius', 'inner_radius_uom', 'outer_radius',
+                       'outer_radius_uom', 'start_angle', 'start_angle_uom', 'opening_angle', 'opening_angle_uom'),
+    geodetic.Polygon: ('spatial_ref', 'vertices'),
+    civic.CivicAddress: ('country', 'a1', 'a2', 'a3', 'a4', 'a5', 'a6', 'prm', 'prd', 'rd', 'sts', 'pod', 'pom',
+                         'rdsec', 'rdbr', 'rdsubr', 'hno', 'hns', 'lmk', 'loc', 'flr', 'nam', 'pc', 'bld', 'unit',
+                         'room', 'seat', 'plc', 'pcn', 'pobox', 'addcode', 'stp', 'stps', 'hnp', 'lmkp', 'mp')
+}
+
+
+class ResponseCache(object):
+    """
+    Cache of findService responses keyed by the request's service, location (rounded to the
+    configured precision) and serviceBoundary flag.  The time a response is held is driven by
+    the expiration of its mappings, NO-CACHE responses are never stored.
+    """
+    @inject
+    def __init__(self, config: ResponseCacheConfigWrapper):
+        """
+        Constructor.
+
+        :param config: The response cache configuration wrapper.
+        :type config: :py:class:`lostservice.caching.ResponseCacheConfigWrapper`
+        """
+        super(ResponseCache, self).__init__()
+        self._precision = config.coordinate_precision()
+        self._max_ttl = config.max_ttl()
+        self._cache = LruCache(config.max_entries(), self._max_ttl)
+
+    def _quantize(self, value):
+        """
+        Turns a location value into something hashable, rounding any floats.
+
+        :param value: The value.
+        :return: The hashable value.
+        """
+        if isinstance(value, float):
+            return round(value, self._precision)
+        if isinstance(value, (list, tuple)):
+            return tuple(self._quantize(item) for item in value)
+        if isinstance(value, dict):
+            return tuple(sorted((key, self._quantize(item)) for key, item in value.items()))
+        if isinstance(value, (str, int, bool, type(None))):
+            return value
+        return repr(value)
+
+    def key_for(self, request):
+        """
+        Builds the cache key for a request.
+
+        :param request: The parsed request.
+        :return: The key, or None if the request can't be cached.
+        :rtype: ``tuple``
+        """
+        if not isinstance(request, FindServiceRequest) or request.location is None \
+                or request.location.location is None:
+            return None
+
+        location = request.location.location
+        fields = LOCATION_KEY_FIELDS.get(type(location))
+        if fields is None:
+            return None
+        return (type(request).__name__,
+                request.service,
+                type(location).__name__,
+                tuple(self._quantize(getattr(location, field)) for field in fields),
+                request.serviceBoundary,
+                getattr(request, 'validateLocation', None),
+                tuple(request.path),
+                tuple(etree.tostring(item) for item in request.nonlostdata))
+
+    def _ttl_for(self, response):
+        """
+        Works out how long a response may be cached for from the expiration of its mappings.
+
+        :param response: The findService response.
+        :type response: :py:class:`lostservice.model.responses.FindServiceResponse`
+        :return: The time to live in seconds, or None if the response must not be cached.
+        :rtype: ``float``
+        """
+        if not response.mappings:
+            return None
+
+        ttl = self._max_ttl
+        now = datetime.datetime.now(tz=pytz.utc)
+        for mapping in response.mappings:
+            expires = getattr(mapping, 'expires', 'NO-CACHE')
+            if expires == 'NO-EXPIRATION':
+                continue
+            if not expires or expires == 'NO-CACHE':
+                return None
+            try:
+                remaining = (isodate.parse_datetime(expires) - now).total_seconds()
+            except (ValueError, isodate.ISO8601Error):
+                return None
+            if remaining <= 0:
+                return None
+            ttl = min(ttl, remaining)
+        return ttl
+
+    def get(self, key, request):
+        """
+        Gets a cached handler result, tailored to the given request.
+
+        :param key: The cache key for the request.
+        :type key: ``tuple``
+        :param request: The parsed request.
+        :return: The handler result or None.
+        :rtype: ``dict``
+        """
+        cached = self._cache.get(key)
+        if cached is None:
+            return None
+
+        # The location id is not part of the key, it must be echoed back from this request.
+        response = copy.copy(cached['response'])
+        response.location_used = request.location.id
+        response.path = list(response.path)
+        # Formatting moves the pass-through elements into the output document, hand out copies.
+        response.nonlostdata = [copy.deepcopy(item) for item in response.nonlostdata]
+        return {'latitude': cached['latitude'], 'longitude': cached['longitude'], 'response': response}
+
+    def put(self, key, result):
+        """
+        Caches a handler result, if its expiration policy allows it.
+
+        :param key: The cache key for the request.
+        :type key: ``tuple``
+        :param result: The handler result.
+        :type result: ``dict``
+        """
+        ttl = self._ttl_for(result['response'])
+        if ttl is not None:
+            response = copy.copy(result['response'])
+            response.path = list(response.path)
+            response.nonlostdata = [copy.deepcopy(item) for item in response.nonlostdata]
+            self._cache.put(key, {'latitude': result['latitude'],
+                                  'longitude': result['longitude'],
+                                  'response': response}, ttl)
+
+    def clear(self):
+        """
+        Drops all cached responses, e.g. after the boundary data has been reloaded.
+        """
+        self._cache.invalidate()
+
+    def stats(self):
+        """
+        Gets the cache counters.
+
+        :return: The hit, miss and eviction counts and the current size.
+        :rtype: ``dict``
+        """
+        return self._cache.stats()
+
+
+class BoundaryCacheConfigWrapper(object):
+    """
+    A wrapper object for service boundary GML cache configuration.
+    """
+    @inject
+    def __init__(self, config: Configuration):
+        """
+        Constructor.
+
+        :param config: The configuration object.
+        :type config: :py:class:`lostservice.configuration.Configuration`
+        """
+        self._config = config
+
+    def enabled(self) -> bool:
+        """
+        Gets whether or not rendered service boundaries are cached.
+
+        :return: ``bool``
+        """
+        enabled = self._config.get('BoundaryCache', 'enabled', as_object=True, required=False)
+        return enabled is not False
+
+    def max_entries(self) -> int:
+        """
+        Gets the maximum number of cached service boundaries.
+
+        :return: ``int``
+        """
+        max_entries = self._config.get('BoundaryCache', 'max_entries', as_object=False, required=False)
+        if max_entries is None:
+            max_entries = 2000
+        return int(max_entries)
+
+    def ttl(self) -> float:
+        """
+        Gets the number of seconds a service boundary is cached, this bounds how long an edit that
+        didn't touch the boundary's updatedate can go unnoticed.
+
+        :return: ``float``
+        """
+        ttl = self._config.get('BoundaryCache', 'ttl_seconds', as_object=False, required=False)
+        if ttl is None:
+            ttl = 3600
+        return float(ttl)
+
+    def precompute(self) -> bool:
+        """
+        Gets whether or not every service boundary is rendered into the cache when a worker starts, and
+        again every half ttl so the rendered boundaries are replaced before they expire.
+
+        :return: ``bool``
+        """
+        precompute = self._config.get('BoundaryCache', 'precompute', as_object=True, required=False)
+        return precompute is True
+
+
+class BoundaryGmlCache(object):
+    """
+    Cache of response-ready service boundary GML, the output of
+    :py:meth:`lostservice.handling.findservice.FindServiceInner.apply_service_boundary_policy`.
+
+    Entries are keyed by the boundary's table, id (srcunqid) and updatedate along with the
+    simplification tolerance and GML precision they were rendered with, so an edited boundary
+    gets a new entry instead of the stale one.  The same srcunqid can be in more than one table,
+    so boundaries whose table isn't known (no :py:data:`lostservice.db.spatial.BOUNDARY_REF`)
+    aren't cached.
+    """
+    #: The number of decimal digits the GML coordinates are rendered with, see ST_AsGML in :py:mod:`lostservice.db.spatial`.
+    GML_PRECISION = 15
+
+    @inject
+    def __init__(self, config: BoundaryCacheConfigWrapper):
+        """
+        Constructor.
+
+        :param config: The service boundary cache configuration wrapper.
+        :type config: :py:class:`lostservice.caching.BoundaryCacheConfigWrapper`
+        """
+        super(BoundaryGmlCache, self).__init__()
+        self._enabled = config.enabled()
+        self._cache = LruCache(config.max_entries(), config.ttl())
+
+    def key_for(self, mapping, tolerance=None):
+        """
+        Builds the cache key for the boundary of a mapping.
+
+        :param mapping: A mapping row from one of the service boundary queries.
+        :type mapping: ``dict``
+        :param tolerance: The simplification tolerance, None if the boundary isn't simplified.
+        :type tolerance: ``float``
+        :return: The key, or None if the boundary can't be cached.
+        :rtype: ``tuple``
+        """
+        boundary_ref = mapping.get(BOUNDARY_REF)
+        if not self._enabled or boundary_ref is None:
+            return None
+        boundary_table, primary_key = boundary_ref
+        boundary_id = mapping.get('srcunqid')
+        if boundary_id is None:
+            boundary_id = tuple(sorted(primary_key.items()))
+        return boundary_table, boundary_id, mapping.get('updatedate'), tolerance, self.GML_PRECISION
+
+    def get(self, key):
+        """
+        Gets the rendered GML of a boundary.
+
+        :param key: The cache key for the boundary.
+        :type key: ``tuple``
+        :return: The GML or None.
+        :rtype: ``str``
+        """
+        return self._cache.get(key)
+
+    def put(self, key, gml):
+        """
+        Caches the rendered GML of a boundary.
+
+        :param key: The cache key for the boundary.
+        :type key: ``tuple``
+        :param gml: The GML.
+        :type gml: ``str``
+        """
+        self._cache.put(key, gml)
+
+    def clear(self, table_names=None):
+        """
+        Drops cached boundaries, e.g. after the boundary data has been reloaded.
+
+        :param table_names: The tables to drop the boundaries of, if None all of them are dropped.
+        :type table_names: ``list`` of ``str``
+        """
+        if table_names is None:
+            self._cache.invalidate()
+        else:
+            table_names = set(table_names)
+            self._cache.invalidate(lambda key: key[0] in table_names)
+
+    def stats(self):
+        """
+        Gets the cache counters.
+
+        :return: The hit, miss and eviction counts and the current size.
+        :rtype: ``dict``
+        """
+        return self._cache.stats()
@@ -343,6 +343,25 @@ class Configuration(object):
             self._db_connection_string = self._rebuild_db_connection_string('Database')
         return self._db_connection_string
 
+    def get_gis_db_replica_connection_strings(self):
+        """
+        Gets the connection strings for the read replicas of the gis database, one for each section
+        named in the read_replicas option of the Database section.
+
+        :rtype: ``list`` of ``str``
+        """
+        sections = self.get('Database', 'read_replicas', required=False)
+        if not sections:
+            return []
+        connection_strings = []
+        for section in sections.split(','):
+            connection_string = self._rebuild_db_connection_string(section.strip())
+            if connection_string is None:
+                general_logger().warning('Read replica section {0} was not found.'.format(section.strip()))
+            else:
+                connection_strings.append(connection_string)
+        return connection_strings
+
     def get_logging_db_connection_string(self):
         """
         Gets a valid database connection string for the logging database from configuration.
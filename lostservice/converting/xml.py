@@ -9,6 +9,7 @@ Xml conversion classes.
 """
 
 import collections
+import copy
 import io
 
 import lxml
@@ -31,6 +32,7 @@ from lostservice.model.requests import ListServicesByLocationRequest
 from lostservice.model.requests import ListServicesRequest
 from lostservice.model.responses import AdditionalDataResponseMapping, ResponseMapping
 
+from lostservice.caching import LruCache
 from lostservice.configuration import general_logger
 logger = general_logger()
 
@@ -57,6 +59,26 @@ _namespace_map = {LOST_PREFIX: LOST_URN,
                   CAN_PREFIX: CAN_URN,
                   CAE_PREFIX: CAE_URN}
 
+# Parsed service boundary GML by its text, boundaries returned by value are cached rendered
+# (see lostservice.caching.BoundaryGmlCache) so the same text keeps coming back.
+_boundary_elements = LruCache(256)
+
+
+def _parse_boundary_gml(gml):
+    """
+    Parses service boundary GML into elements ready to be added to a response.
+
+    :param gml: The GML, one or more elements using the gml prefix.
+    :type gml: ``str``
+    :return: Copies of the parsed elements.
+    :rtype: ``list`` of :py:class:`_Element`
+    """
+    root = _boundary_elements.get(gml)
+    if root is None:
+        root = etree.parse(io.StringIO('''<root xmlns:gml="{0}">{1}</root>'''.format(GML_URN, gml))).getroot()
+        _boundary_elements.put(gml, root)
+    return [copy.deepcopy(element) for element in root]
+
 
 class XmlConverter(Converter):
     """ 
@@ -684,9 +706,7 @@ class FindServiceXmlConverter(XmlConverter):
                         # TODO - fix the profile.
                         services_element = lxml.etree.SubElement(mapping, 'serviceBoundary', profile='geodetic-2d')
 
-                        final_gml_as_xml = io.StringIO('''<root xmlns:gml="{0}">{1}</root>'''.format(GML_URN, item.boundary_value))
-                        final_gml = etree.parse(final_gml_as_xml).getroot()
-                        services_element.extend(final_gml)
+                        services_element.extend(_parse_boundary_gml(item.boundary_value))
 
             elif type(item) is AdditionalDataResponseMapping:
                 services_element = lxml.etree.SubElement(mapping, 'uri')
@@ -925,9 +945,7 @@ class GetServiceBoundaryXmlConverter(XmlConverter):
 
         for item in data:
             services_element = lxml.etree.SubElement(xml_response, 'serviceBoundary', profile=item.get('profile',GEO_PROFILE))
-            final_gml_as_xml = io.StringIO('''<root xmlns:gml="{0}">{1}</root>'''.format(GML_URN, item['ST_AsGML_1']))
-            final_gml = etree.parse(final_gml_as_xml).getroot()
-            services_element.extend(final_gml)
+            services_element.extend(_parse_boundary_gml(item['ST_AsGML_1']))
 
         if data[0] is not None:
             # add the path element
@@ -8,11 +8,17 @@
 Base class(es) for coverage support.
 """
 
+import threading
+import time
 from abc import ABCMeta, abstractmethod
 from injector import inject
-from typing import Iterator
-import civvy.db.postgis.query as civvy_pg
+from typing import Iterator, List, Tuple
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
 import lostservice.configuration as lost_config
+import lostservice.db.spatial as spatialdb
+from lostservice.configuration import general_logger
+logger = general_logger()
 
 
 class CoverageConfigWrapper(object):
@@ -74,6 +80,26 @@ class CoverageConfigWrapper(object):
             parent = False
         return parent
 
+    def cache_regions(self) -> bool:
+        """
+        Checks to see if the coverage regions are held in memory instead of being queried for every request.
+
+        :return: True if the coverage regions are cached, false otherwise.
+        """
+        cache_regions = self._config.get('Coverage', 'cache_regions', as_object=True, required=False)
+        return cache_regions is True
+
+    def cache_refresh_seconds(self) -> float:
+        """
+        Gets the number of seconds after which the cached coverage regions are reloaded, 0 to never reload them.
+
+        :return: The refresh interval in seconds.
+        """
+        refresh = self._config.get('Coverage', 'cache_refresh_seconds', as_object=False, required=False)
+        if refresh is None:
+            refresh = 300
+        return float(refresh)
+
     def server_name(self) -> str:
         """
         Gets the current ECRF server name.
@@ -88,26 +114,54 @@ class CoverageConfigWrapper(object):
 class CoverageBase(object):
     """
     Base class for anything that will do coverage searches against Postgres.
+
+    When the coverage regions are cached the whole coverage table is loaded into memory (see
+    :py:meth:`load_regions`) and requests are matched against that, otherwise every request runs
+    the coverage query.
     """
 
     __metaclass__ = ABCMeta
 
-    def __init__(self, cov_config: CoverageConfigWrapper, query_executor: civvy_pg.PgQueryExecutor):
+    def __init__(self, cov_config: CoverageConfigWrapper, engine: Engine):
         """
         Constructor
 
         :param cov_config: A reference to the CoverageConfig.
-        :param query_executor: An instance of a PgQueryExecutor that will perform the query.
+        :param engine: SQLAlchemy database engine.
+        :type engine: :py:class:`sqlalchemy.engine.Engine`
         """
         super().__init__()
         self._config = cov_config
-        self._query_executor = query_executor
+        self._engine = engine
+        self._regions_lock = threading.Lock()
+        self._regions = None
+        self._regions_loaded = 0.0
+
+    @abstractmethod
+    def build_coverage_query(self, *args, **kwargs) -> Tuple[object, dict]:
+        """
+        Abstract method to build the query to execute. Override this.
+
+        :return: The query and the values of its bound parameters.
+        """
+        pass
 
     @abstractmethod
-    def build_coverage_query(self, *args, **kwargs) -> str:
+    def load_regions(self) -> object:
         """
-        Abstract method to build the query string to execute. Override this.
+        Abstract method to load the coverage regions into memory. Override this.
 
+        :return: The in-memory coverage regions, passed to :py:meth:`match_regions`.
+        """
+        pass
+
+    @abstractmethod
+    def match_regions(self, regions: object, *args, **kwargs) -> List[dict]:
+        """
+        Abstract method to match a location against the in-memory coverage regions. Override this.
+
+        :param regions: The coverage regions returned by :py:meth:`load_regions`.
+        :return: The same rows the coverage query would have returned.
         """
         pass
 
@@ -122,11 +176,46 @@ class CoverageBase(object):
         """
         pass
 
+    def _get_regions(self):
+        """
+        Gets the in-memory coverage regions, loading them on first use and when they are due for a refresh.
+
+        :return: The coverage regions.
+        """
+        refresh = self._config.cache_refresh_seconds()
+        regions = self._regions
+        if regions is None or (refresh and time.monotonic() - self._regions_loaded > refresh):
+            with self._regions_lock:
+                if self._regions is regions:
+                    try:
+                        self._regions = self.load_regions()
+                    except (spatialdb.SpatialQueryException, SQLAlchemyError):
+                        if regions is None:
+                            raise
+                        logger.warning('Unable to reload the coverage regions, keeping the ones already loaded.')
+                    self._regions_loaded = time.monotonic()
+                regions = self._regions
+        return regions
+
+    def refresh_regions(self):
+        """
+        Drops the in-memory coverage regions, they are reloaded on the next request.
+        """
+        with self._regions_lock:
+            self._regions = None
+
     def execute(self, *args, **kwargs) -> str:
         """
-        Executes a civic coverage query.
+        Executes a coverage query.
 
         """
-        query_string: str = self.build_coverage_query(*args, **kwargs)
-        query_result = self._query_executor.execute(query_string)
+        if self._config.cache_regions():
+            try:
+                return self.build_response(self.match_regions(self._get_regions(), *args, **kwargs))
+            except (spatialdb.SpatialQueryException, SQLAlchemyError) as ex:
+                logger.warning('Unable to load the coverage regions, querying the database: {0}'.format(ex))
+
+        query, params = self.build_coverage_query(*args, **kwargs)
+        # No matching rows comes back as None, the responses are built from a list.
+        query_result = spatialdb._execute_query(self._engine, query, params) or []
         return self.build_response(query_result)
@@ -8,14 +8,85 @@
 Implementation for civic coverage resolver.
 """
 
+import threading
 from injector import inject
-from typing import Iterator, Dict, List
-import civvy.db.postgis.query as civvy_pg
+from typing import Iterator, Dict, List, Tuple
+from sqlalchemy import and_, or_
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import select, bindparam
 import lostservice.coverage.base as base
+import lostservice.db.spatial as spatialdb
+import lostservice.db.statements as statements
+import lostservice.db.tables as dbtables
 import lostservice.exception as exp
 import lostservice.model.civic as model
 
 
+# The civic address fields coverage regions are defined by, from the top down.
+CIVIC_LEVELS = ['country', 'a1', 'a2', 'a3', 'a4', 'a5']
+
+
+def _build_coverage_query(the_table):
+    """
+    Builds the query for the civic coverage regions matching the bound civic address.  A region
+    matches if each of its fields is either null or equal to the address's value, a missing
+    address value is bound as null so it only matches null fields.
+
+    :param the_table: The civic coverage table.
+    :type the_table: :py:class:`sqlalchemy.Table`
+    :return: The query.
+    :rtype: :py:class:`sqlalchemy.sql.expression.Select`
+    """
+    return select([the_table],
+                  and_(*[or_(the_table.c[level].is_(None), the_table.c[level] == bindparam(level))
+                         for level in CIVIC_LEVELS]))
+
+
+class CivicRegionTrie(object):
+    """
+    Trie over the civic coverage regions, one level per civic address field.  Fields that are null
+    in a region are stored under None, they match any address value.
+
+    :param rows: The coverage table rows.
+    :type rows: ``list`` of ``dict``
+    """
+    def __init__(self, rows):
+        """
+        Constructor.
+        """
+        super(CivicRegionTrie, self).__init__()
+        self._root = {}
+        self._count = 0
+        for row in rows or []:
+            node = self._root
+            for level in CIVIC_LEVELS[:-1]:
+                node = node.setdefault(row.get(level), {})
+            node.setdefault(row.get(CIVIC_LEVELS[-1]), []).append(row)
+            self._count += 1
+
+    def __len__(self):
+        return self._count
+
+    def match(self, civic_addr: model.CivicAddress) -> List[dict]:
+        """
+        Gets the regions matching the given address, the same rows as the coverage query.
+
+        :param civic_addr: The civic address model.
+        :return: Copies of the matching rows.
+        """
+        nodes = [self._root]
+        for level in CIVIC_LEVELS:
+            value = getattr(civic_addr, level, None) or None
+            children = []
+            for node in nodes:
+                if None in node:
+                    children.append(node[None])
+                if value is not None and value in node:
+                    children.append(node[value])
+            nodes = children
+        return [dict(row) for rows in nodes for row in rows]
+
+
 class CivicCoverageResolver(base.CoverageBase):
     """
     Class that implements civic coverage resolution
@@ -23,60 +94,69 @@ class CivicCoverageResolver(base.CoverageBase):
     """
 
     @inject
-    def __init__(self, cov_config: base.CoverageConfigWrapper, query_executor: civvy_pg.PgQueryExecutor):
+    def __init__(self, cov_config: base.CoverageConfigWrapper, engine: Engine):
         """
         Constructor
 
         :param cov_config: A reference to the CoverageConfig.
-        :param query_executor: An instance of a PgQueryExecutor that will perform the query.
+        :param engine: SQLAlchemy database engine.
+        :type engine: :py:class:`sqlalchemy.engine.Engine`
         """
-        super().__init__(cov_config, query_executor)
-        self._civic_address = None
+        super().__init__(cov_config, engine)
+        # The resolver is shared across requests, keep the address being resolved per thread.
+        self._state = threading.local()
 
-    def _build_where_clause(self, field_name: str=None, value: str=None, appending: bool=False) -> str:
+    @property
+    def _civic_address(self):
         """
-        Builds a where clause for the given target and value.
+        The civic address currently being resolved on this thread.
 
-        :param field_name: The target field to match.
-        :param value:  The value to match to.
-        :param appending: Whether this will be appending to an already existing where clause or not.
-        :return: The constructed where clause ready to be dropped into a query.
+        :return: :py:class:`lostservice.model.civic.CivicAddress`
         """
-        where_clause = ''
-        if field_name:
-            if appending:
-                where_clause += ' AND '
+        return getattr(self._state, 'civic_address', None)
 
-            if value:
-                where_clause += "(({0} IS NULL) OR ({0} = '{1}'))".format(field_name, value)
-            else:
-                where_clause += "({0} IS NULL)".format(field_name)
+    @_civic_address.setter
+    def _civic_address(self, value):
+        self._state.civic_address = value
 
-        return where_clause
-
-    def build_coverage_query(self, civic_addr: model.CivicAddress) -> str:
+    def build_coverage_query(self, civic_addr: model.CivicAddress) -> Tuple[object, dict]:
         """
-        Build the query string for the given address.
+        Build the query for the given address.
 
         :param civic_addr: The civic address model.
-        :return: The
+        :return: The query and the values of its bound parameters.
         """
         # cache the address so we can use it when building the response.
         self._civic_address = civic_addr
 
         table_name = self._config.civic_coverage_table()
-        where_clause = ''
+        the_table = dbtables.get_table(self._engine, table_name)
+        query = statements.statement_cache.get_statement(('civic_coverage', table_name),
+                                                         the_table,
+                                                         _build_coverage_query)
+
+        return query, {level: getattr(civic_addr, level, None) or None for level in CIVIC_LEVELS}
+
+    def load_regions(self) -> CivicRegionTrie:
+        """
+        Loads the civic coverage regions into a trie.
 
-        where_clause += self._build_where_clause('country', civic_addr.country)
-        where_clause += self._build_where_clause('a1', civic_addr.a1, appending=True)
-        where_clause += self._build_where_clause('a2', civic_addr.a2, appending=True)
-        where_clause += self._build_where_clause('a3', civic_addr.a3, appending=True)
-        where_clause += self._build_where_clause('a4', civic_addr.a4, appending=True)
-        where_clause += self._build_where_clause('a5', civic_addr.a5, appending=True)
+        :return: The trie.
+        """
+        the_table = dbtables.get_table(self._engine, self._config.civic_coverage_table())
+        return CivicRegionTrie(spatialdb._execute_query(self._engine, select([the_table])))
 
-        sql_query = "SELECT * FROM {0} WHERE ".format(table_name) + where_clause
+    def match_regions(self, regions: CivicRegionTrie, civic_addr: model.CivicAddress) -> List[dict]:
+        """
+        Finds the coverage regions matching the given address in the in-memory trie.
 
-        return sql_query
+        :param regions: The trie returned by load_regions.
+        :param civic_addr: The civic address model.
+        :return: The matching regions.
+        """
+        # cache the address so we can use it when building the response.
+        self._civic_address = civic_addr
+        return regions.match(civic_addr)
 
     def _get_address_depth(self) -> int:
         """
@@ -9,13 +9,38 @@ Implementation for geodetic coverage resolver.
 """
 
 from injector import inject
-from typing import Iterator
-import civvy.db.postgis.query as civvy_pg
+from typing import Iterator, List, Tuple
+from sqlalchemy import desc
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import select, bindparam
+from sqlalchemy.sql.functions import func
+from shapely import wkt as shapely_wkt
 import lostservice.coverage.base as base
+import lostservice.db.boundaryindex as boundaryindex
+import lostservice.db.spatial as spatialdb
+import lostservice.db.statements as statements
+import lostservice.db.tables as dbtables
 import lostservice.exception as exp
 import lostservice.model.geodetic as model
 
 
+def _build_coverage_query(the_table):
+    """
+    Builds the query for the coverage regions intersecting the bound geometry, deepest and largest
+    intersection first.
+
+    :param the_table: The geodetic coverage table.
+    :type the_table: :py:class:`sqlalchemy.Table`
+    :return: The query.
+    :rtype: :py:class:`sqlalchemy.sql.expression.Select`
+    """
+    geom = func.ST_GeomFromText(bindparam('wkt'), 4326)
+    st_area = func.ST_Area(func.ST_Intersection(geom, the_table.c.wkb_geometry)).label('st_area')
+    return select([the_table.c.depth, the_table.c.serviceurn, the_table.c.lostserver, st_area],
+                  func.ST_Intersects(geom, the_table.c.wkb_geometry))\
+        .order_by(desc(the_table.c.depth), desc(st_area))
+
+
 class GeodeticCoverageResolver(base.CoverageBase):
     """
     Class that implements geodetic coverage resolution
@@ -23,35 +48,57 @@ class GeodeticCoverageResolver(base.CoverageBase):
     """
 
     @inject
-    def __init__(self, cov_config: base.CoverageConfigWrapper, query_executor: civvy_pg.PgQueryExecutor):
+    def __init__(self, cov_config: base.CoverageConfigWrapper, engine: Engine):
         """
         Constructor
 
         :param cov_config: A reference to the CoverageConfig.
-        :param query_executor: An instance of a PgQueryExecutor that will perform the query.
+        :param engine: SQLAlchemy database engine.
+        :type engine: :py:class:`sqlalchemy.engine.Engine`
         """
-        super().__init__(cov_config, query_executor)
+        super().__init__(cov_config, engine)
 
-    def build_coverage_query(self, geometry_model: model.Geodetic2D) -> str:
+    def build_coverage_query(self, geometry_model: model.Geodetic2D) -> Tuple[object, dict]:
         """
-        Build the query string for the given geometry.
+        Build the query for the given geometry.
 
         :param geometry_model: The geometry model.
-        :return: The string to be used to perform the query.
+        :return: The query and the values of its bound parameters.
+        """
+        table_name = self._config.geodetic_coverage_table()
+        the_table = dbtables.get_table(self._engine, table_name)
+        query = statements.statement_cache.get_statement(('geodetic_coverage', table_name),
+                                                         the_table,
+                                                         _build_coverage_query)
+
+        return query, {'wkt': geometry_model.to_ogr_geometry().ExportToWkt()}
+
+    def load_regions(self) -> boundaryindex.BoundaryIndex:
+        """
+        Loads the geodetic coverage regions into a spatial index.
+
+        :return: The index.
         """
         table_name = self._config.geodetic_coverage_table()
-        wkt = geometry_model.to_ogr_geometry().ExportToWkt()
-
-        sql_str = (
-            """
-            select depth, serviceurn, lostserver, ST_Area(ST_Intersection(ST_GeomFromText('{0}', 4326), wkb_geometry))
-            from {1} 
-            where ST_Intersects(ST_GeomFromText('{0}', 4326), wkb_geometry)
-            order by depth desc, st_area desc
-            """
-        )
-
-        return sql_str.format(wkt, table_name)
+        the_table = dbtables.get_table(self._engine, table_name)
+        s = select([the_table.c.depth, the_table.c.serviceurn, the_table.c.lostserver, the_table.c.wkb_geometry])
+        return boundaryindex.BoundaryIndex(spatialdb._execute_query(self._engine, s))
+
+    def match_regions(self, regions: boundaryindex.BoundaryIndex, geometry_model: model.Geodetic2D) -> List[dict]:
+        """
+        Finds the coverage regions intersecting the given geometry in the in-memory index.
+
+        :param regions: The index returned by load_regions.
+        :param geometry_model: The geometry model.
+        :return: The matching regions ordered like the coverage query.
+        """
+        geometry = shapely_wkt.loads(geometry_model.to_ogr_geometry().ExportToWkt())
+        matches = []
+        for row, area in regions.intersecting(geometry):
+            del row['wkb_geometry']
+            row['st_area'] = area
+            matches.append(row)
+        return sorted(matches, key=lambda match: (match['depth'], match['st_area']), reverse=True)
 
     def build_response(self, result: Iterator[dict]) -> str:
         """
@@ -0,0 +1,408 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. currentmodule:: lostservice.db.boundaryindex
+.. moduleauthor:: Tom Weitzel <tweitzel@geo-comm.com>
+
+In-memory service boundary index.
+
+The service boundary tables change rarely, so for point containment (and proximity) queries
+the boundaries can be loaded once and searched locally with an STR tree and prepared
+geometries instead of going to PostGIS for every request.  An index is reloaded on
+a background thread when it gets old, requests keep using the old one until the
+new one is ready.
+"""
+
+import threading
+import time
+from enum import Enum
+from injector import inject
+from sqlalchemy.engine import Engine
+from geoalchemy2.shape import to_shape
+from shapely.prepared import prep
+from shapely.strtree import STRtree
+from osgeo import ogr
+from lostservice.configuration import Configuration
+from lostservice.configuration import general_logger
+from lostservice.db.gisdb import GisDbInterface
+import lostservice.db.spatial as spatialdb
+import lostservice.geometry as gc_geom
+from lostservice.model.geodetic import Point
+logger = general_logger()
+
+
+class SpatialIndexModeEnum(Enum):
+    """
+    Enumeration of where point containment queries are answered.
+
+    Database - Every query goes to PostGIS.
+    InMemory - Point containment queries are answered from an in-memory index.
+    """
+    Database = 1
+    InMemory = 2
+
+
+def spatial_index_mode(config: Configuration):
+    """
+    Gets the configured spatial index mode.
+
+    :param config: The configuration object.
+    :type config: :py:class:`lostservice.configuration.Configuration`
+    :return: The spatial index mode, defaults to Database.
+    :rtype: :py:class:`SpatialIndexModeEnum`
+    """
+    mode = config.get('Database', 'spatial_index', as_object=False, required=False)
+    try:
+        return SpatialIndexModeEnum[mode] if mode else SpatialIndexModeEnum.Database
+    except KeyError:
+        logger.warning('Unknown spatial_index setting {0}, using Database.'.format(mode))
+        return SpatialIndexModeEnum.Database
+
+
+class BoundaryIndex(object):
+    """
+    Spatial index over the rows of a single service boundary table.
+
+    :param rows: The table rows, as returned by the containment query (all columns plus the GML).
+    :type rows: ``list`` of ``dict``
+    """
+    def __init__(self, rows):
+        """
+        Constructor.
+        """
+        super(BoundaryIndex, self).__init__()
+        self._rows = []
+        self._prepared = []
+        self._geometries = []
+        for row in rows or []:
+            geometry = to_shape(row['wkb_geometry'])
+            self._rows.append(row)
+            self._prepared.append(prep(geometry))
+            self._geometries.append(geometry)
+
+        self._positions = {id(geometry): position for position, geometry in enumerate(self._geometries)}
+        self._tree = STRtree(self._geometries) if self._geometries else None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _candidates(self, geometry):
+        """
+        Gets the positions of the rows whose envelope intersects the given geometry.
+
+        :param geometry: The search geometry.
+        :type geometry: :py:class:`shapely.geometry.base.BaseGeometry`
+        :return: The row positions in load order.
+        :rtype: ``list`` of ``int``
+        """
+        if self._tree is None:
+            return []
+
+        # Older versions of Shapely hand back the geometries, newer ones their positions.
+        positions = []
+        for hit in self._tree.query(geometry):
+            position = self._positions.get(id(hit))
+            positions.append(int(hit) if position is None else position)
+        return sorted(positions)
+
+    def containing(self, point):
+        """
+        Gets the rows whose boundary contains the given point.
+
+        :param point: The point, in the same spatial reference as the table.
+        :type point: :py:class:`shapely.geometry.Point`
+        :return: Copies of the matching rows, or None if nothing matched (just like the database queries).
+        :rtype: ``list`` of ``dict``
+        """
+        results = [dict(self._rows[position])
+                   for position in self._candidates(point)
+                   if self._prepared[position].contains(point)]
+        return results if results else None
+
+    def intersecting(self, geometry):
+        """
+        Gets the rows whose boundary intersects the given geometry along with the area of the intersection.
+
+        :param geometry: The geometry, in the same spatial reference as the table.
+        :type geometry: :py:class:`shapely.geometry.base.BaseGeometry`
+        :return: Copies of the matching rows and their intersection areas, in load order.
+        :rtype: ``list`` of ``tuple``
+        """
+        return [(dict(self._rows[position]), self._geometries[position].intersection(geometry).area)
+                for position in self._candidates(geometry)
+                if self._prepared[position].intersects(geometry)]
+
+    def containing_or_nearby(self, point, search_area, measure_area=None):
+        """
+        Gets the rows whose boundary contains the given point or, when none do, the rows whose boundary
+        intersects the search area around it, closest first.  Like the database query each row gets the
+        :py:data:`lostservice.db.spatial.CONTAINED` flag and its DISTANCE from the point.
+
+        :param point: The point, in the same spatial reference as the table.
+        :type point: :py:class:`shapely.geometry.Point`
+        :param search_area: Function returning the area to search around the point, only called when
+                            nothing contains the point.
+        :type search_area: ``callable``
+        :param measure_area: Function measuring the part of a nearby boundary inside the search area,
+                             None leaves the AREA_RET column out.
+        :type measure_area: ``callable``
+        :return: Copies of the matching rows, or None if nothing matched (just like the database queries).
+        :rtype: ``list`` of ``dict``
+        """
+        results = self.containing(point)
+        if results:
+            for row in results:
+                row[spatialdb.CONTAINED] = True
+                row['DISTANCE'] = 0.0
+                if measure_area is not None:
+                    row['AREA_RET'] = None
+            return results
+
+        area = search_area()
+        results = []
+        for position in self._candidates(area):
+            if not self._prepared[position].intersects(area):
+                continue
+            geometry = self._geometries[position]
+            row = dict(self._rows[position])
+            row[spatialdb.CONTAINED] = False
+            row['DISTANCE'] = geometry.distance(point)
+            if measure_area is not None:
+                row['AREA_RET'] = measure_area(geometry.intersection(area))
+            results.append(row)
+        results.sort(key=lambda row: row['DISTANCE'])
+        return results if results else None
+
+
+class InMemoryGisDbInterface(GisDbInterface):
+    """
+    GisDbInterface that answers point containment and proximity queries from in-memory boundary
+    indexes, everything else goes to the database.
+    """
+    @inject
+    def __init__(self, config: Configuration, engine: Engine, mapping_engine=None, clock=time.monotonic):
+        """
+        Constructor.
+
+        :param config: The configuration object.
+        :type config: :py:class:`lostservice.configuration.Configuration`
+        :param engine: SQLAlchemy database engine.
+        :type engine: :py:class:`sqlalchemy.engine.Engine`
+        :param mapping_engine: SQLAlchemy database engine for the service urn to table mappings, defaults to engine.
+        :type mapping_engine: :py:class:`sqlalchemy.engine.Engine`
+        :param clock: Function returning the current time in seconds.
+        :type clock: ``callable``
+        """
+        super(InMemoryGisDbInterface, self).__init__(config, engine, mapping_engine)
+        self._clock = clock
+        self._refresh_seconds = self._boundary_index_refresh_seconds()
+        self._lock = threading.Lock()
+        self._refresh_locks = {}
+        self._indexes = {}
+        self._loaded_at = {}
+
+    def _boundary_index_refresh_seconds(self):
+        """
+        Gets how old a boundary index can get before it is reloaded.
+
+        :return: The number of seconds, defaults to 3600.
+        :rtype: ``float``
+        """
+        refresh = self._config.get('Database', 'boundary_index_refresh_seconds', as_object=False, required=False)
+        try:
+            return float(refresh) if refresh is not None else 3600.0
+        except (TypeError, ValueError):
+            return 3600.0
+
+    def _load_index(self, boundary_table):
+        """
+        Loads all of the boundaries from a table into a new index.
+
+        :param boundary_table: The name of the service boundary table.
+        :type boundary_table: `str`
+        :return: The index.
+        :rtype: :py:class:`BoundaryIndex`
+        """
+        # Same columns as the database containment query so the results are identical.
+        index = BoundaryIndex(self.iterate_boundaries(boundary_table))
+        logger.info('Loaded {0} boundaries from {1} into the in-memory index.'.format(len(index), boundary_table))
+        return index
+
+    def _store_indexes(self, indexes, loaded_at):
+        """
+        Swaps new indexes in all at once along with the time they were loaded, readers keep using
+        the old ones until then.
+
+        :param indexes: The new indexes by table name.
+        :type indexes: ``dict``
+        :param loaded_at: The time the indexes were loaded.
+        :type loaded_at: ``float``
+        """
+        with self._lock:
+            current = dict(self._indexes)
+            current.update(indexes)
+            self._indexes = current
+            for boundary_table in indexes:
+                self._loaded_at[boundary_table] = loaded_at
+
+    def _refresh_lock(self, boundary_table):
+        """
+        Gets the lock held while the index for a table is being loaded, so each table loads
+        independently of the others.
+
+        :param boundary_table: The name of the service boundary table.
+        :type boundary_table: `str`
+        :rtype: :py:class:`threading.Lock`
+        """
+        lock = self._refresh_locks.get(boundary_table)
+        if lock is None:
+            with self._lock:
+                lock = self._refresh_locks.setdefault(boundary_table, threading.Lock())
+        return lock
+
+    def _get_index(self, boundary_table):
+        """
+        Gets the index for a table, loading it on first use and reloading it in the background
+        when it is older than the refresh interval.
+
+        :param boundary_table: The name of the service boundary table.
+        :type boundary_table: `str`
+        :return: The index.
+        :rtype: :py:class:`BoundaryIndex`
+        """
+        index = self._indexes.get(boundary_table)
+        if index is None:
+            with self._refresh_lock(boundary_table):
+                index = self._indexes.get(boundary_table)
+                if index is None:
+                    index = self._load_index(boundary_table)
+                    self._store_indexes({boundary_table: index}, self._clock())
+        elif self._refresh_seconds and \
+                self._clock() - self._loaded_at.get(boundary_table, 0.0) >= self._refresh_seconds:
+            self._refresh_in_background(boundary_table)
+        return index
+
+    def _refresh_in_background(self, boundary_table):
+        """
+        Starts reloading the index for a table on another thread, unless that table is already being reloaded.
+
+        :param boundary_table: The name of the service boundary table.
+        :type boundary_table: `str`
+        """
+        lock = self._refresh_lock(boundary_table)
+        if not lock.acquire(blocking=False):
+            return
+        try:
+            threading.Thread(target=self._background_refresh, args=(boundary_table, lock),
+                             name='boundary-index-refresh', daemon=True).start()
+        except Exception:
+            lock.release()
+            raise
+
+    def _background_refresh(self, boundary_table, lock):
+        """
+        Reloads the index for a table, keeping the current one if that fails.  Releases the lock
+        taken by :py:meth:`_refresh_in_background`.
+
+        :param boundary_table: The name of the service boundary table.
+        :type boundary_table: `str`
+        :param lock: The refresh lock for the table.
+        :type lock: :py:class:`threading.Lock`
+        """
+        try:
+            self._store_indexes({boundary_table: self._load_index(boundary_table)}, self._clock())
+        except Exception as ex:
+            logger.warning('Unable to refresh the boundary index for {0}, keeping the current one: {1}'
+                           .format(boundary_table, ex))
+            with self._lock:
+                self._loaded_at[boundary_table] = self._clock()
+        finally:
+            lock.release()
+
+    def preload_tables(self):
+        """
+        Reflects the tables and loads the boundary indexes for all of the service boundary tables.
+        """
+        super(InMemoryGisDbInterface, self).preload_tables()
+        for boundary_table in self.get_urn_table_mappings().values():
+            self._get_index(boundary_table)
+
+    def refresh_tables(self, table_names=None):
+        """
+        Re-reflects the tables and rebuilds their boundary indexes.
+
+        :param table_names: The tables to refresh, if None all known tables are refreshed.
+        :type table_names: ``list`` of ``str``
+        """
+        super(InMemoryGisDbInterface, self).refresh_tables(table_names)
+        refreshed = {}
+        for boundary_table in (table_names if table_names is not None else list(self._indexes.keys())):
+            refreshed[boundary_table] = self._load_index(boundary_table)
+        self._store_indexes(refreshed, self._clock())
+
+    def get_containing_boundaries_for_points(self, locations, boundary_table):
+        """
+        Executes a contains query for each of a batch of points against the in-memory index.
+
+        :param locations: location objects.
+        :type locations: ``list`` of :py:class:Geodetic2D
+        :param boundary_table: The name of the service boundary table.
+        :type boundary_table: `str`
+        :return: For each point, a list of dictionaries containing the contents of returned rows.
+        :rtype: ``list``
+        """
+        index = self._get_index(boundary_table)
+        return [index.containing(to_shape(location.to_wkbelement(project_to=4326))) for location in locations]
+
+    def get_containing_boundary_for_point(self, location: Point, boundary_table, add_data_requested=False, buffer_distance=None,
+                                          result_limit=None):
+        """
+        Executes a contains query for a point against the in-memory index.
+
+        :param location: location object.
+        :type location: :py:class:Geodetic2D
+        :param boundary_table: The name of the service boundary table.
+        :type boundary_table: `str`
+        :param result_limit: The most boundaries to return, None for all of them.
+        :type result_limit: `int`
+        :return: A list of dictionaries containing the contents of returned rows.
+        """
+        if add_data_requested:
+            # Nearest boundary queries still go to the database.
+            return super(InMemoryGisDbInterface, self).get_containing_boundary_for_point(
+                location, boundary_table, add_data_requested=add_data_requested, buffer_distance=buffer_distance,
+                result_limit=result_limit)
+
+        point = to_shape(location.to_wkbelement(project_to=4326))
+        results = self._get_index(boundary_table).containing(point)
+        if results and result_limit is not None:
+            results = results[:result_limit]
+        return results
+
+    def get_containing_or_nearby_boundaries_for_point(self, location: Point, boundary_table, proximity_buffer,
+                                                      return_area=False):
+        """
+        Executes a contains query for a point against the in-memory index, falling back to a proximity search.
+
+        :param location: location object.
+        :type location: :py:class:Geodetic2D
+        :param boundary_table: The name of the service boundary table.
+        :type boundary_table: `str`
+        :param proximity_buffer: The distance to search around the point, in meters.
+        :type proximity_buffer: `float`
+        :param return_area: Flag which triggers an area calculation on the nearby polygons.
+        :type return_area: `bool`
+        :return: A list of dictionaries containing the contents of returned rows.
+        """
+        point = to_shape(location.to_wkbelement(project_to=4326))
+        utmsrid = gc_geom.getutmsrid(point.x, point.y)
+
+        # The search area is buffered in UTM and the areas measured there, the same as the database query.
+        def search_area():
+            return to_shape(gc_geom.transform_circle(point.x, point.y, 4326, proximity_buffer, None))
+
+        def measure_area(geometry):
+            return gc_geom.reproject_geom(ogr.CreateGeometryFromWkb(geometry.wkb), 4326, utmsrid).GetArea()
+
+        return self._get_index(boundary_table).containing_or_nearby(point, search_area,
+                                                                    measure_area if return_area else None)
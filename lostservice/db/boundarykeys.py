@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. currentmodule:: lostservice.db.boundarykeys
+.. moduleauthor:: Tom Weitzel <tweitzel@geo-comm.com>
+
+Index from service boundary key (srcunqid) to the table and row holding it.
+
+getServiceBoundary only has the boundary key to go on, so without an index every
+service boundary table has to be searched until the key turns up.  The keys and
+primary keys of all of the boundaries are small, so they are loaded once and the
+request can go straight to the right row.
+"""
+
+import threading
+import time
+from sqlalchemy.sql import select
+from lostservice.configuration import general_logger
+import lostservice.db.spatial as spatialdb
+import lostservice.db.tables as dbtables
+logger = general_logger()
+
+
+class BoundaryKeyIndex(object):
+    """
+    Thread-safe index from boundary key to (table name, primary key values).  Readers use
+    whatever index is current while a new one is loaded, it is swapped in all at once.
+
+    :param engine: SQLAlchemy database engine.
+    :type engine: :py:class:`sqlalchemy.engine.Engine`
+    :param refresh_seconds: How old the index can get before it is reloaded, 0 never reloads it.
+    :type refresh_seconds: ``float``
+    :param clock: Function returning the current time in seconds.
+    :type clock: ``callable``
+    :param query_pool: Pool to load the tables on concurrently, None loads them one after another.
+    :type query_pool: :py:class:`lostservice.db.concurrency.QueryPool`
+    :param table_source: Function returning the names of the tables to reload from, None reloads
+                         the tables last loaded.
+    :type table_source: ``callable``
+    """
+    def __init__(self, engine, refresh_seconds=300.0, clock=time.monotonic, query_pool=None, table_source=None):
+        """
+        Constructor.
+        """
+        super(BoundaryKeyIndex, self).__init__()
+        self._engine = engine
+        self._refresh_seconds = refresh_seconds
+        self._clock = clock
+        self._query_pool = query_pool
+        self._table_source = table_source
+        self._load_lock = threading.Lock()
+        self._keys = None
+        self._table_names = None
+        self._loaded_at = None
+
+    @property
+    def loaded(self):
+        """
+        Whether or not the index has been loaded.
+
+        :rtype: ``bool``
+        """
+        return self._keys is not None
+
+    def __len__(self):
+        keys = self._keys
+        return len(keys) if keys is not None else 0
+
+    def _load_table(self, table_name):
+        """
+        Reads the keys of one table.
+
+        :return: The primary key values of the rows for each key.
+        :rtype: ``dict``
+        """
+        the_table = dbtables.get_table(self._engine, table_name)
+        pk_columns = list(the_table.primary_key.columns)
+        keys = {}
+        for row in spatialdb._iterate_query(self._engine, select([the_table.c.srcunqid] + pk_columns)):
+            key = row['srcunqid']
+            if key is not None:
+                keys.setdefault(key, []).append({column.name: row[column.name] for column in pk_columns})
+        return keys
+
+    def load(self, table_names):
+        """
+        Loads the index for the given tables, searched in order.
+
+        :param table_names: The names of the service boundary tables.
+        :type table_names: ``list`` of ``str``
+        """
+        table_names = list(table_names)
+        if self._query_pool is None:
+            table_keys = [self._load_table(table_name) for table_name in table_names]
+        else:
+            table_keys = self._query_pool.map(self._load_table, table_names)
+
+        # Keys already in the index from an earlier table win.
+        keys = {}
+        for table_name, primary_keys in zip(table_names, table_keys):
+            for key, rows in primary_keys.items():
+                if key not in keys:
+                    keys[key] = (table_name, rows)
+        self._keys = keys
+        self._table_names = table_names
+        self._loaded_at = self._clock()
+        logger.info('Loaded {0} boundary keys from {1} tables.'.format(len(keys), len(table_names)))
+
+    def _refresh_if_stale(self):
+        """
+        Starts reloading the index when it is older than the refresh interval.
+        """
+        if self._refresh_seconds and self._clock() - self._loaded_at >= self._refresh_seconds:
+            self._refresh_in_background()
+
+    def _refresh_in_background(self):
+        """
+        Starts reloading the index on another thread, unless that is already under way.
+        """
+        if not self._load_lock.acquire(blocking=False):
+            return
+        try:
+            threading.Thread(target=self._background_refresh, name='boundary-key-refresh', daemon=True).start()
+        except Exception:
+            self._load_lock.release()
+            raise
+
+    def _background_refresh(self):
+        """
+        Reloads the index from the current tables, keeping the current index if that fails.  Releases
+        the lock taken by :py:meth:`_refresh_in_background`.
+        """
+        try:
+            self.load(self._table_source() if self._table_source is not None else self._table_names)
+        except Exception as ex:
+            logger.warning('Unable to refresh the boundary key index, keeping the current one: {0}'.format(ex))
+            self._loaded_at = self._clock()
+        finally:
+            self._load_lock.release()
+
+    def lookup(self, key):
+        """
+        Finds the table and rows for a boundary key.
+
+        :param key: The boundary key.
+        :type key: ``str``
+        :return: The table name and a list of primary key values for the rows, or None if the key isn't known.
+        :rtype: ``tuple``
+        """
+        if self._keys is None:
+            raise LookupError('The boundary key index has not been loaded.')
+        self._refresh_if_stale()
+        return self._keys.get(key)
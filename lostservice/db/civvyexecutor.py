@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. currentmodule:: lostservice.db.civvyexecutor
+.. moduleauthor:: Tom Weitzel <tweitzel@geo-comm.com>
+
+civvy query executor on the shared connection pool.
+
+civvy opens a connection of its own for each civic address query.  This executor
+hands it a connection from the pool of the GIS database engine instead, so the civic
+queries share pool_size, the connection checks and the statement timeout with the
+spatial queries and show up in the same pool counters.
+"""
+
+from civvy.db.postgis.query import PgQueryExecutor
+
+
+class PooledConnection(object):
+    """
+    A DBAPI connection checked out of an engine's pool.  It behaves like the connection itself,
+    except that closing it, or leaving the ``with`` block it was used in, returns it to the pool.
+
+    :param connection: The pooled connection, from :py:meth:`sqlalchemy.engine.Engine.raw_connection`.
+    """
+    def __init__(self, connection):
+        """
+        Constructor.
+        """
+        super(PooledConnection, self).__init__()
+        self._connection = connection
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Like a psycopg2 connection the transaction ends with the block, the connection goes back to the pool too.
+        try:
+            if exc_type is None:
+                self._connection.commit()
+            else:
+                self._connection.rollback()
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Returns the connection to the pool, it can't be used after that.
+        """
+        if not self._closed:
+            self._closed = True
+            self._connection.close()
+
+
+class PooledPgQueryExecutor(PgQueryExecutor):
+    """
+    :py:class:`civvy.db.postgis.query.PgQueryExecutor` that takes its connections from an engine's pool.
+
+    :param engine: SQLAlchemy database engine for the GIS database.
+    :type engine: :py:class:`sqlalchemy.engine.Engine`
+    """
+    def __init__(self, engine, **kwargs):
+        """
+        Constructor.
+
+        :param kwargs: The connection settings civvy's executor takes (host, port, database, user, password).
+        """
+        super(PooledPgQueryExecutor, self).__init__(**kwargs)
+        self._engine = engine
+
+    def connect(self):
+        """
+        Checks a connection out of the engine's pool.
+
+        :return: The connection, closing it returns it to the pool.
+        :rtype: :py:class:`PooledConnection`
+        """
+        return PooledConnection(self._engine.raw_connection())
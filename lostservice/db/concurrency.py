@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. currentmodule:: lostservice.db.concurrency
+.. moduleauthor:: Tom Weitzel <tweitzel@geo-comm.com>
+
+Concurrent execution of independent spatial queries.
+
+The database layer is synchronous (SQLAlchemy connections), so queries are run
+concurrently by handing them to a bounded pool of threads, each checking out its
+own pooled connection.  A request that needs several independent queries (one per
+boundary table, for instance) waits about as long as the slowest of them rather
+than the sum.  The threads are shared by every request, each request runs only a
+few of its queries at once and runs them itself when all of the threads are busy.
+
+Queries that have not started when a request times out are cancelled.  Queries
+already running can't be interrupted from another thread, they finish in the
+background and their results are dropped.
+"""
+
+import functools
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_EXCEPTION, TimeoutError
+from lostservice.exception import InternalErrorException
+from lostservice.configuration import general_logger
+logger = general_logger()
+
+
+class QueryTimeoutException(InternalErrorException):
+    """
+    Raised when concurrent queries don't finish within the request timeout.
+
+    :param message: The exception message
+    :type message:  ``str``
+    :param nested: Nested exception, if any.
+    :type nested:
+    """
+    def __init__(self, message, nested=None):
+        super(QueryTimeoutException, self).__init__(message, nested)
+
+
+class QueryPool(object):
+    """
+    Bounded pool of threads running queries.  The threads are started on first use, and
+    started over in a process forked after that since threads don't survive a fork.
+
+    The pool is shared by every request of the process.  Each set of queries (each call to
+    :py:meth:`gather`, :py:meth:`map` or :py:meth:`first`) gets its own limit of max_workers
+    queries at once, so one request can't take every thread.  When every thread is busy a
+    query runs on the calling thread instead of queueing behind the other requests, so
+    nested sets of queries can't deadlock the pool either.
+
+    :param max_workers: The most queries of one set run at once, 1 (or less) runs them one after another on
+                        the calling thread.
+    :type max_workers: ``int``
+    :param timeout: The default number of seconds to wait for a set of queries, None waits for as long as they take.
+    :type timeout: ``float``
+    :param threads: The number of threads shared by every set of queries, size it to the connection pool
+                    so the threads don't wait for connections, defaults to max_workers.
+    :type threads: ``int``
+    """
+    def __init__(self, max_workers=4, timeout=None, threads=None):
+        """
+        Constructor.
+        """
+        super(QueryPool, self).__init__()
+        self._max_workers = max_workers
+        self._timeout = timeout
+        self._threads = max(threads if threads is not None else max_workers, 1)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._busy = 0
+
+    @property
+    def max_workers(self):
+        """
+        The most queries of one set run at once.
+
+        :rtype: ``int``
+        """
+        return self._max_workers
+
+    @property
+    def threads(self):
+        """
+        The number of threads shared by every set of queries.
+
+        :rtype: ``int``
+        """
+        return self._threads
+
+    def _get_executor(self):
+        """
+        Gets the executor for this process, creating it on first use.
+        """
+        pid = os.getpid()
+        if self._executor is None or self._pid != pid:
+            with self._lock:
+                if self._executor is None or self._pid != pid:
+                    # An executor inherited from the parent process has no threads behind it, drop it.
+                    self._executor = ThreadPoolExecutor(max_workers=self._threads)
+                    self._pid = pid
+                    self._busy = 0
+        return self._executor
+
+    def _reserve_thread(self):
+        """
+        Reserves one of the threads for a query.
+
+        :return: Whether or not a thread was free.
+        :rtype: ``bool``
+        """
+        self._get_executor()
+        with self._lock:
+            if self._busy >= self._threads:
+                return False
+            self._busy += 1
+            return True
+
+    def _release_thread(self):
+        with self._lock:
+            self._busy -= 1
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Starts running a query on one of the threads, it waits for a thread if they are all busy.
+
+        :param fn: The function running the query.
+        :type fn: ``callable``
+        :return: The future for the result.
+        :rtype: :py:class:`concurrent.futures.Future`
+        """
+        return self._get_executor().submit(fn, *args, **kwargs)
+
+    @staticmethod
+    def _acquire(slots, deadline):
+        """
+        Waits for a set of queries to have a free slot.
+
+        :param slots: The semaphore limiting the queries of the set.
+        :type slots: :py:class:`threading.BoundedSemaphore`
+        :param deadline: When to give up waiting, None waits for as long as it takes.
+        :type deadline: ``float``
+        :return: Whether or not a slot came free before the deadline.
+        :rtype: ``bool``
+        """
+        return slots.acquire(timeout=max(deadline - time.monotonic(), 0) if deadline is not None else None)
+
+    def _start(self, call, slots):
+        """
+        Starts a query of a set in the slot acquired for it, on one of the threads if one is free
+        and on the calling thread if not.  The slot is released when the query is done.
+
+        :param call: The function running the query, called without arguments.
+        :type call: ``callable``
+        :param slots: The semaphore limiting the queries of the set.
+        :type slots: :py:class:`threading.BoundedSemaphore`
+        :return: The future for the result, already done for a query run on the calling thread.
+        :rtype: :py:class:`concurrent.futures.Future`
+        """
+        if self._reserve_thread():
+            try:
+                future = self._get_executor().submit(call)
+            except Exception:
+                self._release_thread()
+                slots.release()
+                raise
+            future.add_done_callback(lambda done: self._finished(slots))
+            return future
+
+        future = Future()
+        try:
+            future.set_result(call())
+        except Exception as ex:
+            future.set_exception(ex)
+        finally:
+            slots.release()
+        return future
+
+    def _finished(self, slots):
+        """
+        Frees the thread and the slot of a query that has finished (or was cancelled).
+        """
+        self._release_thread()
+        slots.release()
+
+    def _deadline(self, timeout):
+        """
+        Gets the time a set of queries has to finish by.
+        """
+        timeout = self._timeout if timeout is None else timeout
+        return timeout, (time.monotonic() + timeout if timeout is not None else None)
+
+    def gather(self, calls, timeout=None):
+        """
+        Runs independent queries concurrently and waits for all of them.
+
+        :param calls: The functions running the queries, called without arguments.
+        :type calls: ``list`` of ``callable``
+        :param timeout: The number of seconds to wait, defaults to the pool's timeout.
+        :type timeout: ``float``
+        :return: The results, in the order of the calls.
+        :rtype: ``list``
+        """
+        calls = list(calls)
+        if self._max_workers <= 1 or len(calls) <= 1:
+            return [call() for call in calls]
+
+        timeout, deadline = self._deadline(timeout)
+        slots = threading.BoundedSemaphore(self._max_workers)
+        futures = []
+        for call in calls:
+            if not self._acquire(slots, deadline):
+                break
+            future = self._start(call, slots)
+            futures.append(future)
+            if future.done() and future.exception() is not None:
+                # No point starting the rest.
+                break
+
+        remaining = max(deadline - time.monotonic(), 0) if deadline is not None else None
+        done, not_done = wait(futures, timeout=remaining, return_when=FIRST_EXCEPTION)
+        failed = [future for future in done if future.exception() is not None]
+        unfinished = len(not_done) + len(calls) - len(futures)
+        if failed or unfinished:
+            for future in not_done:
+                future.cancel()
+            if failed:
+                # Report the first query that failed, in call order.
+                raise next(future for future in futures if future in failed).exception()
+            raise QueryTimeoutException(
+                '{0} of {1} queries did not finish within {2} seconds.'.format(unfinished, len(calls), timeout))
+        return [future.result() for future in futures]
+
+    def map(self, fn, items, timeout=None):
+        """
+        Runs a query for each item concurrently.
+
+        :param fn: The function running the query, called with one item.
+        :type fn: ``callable``
+        :param items: The items, e.g. table names.
+        :type items: ``iterable``
+        :param timeout: The number of seconds to wait, defaults to the pool's timeout.
+        :type timeout: ``float``
+        :return: The results, in the order of the items.
+        :rtype: ``list``
+        """
+        return self.gather([functools.partial(fn, item) for item in items], timeout)
+
+    def first(self, calls, timeout=None):
+        """
+        Runs alternative queries concurrently and gets the first result, in call order, that
+        has rows.  Once it is in, the later queries that haven't started are cancelled or
+        not started at all.
+
+        :param calls: The functions running the queries, called without arguments.
+        :type calls: ``list`` of ``callable``
+        :param timeout: The number of seconds to wait, defaults to the pool's timeout.
+        :type timeout: ``float``
+        :return: The first result with rows, or None if none of them have any.
+        """
+        calls = list(calls)
+        if self._max_workers <= 1 or len(calls) <= 1:
+            for call in calls:
+                result = call()
+                if result:
+                    return result
+            return None
+
+        timeout, deadline = self._deadline(timeout)
+        slots = threading.BoundedSemaphore(self._max_workers)
+        futures = []
+        try:
+            for call in calls:
+                if not self._acquire(slots, deadline):
+                    raise QueryTimeoutException('Queries did not finish within {0} seconds.'.format(timeout))
+                # An earlier query may have answered while waiting for the slot.
+                found, result = self._leading_result(futures)
+                if found:
+                    slots.release()
+                    return result
+                futures.append(self._start(call, slots))
+
+            for future in futures:
+                try:
+                    result = future.result(max(deadline - time.monotonic(), 0) if deadline is not None else None)
+                except TimeoutError as ex:
+                    raise QueryTimeoutException('Queries did not finish within {0} seconds.'.format(timeout), ex)
+                if result:
+                    return result
+            return None
+        finally:
+            for future in futures:
+                future.cancel()
+
+    @staticmethod
+    def _leading_result(futures):
+        """
+        Looks for a result with rows among the queries started so far that no earlier query can beat.
+
+        :return: Whether or not there is one, and the result.
+        :rtype: ``tuple``
+        """
+        for future in futures:
+            if not future.done():
+                return False, None
+            result = future.result()
+            if result:
+                return True, result
+        return False, None
+
+    def shutdown(self, wait=True):
+        """
+        Stops the threads once the queries already submitted have run.
+
+        :param wait: Whether or not to wait for them.
+        :type wait: ``bool``
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=wait)
@@ -0,0 +1,496 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. currentmodule:: lostservice.db.connections
+.. moduleauthor:: Tom Weitzel <tweitzel@geo-comm.com>
+
+The pooled connections to the GIS database.
+
+The pool is sized and tuned from the Database section of the configuration, checks
+connections before handing them out, retires them once they get old and keeps
+counters of how many are checked out, how many requests are waiting for one and
+how long they waited.
+
+With read replicas configured the spatial lookups get an engine of their own whose
+pool opens its connections on the replicas in turn.  A replica that can't be reached
+is left out for a while, and when none can be reached the connections go to the
+primary.  Coverage and mapping discovery can be pinned to the primary.
+"""
+
+import itertools
+import threading
+import time
+from injector import inject
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+from lostservice.configuration import Configuration
+from lostservice.configuration import general_logger
+logger = general_logger()
+
+# What the queries of a database engine are for, see :py:class:`EngineRouter`.
+LOOKUPS = 'lookups'
+COVERAGE = 'coverage'
+MAPPINGS = 'mappings'
+
+
+class PoolMetrics(object):
+    """
+    Thread-safe counters for a connection pool.
+    """
+    def __init__(self):
+        """
+        Constructor.
+        """
+        super(PoolMetrics, self).__init__()
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waiting = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self.disconnects = 0
+
+    def start_wait(self):
+        """
+        Records a request starting to wait for a connection.
+
+        :return: When it started.
+        :rtype: ``float``
+        """
+        with self._lock:
+            self.waiting += 1
+        return time.monotonic()
+
+    def end_wait(self, started, timed_out=False):
+        """
+        Records a request done waiting for a connection.
+
+        :param started: When it started waiting.
+        :type started: ``float``
+        :param timed_out: Whether or not it gave up without a connection.
+        :type timed_out: ``bool``
+        """
+        waited = time.monotonic() - started
+        with self._lock:
+            self.waiting -= 1
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def disconnected(self):
+        """
+        Records a dead connection found by the health check.
+        """
+        with self._lock:
+            self.disconnects += 1
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    A :py:class:`sqlalchemy.pool.QueuePool` keeping :py:class:`PoolMetrics`.
+    """
+    def __init__(self, creator, **kw):
+        """
+        Constructor.
+        """
+        super(InstrumentedQueuePool, self).__init__(creator, **kw)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        started = self.metrics.start_wait()
+        try:
+            connection = super(InstrumentedQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            self.metrics.end_wait(started, timed_out=True)
+            raise
+        except Exception:
+            self.metrics.end_wait(started)
+            raise
+        self.metrics.end_wait(started)
+        return connection
+
+    def recreate(self):
+        pool = super(InstrumentedQueuePool, self).recreate()
+        # Keep counting across engine.dispose().
+        pool.metrics = self.metrics
+        return pool
+
+    def stats(self):
+        """
+        Gets the pool counters.
+
+        :return: The pool size, connections checked out, overflow, requests waiting, checkouts,
+                 timeouts, dead connections and the total and longest wait for a connection.
+        :rtype: ``dict``
+        """
+        metrics = self.metrics
+        return {'size': self.size(),
+                'checked_out': self.checkedout(),
+                'overflow': max(self.overflow(), 0),
+                'waiting': metrics.waiting,
+                'checkouts': metrics.checkouts,
+                'timeouts': metrics.timeouts,
+                'disconnects': metrics.disconnects,
+                'wait_seconds': metrics.wait_seconds,
+                'max_wait_seconds': metrics.max_wait_seconds}
+
+
+class PoolConfigWrapper(object):
+    """
+    A wrapper object for the connection pool settings in the Database section.
+
+    :param config: The configuration object.
+    :type config: :py:class:`lostservice.configuration.Configuration`
+    """
+    @inject
+    def __init__(self, config: Configuration):
+        """
+        Constructor.
+        """
+        super(PoolConfigWrapper, self).__init__()
+        self._config = config
+
+    def _number(self, option, default, convert):
+        value = self._config.get('Database', option, as_object=False, required=False)
+        try:
+            return convert(value) if value is not None else default
+        except (TypeError, ValueError):
+            return default
+
+    def pool_size(self) -> int:
+        """
+        The number of connections kept open.
+
+        :return: The number of connections, defaults to 5.
+        """
+        return max(self._number('pool_size', 5, int), 1)
+
+    def max_overflow(self) -> int:
+        """
+        The number of connections opened beyond the pool size under load, closed again when returned.
+
+        :return: The number of connections, defaults to 10.
+        """
+        return max(self._number('pool_max_overflow', 10, int), 0)
+
+    def pool_timeout(self) -> float:
+        """
+        How long to wait for a connection when they are all checked out.
+
+        :return: The number of seconds, defaults to 30.
+        """
+        return self._number('pool_timeout_seconds', 30.0, float)
+
+    def pool_recycle(self) -> int:
+        """
+        How old a connection can get before it is closed and replaced.
+
+        :return: The number of seconds, defaults to 1800, -1 never replaces them.
+        """
+        return self._number('pool_recycle_seconds', 1800, int)
+
+    def pre_ping(self) -> bool:
+        """
+        Whether or not to check a connection is alive before handing it out, see :py:meth:`pre_ping_idle`
+        for which ones are checked.  With the checks off dead connections surface as failed queries.
+
+        :return: Defaults to True.
+        """
+        value = self._config.get('Database', 'pool_pre_ping', as_object=False, required=False)
+        if value is None:
+            return True
+        return str(value).strip().lower() not in ('false', 'no', 'off', '0')
+
+    def pre_ping_idle(self) -> float:
+        """
+        How long a connection has to have sat in the pool before it is checked, connections
+        used more recently than that are handed out as they are.  The check is a round trip to
+        the server, so under load most connections aren't checked.
+
+        :return: The number of seconds, defaults to 30, 0 checks every connection.
+        """
+        return max(self._number('pool_pre_ping_idle_seconds', 30.0, float), 0.0)
+
+    def statement_timeout(self) -> int:
+        """
+        How long a statement can run before the server cancels it.
+
+        :return: The number of milliseconds, 0 (the default) for no limit.
+        """
+        return max(self._number('statement_timeout_ms', 0, int), 0)
+
+    def replica_eject_seconds(self) -> float:
+        """
+        How long a read replica that can't be reached is left out.
+
+        :return: The number of seconds, defaults to 30.
+        """
+        return self._number('replica_eject_seconds', 30.0, float)
+
+    def pinned_to_primary(self) -> set:
+        """
+        What always goes to the primary when there are read replicas, any of coverage and mappings.
+
+        :return: Defaults to mappings.
+        """
+        value = self._config.get('Database', 'pin_to_primary', as_object=False, required=False)
+        if value is None:
+            return {MAPPINGS}
+        return {purpose.strip().lower() for purpose in str(value).split(',') if purpose.strip()}
+
+
+def _ping_on_checkout(pool, metrics, idle_seconds=0.0):
+    """
+    Checks connections that have been idle for at least idle_seconds before they are handed out,
+    dead ones are replaced.
+    """
+    @event.listens_for(pool, 'checkin')
+    def checked_in(dbapi_connection, connection_record):
+        if connection_record is not None:
+            connection_record.info['checked_in_at'] = time.monotonic()
+
+    @event.listens_for(pool, 'checkout')
+    def ping(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get('checked_in_at')
+        if idle_seconds and (checked_in_at is None or time.monotonic() - checked_in_at < idle_seconds):
+            # New and recently used connections are taken to be alive.
+            return
+        try:
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except Exception as ex:
+            metrics.disconnected()
+            logger.warning('Dropping a dead database connection: {0}'.format(ex))
+            # The pool discards the connection and tries again with a new one.
+            raise exc.DisconnectionError() from ex
+
+
+def create_pooled_engine(connection_string, settings: PoolConfigWrapper):
+    """
+    Creates an engine for the GIS database with a tuned, instrumented connection pool.
+
+    :param connection_string: The database URL.
+    :type connection_string: ``str``
+    :param settings: The pool settings.
+    :type settings: :py:class:`PoolConfigWrapper`
+    :return: The engine, its pool is an :py:class:`InstrumentedQueuePool`.
+    :rtype: :py:class:`sqlalchemy.engine.Engine`
+    """
+    return _create_engine(connection_string, settings, connect_args=_connect_args(connection_string, settings))
+
+
+def _connect_args(connection_string, settings):
+    """
+    Gets the arguments for opening connections beyond those in the database URL.
+    """
+    connect_args = {}
+    statement_timeout = settings.statement_timeout()
+    if statement_timeout and connection_string.startswith('postgresql'):
+        connect_args['options'] = '-c statement_timeout={0}'.format(statement_timeout)
+    return connect_args
+
+
+def _create_engine(connection_string, settings, **kwargs):
+    engine = create_engine(connection_string,
+                           poolclass=InstrumentedQueuePool,
+                           pool_size=settings.pool_size(),
+                           max_overflow=settings.max_overflow(),
+                           pool_timeout=settings.pool_timeout(),
+                           pool_recycle=settings.pool_recycle(),
+                           **kwargs)
+    if settings.pre_ping():
+        _ping_on_checkout(engine.pool, engine.pool.metrics, settings.pre_ping_idle())
+    return engine
+
+
+class _Endpoint(object):
+    """
+    Opens DBAPI connections to one database server.
+    """
+    def __init__(self, connection_string, connect_args):
+        """
+        Constructor.
+        """
+        super(_Endpoint, self).__init__()
+        url = make_url(connection_string)
+        dialect_class = url.get_dialect()
+        self._dialect = dialect_class(dbapi=dialect_class.dbapi())
+        self._cargs, self._cparams = self._dialect.create_connect_args(url)
+        self._cparams.update(connect_args)
+        self.name = repr(url)
+        self.ejected_until = 0.0
+
+    def connect(self):
+        return self._dialect.connect(*self._cargs, **self._cparams)
+
+
+class ReplicaSet(object):
+    """
+    Opens connections on the read replicas in turn.  A replica that fails to connect is left out
+    for a while, when all of them are left out connections are opened on the primary.
+
+    :param replica_strings: The database URLs of the replicas.
+    :type replica_strings: ``list`` of ``str``
+    :param primary_string: The database URL of the primary.
+    :type primary_string: ``str``
+    :param eject_seconds: How long a replica that fails to connect is left out.
+    :type eject_seconds: ``float``
+    :param connect_args: Arguments for opening connections beyond those in the database URLs.
+    :type connect_args: ``dict``
+    :param clock: Function returning the current time in seconds.
+    :type clock: ``callable``
+    """
+    def __init__(self, replica_strings, primary_string, eject_seconds=30.0, connect_args=None, clock=time.monotonic):
+        """
+        Constructor.
+        """
+        super(ReplicaSet, self).__init__()
+        self._replicas = [_Endpoint(replica, connect_args or {}) for replica in replica_strings]
+        self._primary = _Endpoint(primary_string, connect_args or {})
+        self._eject_seconds = eject_seconds
+        self._clock = clock
+        self._turn = itertools.count()
+
+    def healthy(self):
+        """
+        Gets the replicas not left out at the moment.
+
+        :rtype: ``list`` of ``str``
+        """
+        now = self._clock()
+        return [replica.name for replica in self._replicas if replica.ejected_until <= now]
+
+    def connect(self):
+        """
+        Opens a connection on the next replica able to take it, or the primary.
+
+        :return: A DBAPI connection.
+        """
+        start = next(self._turn) % len(self._replicas)
+        for replica in self._replicas[start:] + self._replicas[:start]:
+            if replica.ejected_until > self._clock():
+                continue
+            try:
+                return replica.connect()
+            except Exception as ex:
+                replica.ejected_until = self._clock() + self._eject_seconds
+                logger.warning('Leaving out read replica {0} for {1} seconds: {2}'.format(
+                    replica.name, self._eject_seconds, ex))
+        logger.warning('No read replica is available, connecting to the primary.')
+        return self._primary.connect()
+
+
+def create_replica_engine(primary_string, replica_strings, settings: PoolConfigWrapper):
+    """
+    Creates an engine for read-only queries whose connections are spread over the read replicas.
+
+    :param primary_string: The database URL of the primary.
+    :type primary_string: ``str``
+    :param replica_strings: The database URLs of the replicas.
+    :type replica_strings: ``list`` of ``str``
+    :param settings: The pool settings.
+    :type settings: :py:class:`PoolConfigWrapper`
+    :return: The engine, its pool is an :py:class:`InstrumentedQueuePool`.
+    :rtype: :py:class:`sqlalchemy.engine.Engine`
+    """
+    replicas = ReplicaSet(replica_strings, primary_string, settings.replica_eject_seconds(),
+                          _connect_args(primary_string, settings))
+    engine = _create_engine(primary_string, settings, creator=replicas.connect)
+    engine.replicas = replicas
+    return engine
+
+
+class EngineRouter(object):
+    """
+    Picks the engine for a kind of query, the primary or the read replicas.
+
+    :param primary: The engine for the primary.
+    :type primary: :py:class:`sqlalchemy.engine.Engine`
+    :param replica: The engine for the read replicas, None when there are none.
+    :type replica: :py:class:`sqlalchemy.engine.Engine`
+    :param pinned: What always goes to the primary, any of :py:data:`COVERAGE` and :py:data:`MAPPINGS`.
+    :type pinned: ``set``
+    """
+    def __init__(self, primary, replica=None, pinned=frozenset()):
+        """
+        Constructor.
+        """
+        super(EngineRouter, self).__init__()
+        self._primary = primary
+        self._replica = replica
+        self._pinned = frozenset(pinned)
+        self._discarded = []
+
+    @property
+    def primary(self):
+        """
+        The engine for the primary.
+
+        :rtype: :py:class:`sqlalchemy.engine.Engine`
+        """
+        return self._primary
+
+    def engine_for(self, purpose):
+        """
+        Gets the engine for a kind of query.
+
+        :param purpose: One of :py:data:`LOOKUPS`, :py:data:`COVERAGE` or :py:data:`MAPPINGS`.
+        :type purpose: ``str``
+        :rtype: :py:class:`sqlalchemy.engine.Engine`
+        """
+        if self._replica is None or purpose in self._pinned:
+            return self._primary
+        return self._replica
+
+    def _engines(self):
+        return [self._primary] if self._replica is None else [self._primary, self._replica]
+
+    def stats(self):
+        """
+        Gets the counters of the connection pools, see :py:func:`pool_stats`.
+
+        :return: The counters of the primary pool and, when there are read replicas, the replica pool.
+        :rtype: ``dict``
+        """
+        stats = {'primary': pool_stats(self._primary)}
+        if self._replica is not None:
+            stats['replica'] = pool_stats(self._replica)
+        return stats
+
+    def dispose(self):
+        """
+        Closes the pooled connections of the engines, a pre-forking server calls this in the parent
+        right before each fork so the child doesn't inherit open connections.
+        """
+        for engine in self._engines():
+            engine.dispose()
+
+    def discard(self):
+        """
+        Starts the engines over with new, empty pools without closing the pooled connections, for a
+        process forked from the one that opened them.  Closing the connections would end the database
+        sessions of that process as well, so the old pools are held on to rather than garbage collected.
+        """
+        for engine in self._engines():
+            self._discarded.append(engine.pool)
+            engine.pool = engine.pool.recreate()
+
+
+def pool_stats(engine):
+    """
+    Gets the counters of an engine's connection pool.
+
+    :param engine: SQLAlchemy database engine.
+    :type engine: :py:class:`sqlalchemy.engine.Engine`
+    :return: The counters, or None if the pool doesn't keep any.
+    :rtype: ``dict``
+    """
+    pool = engine.pool
+    return pool.stats() if isinstance(pool, InstrumentedQueuePool) else None
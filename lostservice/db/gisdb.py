@@ -8,17 +8,29 @@
 Database wrapper class(es)
 """
 
+import contextlib
+import functools
+import threading
 from injector import inject
 from sqlalchemy import create_engine
 from sqlalchemy.engine import Engine
 from lostservice.configuration import Configuration
 import lostservice.db.spatial as spatialdb
-import lostservice.db.utilities as dbutilities
+import lostservice.db.tables as dbtables
+from lostservice.db.boundarykeys import BoundaryKeyIndex
+from lostservice.db.concurrency import QueryPool
+from lostservice.db.connections import PoolConfigWrapper
+from lostservice.db.urnmappings import UrnMappingService
+from lostservice.configuration import general_logger
 from lostservice.model.geodetic import Point
 from lostservice.model.geodetic import Circle
 from lostservice.model.geodetic import Ellipse
 from lostservice.model.geodetic import Polygon
 from lostservice.model.geodetic import Arcband
+logger = general_logger()
+
+# Marks a point with no boundaries fetched ahead for it.
+_NOT_PREFETCHED = object()
 
 
 class GisDbInterface(object):
@@ -26,26 +38,228 @@ class GisDbInterface(object):
     Wrapper class for DB functions.
     """
     @inject
-    def __init__(self, config: Configuration, engine: Engine):
+    def __init__(self, config: Configuration, engine: Engine, mapping_engine=None):
         """
         Constructor.
 
         :param config: The configuration object.
         :type config: :py:class:`lostservice.configuration.Configuration`
+        :param engine: SQLAlchemy database engine for the spatial lookups.
+        :type engine: :py:class:`sqlalchemy.engine.Engine`
+        :param mapping_engine: SQLAlchemy database engine for the service urn to table mappings, defaults to engine.
+        :type mapping_engine: :py:class:`sqlalchemy.engine.Engine`
         """
         self._config = config
         self._engine = engine
+        self._mapping_engine = mapping_engine if mapping_engine is not None else engine
+        self._urn_mappings = UrnMappingService(self._mapping_engine, self._urn_mapping_refresh_seconds(),
+                                               self._urn_mapping_table())
+        # One thread per pooled connection, more would only wait for connections.
+        pool_settings = PoolConfigWrapper(config)
+        self._query_pool = QueryPool(self._query_concurrency(), self._query_timeout_seconds(),
+                                     pool_settings.pool_size() + pool_settings.max_overflow())
+        self._boundary_keys = BoundaryKeyIndex(engine, self._boundary_key_refresh_seconds(),
+                                               query_pool=self._query_pool,
+                                               table_source=lambda: self.get_urn_table_mappings().values())
+        self._prefetched = threading.local()
+
+    @property
+    def query_pool(self):
+        """
+        The pool running independent queries concurrently.
+
+        :rtype: :py:class:`lostservice.db.concurrency.QueryPool`
+        """
+        return self._query_pool
+
+    def _query_concurrency(self):
+        """
+        Gets the most independent queries a request runs at once.
+
+        :return: The number of queries, defaults to 4.
+        :rtype: ``int``
+        """
+        concurrency = self._config.get('Database', 'query_concurrency', as_object=False, required=False)
+        try:
+            return max(int(concurrency), 1) if concurrency is not None else 4
+        except (TypeError, ValueError):
+            return 4
+
+    def _query_timeout_seconds(self):
+        """
+        Gets how long a request waits for its concurrent queries.
+
+        :return: The number of seconds, defaults to 30.
+        :rtype: ``float``
+        """
+        timeout = self._config.get('Database', 'query_timeout_seconds', as_object=False, required=False)
+        try:
+            return float(timeout) if timeout is not None else 30.0
+        except (TypeError, ValueError):
+            return 30.0
+
+    def _urn_mapping_refresh_seconds(self):
+        """
+        Gets how old the service urn to table mappings can get before they are rediscovered.
+
+        :return: The number of seconds, defaults to 300.
+        :rtype: ``float``
+        """
+        refresh = self._config.get('Database', 'urn_mapping_refresh_seconds', as_object=False, required=False)
+        try:
+            return float(refresh) if refresh is not None else 300.0
+        except (TypeError, ValueError):
+            return 300.0
+
+    def _urn_mapping_table(self):
+        """
+        Gets the name of the table listing the service urn to table mappings, if one is configured.
+
+        :return: The table name or None.
+        :rtype: ``str``
+        """
+        mapping_table = self._config.get('Database', 'urn_mapping_table', as_object=False, required=False)
+        return mapping_table if mapping_table and isinstance(mapping_table, str) else None
+
+    def _boundary_key_refresh_seconds(self):
+        """
+        Gets how old the boundary key index can get before it is reloaded.
+
+        :return: The number of seconds, defaults to 300.
+        :rtype: ``float``
+        """
+        refresh = self._config.get('Database', 'boundary_key_refresh_seconds', as_object=False, required=False)
+        try:
+            return float(refresh) if refresh is not None else 300.0
+        except (TypeError, ValueError):
+            return 300.0
 
     def get_urn_table_mappings(self):
         """
-        Inspects the database and extracts the service urn to table mappings.
+        Gets the current service urn to table mappings, they are rediscovered in the background
+        as they get old.
 
-        :return: A dictionary containing the service URNs as keys and associated table names as values
+        :return: A read-only dictionary containing the service URNs as keys and associated table names as values
         :rtype: ``dict``
         """
-        return dbutilities.get_urn_table_mappings(self._engine)
+        return self._urn_mappings.get()
 
-    def get_containing_boundary_for_point(self, location: Point, boundary_table, add_data_requested=False, buffer_distance=None):
+    def _boundary_table_names(self):
+        """
+        Gets the names of all of the tables the spatial queries run against, that is the
+        service boundary tables plus the additional data table (if configured).
+
+        :return: The table names.
+        :rtype: ``list`` of ``str``
+        """
+        table_names = list(self.get_urn_table_mappings().values())
+        additional_data_table = self._config.get('AddtionalData', 'data_table', as_object=False, required=False)
+        if additional_data_table and additional_data_table not in table_names:
+            table_names.append(additional_data_table)
+        availability_view = self._service_availability_view()
+        if availability_view and availability_view not in table_names:
+            table_names.append(availability_view)
+        return table_names
+
+    def _service_availability_view(self):
+        """
+        Gets the name of the consolidated service availability view listServicesByLocation queries
+        run against, if one is configured.
+
+        :return: The view name or None.
+        :rtype: ``str``
+        """
+        view = self._config.get('Database', 'service_availability_view', as_object=False, required=False)
+        return view if view and isinstance(view, str) else None
+
+    def preload_tables(self):
+        """
+        Reflects all of the boundary and additional data tables into the table registry.
+        """
+        dbtables.registry.preload(self._engine, self._boundary_table_names())
+        self._boundary_keys.load(self.get_urn_table_mappings().values())
+
+    def refresh_tables(self, table_names=None):
+        """
+        Re-reflects tables in the table registry, to be called when the boundary data has been reloaded.
+
+        :param table_names: The tables to refresh, if None all known tables are refreshed.
+        :type table_names: ``list`` of ``str``
+        """
+        self._urn_mappings.refresh()
+        dbtables.registry.refresh(self._engine, table_names)
+        self._boundary_keys.load(self.get_urn_table_mappings().values())
+
+    def get_containing_boundaries_for_points(self, locations, boundary_table):
+        """
+        Executes one contains query for a batch of points.
+
+        :param locations: location objects.
+        :type locations: ``list`` of :py:class:Geodetic2D
+        :param boundary_table: The name of the service boundary table.
+        :type boundary_table: `str`
+        :return: For each point, a list of dictionaries containing the contents of returned rows or None.
+        :rtype: ``list``
+        """
+        return spatialdb.get_containing_boundaries_for_points(locations, boundary_table, self._engine)
+
+    def get_containing_boundaries_for_tables(self, location: Point, boundary_tables):
+        """
+        Executes the contains query for one point against several service boundary tables at once.
+
+        :param location: location object.
+        :type location: :py:class:Geodetic2D
+        :param boundary_tables: The names of the service boundary tables.
+        :type boundary_tables: ``list`` of `str`
+        :return: For each table, a list of dictionaries containing the contents of returned rows or None.
+        :rtype: ``list``
+        """
+        # Tables fetched ahead for the point on this thread aren't queried again.
+        results = [self._get_prefetched_point_boundaries(location, boundary_table) for boundary_table in boundary_tables]
+        missing = [boundary_table for boundary_table, rows in zip(boundary_tables, results) if rows is _NOT_PREFETCHED]
+        if missing:
+            fetched = iter(self._query_pool.map(functools.partial(self.get_containing_boundary_for_point, location),
+                                                missing))
+            results = [next(fetched) if rows is _NOT_PREFETCHED else rows for rows in results]
+        return results
+
+    @contextlib.contextmanager
+    def prefetched_point_boundaries(self, location, boundary_table, rows):
+        """
+        Answers the contains query for the given point and table with boundaries fetched ahead, e.g. by
+        :py:meth:`get_containing_boundaries_for_points`, while the context is active on this thread.
+
+        :param location: The location object the boundaries were fetched for.
+        :type location: :py:class:Geodetic2D
+        :param boundary_table: The name of the service boundary table.
+        :type boundary_table: `str`
+        :param rows: The boundaries containing the point, None or empty if there aren't any.
+        :type rows: ``list`` of ``dict``
+        """
+        previous = getattr(self._prefetched, 'points', None)
+        points = dict(previous) if previous else {}
+        points[(id(location), boundary_table)] = (location, rows)
+        self._prefetched.points = points
+        try:
+            yield
+        finally:
+            self._prefetched.points = previous
+
+    def _get_prefetched_point_boundaries(self, location, boundary_table):
+        """
+        Gets the boundaries fetched ahead for the given point and table.
+
+        :return: The boundaries, or _NOT_PREFETCHED if there are none for this point.
+        """
+        points = getattr(self._prefetched, 'points', None)
+        if points:
+            prefetched = points.get((id(location), boundary_table))
+            if prefetched is not None and prefetched[0] is location:
+                return prefetched[1]
+        return _NOT_PREFETCHED
+
+    def get_containing_boundary_for_point(self, location: Point, boundary_table, add_data_requested=False, buffer_distance=None,
+                                          result_limit=None):
         """
         Executes a contains query for a point.
 
@@ -53,9 +267,47 @@ class GisDbInterface(object):
         :type location: :py:class:Geodetic2D
         :param boundary_table: The name of the service boundary table.
         :type boundary_table: `str`
+        :param result_limit: The most boundaries to return, None for all of them.
+        :type result_limit: `int`
         :return: A list of dictionaries containing the contents of returned rows.
         """
-        return spatialdb.get_containing_boundary_for_point(location, boundary_table, self._engine, add_data_required=add_data_requested, buffer_distance=buffer_distance)
+        if not add_data_requested:
+            results = self._get_prefetched_point_boundaries(location, boundary_table)
+            if results is not _NOT_PREFETCHED:
+                if results and result_limit is not None:
+                    results = results[:result_limit]
+                return results
+
+        return spatialdb.get_containing_boundary_for_point(location, boundary_table, self._engine, add_data_required=add_data_requested, buffer_distance=buffer_distance,
+                                                           result_limit=result_limit)
+
+    def get_containing_or_nearby_boundaries_for_point(self, location: Point, boundary_table, proximity_buffer,
+                                                      return_area=False):
+        """
+        Executes a contains query for a point, falling back to a proximity search in the same query.
+
+        :param location: location object.
+        :type location: :py:class:Geodetic2D
+        :param boundary_table: The name of the service boundary table.
+        :type boundary_table: `str`
+        :param proximity_buffer: The distance to search around the point, in meters.
+        :type proximity_buffer: `float`
+        :param return_area: Flag which triggers an area calculation on the nearby polygons.
+        :type return_area: `bool`
+        :return: A list of dictionaries containing the contents of returned rows.
+        """
+        results = self._get_prefetched_point_boundaries(location, boundary_table)
+        if results:
+            # Only the nearby search is left to the query when nothing contains the point.
+            for row in results:
+                row[spatialdb.CONTAINED] = True
+                row['DISTANCE'] = 0.0
+                if return_area:
+                    row['AREA_RET'] = None
+            return results
+
+        return spatialdb.get_containing_or_nearby_boundaries_for_point(location, boundary_table, self._engine,
+                                                                      proximity_buffer, return_area)
 
     def get_containing_boundary_for_circle(self, long, lat, srid, radius, uom, boundary_table):
         """
@@ -78,7 +330,9 @@ class GisDbInterface(object):
                                                return_area: bool=False,
                                                return_shape: bool=False,
                                                proximity_search: bool=False,
-                                               proximity_buffer = 0):
+                                               proximity_buffer = 0,
+                                               result_limit=None,
+                                               order_by_area=False):
         """
         Executes an intersection query for a circle.
 
@@ -88,6 +342,10 @@ class GisDbInterface(object):
         :type boundary_table: `str`
         :param return_area: Flag which triggers an area calculation on the Intersecting polygons
         :type boundary_table: `bool`
+        :param result_limit: The most boundaries to return, None for all of them.
+        :type result_limit: `int`
+        :param order_by_area: Whether to return the boundaries with the largest intersection area first.
+        :type order_by_area: `bool`
         :return: A list of dictionaries containing the contents of returned rows.
         """
         return spatialdb.get_intersecting_boundaries_for_circle(location,
@@ -96,7 +354,9 @@ class GisDbInterface(object):
                                                                 return_area,
                                                                 return_shape,
                                                                 proximity_search,
-                                                                proximity_buffer)
+                                                                proximity_buffer,
+                                                                result_limit,
+                                                                order_by_area)
 
     def get_containing_boundary_for_polygon(self, points, srid, boundary_table):
         """
@@ -115,7 +375,9 @@ class GisDbInterface(object):
     def get_intersecting_boundaries_for_polygon(self, location: Polygon,
                                                 boundary_table,
                                                 proximity_search = False,
-                                                proximity_buffer = 0 ):
+                                                proximity_buffer = 0,
+                                                result_limit=None,
+                                                order_by_area=False):
         """
         Executes an intersection query for a polygon.
 
@@ -123,6 +385,10 @@ class GisDbInterface(object):
         :type location: :py:class:Geodetic2D
         :param boundary_table: The name of the service boundary table.
         :type boundary_table: `str`
+        :param result_limit: The most boundaries to return, None for all of them.
+        :type result_limit: `int`
+        :param order_by_area: Whether to return the boundaries with the largest intersection area first.
+        :type order_by_area: `bool`
         :return: A list of dictionaries containing the contents of returned rows.
         """
         return spatialdb.get_intersecting_boundaries_for_polygon(location,
@@ -130,7 +396,9 @@ class GisDbInterface(object):
                                                                  self._engine,
                                                                  True,
                                                                  proximity_search,
-                                                                 proximity_buffer)
+                                                                 proximity_buffer,
+                                                                 result_limit,
+                                                                 order_by_area)
 
     def get_additionaldata_for_polygon(self, location: Polygon, boundary_table, buffer_distance ):
         """
@@ -155,7 +423,77 @@ class GisDbInterface(object):
         """
         return spatialdb.get_boundaries_for_previous_id(pid, self._engine, boundary_table)
 
-    def get_intersecting_boundary_for_ellipse(self, location: Ellipse, boundary_table):
+    def load_boundary_shape(self, mapping):
+        """
+        Adds the boundary geometry and GML to a mapping found without them.  Mappings that
+        already have the GML, or that can't be traced back to their row, are left as they are.
+
+        :param mapping: A mapping row from one of the service boundary queries.
+        :type mapping: ``dict``
+        :return: The mapping.
+        :rtype: ``dict``
+        """
+        boundary_ref = mapping.get(spatialdb.BOUNDARY_REF)
+        if boundary_ref is None or 'ST_AsGML_1' in mapping:
+            return mapping
+
+        boundary_table, primary_key = boundary_ref
+        rows = spatialdb.get_boundary_for_primary_key(primary_key, self._engine, boundary_table)
+        if rows:
+            mapping['wkb_geometry'] = rows[0].get('wkb_geometry')
+            mapping['ST_AsGML_1'] = rows[0].get('ST_AsGML_1')
+        return mapping
+
+    def iterate_boundaries(self, boundary_table):
+        """
+        Streams every boundary of a table along with its geometry and GML.
+
+        :param boundary_table: The name of the service boundary table.
+        :type boundary_table: `str`
+        :return: Dictionaries containing the contents of the rows.
+        :rtype: ``generator``
+        """
+        return spatialdb.iterate_boundaries(self._engine, boundary_table)
+
+    def _scan_boundaries_for_id(self, pid):
+        """
+        Searches the service boundary tables for boundaries with the given ID, the first table
+        in order with any wins.  The tables are searched concurrently, the ones after the winner
+        that haven't been searched yet are skipped.
+        """
+        return self._query_pool.first([functools.partial(self.get_boundaries_for_previous_id, pid, boundary_table)
+                                       for boundary_table in self.get_urn_table_mappings().values()])
+
+    def get_boundaries_for_id(self, pid):
+        """
+        Gets the boundaries with the given ID (srcunqid) from whichever service boundary table holds
+        them, using the boundary key index to go straight to the table and row.  IDs that aren't in
+        the index are searched for table by table.
+
+        :param pid: The boundary ID.
+        :type pid: ``str``
+        :return: A list of dictionaries containing the contents of returned rows, or None if not found.
+        """
+        if not self._boundary_keys.loaded:
+            try:
+                self._boundary_keys.load(self.get_urn_table_mappings().values())
+            except Exception as ex:
+                logger.warning('Unable to load the boundary key index, searching every table: {0}'.format(ex))
+                return self._scan_boundaries_for_id(pid)
+
+        entry = self._boundary_keys.lookup(pid)
+        if entry is None:
+            # Patterns, and boundaries added since the index was loaded, aren't in the index.
+            return self._scan_boundaries_for_id(pid)
+
+        boundary_table, primary_keys = entry
+        if len(primary_keys) == 1 and primary_keys[0]:
+            return spatialdb.get_boundary_for_primary_key(primary_keys[0], self._engine, boundary_table)
+        # Tables without a primary key, or several rows sharing the ID.
+        return self.get_boundaries_for_previous_id(pid, boundary_table)
+
+    def get_intersecting_boundary_for_ellipse(self, location: Ellipse, boundary_table, result_limit=None,
+                                              order_by_area=False):
         """
         Executes an intersection query for a ellipse.
 
@@ -163,9 +501,14 @@ class GisDbInterface(object):
         :type location: :py:class:Geodetic2D
         :param boundary_table: The name of the service boundary table.
         :type boundary_table: `str`
+        :param result_limit: The most boundaries to return, None for all of them.
+        :type result_limit: `int`
+        :param order_by_area: Whether to return the boundaries with the largest intersection area first.
+        :type order_by_area: `bool`
         :return: A list of dictionaries containing the contents of returned rows.
         """
-        return spatialdb.get_intersecting_boundary_for_ellipse(location, boundary_table, self._engine)
+        return spatialdb.get_intersecting_boundary_for_ellipse(location, boundary_table, self._engine, result_limit,
+                                                               order_by_area)
 
     def get_additional_data_for_ellipse(self,location: Ellipse, boundary_table, buffer_distance):
         """
@@ -185,11 +528,12 @@ class GisDbInterface(object):
 
         :param location: location object
         :type location: :py:class:Geodetic2D
-        :param boundary_table: The name of the service boundary table.
-        :type boundary_table: `str`
+        :param boundary_table: The names of the service boundary tables, all queried at once.
+        :type boundary_table: ``list`` of ``str``
         :return: A list of dictionaries containing the contents of returned rows.
         """
-        return spatialdb.get_list_service_for_point(location, boundary_table, self._engine)
+        return spatialdb.get_list_service_for_point(location, boundary_table, self._engine,
+                                                    availability_view=self._service_availability_view())
 
     def get_intersecting_list_service_for_circle(self, location: Circle, boundary_table, return_area=False,
                                                  return_shape=False, proximity_search=False, proximity_buffer=0):
@@ -198,27 +542,29 @@ class GisDbInterface(object):
 
         :param location: location object
         :type location: :py:class:Geodetic2D
-        :param boundary_table: The name of the service boundary table.
-        :type boundary_table: `str`
+        :param boundary_table: The names of the service boundary tables, all queried at once.
+        :type boundary_table: ``list`` of ``str``
         :param return_area: Flag which triggers an area calculation on the Intersecting polygons
         :type return_area: `bool`
         :return: A list of dictionaries containing the contents of returned rows.
         """
         return spatialdb.get_intersecting_list_services_for_circle(location, boundary_table,
                                                                    self._engine, return_area, return_shape,
-                                                                   proximity_search, proximity_buffer)
+                                                                   proximity_search, proximity_buffer,
+                                                                   availability_view=self._service_availability_view(),
+                                                                   query_pool=self._query_pool)
 
     def get_list_services_for_ellipse(self, location: Ellipse, boundary_table):
         """
 
         :param location: location object
         :type location: :py:class:Geodetic2D
-        :param boundary_table: The name of the service boundary table.
-        :type boundary_table: `str`
+        :param boundary_table: The names of the service boundary tables, all queried at once.
+        :type boundary_table: ``list`` of ``str``
         :return: 
         """
-        return spatialdb.get_list_services_for_ellipse(location, boundary_table,
-                                                       self._engine, )
+        return spatialdb.get_list_services_for_ellipse(location, boundary_table, self._engine,
+                                                       availability_view=self._service_availability_view())
 
     def get_intersecting_list_service_for_polygon(self, location: Polygon,
                                                   boundary_table,
@@ -229,8 +575,8 @@ class GisDbInterface(object):
 
         :param location: location object
         :type location: :py:class:Geodetic2D
-        :param boundary_table: The name of the service boundary table.
-        :type boundary_table: `str`
+        :param boundary_table: The names of the service boundary tables, all queried at once.
+        :type boundary_table: ``list`` of ``str``
         :param proximity_search: Whether or not to allow the proximity buffer to be included in the search.
         :type proximity_search: `bool`
         :param proximity_buffer: A buffer around the polygon to search for extra results around the area.
@@ -239,7 +585,9 @@ class GisDbInterface(object):
         """
 
         return spatialdb.get_intersecting_list_service_for_polygon(location, boundary_table, self._engine, False,
-                                                                   proximity_search, proximity_buffer)
+                                                                   proximity_search, proximity_buffer,
+                                                                   availability_view=self._service_availability_view(),
+                                                                   query_pool=self._query_pool)
 
     def get_additional_data_for_circle(self, location: Circle, boundary_table, buffer_distance):
         """
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. currentmodule:: lostservice.db.rows
+.. moduleauthor:: Tom Weitzel <tweitzel@geo-comm.com>
+
+Compact rows for query results.
+
+Every row of a result shares one :py:class:`ResultHeader` mapping the column names
+to their positions, and keeps its values in the tuple it came back in, so reading
+a result doesn't build a keys list and a dict for each row.  A :py:class:`Row` is
+a mutable mapping, the handlers add and change keys (expiration, GML, ...) as they
+always have; the changes are kept next to the values without copying them.
+"""
+
+from collections.abc import MutableMapping
+
+# Marks a column removed from a row.
+_DELETED = object()
+
+
+class ResultHeader(object):
+    """
+    The column names of a result and their positions, shared by all of its rows.
+
+    :param keys: The column names, in order.
+    :type keys: ``list`` of ``str``
+    """
+    __slots__ = ('keys', 'index')
+
+    def __init__(self, keys):
+        """
+        Constructor.
+        """
+        self.keys = tuple(keys)
+        self.index = {key: position for position, key in enumerate(self.keys)}
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class Row(MutableMapping):
+    """
+    A result row backed by a tuple of values and the header of its result.
+
+    :param header: The header shared by the rows of the result.
+    :type header: :py:class:`ResultHeader`
+    :param values: The values of the row, in header order.
+    :type values: ``tuple``
+    """
+    __slots__ = ('_header', '_values', '_changes')
+
+    def __init__(self, header, values):
+        """
+        Constructor.
+        """
+        self._header = header
+        self._values = values
+        self._changes = None
+
+    def __getitem__(self, key):
+        changes = self._changes
+        if changes is not None and key in changes:
+            value = changes[key]
+            if value is _DELETED:
+                raise KeyError(key)
+            return value
+        position = self._header.index.get(key)
+        if position is None:
+            raise KeyError(key)
+        return self._values[position]
+
+    def get(self, key, default=None):
+        changes = self._changes
+        if changes is None:
+            position = self._header.index.get(key)
+            return default if position is None else self._values[position]
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        changes = self._changes
+        if changes is not None and key in changes:
+            return changes[key] is not _DELETED
+        return key in self._header.index
+
+    def __setitem__(self, key, value):
+        if self._changes is None:
+            self._changes = {}
+        self._changes[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key in self._header.index:
+            self[key] = _DELETED
+        else:
+            del self._changes[key]
+
+    def __iter__(self):
+        changes = self._changes
+        if changes is None:
+            return iter(self._header.keys)
+        return self._iter_changed()
+
+    def _iter_changed(self):
+        changes = self._changes
+        index = self._header.index
+        for key in self._header.keys:
+            if changes.get(key) is not _DELETED:
+                yield key
+        for key, value in list(changes.items()):
+            if key not in index and value is not _DELETED:
+                yield key
+
+    def __len__(self):
+        if self._changes is None:
+            return len(self._header.keys)
+        return sum(1 for _ in self._iter_changed())
+
+    def copy(self):
+        """
+        Gets a plain dictionary copy of the row.
+
+        :rtype: ``dict``
+        """
+        return dict(self.items())
+
+    def __repr__(self):
+        return 'Row({0!r})'.format(self.copy())
+
+
+def materialize(result):
+    """
+    Reads all of the rows of a SQLAlchemy result.
+
+    :param result: The result of executing a query.
+    :type result: :py:class:`sqlalchemy.engine.ResultProxy`
+    :return: The rows.
+    :rtype: ``list`` of :py:class:`Row`
+    """
+    header = ResultHeader(result.keys())
+    return [Row(header, tuple(values)) for values in result]
+
+
+def iterate(result):
+    """
+    Reads the rows of a SQLAlchemy result one at a time.
+
+    :param result: The result of executing a query.
+    :type result: :py:class:`sqlalchemy.engine.ResultProxy`
+    :return: The rows.
+    :rtype: ``generator`` of :py:class:`Row`
+    """
+    header = ResultHeader(result.keys())
+    for values in result:
+        yield Row(header, tuple(values))
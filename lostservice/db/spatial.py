@@ -9,8 +9,10 @@ TODO: This code currently does not deal with any projections that will be requir
 to transform incoming coordinates to 4326 which is our standard.
 """
 
-from sqlalchemy import MetaData, Table
-from sqlalchemy.sql import select
+from sqlalchemy import Float, Integer, LargeBinary
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.sql import select, bindparam, union_all, literal_column, and_, exists, cast, null, true, false, type_coerce, \
+    text
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.sql.functions import func
 from shapely.geometry import Point
@@ -19,10 +21,13 @@ from shapely import affinity
 from shapely.geometry.polygon import LinearRing
 from shapely.wkt import loads
 from geoalchemy2.shape import from_shape
-from osgeo import osr
 from osgeo import ogr
 import math
 import lostservice.geometry as gc_geom
+import lostservice.spatialreference as spatialreference
+import lostservice.db.rows as dbrows
+import lostservice.db.tables as tables
+import lostservice.db.statements as statements
 from lostservice.exception import InternalErrorException
 from lostservice.configuration import general_logger
 from lostservice.model.geodetic import Point as geodetic_point
@@ -46,7 +51,7 @@ class SpatialQueryException(InternalErrorException):
         super(SpatialQueryException, self).__init__(message, nested)
 
 
-def _execute_query(engine, query):
+def _execute_query(engine, query, params=None):
     """
     Execute the given query.  Handles connecting and cleanup.
 
@@ -54,15 +59,16 @@ def _execute_query(engine, query):
     :type engine: :py:class:`sqlalchemy.engine.Engine`
     :param query: The query to execute (created by calling SQLAlchemy select() function).
     :type query: :py:class:`sqlalchemy.sql.expression.Select
-    :return: A list of dictionaries containing returned rows and their contents.
+    :param params: Values for the bound parameters of the query.
+    :type params: ``dict``
+    :return: A list of :py:class:`lostservice.db.rows.Row` mappings containing returned rows and their contents.
     """
     retval = []
     try:
         with engine.connect() as conn:
-            result = conn.execute(query)
-            for row in result:
-                row_copy = dict(zip(row.keys(), row))
-                retval.append(row_copy)
+            result = conn.execution_options(compiled_cache=statements.statement_cache.compiled_cache)\
+                .execute(query, params or {})
+            retval = dbrows.materialize(result)
             result.close()
             conn.close()
 
@@ -74,12 +80,167 @@ def _execute_query(engine, query):
     return retval if retval else None
 
 
+def _iterate_query(engine, query, params=None):
+    """
+    Execute the given query and stream its rows instead of reading them all first, for results
+    that are only read once and may be large.  The connection is held until the rows have been
+    read or the generator is closed.
+
+    :param engine: SQLAlchemy database engine.
+    :type engine: :py:class:`sqlalchemy.engine.Engine`
+    :param query: The query to execute (created by calling SQLAlchemy select() function).
+    :type query: :py:class:`sqlalchemy.sql.expression.Select
+    :param params: Values for the bound parameters of the query.
+    :type params: ``dict``
+    :return: The :py:class:`lostservice.db.rows.Row` mappings of the returned rows.
+    :rtype: ``generator``
+    """
+    try:
+        with engine.connect() as conn:
+            result = conn.execution_options(compiled_cache=statements.statement_cache.compiled_cache,
+                                            stream_results=True)\
+                .execute(query, params or {})
+            try:
+                yield from dbrows.iterate(result)
+            finally:
+                result.close()
+
+    except SQLAlchemyError as ex:
+        logger.error(ex)
+        raise SpatialQueryException(
+            'Spatial query failed with an error.', ex)
+
+
+#: The boundary attributes the response builders use, the rest of the row (and the geometry) stays in the database.
+MAPPING_COLUMNS = ('serviceurn', 'routeuri', 'displayname', 'srcunqid', 'servicenum', 'updatedate')
+
+#: Key of the (table name, primary key values) reference added to each mapping row, see
+#: :py:func:`get_boundary_for_primary_key`.
+BOUNDARY_REF = 'boundary_ref'
+
+
+def _mapping_columns(the_table):
+    """
+    Gets the columns selected by the queries finding service boundaries for a mapping, the
+    primary key and the :py:data:`MAPPING_COLUMNS` the table has.  The geometry is only
+    fetched for the mappings that end up in the response, and only when it is returned.
+
+    :param the_table: The service boundary table.
+    :type the_table: :py:class:`sqlalchemy.Table`
+    :return: The columns.
+    :rtype: ``list``
+    """
+    columns = list(the_table.primary_key.columns)
+    columns.extend(the_table.c[name] for name in MAPPING_COLUMNS
+                   if name in the_table.c and the_table.c[name] not in columns)
+    if len(the_table.primary_key.columns) == 0:
+        # Without a key the boundary can't be fetched later on, so it has to come along now.
+        columns.extend([the_table.c.wkb_geometry,
+                        func.ST_AsGML(3, the_table.c.wkb_geometry, 15, 16).label('ST_AsGML_1')])
+    return columns
+
+
+def _execute_mapping_query(engine, query, params, the_table, table_name):
+    """
+    Executes a query built with :py:func:`_mapping_columns` and adds the
+    :py:data:`BOUNDARY_REF` to each row.
+
+    :return: A list of dictionaries containing returned rows and their contents.
+    """
+    results = _execute_query(engine, query, params)
+    pk_names = [column.name for column in the_table.primary_key.columns]
+    if results and pk_names:
+        for row in results:
+            row[BOUNDARY_REF] = (table_name, {name: row[name] for name in pk_names})
+    return results
+
+
+#: Degrees added around the bounding box of a buffered search area before it is compared with the
+#: untransformed boundaries, covers edges being straight in UTM but not in WGS 84.
+BUFFER_PREFILTER_MARGIN = 0.01
+
+
+def _intersects_buffered(geometry_column, buffered, utmsrid):
+    """
+    Builds the predicate for boundaries intersecting a search area buffered in UTM.
+
+    The exact test has to transform every boundary into the UTM zone, which keeps the
+    spatial index on the geometry column from being used.  It is preceded by a bounding
+    box test of the untransformed column against the search area transformed back to
+    WGS 84, which can use the index, so only the boundaries near the search area are
+    transformed.
+
+    :param geometry_column: The (WGS 84) geometry column of the table.
+    :param buffered: The buffered search area, in the UTM zone.
+    :param utmsrid: The UTM zone SRID.
+    :return: The predicate.
+    """
+    prefilter = func.ST_Expand(func.ST_Transform(buffered, 4326),
+                               bindparam('prefilter_margin', BUFFER_PREFILTER_MARGIN))
+    return and_(geometry_column.op('&&')(prefilter),
+                func.ST_Intersects(buffered, geometry_column.ST_Transform(utmsrid)))
+
+
+def _limit_key(result_limit, order_by_area):
+    """
+    Gets the part of a statement cache key describing :py:func:`_limit_query`.
+    """
+    return result_limit is not None, bool(order_by_area)
+
+
+def _limit_query(query, result_limit, order_by_area):
+    """
+    Pushes a multiple match policy into a query so the database only returns the rows the
+    policy keeps.  The number of rows is bound as result_limit, see :py:func:`_limit_params`.
+
+    :param query: The query.
+    :param result_limit: The number of rows to return, None for all of them.
+    :type result_limit: ``int``
+    :param order_by_area: Whether to return the rows with the largest AREA_RET first.
+    :type order_by_area: ``bool``
+    :return: The query.
+    """
+    if order_by_area:
+        query = query.order_by(literal_column('"AREA_RET"').desc().nullslast())
+    if result_limit is not None:
+        query = query.limit(bindparam('result_limit', type_=Integer))
+    return query
+
+
+def _limit_params(params, result_limit):
+    """
+    Adds the value of the result_limit parameter bound by :py:func:`_limit_query`.
+
+    :return: The parameters.
+    :rtype: ``dict``
+    """
+    if result_limit is not None:
+        params['result_limit'] = result_limit
+    return params
+
+
 # TODO - We could probably use a decorator to handle the repeated work
 # TODO - of setting up the table reference and exception handling
 # TODO - in the two functions below.
 
 
-def _get_containing_boundary_for_geom(engine, table_name, geom):
+def _build_contains_query(the_table):
+    """
+    Builds the query for boundaries containing the bound geometry.
+
+    :param the_table: The service boundary table.
+    :type the_table: :py:class:`sqlalchemy.Table`
+    :return: The query.
+    :rtype: :py:class:`sqlalchemy.sql.expression.Select`
+    """
+    #ST_AsGML(geometry geom, integer maxdecimaldigits=15, integer options=0);
+    #maxdecimaldigits = precision
+    #option 16 = swap the coordinates so order is lat lon instead of database lon lat
+    return select(_mapping_columns(the_table),
+                  the_table.c.wkb_geometry.ST_Contains(statements.geometry_param()))
+
+
+def _get_containing_boundary_for_geom(engine, table_name, geom, result_limit=None):
     """
     Queries the given table for the boundary in which the given
     geometry falls.
@@ -90,24 +251,22 @@ def _get_containing_boundary_for_geom(engine, table_name, geom):
     :type table_name: `str`
     :param geom: The geometry to use in the search as a GeoAlchemy WKBElement.
     :type geom: :py:class:geoalchemy2.types.WKBElement
+    :param result_limit: The most rows to return, None for all of them.
+    :type result_limit: `int`
     :return: A list of dictionaries containing the contents of returned rows.
     """
     retval = None
     try:
         # Get a reference to the table we're going to look in.
-        tbl_metadata = MetaData(bind=engine)
-        the_table = Table(table_name, tbl_metadata, autoload=True)
-
-        #ST_AsGML(geometry geom, integer maxdecimaldigits=15, integer options=0);
-        #maxdecimaldigits = precision
-        #option 16 = swap the coordinates so order is lat lon instead of database lon lat
-
-        # Construct the "contains" query and execute it.
-        s = select([the_table, func.ST_AsGML(3, the_table.c.wkb_geometry, 15, 16)],
-                   the_table.c.wkb_geometry.ST_Contains(geom))
+        the_table = tables.get_table(engine, table_name)
 
-
-        retval = _execute_query(engine, s)
+        # Get the "contains" query and execute it.
+        s = statements.statement_cache.get_statement(
+            ('contains', table_name) + _limit_key(result_limit, False),
+            the_table,
+            lambda t: _limit_query(_build_contains_query(t), result_limit, False))
+        params = _limit_params(statements.geometry_params(geom), result_limit)
+        retval = _execute_mapping_query(engine, s, params, the_table, table_name)
 
     except SQLAlchemyError as ex:
         logger.error("Unable to construct contains query", ex)
@@ -120,6 +279,28 @@ def _get_containing_boundary_for_geom(engine, table_name, geom):
     return retval
 
 
+def _build_nearest_query(the_table):
+    """
+    Builds the query for the boundary nearest to the bound geometry within the bound buffer distance.
+
+    :param the_table: The service boundary table.
+    :type the_table: :py:class:`sqlalchemy.Table`
+    :return: The query.
+    :rtype: :py:class:`sqlalchemy.sql.expression.Select`
+    """
+    geom = statements.geometry_param()
+    return select([the_table, the_table.c.wkb_geometry.ST_AsGML(),
+                   the_table.c.wkb_geometry.ST_Distance(geom).label('DISTANCE')],
+                  the_table.c.wkb_geometry.ST_Intersects(
+                      func.ST_Transform(
+                          func.ST_Buffer(
+                          func.ST_Transform(
+                              func.st_centroid(geom),
+                              bindparam('utmsrid')
+                          ), bindparam('buffer_distance'), 32), 4326))
+                  ).order_by('DISTANCE').limit(1)
+
+
 def _get_nearest_point(long, lat, engine, table_name, geom, buffer_distance=None):
     """
     Queries the given table for the nearest boundary
@@ -135,22 +316,14 @@ def _get_nearest_point(long, lat, engine, table_name, geom, buffer_distance=None
     retval = None
     try:
         # Get a reference to the table we're going to look in.
-        tbl_metadata = MetaData(bind=engine)
-        the_table = Table(table_name, tbl_metadata, autoload=True)
-        # Construct the "contains" query and execute it.
+        the_table = tables.get_table(engine, table_name)
+        # Get the "nearest" query and execute it.
         utmsrid = gc_geom.getutmsrid(long, lat)
-        s = select([the_table, the_table.c.wkb_geometry.ST_AsGML(),
-                    the_table.c.wkb_geometry.ST_Distance(geom).label('DISTANCE')],
-                   the_table.c.wkb_geometry.ST_Intersects(
-                       func.ST_Transform(
-                           func.ST_Buffer(
-                           func.ST_Transform(
-                               func.st_centroid(geom),
-                               utmsrid
-                           ),buffer_distance, 32), 4326))
-                   ).order_by('DISTANCE').limit(1)
-
-        retval = _execute_query(engine, s)
+        s = statements.statement_cache.get_statement(('nearest', table_name), the_table, _build_nearest_query)
+
+        params = statements.geometry_params(geom)
+        params.update({'utmsrid': utmsrid, 'buffer_distance': buffer_distance})
+        retval = _execute_mapping_query(engine, s, params, the_table, table_name)
     except SQLAlchemyError as ex:
         logger.error(ex)
         raise SpatialQueryException(
@@ -161,18 +334,30 @@ def _get_nearest_point(long, lat, engine, table_name, geom, buffer_distance=None
     return retval
 
 
+def _build_additional_data_query(the_table):
+    """
+    Builds the query for additional data intersecting the bound geometry.
+
+    :param the_table: The additional data table.
+    :type the_table: :py:class:`sqlalchemy.Table`
+    :return: The query.
+    :rtype: :py:class:`sqlalchemy.sql.expression.Select`
+    """
+    return select(
+        [the_table],
+        func.ST_Intersects(the_table.c.wkb_geometry, statements.geometry_param()))
+
+
 def _get_additional_data_for_geometry(engine, geom, table_name):
 
     try:
         # Get a reference to the table we're going to look in.
-        tbl_metadata = MetaData(bind=engine)
-        the_table = Table(table_name, tbl_metadata, autoload=True)
+        the_table = tables.get_table(engine, table_name)
 
-        s = select(
-            [the_table],
-            func.ST_Intersects(the_table.c.wkb_geometry,geom))
+        s = statements.statement_cache.get_statement(('additional_data', table_name), the_table,
+                                                     _build_additional_data_query)
 
-        results = _execute_query(engine, s)
+        results = _execute_query(engine, s, statements.geometry_params(geom))
         return results
     except SQLAlchemyError as ex:
         logger.error(ex)
@@ -183,27 +368,32 @@ def _get_additional_data_for_geometry(engine, geom, table_name):
         raise
 
 
+def _build_additional_data_with_buffer_query(the_table):
+    """
+    Builds the query for additional data intersecting the bound geometry buffered by the bound distance.
+
+    :param the_table: The additional data table.
+    :type the_table: :py:class:`sqlalchemy.Table`
+    :return: The query.
+    :rtype: :py:class:`sqlalchemy.sql.expression.Select`
+    """
+    utmsrid = bindparam('utmsrid')
+    buffered = func.ST_Buffer(func.ST_Transform(func.ST_SetSRID(statements.geometry_param(), 4326), utmsrid),
+                              bindparam('buffer_distance'))
+    return select([the_table], _intersects_buffered(the_table.c.wkb_geometry, buffered, utmsrid))
+
+
 def _get_additional_data_for_geometry_with_buffer(engine, geom, table_name, buffer_distance, utmsrid):
     try:
         # Get a reference to the table we're going to look in.
-        tbl_metadata = MetaData(bind=engine)
-        the_table = Table(table_name, tbl_metadata, autoload=True)
-
-        s = select(
-            [the_table],
-            func.ST_Intersects(
-                func.ST_Buffer(
-                    func.ST_Transform(
-                        func.ST_SetSRID(geom, 4326),
-                        utmsrid
-                    ),
-                    buffer_distance
-                ),
-                the_table.c.wkb_geometry.ST_Transform(utmsrid)
-            )
-        )
+        the_table = tables.get_table(engine, table_name)
+
+        s = statements.statement_cache.get_statement(('additional_data_with_buffer', table_name), the_table,
+                                                     _build_additional_data_with_buffer_query)
 
-        results = _execute_query(engine, s)
+        params = statements.geometry_params(geom)
+        params.update({'utmsrid': utmsrid, 'buffer_distance': buffer_distance})
+        results = _execute_query(engine, s, params)
         return results
     except SQLAlchemyError as ex:
         logger.error(ex)
@@ -244,7 +434,30 @@ def get_additional_data_for_circle(location: geodetic_circle, table_name, buffer
     return results
 
 
-def _get_intersecting_boundaries_for_geom(engine, table_name, geom, return_intersection_area):
+def _build_intersects_query(the_table, return_intersection_area):
+    """
+    Builds the query for boundaries intersecting the bound geometry (transformed to 4326).
+
+    :param the_table: The service boundary table.
+    :type the_table: :py:class:`sqlalchemy.Table`
+    :param return_intersection_area: Flag which triggers an area calculation on the Intersecting polygons.
+    :type return_intersection_area: `bool`
+    :return: The query.
+    :rtype: :py:class:`sqlalchemy.sql.expression.Select`
+    """
+    geom = func.ST_Transform(func.ST_SetSRID(statements.geometry_param(), bindparam('geom_srid')), 4326)
+    if return_intersection_area:
+        # include a calculation for the intersecting the area
+        return select(
+            _mapping_columns(the_table) +
+            [func.ST_Area(the_table.c.wkb_geometry.ST_Intersection(geom)).label('AREA_RET')],
+            the_table.c.wkb_geometry.ST_Intersects(geom))
+
+    return select(_mapping_columns(the_table), the_table.c.wkb_geometry.ST_Intersects(geom))
+
+
+def _get_intersecting_boundaries_for_geom(engine, table_name, geom, return_intersection_area, result_limit=None,
+                                          order_by_area=False):
     """
     Queries the given table for any boundaries that intersect the given geometry.
 
@@ -254,33 +467,25 @@ def _get_intersecting_boundaries_for_geom(engine, table_name, geom, return_inter
     :type table_name: `str`
     :param geom: The geometry to use in the search as a GeoAlchemy WKBElement.
     :type geom: :py:class:geoalchemy2.types.WKBElement
+    :param result_limit: The most rows to return, None for all of them.
+    :type result_limit: `int`
+    :param order_by_area: Whether to return the rows with the largest intersection area first.
+    :type order_by_area: `bool`
     :return: A list of dictionaries containing the contents of returned rows.
     """
     retval = None
     try:
         # Get a reference to the table we're going to look in.
-        tbl_metadata = MetaData(bind=engine)
-        the_table = Table(table_name, tbl_metadata, autoload=True)
-
-        # s = select([the_table, the_table.c.wkb_geometry.ST_AsGML()], the_table.c.wkb_geometry.ST_Contains(geom))
-
-        # Construct the "intersection" query and execute
-        if return_intersection_area:
-            # include a calculation for the intersecting the area
-            s = select(
-                [the_table,
-                 func.ST_AsGML(3, the_table.c.wkb_geometry, 15, 16),
-                 func.ST_Area(the_table.c.wkb_geometry.ST_Intersection(func.ST_Transform(func.ST_SetSRID(geom, geom.srid),4326))).label('AREA_RET')
-                 ],
-                the_table.c.wkb_geometry.ST_Intersects(func.ST_Transform(func.ST_SetSRID(geom, geom.srid),4326)))
-        else:
+        the_table = tables.get_table(engine, table_name)
 
-            s = select(
-                [the_table,
-                 func.ST_AsGML(3, the_table.c.wkb_geometry, 15, 16)],
-                the_table.c.wkb_geometry.ST_Intersects(func.ST_Transform(func.ST_SetSRID(geom, geom.srid),4326)))
+        # Get the "intersection" query and execute
+        s = statements.statement_cache.get_statement(
+            ('intersects', table_name, bool(return_intersection_area)) + _limit_key(result_limit, order_by_area),
+            the_table,
+            lambda t: _limit_query(_build_intersects_query(t, return_intersection_area), result_limit, order_by_area))
 
-        results = _execute_query(engine, s)
+        params = _limit_params(statements.geometry_params(geom), result_limit)
+        results = _execute_mapping_query(engine, s, params, the_table, table_name)
     except SQLAlchemyError as ex:
         logger.error(ex)
         raise SpatialQueryException(
@@ -292,7 +497,31 @@ def _get_intersecting_boundaries_for_geom(engine, table_name, geom, return_inter
     return results
 
 
-def _get_intersecting_boundaries_for_geom_value(engine, table_name, geom, return_intersection_area):
+def _build_intersects_value_query(the_table, return_intersection_area):
+    """
+    Builds the query for boundaries intersecting the bound geometry (taken as 4326) which returns the shape.
+
+    :param the_table: The service boundary table.
+    :type the_table: :py:class:`sqlalchemy.Table`
+    :param return_intersection_area: Flag which triggers an area calculation on the Intersecting polygons.
+    :type return_intersection_area: `bool`
+    :return: The query.
+    :rtype: :py:class:`sqlalchemy.sql.expression.Select`
+    """
+    geom = func.ST_SetSRID(statements.geometry_param(), 4326)
+    if return_intersection_area:
+        # include a calculation for the intersecting the area
+        return select(
+            _mapping_columns(the_table) +
+            [func.ST_Area(the_table.c.wkb_geometry.ST_Intersection(geom)).label('AREA_RET')],
+            the_table.c.wkb_geometry.ST_Intersects(geom)
+        )
+
+    return select(_mapping_columns(the_table), the_table.c.wkb_geometry.ST_Intersects(geom))
+
+
+def _get_intersecting_boundaries_for_geom_value(engine, table_name, geom, return_intersection_area,
+                                                result_limit=None, order_by_area=False):
     """
     Queries the given table for any boundaries that intersect the given geometry and returns the shape.
 
@@ -302,39 +531,26 @@ def _get_intersecting_boundaries_for_geom_value(engine, table_name, geom, return
     :type table_name: `str`
     :param geom: The geometry to use in the search as a GeoAlchemy WKBElement.
     :type geom: :py:class:geoalchemy2.types.WKBElement
+    :param result_limit: The most rows to return, None for all of them.
+    :type result_limit: `int`
+    :param order_by_area: Whether to return the rows with the largest intersection area first.
+    :type order_by_area: `bool`
     :return: A list of dictionaries containing the contents of returned rows.
     """
     retval = None
     try:
         # Get a reference to the table we're going to look in.
-        tbl_metadata = MetaData(bind=engine)
-        the_table = Table(table_name, tbl_metadata, autoload=True)
-
-        # s = select([the_table, the_table.c.wkb_geometry.ST_AsGML()], the_table.c.wkb_geometry.ST_Contains(geom))
-
-        # Construct the "intersection" query and execute
-        if return_intersection_area == True:
-            # include a calculation for the intersecting the area
-
-            s = select(
-                [
-                    the_table,
-                    func.ST_AsGML(3, the_table.c.wkb_geometry, 15, 16),
-                    func.ST_Area(
-                        the_table.c.wkb_geometry.ST_Intersection(func.ST_SetSRID(geom, 4326))
-                    ).label('AREA_RET')
-                ],
-                the_table.c.wkb_geometry.ST_Intersects(func.ST_SetSRID(geom, 4326))
-            )
-        else:
-            s = select(
-                [
-                    the_table,
-                    func.ST_AsGML(3, the_table.c.wkb_geometry, 15, 16)
-                ],
-                the_table.c.wkb_geometry.ST_Intersects(func.ST_SetSRID(geom, 4326)))
-
-        results = _execute_query(engine, s)
+        the_table = tables.get_table(engine, table_name)
+
+        # Get the "intersection" query and execute
+        return_area = return_intersection_area == True
+        s = statements.statement_cache.get_statement(
+            ('intersects_value', table_name, return_area) + _limit_key(result_limit, order_by_area),
+            the_table,
+            lambda t: _limit_query(_build_intersects_value_query(t, return_area), result_limit, order_by_area))
+
+        params = _limit_params(statements.geometry_params(geom), result_limit)
+        results = _execute_mapping_query(engine, s, params, the_table, table_name)
     except SQLAlchemyError as ex:
         logger.error(ex)
         raise SpatialQueryException(
@@ -346,7 +562,8 @@ def _get_intersecting_boundaries_for_geom_value(engine, table_name, geom, return
     return results
 
 
-def get_containing_boundary_for_point(point: geodetic_point, boundary_table, engine, add_data_required=False, buffer_distance=None):
+def get_containing_boundary_for_point(point: geodetic_point, boundary_table, engine, add_data_required=False, buffer_distance=None,
+                                      result_limit=None):
     """
     Executes a contains query for a point.
 
@@ -356,6 +573,8 @@ def get_containing_boundary_for_point(point: geodetic_point, boundary_table, eng
     :type boundary_table: `str`
     :param engine: SQLAlchemy database engine.
     :type engine: :py:class:`sqlalchemy.engine.Engine`
+    :param result_limit: The most boundaries to return, None for all of them.
+    :type result_limit: `int`
     :return: A list of dictionaries containing the contents of returned rows.
     """
 
@@ -363,7 +582,169 @@ def get_containing_boundary_for_point(point: geodetic_point, boundary_table, eng
     # Run the query.
     if add_data_required:
         return _get_nearest_point(point.longitude, point.latitude, engine, boundary_table, wkb_pt,buffer_distance=buffer_distance)
-    return _get_containing_boundary_for_geom(engine, boundary_table, wkb_pt)
+    return _get_containing_boundary_for_geom(engine, boundary_table, wkb_pt, result_limit)
+
+
+#: Key of the position of the point a row from :py:func:`get_containing_boundaries_for_points` was found for.
+BATCH_ITEM = 'batch_item'
+
+
+def _build_contains_points_query(the_table):
+    """
+    Builds the query for the boundaries containing each of a batch of points, the points are bound
+    as arrays of positions and WKB and joined to the table.
+
+    :param the_table: The service boundary table.
+    :type the_table: :py:class:`sqlalchemy.Table`
+    :return: The query.
+    :rtype: :py:class:`sqlalchemy.sql.expression.Select`
+    """
+    points = text('unnest(:batch_items, :batch_wkbs) AS batch_points(item, wkb)').bindparams(
+        bindparam('batch_items', type_=ARRAY(Integer)),
+        bindparam('batch_wkbs', type_=ARRAY(LargeBinary)))
+    geom = func.ST_GeomFromWKB(literal_column('batch_points.wkb'), bindparam('geom_srid'))
+    columns = [literal_column('batch_points.item', Integer).label(BATCH_ITEM)] + _mapping_columns(the_table)
+    return select(columns, the_table.c.wkb_geometry.ST_Contains(geom)).select_from(points)
+
+
+def get_containing_boundaries_for_points(points, boundary_table, engine):
+    """
+    Executes one contains query for a batch of points.
+
+    :param points: The location objects.
+    :type points: ``list`` of `location`
+    :param boundary_table: The name of the service boundary table.
+    :type boundary_table: `str`
+    :param engine: SQLAlchemy database engine.
+    :type engine: :py:class:`sqlalchemy.engine.Engine`
+    :return: For each point, a list of dictionaries containing the contents of returned rows or None, just like
+             :py:func:`get_containing_boundary_for_point`.
+    :rtype: ``list``
+    """
+    retval = [None] * len(points)
+    if not points:
+        return retval
+    try:
+        the_table = tables.get_table(engine, boundary_table)
+        s = statements.statement_cache.get_statement(('contains_points', boundary_table), the_table,
+                                                     _build_contains_points_query)
+
+        wkb_points = [statements.geometry_params(point.to_wkbelement(project_to=4326)) for point in points]
+        params = {'batch_items': list(range(len(points))),
+                  'batch_wkbs': [wkb_point['geom_wkb'] for wkb_point in wkb_points],
+                  'geom_srid': wkb_points[0]['geom_srid']}
+        for row in _execute_mapping_query(engine, s, params, the_table, boundary_table) or []:
+            item = row[BATCH_ITEM]
+            del row[BATCH_ITEM]
+            if retval[item] is None:
+                retval[item] = []
+            retval[item].append(row)
+
+    except SQLAlchemyError as ex:
+        logger.error(ex)
+        raise SpatialQueryException(
+            'Unable to construct contains query for a batch of points.', ex)
+    except SpatialQueryException as ex:
+        logger.error(ex)
+        raise
+
+    return retval
+
+
+#: Key of the flag telling whether a row from :py:func:`get_containing_or_nearby_boundaries_for_point`
+#: contains the point (True) or was found by the proximity search (False).
+CONTAINED = 'CONTAINED'
+
+
+def _contains_or_nearby_columns(the_table, geom, is_contained, area):
+    """
+    Gets the columns of one branch of the contains-or-nearby query.
+    """
+    columns = _mapping_columns(the_table)
+    columns.append((true() if is_contained else false()).label(CONTAINED))
+    # KNN distance, typed so it isn't read back as a geometry.
+    columns.append(type_coerce(the_table.c.wkb_geometry.op('<->')(geom), Float).label('DISTANCE'))
+    if area is not None:
+        columns.append(area.label('AREA_RET'))
+    return columns
+
+
+def _build_contains_or_nearby_query(the_table, return_intersection_area):
+    """
+    Builds the query for boundaries containing the bound point or, when none do, the boundaries
+    intersecting the point buffered by the bound distance, closest first.
+
+    :param the_table: The service boundary table.
+    :type the_table: :py:class:`sqlalchemy.Table`
+    :param return_intersection_area: Flag which triggers an area calculation on the nearby polygons.
+    :type return_intersection_area: `bool`
+    :return: The query.
+    :rtype: :py:class:`sqlalchemy.sql.expression.CompoundSelect`
+    """
+    geom = statements.geometry_param()
+    utmsrid = bindparam('utmsrid')
+    buffered = func.ST_Buffer(func.ST_Transform(geom, utmsrid), bindparam('buffer_distance'))
+
+    contained_area = nearby_area = None
+    if return_intersection_area:
+        contained_area = cast(null(), Float)
+        nearby_area = func.ST_Area(func.ST_Intersection(buffered, the_table.c.wkb_geometry.ST_Transform(utmsrid)))
+
+    contained = select(_contains_or_nearby_columns(the_table, geom, True, contained_area),
+                       the_table.c.wkb_geometry.ST_Contains(geom)).cte('contained')
+    # The proximity search only runs when nothing contains the point.
+    nearby = select(_contains_or_nearby_columns(the_table, geom, False, nearby_area),
+                    and_(~exists(select([literal_column('1')]).select_from(contained)),
+                         _intersects_buffered(the_table.c.wkb_geometry, buffered, utmsrid)))
+    return union_all(select([contained]), nearby).order_by(literal_column('"DISTANCE"'))
+
+
+def get_containing_or_nearby_boundaries_for_point(point: geodetic_point, boundary_table, engine, proximity_buffer,
+                                                  return_intersection_area=False):
+    """
+    Executes a contains query for a point that falls back to a proximity search in the same
+    statement.  Returns the boundaries containing the point if there are any, otherwise the
+    boundaries within proximity_buffer meters of it, closest first.  Each row has the
+    :py:data:`CONTAINED` flag telling which of the two it is.
+
+    :param point: location object
+    :type point: `location`
+    :param boundary_table: The name of the service boundary table.
+    :type boundary_table: `str`
+    :param engine: SQLAlchemy database engine.
+    :type engine: :py:class:`sqlalchemy.engine.Engine`
+    :param proximity_buffer: The distance to search around the point, in meters.
+    :type proximity_buffer: `float`
+    :param return_intersection_area: Flag which triggers an area calculation on the nearby polygons.
+    :type return_intersection_area: `bool`
+    :return: A list of dictionaries containing the contents of returned rows.
+    """
+    retval = None
+    try:
+        # Get a reference to the table we're going to look in.
+        the_table = tables.get_table(engine, boundary_table)
+
+        wkb_pt = point.to_wkbelement(project_to=4326)
+        return_area = bool(return_intersection_area)
+        s = statements.statement_cache.get_statement(
+            ('contains_or_nearby', boundary_table, return_area),
+            the_table,
+            lambda t: _build_contains_or_nearby_query(t, return_area))
+
+        params = statements.geometry_params(wkb_pt)
+        params.update({'utmsrid': gc_geom.getutmsrid(point.longitude, point.latitude),
+                       'buffer_distance': proximity_buffer})
+        retval = _execute_mapping_query(engine, s, params, the_table, boundary_table)
+
+    except SQLAlchemyError as ex:
+        logger.error(ex)
+        raise SpatialQueryException(
+            'Unable to construct contains or nearby query.', ex)
+    except SpatialQueryException as ex:
+        logger.error(ex)
+        raise
+
+    return retval
 
 
 def _transform_circle(long, lat, srid, radius, uom):
@@ -385,20 +766,14 @@ def _transform_circle(long, lat, srid, radius, uom):
     :rtype: :py:class:geoalchemy2.types.WKBElement
     """
 
-    # Source spatial reference.
-    source = osr.SpatialReference()
-    source.ImportFromEPSG(srid)
-
     # TODO - Need to handle different values for the incoming UOM
     # TODO - Must have a lookup table of some kind.
     # The target will depend on the value of uom, but we'll just assume
-    # it's 9001/meters for now and project to 3857.
-    target = osr.SpatialReference()
-    #target.ImportFromEPSG(3857)
-    target.ImportFromEPSG(gc_geom.getutmsrid(longitude=long, latitude=lat))
+    # it's 9001/meters for now and project to UTM.
+    target_srid = gc_geom.getutmsrid(longitude=long, latitude=lat)
 
     # Set up the transform.
-    transform = osr.CoordinateTransformation(source, target)
+    transform = spatialreference.get_transformation(srid, target_srid)
 
     # Create a geometry we can use with the transform.
     center = ogr.CreateGeometryFromWkt('POINT({0} {1})'.format(long, lat))
@@ -408,7 +783,7 @@ def _transform_circle(long, lat, srid, radius, uom):
     circle = center.Buffer(radius)
 
     # Now transform it back and extract the wkt
-    reverse_transform = osr.CoordinateTransformation(target, source)
+    reverse_transform = spatialreference.get_transformation(target_srid, srid)
     circle.Transform(reverse_transform)
     wkt_circle = circle.ExportToWkt()
 
@@ -451,7 +826,8 @@ def get_containing_boundary_for_circle(long, lat, srid, radius, uom, boundary_ta
 
 def get_intersecting_boundaries_for_circle(location: geodetic_circle, boundary_table, engine,
                                            return_intersection_area=False, return_shape=False,
-                                           proximity_search = False, proximity_buffer = 0):
+                                           proximity_search = False, proximity_buffer = 0,
+                                           result_limit=None, order_by_area=False):
     """    
     Executes an intersection query for a circle.
 
@@ -465,6 +841,10 @@ def get_intersecting_boundaries_for_circle(location: geodetic_circle, boundary_t
     :type return_intersection_area: `bool`
     :param return_shape: Flag which triggers the return of the shape in GML.
     :type return_shape: `bool`
+    :param result_limit: The most boundaries to return, None for all of them.
+    :type result_limit: `int`
+    :param order_by_area: Whether to return the boundaries with the largest intersection area first.
+    :type order_by_area: `bool`
     :return: A list of dictionaries containing the contents of returned rows.
     """
     # Pull out just the number from the SRID
@@ -477,21 +857,43 @@ def get_intersecting_boundaries_for_circle(location: geodetic_circle, boundary_t
     if return_shape == True:
         if proximity_search == True:
             return get_intersecting_boundaries_with_buffer(location.longitude, location.latitude, engine, boundary_table, wkb_circle,
-                                                           proximity_buffer, return_intersection_area)
+                                                           proximity_buffer, return_intersection_area,
+                                                           result_limit, order_by_area)
         else:
             # Call Overload to return the GML representation of the shape
             return _get_intersecting_boundaries_for_geom_value(engine, boundary_table,
                                                                wkb_circle,
-                                                               return_intersection_area)
+                                                               return_intersection_area,
+                                                               result_limit, order_by_area)
     else:
         if proximity_search == True:
             return get_intersecting_boundaries_with_buffer(location.longitude, location.latitude, engine, boundary_table, wkb_circle,
-                                                           proximity_buffer, return_intersection_area)
+                                                           proximity_buffer, return_intersection_area,
+                                                           result_limit, order_by_area)
         else:
-            return _get_intersecting_boundaries_for_geom(engine, boundary_table, wkb_circle, return_intersection_area)
+            return _get_intersecting_boundaries_for_geom(engine, boundary_table, wkb_circle, return_intersection_area,
+                                                         result_limit, order_by_area)
+
+
+def _build_ellipse_query(the_table):
+    """
+    Builds the query for boundaries intersecting the bound ellipse, including the intersection area.
+
+    :param the_table: The service boundary table.
+    :type the_table: :py:class:`sqlalchemy.Table`
+    :return: The query.
+    :rtype: :py:class:`sqlalchemy.sql.expression.Select`
+    """
+    geom = statements.geometry_param()
+    return select(
+        _mapping_columns(the_table) +
+        [func.ST_Area(the_table.c.wkb_geometry.ST_Intersection(func.ST_SetSRID(geom, 4326))).label('AREA_RET')],
+        the_table.c.wkb_geometry.ST_Intersects(geom)
+    )
 
 
-def get_intersecting_boundary_for_ellipse(location: geodetic_ellipse, boundary_table, engine):
+def get_intersecting_boundary_for_ellipse(location: geodetic_ellipse, boundary_table, engine, result_limit=None,
+                                          order_by_area=False):
     """
     Executes a contains query for a polygon.
 
@@ -501,6 +903,10 @@ def get_intersecting_boundary_for_ellipse(location: geodetic_ellipse, boundary_t
     :type boundary_table: `str`
     :param engine: SQLAlchemy database engine.
     :type engine: :py:class:`sqlalchemy.engine.Engine`
+    :param result_limit: The most boundaries to return, None for all of them.
+    :type result_limit: `int`
+    :param order_by_area: Whether to return the boundaries with the largest intersection area first.
+    :type order_by_area: `bool`
     :return: A list of dictionaries containing the contents of returned rows.
     """
 
@@ -508,20 +914,16 @@ def get_intersecting_boundary_for_ellipse(location: geodetic_ellipse, boundary_t
     # Pull out just the number from the SRID
     try:
         # Get a reference to the table we're going to look in.
-        tbl_metadata = MetaData(bind=engine)
-        the_table = Table(boundary_table, tbl_metadata, autoload=True)
+        the_table = tables.get_table(engine, boundary_table)
 
         wkb_ellipse = location.to_wkbelement(project_to=4326)
 
-        s = select(
-            [
-                the_table,
-                func.ST_AsGML(3, the_table.c.wkb_geometry, 15, 16),
-                func.ST_Area(the_table.c.wkb_geometry.ST_Intersection(func.ST_SetSRID(wkb_ellipse, 4326))).label('AREA_RET')
-            ],
-            the_table.c.wkb_geometry.ST_Intersects(wkb_ellipse)
-        )
-        results = _execute_query(engine, s)
+        s = statements.statement_cache.get_statement(
+            ('ellipse', boundary_table) + _limit_key(result_limit, order_by_area),
+            the_table,
+            lambda t: _limit_query(_build_ellipse_query(t), result_limit, order_by_area))
+        params = _limit_params(statements.geometry_params(wkb_ellipse), result_limit)
+        results = _execute_mapping_query(engine, s, params, the_table, boundary_table)
     except SQLAlchemyError as ex:
         logger.error(ex)
         raise SpatialQueryException(
@@ -572,20 +974,14 @@ def _transform_ellipse(long ,lat , major, minor, orientation, srid):
     :return: 
     """
 
-    # Source spatial reference.
-    source = osr.SpatialReference()
-    source.ImportFromEPSG(srid)
-
     # TODO - Need to handle different values for the incoming UOM
     # TODO - Must have a lookup table of some kind.
     # The target will depend on the value of uom, but we'll just assume
     # it's 9001/meters for now.
-    target = osr.SpatialReference()
-    # target.ImportFromEPSG(3857)
-    target.ImportFromEPSG(gc_geom.getutmsrid(long, lat, srid))
+    target_srid = gc_geom.getutmsrid(long, lat, srid)
 
     # Set up the transform.
-    transform = osr.CoordinateTransformation(source, target)
+    transform = spatialreference.get_transformation(srid, target_srid)
 
     # Create a geometry we can use with the transform.
     center = ogr.CreateGeometryFromWkt('POINT({0} {1})'.format(long, lat))
@@ -622,7 +1018,7 @@ def _transform_ellipse(long ,lat , major, minor, orientation, srid):
     org_ellipse = ogr.CreateGeometryFromWkt(ellr.wkt)
 
     # Now transform it back to 4326 and extract the wkt
-    reverse_transform = osr.CoordinateTransformation(target, source)
+    reverse_transform = spatialreference.get_transformation(target_srid, srid)
     org_ellipse.Transform(reverse_transform)
     wkt_ellipse = org_ellipse.ExportToWkt()
 
@@ -685,7 +1081,8 @@ def get_containing_boundary_for_polygon(points, srid, boundary_table, engine, pr
         return _get_containing_boundary_for_geom(engine, boundary_table, wkb_ring)
 
 
-def get_intersecting_boundaries_for_polygon(location: geodetic_polygon, boundary_table, engine, return_intersection_area=False, proximity_search = False, proximity_buffer = 0 ):
+def get_intersecting_boundaries_for_polygon(location: geodetic_polygon, boundary_table, engine, return_intersection_area=False, proximity_search = False, proximity_buffer = 0,
+                                            result_limit=None, order_by_area=False):
     """
     Executes an intersection query for a polygon.
 
@@ -697,6 +1094,10 @@ def get_intersecting_boundaries_for_polygon(location: geodetic_polygon, boundary
     :type engine: :py:class:`sqlalchemy.engine.Engine`
     :param return_intersection_area: Flag which triggers an area calculation on the Intersecting polygons.
     :type return_intersection_area: `bool`
+    :param result_limit: The most boundaries to return, None for all of them.
+    :type result_limit: `int`
+    :param order_by_area: Whether to return the boundaries with the largest intersection area first.
+    :type order_by_area: `bool`
     :return: A list of dictionaries containing the contents of returned rows.
     """
     # Pull out just the number from the SRID
@@ -713,9 +1114,11 @@ def get_intersecting_boundaries_for_polygon(location: geodetic_polygon, boundary
 
     if proximity_search == True:
         return get_intersecting_boundaries_with_buffer(points[0][0], points[0][1], engine, boundary_table, wkb_poly,
-                                                proximity_buffer, return_intersection_area)
+                                                proximity_buffer, return_intersection_area,
+                                                result_limit, order_by_area)
     else:
-        return _get_intersecting_boundaries_for_geom(engine, boundary_table, wkb_poly, return_intersection_area)
+        return _get_intersecting_boundaries_for_geom(engine, boundary_table, wkb_poly, return_intersection_area,
+                                                     result_limit, order_by_area)
 
 
 def get_additionaldata_for_polygon(location: geodetic_polygon, boundary_table, engine, buffer_distance):
@@ -757,6 +1160,19 @@ def get_additionaldata_for_polygon(location: geodetic_polygon, boundary_table, e
     return results
 
 
+def _build_previous_id_query(the_table):
+    """
+    Builds the query for boundaries matching the bound previous id.
+
+    :param the_table: The service boundary table.
+    :type the_table: :py:class:`sqlalchemy.Table`
+    :return: The query.
+    :rtype: :py:class:`sqlalchemy.sql.expression.Select`
+    """
+    return select([the_table, func.ST_AsGML(3, the_table.c.wkb_geometry, 15, 16)],
+                  the_table.c.srcunqid.like(bindparam('pid')))
+
+
 def get_boundaries_for_previous_id(pid, engine, boundary_table):
     """
     Executes an query to get the boundary.
@@ -771,13 +1187,12 @@ def get_boundaries_for_previous_id(pid, engine, boundary_table):
     """
     try:
         # Get a reference to the table we're going to look in.
-        tbl_metadata = MetaData(bind=engine)
-        the_table = Table(boundary_table, tbl_metadata, autoload=True)
+        the_table = tables.get_table(engine, boundary_table)
 
-        s = select([the_table, func.ST_AsGML(3, the_table.c.wkb_geometry, 15, 16)],
-                   the_table.c.srcunqid.like(pid))
+        s = statements.statement_cache.get_statement(('previous_id', boundary_table), the_table,
+                                                     _build_previous_id_query)
 
-        results = _execute_query(engine, s)
+        results = _execute_mapping_query(engine, s, {'pid': pid}, the_table, boundary_table)
     except SQLAlchemyError as ex:
         logger.error(ex)
         raise SpatialQueryException(
@@ -789,206 +1204,406 @@ def get_boundaries_for_previous_id(pid, engine, boundary_table):
     return results
 
 
-def get_intersecting_boundaries_with_buffer(long, lat, engine, table_name, geom, buffer_distance, return_intersection_area = False):
+def _build_primary_key_query(the_table):
+    """
+    Builds the query for the boundary with the bound primary key values, one bound
+    parameter per primary key column named pk_<column>.
+
+    :param the_table: The service boundary table.
+    :type the_table: :py:class:`sqlalchemy.Table`
+    :return: The query.
+    :rtype: :py:class:`sqlalchemy.sql.expression.Select`
+    """
+    return select([the_table, func.ST_AsGML(3, the_table.c.wkb_geometry, 15, 16)],
+                  and_(*[column == bindparam('pk_' + column.name) for column in the_table.primary_key.columns]))
+
+
+def get_boundary_for_primary_key(primary_key, engine, boundary_table):
+    """
+    Executes a query to get a boundary by its primary key.
+
+    :param primary_key: The primary key values, keyed by column name.
+    :type primary_key: ``dict``
+    :param engine: SQLAlchemy database engine.
+    :type engine: :py:class:`sqlalchemy.engine.Engine`
+    :param boundary_table: The name of the service boundary table.
+    :type boundary_table: `str`
+    :return: A list of dictionaries containing the contents of returned rows.
+    """
+    try:
+        the_table = tables.get_table(engine, boundary_table)
+
+        s = statements.statement_cache.get_statement(('primary_key', boundary_table), the_table,
+                                                     _build_primary_key_query)
+
+        results = _execute_mapping_query(engine, s, {'pk_' + name: value for name, value in primary_key.items()},
+                                         the_table, boundary_table)
+    except SQLAlchemyError as ex:
+        logger.error(ex)
+        raise SpatialQueryException(
+            'Unable to construct boundary query.', ex)
+    except SpatialQueryException as ex:
+        logger.error(ex)
+        raise
+
+    return results
+
+
+def _build_all_boundaries_query(the_table):
+    """
+    Builds the query for every boundary of a table along with its GML, in primary key order.
+
+    :param the_table: The service boundary table.
+    :type the_table: :py:class:`sqlalchemy.Table`
+    :return: The query.
+    :rtype: :py:class:`sqlalchemy.sql.expression.Select`
+    """
+    return select([the_table, func.ST_AsGML(3, the_table.c.wkb_geometry, 15, 16).label('ST_AsGML_1')])\
+        .order_by(*the_table.primary_key.columns)
+
+
+def iterate_boundaries(engine, boundary_table):
+    """
+    Streams every boundary of a table along with its GML and :py:data:`BOUNDARY_REF`.
+
+    :param engine: SQLAlchemy database engine.
+    :type engine: :py:class:`sqlalchemy.engine.Engine`
+    :param boundary_table: The name of the service boundary table.
+    :type boundary_table: `str`
+    :return: Dictionaries containing the contents of the rows.
+    :rtype: ``generator``
+    """
+    try:
+        the_table = tables.get_table(engine, boundary_table)
+        s = statements.statement_cache.get_statement(('all_boundaries', boundary_table), the_table,
+                                                     _build_all_boundaries_query)
+    except SQLAlchemyError as ex:
+        logger.error(ex)
+        raise SpatialQueryException(
+            'Unable to construct boundaries query.', ex)
+
+    pk_names = [column.name for column in the_table.primary_key.columns]
+    for row in _iterate_query(engine, s):
+        if pk_names:
+            row[BOUNDARY_REF] = (boundary_table, {name: row[name] for name in pk_names})
+        yield row
+
+
+def _build_intersects_with_buffer_query(the_table, return_intersection_area):
+    """
+    Builds the query for boundaries intersecting the bound geometry buffered by the bound distance.
+
+    :param the_table: The service boundary table.
+    :type the_table: :py:class:`sqlalchemy.Table`
+    :param return_intersection_area: Flag which triggers an area calculation on the Intersecting polygons.
+    :type return_intersection_area: `bool`
+    :return: The query.
+    :rtype: :py:class:`sqlalchemy.sql.expression.Select`
+    """
+    utmsrid = bindparam('utmsrid')
+    buffer_distance = bindparam('buffer_distance')
+    if return_intersection_area:
+        # include a calculation for the intersecting the area
+        buffered = func.ST_Buffer(
+            func.ST_Transform(func.ST_SetSRID(statements.geometry_param(), bindparam('geom_srid')), utmsrid),
+            buffer_distance)
+        return select(_mapping_columns(the_table) + [func.ST_Area(
+            func.ST_Intersection(buffered, the_table.c.wkb_geometry.ST_Transform(utmsrid))).label('AREA_RET')],
+            _intersects_buffered(the_table.c.wkb_geometry, buffered, utmsrid))
+
+    buffered = func.ST_Buffer(func.ST_Transform(func.ST_SetSRID(statements.geometry_param(), 4326), utmsrid),
+                              buffer_distance)
+    return select(_mapping_columns(the_table),
+                  _intersects_buffered(the_table.c.wkb_geometry, buffered, utmsrid))
+
+
+def get_intersecting_boundaries_with_buffer(long, lat, engine, table_name, geom, buffer_distance, return_intersection_area = False,
+                                            result_limit=None, order_by_area=False):
     retval = None
     try:
         # Get a reference to the table we're going to look in.
-        tbl_metadata = MetaData(bind=engine)
-        the_table = Table(table_name, tbl_metadata, autoload=True)
+        the_table = tables.get_table(engine, table_name)
 
-        # Construct the "contains" query and execute it.
+        # Get the buffered "intersects" query and execute it.
         utmsrid = gc_geom.getutmsrid(long, lat, geom.srid)
+        return_area = bool(return_intersection_area)
+        s = statements.statement_cache.get_statement(
+            ('intersects_with_buffer', table_name, return_area) + _limit_key(result_limit, order_by_area),
+            the_table,
+            lambda t: _limit_query(_build_intersects_with_buffer_query(t, return_area), result_limit, order_by_area))
 
+        params = _limit_params(statements.geometry_params(geom), result_limit)
+        params.update({'utmsrid': utmsrid, 'buffer_distance': buffer_distance})
+        retval = _execute_mapping_query(engine, s, params, the_table, table_name)
 
-        if return_intersection_area:
-        # include a calculation for the intersecting the area
+    except SQLAlchemyError as ex:
+        logger.error(ex)
+        raise SpatialQueryException(
+            'Unable to construct contains query.', ex)
+    except SpatialQueryException as ex:
+        logger.error(ex)
+        raise
 
-            s = select([the_table, the_table.c.wkb_geometry.ST_AsGML(), func.ST_Area(
-            func.ST_Intersection(
-                func.ST_Buffer(func.ST_Transform(func.ST_SetSRID(geom, geom.srid), utmsrid), buffer_distance), the_table.c.wkb_geometry.ST_Transform(utmsrid))).label(
-            'AREA_RET')],
-                   func.ST_Intersects(
-                       func.ST_Buffer(func.ST_Transform(func.ST_SetSRID(geom, geom.srid), utmsrid), buffer_distance),
-                       the_table.c.wkb_geometry.ST_Transform(utmsrid)))
+    return retval
 
 
-        else:
+#: Predicate used by the list services queries, boundaries containing the location.
+LIST_SERVICES_CONTAINS = 'contains'
+#: Predicate used by the list services queries, boundaries intersecting the location (transformed to 4326).
+LIST_SERVICES_INTERSECTS = 'intersects'
+
+
+def _list_services_predicate(geometry_column, predicate):
+    """
+    Builds the where clause of a list services query for a boundary geometry column.
+
+    :param geometry_column: The boundary geometry column.
+    :param predicate: :py:data:`LIST_SERVICES_CONTAINS` or :py:data:`LIST_SERVICES_INTERSECTS`.
+    :type predicate: ``str``
+    :return: The where clause.
+    """
+    if predicate == LIST_SERVICES_CONTAINS:
+        return geometry_column.ST_Contains(statements.geometry_param())
+    geom = func.ST_Transform(func.ST_SetSRID(statements.geometry_param(), bindparam('geom_srid')), 4326)
+    return geometry_column.ST_Intersects(geom)
+
+
+def _build_list_services_query(the_tables, predicate):
+    """
+    Builds a single list services query across several service boundary tables, a UNION ALL
+    with one branch per table returning at most one service URN for it.
+
+    :param the_tables: The service boundary tables.
+    :type the_tables: ``tuple`` of :py:class:`sqlalchemy.Table`
+    :param predicate: :py:data:`LIST_SERVICES_CONTAINS` or :py:data:`LIST_SERVICES_INTERSECTS`.
+    :type predicate: ``str``
+    :return: The query, returning (ordinal, serviceurn) rows where ordinal is the position of the table.
+    :rtype: :py:class:`sqlalchemy.sql.expression.CompoundSelect`
+    """
+    branches = []
+    for ordinal, the_table in enumerate(the_tables):
+        # Wrapped so each branch can have its own LIMIT.
+        branch = select([literal_column(str(ordinal)).label('ordinal'), the_table.c.serviceurn],
+                        _list_services_predicate(the_table.c.wkb_geometry, predicate)).limit(1).alias()
+        branches.append(select([branch.c.ordinal, branch.c.serviceurn]))
+    return union_all(*branches)
 
-            s = select([the_table, the_table.c.wkb_geometry.ST_AsGML()],
-                   func.ST_Intersects(func.ST_Buffer(func.ST_Transform(func.ST_SetSRID(geom,4326), utmsrid), buffer_distance),
-                                      the_table.c.wkb_geometry.ST_Transform(utmsrid)))
 
+def _build_list_services_view_query(the_view, predicate):
+    """
+    Builds the list services query against a consolidated service availability view, a view (or
+    table) with the source_table, serviceurn and wkb_geometry of the boundaries of every service
+    boundary table and a single spatial index.
+
+    :param the_view: The service availability view.
+    :type the_view: :py:class:`sqlalchemy.Table`
+    :param predicate: :py:data:`LIST_SERVICES_CONTAINS` or :py:data:`LIST_SERVICES_INTERSECTS`.
+    :type predicate: ``str``
+    :return: The query, returning one (source_table, serviceurn) row per matching table.
+    :rtype: :py:class:`sqlalchemy.sql.expression.Select`
+    """
+    return select([the_view.c.source_table, the_view.c.serviceurn],
+                  the_view.c.source_table == func.any(bindparam('source_tables')))\
+        .where(_list_services_predicate(the_view.c.wkb_geometry, predicate))\
+        .distinct(the_view.c.source_table)
 
 
-        retval = _execute_query(engine, s)
+def get_list_services_for_geom(engine, table_names, geom, predicate, availability_view=None):
+    """
+    Finds the service URN of the boundary matching the given geometry in each of the given
+    tables with one query, rather than one query per table.
+
+    :param engine: SQLAlchemy database engine.
+    :type engine: :py:class:`sqlalchemy.engine.Engine`
+    :param table_names: The names of the service boundary tables.
+    :type table_names: ``list`` of ``str``
+    :param geom: The geometry to use in the search as a GeoAlchemy WKBElement.
+    :type geom: :py:class:geoalchemy2.types.WKBElement
+    :param predicate: :py:data:`LIST_SERVICES_CONTAINS` or :py:data:`LIST_SERVICES_INTERSECTS`.
+    :type predicate: ``str``
+    :param availability_view: The name of the consolidated service availability view to query
+                              instead of the individual tables, if any.
+    :type availability_view: ``str``
+    :return: For each table in order, a list holding the matching row or None if nothing matched.
+    :rtype: ``list``
+    """
+    table_names = tuple(table_names)
+    if not table_names:
+        return []
 
+    try:
+        params = statements.geometry_params(geom)
+        if availability_view:
+            the_view = tables.get_table(engine, availability_view)
+            s = statements.statement_cache.get_statement(
+                ('list_services_view', availability_view, predicate),
+                the_view,
+                lambda t: _build_list_services_view_query(t, predicate))
+            params['source_tables'] = list(table_names)
+            rows = _execute_query(engine, s, params) or []
+            positions = {name: position for position, name in reversed(list(enumerate(table_names)))}
+            matches = {positions[row['source_table']]: row['serviceurn'] for row in rows}
+        else:
+            the_tables = tuple(tables.get_table(engine, table_name) for table_name in table_names)
+            s = statements.statement_cache.get_statement(
+                ('list_services', table_names, predicate),
+                the_tables,
+                lambda t: _build_list_services_query(t, predicate))
+            rows = _execute_query(engine, s, params) or []
+            matches = {int(row['ordinal']): row['serviceurn'] for row in rows}
     except SQLAlchemyError as ex:
         logger.error(ex)
         raise SpatialQueryException(
-            'Unable to construct contains query.', ex)
+            'Unable to construct list services query.', ex)
     except SpatialQueryException as ex:
         logger.error(ex)
         raise
 
-    return retval
+    return [[{'serviceurn': matches[position]}] if position in matches else None
+            for position in range(len(table_names))]
 
 
-def get_list_service_for_point(point: geodetic_point, boundary_table, engine):
+def get_list_service_for_point(point: geodetic_point, boundary_table, engine, availability_view=None):
     """
+    Executes a single contains query for a point across all of the given tables.
 
     :param point: location object
     :type point: `location`
-    :param boundary_table: The name of the service boundary table.
-    :type boundary_table: `str`
+    :param boundary_table: The names of the service boundary tables.
+    :type boundary_table: ``list`` of ``str``
     :param engine: SQLAlchemy database engine.
     :type engine: :py:class:`sqlalchemy.engine.Engine`
-    :return: 
+    :param availability_view: The name of the consolidated service availability view, if any.
+    :type availability_view: ``str``
+    :return: For each table, a list holding the matching row or None.
     """
     wkb_pt = point.to_wkbelement(project_to=4326)
-    # Run the query.
-    return (_get_list_service_for_geom(engine, i, wkb_pt) for i in boundary_table)
+    return get_list_services_for_geom(engine, boundary_table, wkb_pt, LIST_SERVICES_CONTAINS, availability_view)
 
 
-def get_intersecting_list_services_for_circle(location: geodetic_circle, boundary_table, engine, return_intersection_area=False, return_shape=False, proximity_search = False, proximity_buffer = 0):
+def get_intersecting_list_services_for_circle(location: geodetic_circle, boundary_table, engine, return_intersection_area=False, return_shape=False, proximity_search = False, proximity_buffer = 0, availability_view=None, query_pool=None):
     """    
     Executes an intersection query for a circle.
 
     :param location: location object
     :type location: :py:class:Geodetic2D
-    :param boundary_table: The name of the service boundary table.
-    :type boundary_table: `str`
+    :param boundary_table: The names of the service boundary tables.
+    :type boundary_table: ``list`` of ``str``
     :param engine: SQLAlchemy database engine.
     :type engine: :py:class:`sqlalchemy.engine.Engine`
     :param return_intersection_area: Flag which triggers an area calculation on the Intersecting polygons.
     :type return_intersection_area: `bool`
      :param return_shape: Flag which triggers the return of the shape in GML.
     :type return_shape: `bool`
-    :return: A list of dictionaries containing the contents of returned rows.
+    :param availability_view: The name of the consolidated service availability view, if any.
+    :type availability_view: ``str``
+    :param query_pool: Pool to run the per-table queries on concurrently, None runs them one after another.
+    :type query_pool: :py:class:`lostservice.db.concurrency.QueryPool`
+    :return: For each table, a list of dictionaries containing the contents of returned rows or None.
     """
 
     # Get a version of the circle we can use.
     wkb_circle = location.to_wkbelement(project_to=4326)
 
-    # Now execute the query.
+    if return_intersection_area:
+        # The areas need the full rows, query each table on its own.
+        return _map_tables(query_pool, lambda i: _get_intersecting_list_service_for_geom(engine, i, wkb_circle, True),
+                           boundary_table)
 
-    return (_get_intersecting_list_service_for_geom(engine, i, wkb_circle, return_intersection_area) for i in boundary_table)
+    return get_list_services_for_geom(engine, boundary_table, wkb_circle, LIST_SERVICES_INTERSECTS,
+                                      availability_view)
 
 
-def get_intersecting_list_service_for_polygon(location: geodetic_polygon, boundary_table, engine, return_intersection_area=False, proximity_search = False, proximity_buffer = 0 ):
+def get_intersecting_list_service_for_polygon(location: geodetic_polygon, boundary_table, engine, return_intersection_area=False, proximity_search = False, proximity_buffer = 0, availability_view=None, query_pool=None):
     """
     Executes an intersection query for a polygon.
 
     :param location: location object
     :type location: :py:class:Geodetic2D
-    :param boundary_table: The name of the service boundary table.
-    :type boundary_table: `str`
+    :param boundary_table: The names of the service boundary tables.
+    :type boundary_table: ``list`` of ``str``
     :param engine: SQLAlchemy database engine.
     :type engine: :py:class:`sqlalchemy.engine.Engine`
     :param return_intersection_area: Flag which triggers an area calculation on the Intersecting polygons.
     :type return_intersection_area: `bool`
-    :return: A list of dictionaries containing the contents of returned rows.
+    :param availability_view: The name of the consolidated service availability view, if any.
+    :type availability_view: ``str``
+    :param query_pool: Pool to run the per-table queries on concurrently, None runs them one after another.
+    :type query_pool: :py:class:`lostservice.db.concurrency.QueryPool`
+    :return: For each table, a list of dictionaries containing the contents of returned rows or None.
     """
     # Pull out just the number from the SRID
     trimmed_srid = int(location.spatial_ref.split('::')[1])
-    p = []
-    points = location.vertices
-    for point in points:
-        long, lat = gc_geom.reproject_point(point[0], point[1], trimmed_srid, 4326)
-        p.append([long, lat])
-
-    ring = LinearRing(p)
     wkb_ring = location.to_wkbelement(project_to=trimmed_srid)
 
-    return (_get_intersecting_list_service_for_geom(engine, i, wkb_ring, return_intersection_area) for i in
-            boundary_table)
+    if return_intersection_area:
+        # The areas need the full rows, query each table on its own.
+        return _map_tables(query_pool, lambda i: _get_intersecting_list_service_for_geom(engine, i, wkb_ring, True),
+                           boundary_table)
+
+    return get_list_services_for_geom(engine, boundary_table, wkb_ring, LIST_SERVICES_INTERSECTS, availability_view)
 
 
-def get_list_services_for_ellipse(location: geodetic_ellipse, boundary_table, engine):
+def get_list_services_for_ellipse(location: geodetic_ellipse, boundary_table, engine, availability_view=None):
     """
-    Executes a contains query for a polygon.
+    Executes a single intersection query for an ellipse across all of the given tables.
 
     :param location: location object
     :type location: :py:class:Geodetic2D
-    :param boundary_table: The name of the service boundary table.
-    :type boundary_table: `str`
+    :param boundary_table: The names of the service boundary tables.
+    :type boundary_table: ``list`` of ``str``
     :param engine: SQLAlchemy database engine.
     :type engine: :py:class:`sqlalchemy.engine.Engine`
-    :return: A list of dictionaries containing the contents of returned rows.
+    :param availability_view: The name of the consolidated service availability view, if any.
+    :type availability_view: ``str``
+    :return: For each table, a list holding the matching row or None.
     """
-
-    return (_get_list_services_for_ellipse(location, i, engine) for i in boundary_table)
+    wkb_ellipse = location.to_wkbelement(project_to=4326)
+    return get_list_services_for_geom(engine, boundary_table, wkb_ellipse, LIST_SERVICES_INTERSECTS,
+                                      availability_view)
 
 
-def _get_list_services_for_ellipse(location: geodetic_ellipse, boundary_table, engine):
+def _build_list_service_with_buffer_query(the_table, return_intersection_area):
     """
-    Executes a contains query for a polygon.
+    Builds the list services query for boundaries intersecting the bound geometry buffered by the bound distance.
 
-    :param location: location object
-    :type location: :py:class:Geodetic2D
-    :param boundary_table: The name of the service boundary table.
-    :type boundary_table: `str`
-    :param engine: SQLAlchemy database engine.
-    :type engine: :py:class:`sqlalchemy.engine.Engine`
-    :return: A list of dictionaries containing the contents of returned rows.
+    :param the_table: The service boundary table.
+    :type the_table: :py:class:`sqlalchemy.Table`
+    :param return_intersection_area: Flag which triggers an area calculation on the Intersecting polygons.
+    :type return_intersection_area: `bool`
+    :return: The query.
+    :rtype: :py:class:`sqlalchemy.sql.expression.Select`
     """
-    # Pull out just the number from the SRID
-
-    try:
-        # Get a reference to the table we're going to look in.
-        tbl_metadata = MetaData(bind=engine)
-        the_table = Table(boundary_table, tbl_metadata, autoload=True)
-        wkb_ellipse = location.to_wkbelement(project_to=4326)
-
-        s = select(
-            [
-                the_table,
-                func.ST_AsGML(3, the_table.c.wkb_geometry, 15, 16),
-                func.ST_Area(the_table.c.wkb_geometry.ST_Intersection(func.ST_SetSRID(wkb_ellipse, 4326))).label(
-                    'AREA_RET')
-            ],
-            the_table.c.wkb_geometry.ST_Intersects(wkb_ellipse)
-        )
+    utmsrid = bindparam('utmsrid')
+    buffered = func.ST_Buffer(func.ST_Transform(func.ST_SetSRID(statements.geometry_param(), 4326), utmsrid),
+                              bindparam('buffer_distance'))
+    if return_intersection_area:
+        # include a calculation for the intersecting the area
+        return select([the_table.c.serviceurn, the_table.c.wkb_geometry.ST_AsGML(), func.ST_Area(
+            func.ST_Intersection(buffered, the_table.c.wkb_geometry.ST_Transform(utmsrid))).label('AREA_RET')],
+            _intersects_buffered(the_table.c.wkb_geometry, buffered, utmsrid))
 
-        results = _execute_query(engine, s)
-    except SQLAlchemyError as ex:
-        logger.error(ex)
-        raise SpatialQueryException(
-            'Unable to construct ellipse intersection query.', ex)
-    except SpatialQueryException as ex:
-        logger.error(ex)
-        raise
-    return results
+    return select([the_table.c.serviceurn, the_table.c.wkb_geometry.ST_AsGML()],
+                  _intersects_buffered(the_table.c.wkb_geometry, buffered, utmsrid))
 
 
 def get_intersecting_list_service_with_buffer(long, lat, engine, table_name, geom, buffer_distance, return_intersection_area = False):
     retval = None
     try:
         # Get a reference to the table we're going to look in.
-        tbl_metadata = MetaData(bind=engine)
-        the_table = Table(table_name, tbl_metadata, autoload=True)
+        the_table = tables.get_table(engine, table_name)
 
-        # Construct the "contains" query and execute it.
+        # Get the buffered "intersects" query and execute it.
         utmsrid = gc_geom.getutmsrid(longitude=long, latitude=lat)
+        return_area = bool(return_intersection_area)
+        s = statements.statement_cache.get_statement(
+            ('list_service_with_buffer', table_name, return_area),
+            the_table,
+            lambda t: _build_list_service_with_buffer_query(t, return_area))
 
-        if return_intersection_area:
-        # include a calculation for the intersecting the area
-
-            s = select([the_table.c.serviceurn, the_table.c.wkb_geometry.ST_AsGML(), func.ST_Area(
-            func.ST_Intersection(
-                func.ST_Buffer(func.ST_Transform(func.ST_SetSRID(geom, 4326), utmsrid), buffer_distance), the_table.c.wkb_geometry.ST_Transform(utmsrid))).label(
-            'AREA_RET')],
-                   func.ST_Intersects(
-                       func.ST_Buffer(func.ST_Transform(func.ST_SetSRID(geom, 4326), utmsrid), buffer_distance),
-                       the_table.c.wkb_geometry.ST_Transform(utmsrid)))
-
-
-        else:
-
-            s = select([the_table.c.serviceurn, the_table.c.wkb_geometry.ST_AsGML()],
-                   func.ST_Intersects(func.ST_Buffer(func.ST_Transform(func.ST_SetSRID(geom,4326), utmsrid), buffer_distance),
-                                      the_table.c.wkb_geometry.ST_Transform(utmsrid)))
-
-        retval = _execute_query(engine, s)
+        params = statements.geometry_params(geom)
+        params.update({'utmsrid': utmsrid, 'buffer_distance': buffer_distance})
+        retval = _execute_query(engine, s, params)
 
     except SQLAlchemyError as ex:
         logger.error(ex)
@@ -1001,6 +1616,47 @@ def get_intersecting_list_service_with_buffer(long, lat, engine, table_name, geo
     return retval
 
 
+def _build_list_service_intersects_query(the_table, return_intersection_area):
+    """
+    Builds the list services query for boundaries intersecting the bound geometry (transformed to 4326).
+
+    :param the_table: The service boundary table.
+    :type the_table: :py:class:`sqlalchemy.Table`
+    :param return_intersection_area: Flag which triggers an area calculation on the Intersecting polygons.
+    :type return_intersection_area: `bool`
+    :return: The query.
+    :rtype: :py:class:`sqlalchemy.sql.expression.Select`
+    """
+    geom = func.ST_Transform(func.ST_SetSRID(statements.geometry_param(), bindparam('geom_srid')), 4326)
+    if return_intersection_area:
+        # include a calculation for the intersecting the area
+        return select(
+            [the_table.c.serviceurn, func.ST_Area(the_table.c.wkb_geometry.ST_Intersection(geom)).label('AREA_RET')],
+            the_table.c.wkb_geometry.ST_Intersects(geom))
+
+    return select(
+        [the_table.c.serviceurn, func.ST_AsGML(3, the_table.c.wkb_geometry, 15, 16)],
+        the_table.c.wkb_geometry.ST_Intersects(geom))
+
+
+def _map_tables(query_pool, query, table_names):
+    """
+    Runs a query for each table, concurrently when there is a query pool.
+
+    :param query_pool: The pool to run the queries on, or None.
+    :type query_pool: :py:class:`lostservice.db.concurrency.QueryPool`
+    :param query: The function running the query for one table name.
+    :type query: ``callable``
+    :param table_names: The table names.
+    :type table_names: ``list`` of ``str``
+    :return: The results, in table order.
+    :rtype: ``list``
+    """
+    if query_pool is None:
+        return [query(table_name) for table_name in table_names]
+    return query_pool.map(query, table_names)
+
+
 def _get_intersecting_list_service_for_geom(engine, table_name, geom, return_intersection_area):
     """
     Queries the given table for any boundaries that intersect the given geometry.
@@ -1016,26 +1672,16 @@ def _get_intersecting_list_service_for_geom(engine, table_name, geom, return_int
     retval = None
     try:
         # Get a reference to the table we're going to look in.
-        tbl_metadata = MetaData(bind=engine)
-        the_table = Table(table_name, tbl_metadata, autoload=True)
-
-        # s = select([the_table, the_table.c.wkb_geometry.ST_AsGML()], the_table.c.wkb_geometry.ST_Contains(geom))
-
-        # Construct the "intersection" query and execute
-        if return_intersection_area:
-            # include a calculation for the intersecting the area
-            s = select(
-                [the_table.c.serviceurn, func.ST_Area(
-                    the_table.c.wkb_geometry.ST_Intersection(func.ST_Transform(func.ST_SetSRID(geom, geom.srid), 4326))).label('AREA_RET')],
-                the_table.c.wkb_geometry.ST_Intersects(func.ST_Transform(func.ST_SetSRID(geom, geom.srid), 4326)))
-        else:
+        the_table = tables.get_table(engine, table_name)
 
-            s = select(
-                [the_table.c.serviceurn, func.ST_AsGML(3, the_table.c.wkb_geometry, 15, 16)],
-                the_table.c.wkb_geometry.ST_Intersects(func.ST_Transform(func.ST_SetSRID(geom, geom.srid), 4326)))
+        # Get the "intersection" query and execute
+        return_area = bool(return_intersection_area)
+        s = statements.statement_cache.get_statement(
+            ('list_service_intersects', table_name, return_area),
+            the_table,
+            lambda t: _build_list_service_intersects_query(t, return_area))
 
-
-        results = _execute_query(engine, s)
+        results = _execute_query(engine, s, statements.geometry_params(geom))
     except SQLAlchemyError as ex:
         logger.error(ex)
         raise SpatialQueryException(
@@ -1045,34 +1691,3 @@ def _get_intersecting_list_service_for_geom(engine, table_name, geom, return_int
         raise
 
     return results
-
-
-def _get_list_service_for_geom(engine, table_name, geom):
-    """
-    Queries the given table for the boundary in which the given
-    geometry falls.
-
-    :param engine: SQLAlchemy database engine
-    :type engine: :py:class:`sqlalchemy.engine.Engine`
-    :param table_name: The name of the service boundary table.
-    :type table_name: `str`
-    :param geom: The geometry to use in the search as a GeoAlchemy WKBElement.
-    :type geom: :py:class:geoalchemy2.types.WKBElement
-    :return: A list of dictionaries containing the contents of returned rows.
-    """
-    retval = None
-    try:
-        # Get a reference to the table we're going to look in.
-        tbl_metadata = MetaData(bind=engine)
-        the_table = Table(table_name, tbl_metadata, autoload=True)
-        # Construct the "contains" query and execute it.
-        s = select([the_table.c.serviceurn], the_table.c.wkb_geometry.ST_Contains(geom))
-        retval = _execute_query(engine, s)
-    except SQLAlchemyError as ex:
-        logger.error(ex)
-        raise SpatialQueryException(
-            'Unable to construct contains query.', ex)
-    except SpatialQueryException as sqe:
-        logger.error(sqe)
-        raise
-    return retval
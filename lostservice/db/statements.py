@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. currentmodule:: lostservice.db.statements
+.. moduleauthor:: Tom Weitzel <tweitzel@geo-comm.com>
+
+Cache of the statements used by the spatial queries.
+
+The shape of each spatial query only depends on the table and a couple of flags,
+the location itself is always passed in as a bound parameter.  Statements are
+built once per (query kind, table, flags) key and executed with a shared compiled
+cache so SQLAlchemy doesn't have to regenerate the SQL text on every request.
+"""
+
+import threading
+from sqlalchemy.sql import bindparam
+from sqlalchemy.sql.functions import func
+from sqlalchemy.util import LRUCache
+
+
+def geometry_param(name='geom'):
+    """
+    Creates the SQL expression for a geometry passed in as a bound parameter.
+
+    :param name: The base name of the bound parameters.
+    :type name: ``str``
+    :return: An ST_GeomFromWKB expression over the bound WKB and SRID parameters.
+    """
+    return func.ST_GeomFromWKB(bindparam(name + '_wkb'), bindparam(name + '_srid'))
+
+
+def geometry_params(geom, name='geom'):
+    """
+    Gets the values of the bound parameters created by :py:func:`geometry_param`.
+
+    :param geom: The geometry as a GeoAlchemy WKBElement.
+    :type geom: :py:class:geoalchemy2.types.WKBElement
+    :param name: The base name of the bound parameters.
+    :type name: ``str``
+    :return: The parameter values.
+    :rtype: ``dict``
+    """
+    data = geom.data
+    if isinstance(data, str):
+        data = bytes.fromhex(data)
+    return {name + '_wkb': bytes(data), name + '_srid': geom.srid}
+
+
+def _same_tables(cached, table):
+    """
+    Checks whether a statement was built against the given table (or tuple of tables).
+    """
+    if isinstance(table, tuple):
+        return (isinstance(cached, tuple) and len(cached) == len(table) and
+                all(first is second for first, second in zip(cached, table)))
+    return cached is table
+
+
+class StatementCache(object):
+    """
+    Thread-safe cache of statements keyed by (query kind, table name, flags...).
+
+    :param compiled_cache_size: The maximum number of compiled statements to keep.
+    :type compiled_cache_size: ``int``
+    """
+    def __init__(self, compiled_cache_size=500):
+        """
+        Constructor.
+        """
+        super(StatementCache, self).__init__()
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._compiled_cache = LRUCache(compiled_cache_size)
+
+    @property
+    def compiled_cache(self):
+        """
+        The compiled cache to pass to the connection execution options.
+
+        :return: The compiled cache.
+        :rtype: :py:class:`sqlalchemy.util.LRUCache`
+        """
+        return self._compiled_cache
+
+    def get_statement(self, key, table, builder):
+        """
+        Gets the statement for the given key, building it if necessary.  If the table
+        has been re-reflected since the statement was built it is rebuilt.
+
+        :param key: The cache key, the table name (or a tuple of table names) is expected to be the second element.
+        :type key: ``tuple``
+        :param table: The table the statement runs against, or a tuple of tables for statements spanning several.
+        :type table: :py:class:`sqlalchemy.Table`
+        :param builder: Function taking the table and returning the statement.
+        :type builder: ``callable``
+        :return: The statement.
+        """
+        entry = self._statements.get(key)
+        if entry is None or not _same_tables(entry[0], table):
+            statement = builder(table)
+            with self._lock:
+                self._statements[key] = (table, statement)
+            return statement
+        return entry[1]
+
+    def invalidate(self, table_name=None):
+        """
+        Drops cached statements.
+
+        :param table_name: The table to drop statements for, if None all statements are dropped.
+        :type table_name: ``str``
+        """
+        with self._lock:
+            if table_name is None:
+                self._statements.clear()
+            else:
+                for key in [key for key in self._statements.keys()
+                            if key[1] == table_name or (isinstance(key[1], tuple) and table_name in key[1])]:
+                    del self._statements[key]
+            self._compiled_cache.clear()
+
+    def __len__(self):
+        return len(self._statements)
+
+
+statement_cache = StatementCache()
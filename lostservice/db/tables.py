@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. currentmodule:: lostservice.db.tables
+.. moduleauthor:: Tom Weitzel <tweitzel@geo-comm.com>
+
+Process wide registry of reflected tables.
+
+Reflecting a table costs a handful of round trips to the catalog, so rather than
+autoloading the service boundary tables on every query they are reflected once and
+reused until explicitly invalidated (e.g. after the boundary data has been reloaded).
+"""
+
+import threading
+from sqlalchemy import MetaData, Table
+from lostservice.configuration import general_logger
+logger = general_logger()
+
+
+class TableRegistry(object):
+    """
+    Thread-safe cache of reflected :py:class:`sqlalchemy.Table` objects, keyed by
+    database url, schema and table name.
+    """
+    def __init__(self):
+        """
+        Constructor.
+        """
+        super(TableRegistry, self).__init__()
+        self._lock = threading.RLock()
+        self._tables = {}
+
+    @staticmethod
+    def _engine_key(engine):
+        """
+        Gets the key used to distinguish tables from different databases.
+
+        :param engine: SQLAlchemy database engine.
+        :type engine: :py:class:`sqlalchemy.engine.Engine`
+        :return: The key for the engine.
+        :rtype: ``str``
+        """
+        return str(engine.url)
+
+    def _reflect(self, engine, table_name, schema=None):
+        """
+        Reflects a single table from the database.
+
+        :param engine: SQLAlchemy database engine.
+        :type engine: :py:class:`sqlalchemy.engine.Engine`
+        :param table_name: The name of the table.
+        :type table_name: ``str``
+        :param schema: The schema of the table, if not the default.
+        :type schema: ``str``
+        :return: The reflected table.
+        :rtype: :py:class:`sqlalchemy.Table`
+        """
+        logger.debug('Reflecting table {0}.'.format(table_name if schema is None else schema + '.' + table_name))
+        return Table(table_name, MetaData(), autoload=True, autoload_with=engine, schema=schema)
+
+    def get_table(self, engine, table_name, schema=None):
+        """
+        Gets the reflected table with the given name, reflecting it on first use.
+
+        :param engine: SQLAlchemy database engine.
+        :type engine: :py:class:`sqlalchemy.engine.Engine`
+        :param table_name: The name of the table.
+        :type table_name: ``str``
+        :param schema: The schema of the table, if not the default.
+        :type schema: ``str``
+        :return: The reflected table.
+        :rtype: :py:class:`sqlalchemy.Table`
+        """
+        key = (self._engine_key(engine), schema, table_name)
+        table = self._tables.get(key)
+        if table is None:
+            with self._lock:
+                table = self._tables.get(key)
+                if table is None:
+                    table = self._reflect(engine, table_name, schema)
+                    self._tables[key] = table
+        return table
+
+    def preload(self, engine, table_names, schema=None):
+        """
+        Reflects the given tables ahead of time so the first request doesn't pay for it.
+
+        :param engine: SQLAlchemy database engine.
+        :type engine: :py:class:`sqlalchemy.engine.Engine`
+        :param table_names: The names of the tables to reflect.
+        :type table_names: ``list`` of ``str``
+        :param schema: The schema of the tables, if not the default.
+        :type schema: ``str``
+        """
+        for table_name in table_names:
+            self.get_table(engine, table_name, schema)
+
+    def invalidate(self, table_name=None, engine=None):
+        """
+        Drops tables from the registry so they are reflected again on next use.
+
+        :param table_name: The table to drop, if None all tables are dropped.
+        :type table_name: ``str``
+        :param engine: Restricts the invalidation to tables for the given engine.
+        :type engine: :py:class:`sqlalchemy.engine.Engine`
+        """
+        engine_key = self._engine_key(engine) if engine is not None else None
+        with self._lock:
+            for key in list(self._tables.keys()):
+                if (table_name is None or key[2] == table_name) and (engine_key is None or key[0] == engine_key):
+                    del self._tables[key]
+
+    def refresh(self, engine, table_names=None, schema=None):
+        """
+        Re-reflects tables, replacing the cached definitions.  The old definition
+        stays visible to readers until the new one is ready.
+
+        :param engine: SQLAlchemy database engine.
+        :type engine: :py:class:`sqlalchemy.engine.Engine`
+        :param table_names: The tables to refresh, if None every known table for the engine is refreshed.
+        :type table_names: ``list`` of ``str``
+        :param schema: The schema of the tables, if not the default.
+        :type schema: ``str``
+        """
+        engine_key = self._engine_key(engine)
+        with self._lock:
+            if table_names is None:
+                keys = [key for key in self._tables.keys() if key[0] == engine_key]
+            else:
+                keys = [(engine_key, schema, table_name) for table_name in table_names]
+
+            for key in keys:
+                self._tables[key] = self._reflect(engine, key[2], key[1])
+
+    def table_names(self, engine):
+        """
+        Gets the names of the tables currently held for the given engine.
+
+        :param engine: SQLAlchemy database engine.
+        :type engine: :py:class:`sqlalchemy.engine.Engine`
+        :return: The table names.
+        :rtype: ``list`` of ``str``
+        """
+        engine_key = self._engine_key(engine)
+        return [key[2] for key in list(self._tables.keys()) if key[0] == engine_key]
+
+
+registry = TableRegistry()
+
+
+def get_table(engine, table_name, schema=None):
+    """
+    Gets a reflected table from the process wide registry.
+
+    :param engine: SQLAlchemy database engine.
+    :type engine: :py:class:`sqlalchemy.engine.Engine`
+    :param table_name: The name of the table.
+    :type table_name: ``str``
+    :param schema: The schema of the table, if not the default.
+    :type schema: ``str``
+    :return: The reflected table.
+    :rtype: :py:class:`sqlalchemy.Table`
+    """
+    return registry.get_table(engine, table_name, schema)
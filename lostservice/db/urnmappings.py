@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. currentmodule:: lostservice.db.urnmappings
+.. moduleauthor:: Tom Weitzel <tweitzel@geo-comm.com>
+
+The service urn to table mappings, kept current without a restart.
+
+The mappings are discovered once and published as a read-only snapshot.  When the
+snapshot gets old it is rediscovered on a background thread and the new snapshot
+replaces the old one all at once, requests keep using the old one in the meantime
+and never wait for the database.  :py:meth:`UrnMappingService.refresh` rediscovers
+them straight away, e.g. after a new service boundary layer has been loaded.
+"""
+
+import threading
+import time
+from types import MappingProxyType
+from lostservice.configuration import general_logger
+import lostservice.db.utilities as dbutilities
+logger = general_logger()
+
+
+class UrnMappingService(object):
+    """
+    Thread-safe holder of the service urn to table mappings.
+
+    :param engine: SQLAlchemy database engine.
+    :type engine: :py:class:`sqlalchemy.engine.Engine`
+    :param refresh_seconds: How old the mappings can get before they are rediscovered, 0 never rediscovers them.
+    :type refresh_seconds: ``float``
+    :param mapping_table: The name of a table listing the mappings (serviceurn, table_name), if any.
+    :type mapping_table: ``str``
+    :param clock: Function returning the current time in seconds.
+    :type clock: ``callable``
+    """
+    def __init__(self, engine, refresh_seconds=300.0, mapping_table=None, clock=time.monotonic):
+        """
+        Constructor.
+        """
+        super(UrnMappingService, self).__init__()
+        self._engine = engine
+        self._refresh_seconds = refresh_seconds
+        self._mapping_table = mapping_table
+        self._clock = clock
+        self._load_lock = threading.Lock()
+        self._mappings = None
+        self._loaded_at = None
+
+    def _load(self):
+        """
+        Discovers the mappings and publishes them.
+        """
+        mappings = MappingProxyType(dbutilities.get_urn_table_mappings(self._engine, self._mapping_table))
+        self._mappings = mappings
+        self._loaded_at = self._clock()
+        logger.info('Discovered {0} service urn to table mappings.'.format(len(mappings)))
+
+    def get(self):
+        """
+        Gets the current mappings, discovering them on first use.
+
+        :return: The service URNs as keys and associated table names as values.
+        :rtype: :py:class:`types.MappingProxyType`
+        """
+        mappings = self._mappings
+        if mappings is None:
+            with self._load_lock:
+                if self._mappings is None:
+                    self._load()
+                return self._mappings
+        if self._refresh_seconds and self._clock() - self._loaded_at >= self._refresh_seconds:
+            self._refresh_in_background()
+        return mappings
+
+    def refresh(self):
+        """
+        Rediscovers the mappings now.
+        """
+        with self._load_lock:
+            self._load()
+
+    def _refresh_in_background(self):
+        """
+        Starts rediscovering the mappings on another thread, unless that is already under way.
+        """
+        if not self._load_lock.acquire(blocking=False):
+            return
+        try:
+            threading.Thread(target=self._background_refresh, name='urn-mapping-refresh', daemon=True).start()
+        except Exception:
+            self._load_lock.release()
+            raise
+
+    def _background_refresh(self):
+        """
+        Rediscovers the mappings, keeping the current ones if that fails.  Releases the lock taken by
+        :py:meth:`_refresh_in_background`.
+        """
+        try:
+            self._load()
+        except Exception as ex:
+            logger.warning('Unable to refresh the service urn to table mappings, keeping the current ones: {0}'
+                           .format(ex))
+            self._loaded_at = self._clock()
+        finally:
+            self._load_lock.release()
@@ -7,12 +7,14 @@
 General database utility functions
 """
 
-from sqlalchemy import MetaData, Table
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.sql import select, or_
+from sqlalchemy.sql import select, and_, or_, table, column, literal, union_all, func
 from lostservice.configuration import general_logger
+import lostservice.db.tables as tables
 logger = general_logger()
-cached_urn_mappings = {}
+
+#: The prefix of a boundary table comment naming the table's service urn.
+URN_COMMENT_PREFIX = 'urn:'
 
 
 class MappingDiscoveryException(Exception):
@@ -30,90 +32,127 @@ class MappingDiscoveryException(Exception):
         self._nested = nested
 
 
-def _get_serviceurn(tablename, engine):
+def _boundary_table_names(engine):
     """
-    Gets the service urn from a emergency services boundary table.
+    Finds the service boundary tables, those named esb... or aloc... with a serviceurn column.
 
-    :param tablename: The name of the ESB table
-    :type tablename: ``str``
     :param engine: An instance of the database engine.
     :type engine:  :py:class:`sqlalchemy.engine.Engine`
-    :return: ``str``
+    :return: The table names.
+    :rtype: ``list`` of ``str``
     """
-    urn = None
-    try:
-        result = None
-        tbl_metadata = MetaData(bind=engine)
-        esb_table = Table(tablename, tbl_metadata, autoload=True)
-
-        q = select([esb_table.c.serviceurn]).distinct()
-
-        with engine.connect() as conn:
-            result = conn.execute(q)
-            rows = result.fetchall()
-            if len(rows) > 1:
-                raise MappingDiscoveryException(
-                    'Table {0} contained more than one service urn: {1}'.format(tablename, rows))
-            urn = rows[0]['serviceurn']
-            result.close()
-            conn.close()
+    info_columns = tables.get_table(engine, 'columns', schema='information_schema')
+    s = select([info_columns.c.table_name]).where(
+        and_(
+            info_columns.c.column_name == 'serviceurn',
+            or_(
+                info_columns.c.table_name.like('esb%'),
+                info_columns.c.table_name.like('aloc%')))).distinct()
 
-    except SQLAlchemyError as ex:
-        logger.error('Failed to extract mapping for table {0}'.format(tablename), ex)
-        raise MappingDiscoveryException('Failed to extract mapping for table {0}'.format(tablename), ex)
-    except MappingDiscoveryException as mpe:
-        logger.error(mpe)
-        raise
-    except Exception as ex:
-        logger.error(ex)
+    with engine.connect() as conn:
+        return sorted(row['table_name'] for row in conn.execute(s))
 
-    return urn
+
+def _table_comment_query(table_names):
+    """
+    Builds the catalog query for the comments on the boundary tables.
+    """
+    pg_class = table('pg_class', column('oid'), column('relname'))
+    return select([pg_class.c.relname.label('table_name'),
+                   func.obj_description(pg_class.c.oid, 'pg_class').label('comment')]).where(
+        and_(pg_class.c.relname.in_(table_names), func.pg_table_is_visible(pg_class.c.oid)))
 
 
-def get_urn_table_mappings(engine):
+def _table_comment_urns(engine, table_names):
     """
-    Inspects the database and extracts the service urn to table mappings.
+    Reads the service urns set as comments on the boundary tables, e.g.
+    ``COMMENT ON TABLE esbpsap IS 'urn:nena:service:sos.psap'``, from the catalog.  Those tables don't
+    have to be scanned for their urn.  Only PostgreSQL keeps table comments.
 
     :param engine: An instance of the database engine.
     :type engine:  :py:class:`sqlalchemy.engine.Engine`
-    :return: A dictionary containing the service URNs as keys and associated table names as values
+    :param table_names: The boundary table names.
+    :type table_names: ``list`` of ``str``
+    :return: The service urn of each table with one in its comment, by table name.
     :rtype: ``dict``
     """
-    mappings = {}
-    try:
-        logger.debug(f'cached_urn_mappings: {cached_urn_mappings}')
-        # check in to see if already have service_urn values
-        if cached_urn_mappings == {}:
-            result = None
-            metadata = MetaData(bind=engine, schema='information_schema')
-            info_table = Table('tables', metadata, autoload=True)
-            s = select([info_table.c.table_name]).where(
-                or_(
-                    info_table.c.table_name.like('esb%'),
-                    info_table.c.table_name.like('aloc%')))
+    if engine.dialect.name != 'postgresql':
+        return {}
+    with engine.connect() as conn:
+        return {row['table_name']: row['comment'].strip() for row in conn.execute(_table_comment_query(table_names))
+                if row['comment'] and row['comment'].strip().startswith(URN_COMMENT_PREFIX)}
 
-            with engine.connect() as conn:
-                result = conn.execute(s)
 
-                for row in result:
-                    tablename = row['table_name']
-                    urn = _get_serviceurn(tablename, engine)
-                    mappings[urn] = tablename
-                    cached_urn_mappings[urn] = tablename
+def _serviceurn_query(table_names):
+    """
+    Builds one query for the service urns of all of the boundary tables, at most two distinct urns per
+    table are read, enough to tell a table holding more than one.
+    """
+    queries = []
+    for table_name in table_names:
+        urns = select([column('serviceurn')]).select_from(table(table_name)).distinct().limit(2).alias()
+        queries.append(select([literal(table_name).label('table_name'), urns.c.serviceurn]))
+    return union_all(*queries) if len(queries) > 1 else queries[0]
 
-                result.close()
-                conn.close()
 
-                if not mappings:
-                    logger.warning('No service boundary tables were found in the database.')
-                    raise MappingDiscoveryException('No service boundary tables were found in the database.')
+def _mapping_table_query(mapping_table):
+    """
+    Builds the query reading the mappings from a metadata table with serviceurn and table_name columns.
+    """
+    return select([column('serviceurn'), column('table_name')]).select_from(table(mapping_table))
+
+
+def get_urn_table_mappings(engine, mapping_table=None):
+    """
+    Inspects the database and extracts the service urn to table mappings, either from a metadata table
+    in one query or from the catalog and the boundary tables.  A boundary table whose comment is its
+    service urn is taken from the catalog, the others are scanned for their urn in one more query.
+
+    :param engine: An instance of the database engine.
+    :type engine:  :py:class:`sqlalchemy.engine.Engine`
+    :param mapping_table: The name of a table listing the mappings (serviceurn, table_name), if any.
+    :type mapping_table: ``str``
+    :return: A dictionary containing the service URNs as keys and associated table names as values
+    :rtype: ``dict``
+    """
+    try:
+        if mapping_table:
+            with engine.connect() as conn:
+                rows = [(row['serviceurn'], row['table_name'])
+                        for row in conn.execute(_mapping_table_query(mapping_table))]
+        else:
+            table_names = _boundary_table_names(engine)
+            if not table_names:
+                raise MappingDiscoveryException('No service boundary tables were found in the database.')
+            commented = _table_comment_urns(engine, table_names)
+            rows = [(urn, table_name) for table_name, urn in commented.items()]
+            scanned = [table_name for table_name in table_names if table_name not in commented]
+            if scanned:
+                logger.debug('Scanning {0} boundary tables without a service urn comment.'.format(len(scanned)))
+                with engine.connect() as conn:
+                    rows.extend((row['serviceurn'], row['table_name'])
+                                for row in conn.execute(_serviceurn_query(scanned)))
 
     except SQLAlchemyError as ex:
-        logger.error('Encountered an error when attempting to discover the service boundary tables.', ex)
+        logger.error('Encountered an error when attempting to discover the service boundary tables. {0}'.format(ex))
         raise MappingDiscoveryException(
             'Encountered an error when attempting to discover the service boundary tables.', ex)
-    except MappingDiscoveryException as ex:
-        logger.error(ex)
-        raise
-    logger.debug(f'mappings:  {cached_urn_mappings}')
-    return cached_urn_mappings
+
+    mappings = {}
+    table_urns = {}
+    for urn, tablename in rows:
+        if urn is None:
+            continue
+        if tablename in table_urns:
+            message = 'Table {0} contained more than one service urn: {1}, {2}'.format(
+                tablename, table_urns[tablename], urn)
+            logger.error(message)
+            raise MappingDiscoveryException(message)
+        table_urns[tablename] = urn
+        mappings[urn] = tablename
+
+    if not mappings:
+        logger.warning('No service boundary tables were found in the database.')
+        raise MappingDiscoveryException('No service boundary tables were found in the database.')
+    logger.debug('mappings: {0}'.format(mappings))
+    return mappings
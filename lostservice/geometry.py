@@ -18,8 +18,8 @@ from shapely.geometry.polygon import LinearRing
 from shapely.wkt import loads
 from geoalchemy2.shape import from_shape
 from geoalchemy2.types import WKBElement
-from osgeo import osr
 from osgeo import ogr
+import lostservice.spatialreference as spatialreference
 
 
 def reproject_point(x: float, y: float, source_srid: int, target_srid: int) -> Tuple[float, float]:
@@ -58,16 +58,8 @@ def reproject_geom(geom: ogr.Geometry, source_srid: int, target_srid: int) -> og
     :return: The reprojected geometry.
     :rtype: :py:class:'Geometry'
     """
-    # Source spatial reference in which the input geometry is projected
-    source = osr.SpatialReference()
-    source.ImportFromEPSG(source_srid)
-
-    # Target spatial reference to which we want to project
-    target = osr.SpatialReference()
-    target.ImportFromEPSG(target_srid)
-
-    # Set up the transform.
-    transform = osr.CoordinateTransformation(source, target)
+    # Get the (cached) transform from the source to the target spatial reference.
+    transform = spatialreference.get_transformation(source_srid, target_srid)
 
     # transform it
     geom.Transform(transform)
@@ -91,15 +83,7 @@ def getutmsrid(longitude: float, latitude: float, incomming_srid: int = 4326) ->
 
     if incomming_srid != 4326:
         # Translate Coordinates from projected system into 4326 in order to calculate UTM Zone
-        # Source spatial reference.
-        source = osr.SpatialReference()
-        source.ImportFromEPSG(incomming_srid)
-
-        target = osr.SpatialReference()
-        target.ImportFromEPSG(4326)
-
-        # Set up the transform.
-        transform = osr.CoordinateTransformation(source, target)
+        transform = spatialreference.get_transformation(incomming_srid, 4326)
 
         # Create a geometry we can use with the transform.
         point_wkt = ogr.CreateGeometryFromWkt('POINT({0} {1})'.format(longitude, latitude))
@@ -277,19 +261,14 @@ def transform_circle(long: float, lat: float, srid: int, radius: float, uom: str
     :rtype: :py:class:geoalchemy2.types.WKBElement
     """
 
-    # Source spatial reference.
-    source = osr.SpatialReference()
-    source.ImportFromEPSG(srid)
-
     # TODO - Need to handle different values for the incoming UOM
     # TODO - Must have a lookup table of some kind.
     # The target will depend on the value of uom, but we'll just assume
-    # it's 9001/meters for now and project to 3857.
-    target = osr.SpatialReference()
-    target.ImportFromEPSG(getutmsrid(longitude=long, latitude=lat))
+    # it's 9001/meters for now and project to UTM.
+    target_srid = getutmsrid(longitude=long, latitude=lat)
 
     # Set up the transform.
-    transform = osr.CoordinateTransformation(source, target)
+    transform = spatialreference.get_transformation(srid, target_srid)
 
     # Create a geometry we can use with the transform.
     center = ogr.CreateGeometryFromWkt('POINT({0} {1})'.format(long, lat))
@@ -299,7 +278,7 @@ def transform_circle(long: float, lat: float, srid: int, radius: float, uom: str
     circle = center.Buffer(radius)
 
     # Now transform it back and extract the wkt
-    reverse_transform = osr.CoordinateTransformation(target, source)
+    reverse_transform = spatialreference.get_transformation(target_srid, srid)
     circle.Transform(reverse_transform)
     wkt_circle = circle.ExportToWkt()
 
@@ -392,20 +371,14 @@ def transform_ellipse(long: float, lat: float, major: float, minor: float, orien
     :rtype: :py:class:`WKBElement`
     """
 
-    # Source spatial reference.
-    source = osr.SpatialReference()
-    source.ImportFromEPSG(srid)
-
     # TODO - Need to handle different values for the incoming UOM
     # TODO - Must have a lookup table of some kind.
     # The target will depend on the value of uom, but we'll just assume
     # it's 9001/meters for now.
-    target = osr.SpatialReference()
-    # target.ImportFromEPSG(3857)
-    target.ImportFromEPSG(getutmsrid(long, lat, srid))
+    target_srid = getutmsrid(long, lat, srid)
 
     # Set up the transform.
-    transform = osr.CoordinateTransformation(source, target)
+    transform = spatialreference.get_transformation(srid, target_srid)
 
     # Create a geometry we can use with the transform.
     center = ogr.CreateGeometryFromWkt('POINT({0} {1})'.format(long, lat))
@@ -439,7 +412,7 @@ def transform_ellipse(long: float, lat: float, major: float, minor: float, orien
     org_ellipse = ogr.CreateGeometryFromWkt(ellr.wkt)
 
     # Now transform it back to 4326 and extract the wkt
-    reverse_transform = osr.CoordinateTransformation(target, source)
+    reverse_transform = spatialreference.get_transformation(target_srid, srid)
     org_ellipse.Transform(reverse_transform)
     wkt_ellipse = org_ellipse.ExportToWkt()
 
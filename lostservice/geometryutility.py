@@ -10,15 +10,15 @@ Implementation classes for findservice queries.
 from enum import Enum
 
 from lostservice.configuration import general_logger
-from geoalchemy2.shape import to_shape
 from measurement.measures import Distance
 from osgeo import ogr
+import lostservice.spatialreference as spatialreference
 from shapely.geometry.base import BaseGeometry
 from shapely.geometry.point import Point
 from shapely.geometry.linestring import LineString
-from typing import Dict
 
 import re
+import struct
 import shapely.wkb
 
 logger = general_logger()
@@ -48,12 +48,9 @@ class GeometryUtility(object):
         :param projected_srid: the SRID of the projected coordinate system used by this utility
         :type projected_srid:  ``int``
         """
-        # Create the cache of manufactured spatial references (so we don't have to keep creating them over and over.)
-        self._spatial_references: Dict[int, ogr.osr.SpatialReference] = {}
         self._projected_srid = projected_srid  #: the SRID of the projected coordinate system used by this utility
-        self._projected_srs = ogr.osr.SpatialReference()  #: the projected coordinate system used by this utility
-        # Import the projected spatial reference.
-        self._projected_srs.ImportFromEPSG(self._projected_srid)
+        #: the projected coordinate system used by this utility
+        self._projected_srs = spatialreference.get_spatial_reference(self._projected_srid)
 
     def get_spatial_reference(self, srid: int) -> ogr.osr.SpatialReference:
         """
@@ -64,17 +61,8 @@ class GeometryUtility(object):
         :return: the associated spatial reference
         :rtype:  :py:class:`ogr.osr.SpatialReference`
         """
-        # If we've already created a spatial reference...
-        if srid in self._spatial_references:
-            # ...return it to the caller.
-            return self._spatial_references[srid]
-        else:  # Otherwise, it's time to build this one.
-            srs = ogr.osr.SpatialReference()
-            srs.ImportFromEPSG(srid)
-            # Save this spatial reference (so we don't need to create it again).
-            self._spatial_references[srid] = srs
-            # Now we can return it.
-            return srs
+        # Spatial references are shared through the process-wide cache (so we don't have to keep creating them).
+        return spatialreference.get_spatial_reference(srid)
 
     def get_srid(self, geometry: ogr.Geometry) -> int or None:
         """
@@ -271,11 +259,41 @@ class GeometryUtility(object):
         shapely_geometry = shapely.wkb.loads(wkb)
         return shapely_geometry
 
+    #: The EWKB flag marking a geometry type followed by an SRID.
+    _EWKB_SRID_FLAG = 0x20000000
+
+    def ogr_from_wkbelement(self, wkb_element, srs: int or ogr.osr.SpatialReference=None) -> ogr.Geometry:
+        """
+        Convert a GeoAlchemy WKB element straight to a GDAL/OGR geometry.
+
+        :param wkb_element: the WKB element (PostGIS returns extended WKB)
+        :type wkb_element:  :py:class:`geoalchemy2.elements.WKBElement`
+        :param srs: the spatial reference (or SRID) of the geometry
+        :type srs:  :py:class:`SpatialReference` or ``int``
+        :return: an OGR geometry
+        :rtype:  :py:class:`ogr.Geometry`
+        """
+        data = wkb_element.data
+        # The data comes back as bytes (or a memoryview) from the database, but may be hex.
+        data = bytes.fromhex(data) if isinstance(data, str) else bytes(data)
+        # OGR reads plain WKB, so drop the SRID PostGIS puts after the geometry type.
+        byte_order = '<I' if data[0] == 1 else '>I'
+        geometry_type = struct.unpack(byte_order, data[1:5])[0]
+        if geometry_type & self._EWKB_SRID_FLAG:
+            data = data[:1] + struct.pack(byte_order, geometry_type & ~self._EWKB_SRID_FLAG) + data[9:]
+        ogr_geometry: ogr.Geometry = ogr.CreateGeometryFromWkb(data)
+        if srs is not None:
+            _srs = srs if isinstance(srs, ogr.osr.SpatialReference) else self.get_spatial_reference(srs)
+            ogr_geometry.AssignSpatialReference(_srs)
+        return ogr_geometry
+
     def simplify_polygon(self, mapping_object, tolerance: float):
         """
         Simplify a polygon, generally used when returning service boundaries to lighten to package
         being sent in the response.
         This is THE LAST step after all queries are ran, to keep us in memory for better performance.
+        The result only depends on the boundary and the tolerance, so callers should cache it (see
+        :py:class:`lostservice.caching.BoundaryGmlCache`).
         :param object: results object to simplify service boundary geometry from.
         :type object: object
         :param tolerance: the range at which we create the buffer from and simplify off of.
@@ -283,31 +301,25 @@ class GeometryUtility(object):
         :return: same results object, but with simplified service boundary.
         :rtype:
         """
-        # First we take the wkb_geometry item of our results object and turn it into a shapely geometry.
-        # We only do this, to get the wkb, and then re-transform it back into an ogr geometry.
-        # It's very silly, but it's the only way.. for now.
-
         if mapping_object['wkb_geometry'] is None:
             logger.error('There is no geometry in the mapping object, so we cannot simplify.')
             return mapping_object
         logger.debug('Beginning Simplification.')
-        shapely_geometry = to_shape(mapping_object['wkb_geometry'])
-
-        # Also, we add a definitive WKID to the geometry
-        my_ogr_geometry = self.shapely_to_ogr(shapely_geometry, 4326)
+        # Go straight from the WKB to OGR, everything below happens in OGR.
+        ogr_geometry = self.ogr_from_wkbelement(mapping_object['wkb_geometry'], 4326)
 
-        # change projected to 3857, then simplify the polygon.
-        ogr_reprojected = self.project(my_ogr_geometry, 3857)
+        # change projected to 3857 (in place, with the cached transformation), then simplify the polygon.
+        ogr_geometry.Transform(spatialreference.get_transformation(4326, self._projected_srid))
         # The buffer is the negative of our tolerance level to "shrink" the original boundary.
         # This guarantees us that when we simplify it, it all fits inside the original boundary.
-        ogr_buffered = ogr_reprojected.Buffer(-tolerance)
+        ogr_buffered = ogr_geometry.Buffer(-tolerance)
         ogr_simplified = ogr_buffered.Simplify(tolerance)
 
         # now that we've simplified, we will want to project back to WKID: 4326
-        ogr_wgs_84 = self.project(ogr_simplified, 4326)
+        ogr_simplified.Transform(spatialreference.get_transformation(self._projected_srid, 4326))
         # Geesh, we're not done yet! Let's take this pretty geometry and export it to GML.
         logger.debug('Formatting simplified polygon to GML3 spec.')
-        ogr_as_gml = ogr_wgs_84.ExportToGML(options=['FORMAT=GML3'])
+        ogr_as_gml = ogr_simplified.ExportToGML(options=['FORMAT=GML3'])
 
         #Wait, all of this actually worked? Well I suppose we should put it into the return object then.
         mapping_object['ST_AsGML_1'] = ogr_as_gml
@@ -7,6 +7,8 @@
 Core handler implementation classes.
 """
 
+import copy
+from collections import OrderedDict
 from injector import inject
 import lostservice.model.responses as responses
 from lostservice.configuration import Configuration
@@ -123,6 +125,48 @@ class FindServiceHandler(Handler):
         except Exception:
             raise
 
+        return self._handle_covered_request(request)
+
+    def handle_request_for_services(self, request, service_urns, context):
+        """
+        Handles a request for several services at the same location.  The location is parsed, projected and
+        checked for coverage once, and for a point the service boundary tables are searched in one pass.
+
+        :param request: The request, its service is ignored.
+        :type request: A subclass of :py:class:`FindServiceRequest`
+        :param service_urns: The identifiers for the services to look up.
+        :type service_urns: ``list`` of ``str``
+        :param context: The request context.
+        :type context: ``dict``
+        :return: The response for each service by service urn, just like :py:meth:`handle_request` returns
+                 it for a request for that service, or the exception raised handling it.
+        :rtype: ``OrderedDict``
+        """
+        self.check_coverage(request.location.location)
+
+        results = OrderedDict()
+        with self._outer.prefetched_services(request, service_urns):
+            for service_urn in service_urns:
+                service_request = copy.copy(request)
+                service_request.service = service_urn
+                service_request.path = list(request.path)
+                service_request.nonlostdata = list(request.nonlostdata)
+                try:
+                    results[service_urn] = self._handle_covered_request(service_request)
+                except Exception as ex:
+                    logger.error(ex)
+                    results[service_urn] = ex
+        return results
+
+    def _handle_covered_request(self, request):
+        """
+        Handles a request whose location passed the coverage check.
+
+        :param request: The request
+        :type request: A subclass of :py:class:`FindServiceRequest`
+        :return: The response.
+        :rtype: :py:class:`FindServiceResponse`
+        """
         try:
             response = None
             if type(request.location.location) is Point:
@@ -201,23 +245,17 @@ class GetServiceBoundaryHandler(Handler):
         :return: The response.
         :rtype: :py:class:`GetServiceBoundaryResponse`
         """
-        # Get the table mappings, this should come from cache eventually.
-        mappings = self._db_wrapper.get_urn_table_mappings()
-
-        # loop through all the tables to find the id until its found.
-        for urn_mapping in mappings.keys():
-            esb_table = mappings[urn_mapping]
-            results = self._db_wrapper.get_boundaries_for_previous_id(request.key, esb_table)
-            if results:
-                # No Recursion available so just add our path
-                our_path = self._config.get('Service', 'source_uri', as_object=False, required=False)
-                # Add our LVF/ECRF path to any other paths already in the original request (recursive)
-                results[0]['path'] = our_path
+        # The boundary key index knows which table (and row) holds the id.
+        results = self._db_wrapper.get_boundaries_for_id(request.key)
+        if results:
+            # No Recursion available so just add our path
+            our_path = self._config.get('Service', 'source_uri', as_object=False, required=False)
+            # Add our LVF/ECRF path to any other paths already in the original request (recursive)
+            results[0]['path'] = our_path
 
-                # Add NonLoSTdata items
-                results[0]['nonlostdata'] = request.nonlostdata
+            # Add NonLoSTdata items
+            results[0]['nonlostdata'] = request.nonlostdata
 
-                break
         for item in results:
             item =  self._inner.apply_service_boundary_policy(item, True)
         return_value = {'response': results,
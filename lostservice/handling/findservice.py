@@ -7,8 +7,11 @@
 Implementation classes for findservice queries.
 """
 
+import contextlib
 import datetime
 import pytz
+import threading
+from collections import OrderedDict
 from enum import Enum
 from injector import inject
 from lostservice.configuration import Configuration
@@ -17,7 +20,9 @@ from lostservice.model.responses import FindServiceResponse, ResponseMapping, Ad
 from lostservice.exception import ServiceNotImplementedException, LoopException, NotFoundException
 import lostservice.geometry as geom
 from lostservice.geometryutility import GeometryUtility
+from lostservice.caching import BoundaryGmlCache
 from lostservice.db.gisdb import GisDbInterface
+import lostservice.db.spatial as spatialdb
 from lxml import etree
 from shapely.geometry import Polygon
 import json
@@ -55,6 +60,11 @@ class PointMultipleMatchPolicyEnum(Enum):
     ReturnError = 3
 
 
+class ProximitySearchQueryModePolicyEnum(Enum):
+    Sequential = 1
+    Combined = 2
+
+
 class ServiceBoundaryGeodeticOverridePolicyEnum(Enum):
     MatchRequest = 1
     ReturnReference = 2
@@ -105,6 +115,23 @@ class FindServiceConfigWrapper(object):
 
         return float(buffer)
 
+    def proximity_search_query_mode_policy(self):
+        """
+        Gets the proximity search query mode policy for points, defaults to Sequential.
+
+        :return: :py:class:`ProximitySearchQueryModePolicyEnum`
+        """
+        retval = ProximitySearchQueryModePolicyEnum.Sequential
+        policy = self._config.get('Policy', 'service_boundary_proximity_search_query_mode', as_object=False,
+                                  required=False)
+        if policy is not None:
+            try:
+                retval = ProximitySearchQueryModePolicyEnum[policy]
+            except KeyError:
+                retval = ProximitySearchQueryModePolicyEnum.Sequential
+
+        return retval
+
     def polygon_multiple_match_policy(self):
         """
         Gets the polygon multiple match policy.
@@ -352,7 +379,8 @@ class FindServiceInner(object):
     def __init__(self,
                  config: FindServiceConfigWrapper,
                  db_wrapper: GisDbInterface,
-                 query_executor: PgQueryExecutor=None):
+                 query_executor: PgQueryExecutor=None,
+                 boundary_cache: BoundaryGmlCache=None):
         """
         Constructor
 
@@ -362,15 +390,35 @@ class FindServiceInner(object):
         :type db_wrapper: :py:class:`lostservice.db.gisdb.GisDbInterface`
         :param query_executor: A query executor with pooled connections.
         :type query_executor: :py:class:civvy.db.postgis.query.PgQueryExecutor`
+        :param boundary_cache: Cache of the service boundary GML returned by value.
+        :type boundary_cache: :py:class:`lostservice.caching.BoundaryGmlCache`
         """
         # TODO: There shouldn't be a default for query_executor,
         # this was to facilitate not breaking existing unit tests for now.
         self._find_service_config = config
         self._db_wrapper = db_wrapper
-        self._mappings = self._db_wrapper.get_urn_table_mappings()
         self._geomutil = GeometryUtility()
         self._query_executor = query_executor
-        self._fuzzy_used = False
+        self._boundary_cache = boundary_cache
+        # Instances are shared across requests, so per request state is kept per thread.
+        self._state = threading.local()
+
+    @property
+    def _mappings(self):
+        """
+        The current service urn to table mappings.
+
+        :rtype: ``dict``
+        """
+        return self._db_wrapper.get_urn_table_mappings()
+
+    @property
+    def _fuzzy_used(self):
+        return getattr(self._state, 'fuzzy_used', False)
+
+    @_fuzzy_used.setter
+    def _fuzzy_used(self, value):
+        self._state.fuzzy_used = value
 
     @property
     def fuzzy_used(self):
@@ -390,8 +438,9 @@ class FindServiceInner(object):
         :return: The table name.
         :rtype: ``str``
         """
-        if service_urn in self._mappings:
-            return self._mappings[service_urn]
+        mappings = self._mappings
+        if service_urn in mappings:
+            return mappings[service_urn]
         else:
             logger.warning('Service URN {0} not supported.'.format(service_urn))
             raise ServiceNotImplementedException('Service URN {0} not supported.'.format(service_urn), None)
@@ -409,6 +458,7 @@ class FindServiceInner(object):
         :return: The service mappings for the given point.
         :rtype: ``list`` of ``dict``
         """
+        self._fuzzy_used = False
         ADD_DATA_REQUESTED = False
         ADD_DATA_SERVICE = self._find_service_config.additional_data_uri()
         buffer_distance = self._find_service_config.additional_data_buffer()
@@ -418,11 +468,20 @@ class FindServiceInner(object):
         else:
             esb_table = self._get_esb_table(service_urn)
 
+        if not ADD_DATA_REQUESTED and \
+                self._find_service_config.proximity_search_query_mode_policy() is \
+                ProximitySearchQueryModePolicyEnum.Combined and \
+                self._find_service_config.do_expanded_search():
+            # One query returns the containing boundaries or, when there are none, the nearby ones.
+            results = self._find_service_for_point_or_nearby(geodetic_location, esb_table)
+            return self._apply_policies(results, return_shape)
+
         results = self._db_wrapper.get_containing_boundary_for_point(
             geodetic_location,
             esb_table,
             add_data_requested=ADD_DATA_REQUESTED,
-            buffer_distance=buffer_distance)
+            buffer_distance=buffer_distance,
+            result_limit=None if ADD_DATA_REQUESTED else self._point_result_limit())
 
         if not ADD_DATA_REQUESTED:
             if results is not None and len(results) != 0:
@@ -432,6 +491,7 @@ class FindServiceInner(object):
                 multiple_match_policy = self._find_service_config.polygon_multiple_match_policy()
                 return_area = multiple_match_policy is PolygonMultipleMatchPolicyEnum.ReturnAreaMajority
                 proximity_buffer = self._find_service_config.expanded_search_buffer()
+                result_limit, order_by_area = self._polygon_result_limit(multiple_match_policy)
 
                 # TODO, what is our UOM for buffers, assert meters?
                 results = self._db_wrapper.get_intersecting_boundaries_for_circle(
@@ -440,7 +500,9 @@ class FindServiceInner(object):
                     return_area=return_area,
                     return_shape=return_shape,
                     proximity_search=True,
-                    proximity_buffer=proximity_buffer)
+                    proximity_buffer=proximity_buffer,
+                    result_limit=result_limit,
+                    order_by_area=order_by_area)
 
                 results = self._apply_polygon_multiple_match_policy(results)
         else:
@@ -449,6 +511,80 @@ class FindServiceInner(object):
 
         return self._apply_policies(results, return_shape)
 
+    def _find_service_for_point_or_nearby(self, geodetic_location, esb_table):
+        """
+        Finds the boundaries containing a point, or the nearby ones if there aren't any, with one query.
+
+        :param geodetic_location: location object.
+        :type geodetic_location: `location object`
+        :param esb_table: The name of the service boundary table.
+        :type esb_table: ``str``
+        :return: The service mappings with the point or polygon multiple match policy applied.
+        :rtype: ``list`` of ``dict``
+        """
+        multiple_match_policy = self._find_service_config.polygon_multiple_match_policy()
+        return_area = multiple_match_policy is PolygonMultipleMatchPolicyEnum.ReturnAreaMajority
+        proximity_buffer = self._find_service_config.expanded_search_buffer()
+
+        results = self._db_wrapper.get_containing_or_nearby_boundaries_for_point(
+            geodetic_location,
+            esb_table,
+            proximity_buffer,
+            return_area=return_area)
+
+        if not results:
+            return results
+        if results[0].get(spatialdb.CONTAINED):
+            return self._apply_point_multiple_match_policy(results)
+        # Nearby boundaries come back closest first.
+        return self._apply_polygon_multiple_match_policy(results)
+
+    @contextlib.contextmanager
+    def prefetched_services_for_point(self, service_urns, geodetic_location):
+        """
+        Finds the boundaries containing a point for several services in one pass, the service boundary
+        tables are queried concurrently with the same projected point.  While the context is active
+        :py:meth:`find_service_for_point` answers those services from them instead of querying again.
+
+        :param service_urns: The identifiers for the services to look up.
+        :type service_urns: ``list`` of ``str``
+        :param geodetic_location: location object.
+        :type geodetic_location: `location object`
+        """
+        mappings = self._mappings
+        esb_tables = []
+        for service_urn in service_urns:
+            esb_table = mappings.get(service_urn)
+            if esb_table is not None and esb_table not in esb_tables:
+                esb_tables.append(esb_table)
+
+        with contextlib.ExitStack() as stack:
+            if len(esb_tables) > 1:
+                results = self._db_wrapper.get_containing_boundaries_for_tables(geodetic_location, esb_tables)
+                for esb_table, rows in zip(esb_tables, results):
+                    stack.enter_context(
+                        self._db_wrapper.prefetched_point_boundaries(geodetic_location, esb_table, rows))
+            yield
+
+    def find_service_for_point_services(self, service_urns, geodetic_location, return_shape=False):
+        """
+        Find services for the given point for several services at once, see
+        :py:meth:`prefetched_services_for_point`.
+
+        :param service_urns: The identifiers for the services to look up.
+        :type service_urns: ``list`` of ``str``
+        :param geodetic_location: location object.
+        :type geodetic_location: `location object`
+        :param return_shape: Whether or not to return the geometries of found mappings.
+        :type return_shape: ``bool``
+        :return: The service mappings for the given point by service urn, just like
+                 :py:meth:`find_service_for_point` returns them for each of the services.
+        :rtype: ``OrderedDict``
+        """
+        with self.prefetched_services_for_point(service_urns, geodetic_location):
+            return OrderedDict((service_urn, self.find_service_for_point(service_urn, geodetic_location, return_shape))
+                               for service_urn in service_urns)
+
     def get_civvy_locator(self, offset_distance):
         """
         Creates the locator(s) needed for civic address location searching.
@@ -551,6 +687,7 @@ class FindServiceInner(object):
          :type return_shape: bool
          :return: The service mappings for the given civic address.
          """
+        self._fuzzy_used = False
         # Get the RCL offset distance from configuration
         rcl_offset_distance = self._find_service_config.offset_distance()
         # Create the locator we want to use for civic address location searching. (Can be multiple locators)
@@ -635,6 +772,7 @@ class FindServiceInner(object):
         :return: The service mappings for the given circle.
         :rtype: ``list`` of ``dict``
         """
+        self._fuzzy_used = False
 
         if self._find_service_config.polygon_search_mode_policy() is PolygonSearchModePolicyEnum.SearchUsingCentroid:
             # search using a centroid.
@@ -665,8 +803,10 @@ class FindServiceInner(object):
                 if results is None or len(results)==0:
                     results = [{'adddatauri':''}]
             else:
+                result_limit, order_by_area = self._polygon_result_limit(multiple_match_policy)
                 results = self._db_wrapper.get_intersecting_boundaries_for_circle(
-                    location, esb_table, return_area, return_shape)
+                    location, esb_table, return_area, return_shape,
+                    result_limit=result_limit, order_by_area=order_by_area)
 
                 if (results is None or len(results) == 0) and self._find_service_config.do_expanded_search():
                     proximity_buffer = self._find_service_config.expanded_search_buffer()
@@ -676,7 +816,9 @@ class FindServiceInner(object):
                         return_area,
                         return_shape,
                         True,
-                        proximity_buffer)
+                        proximity_buffer,
+                        result_limit=result_limit,
+                        order_by_area=order_by_area)
 
                 results = self._apply_polygon_multiple_match_policy(results)
             return self._apply_policies(results, return_shape)
@@ -697,6 +839,7 @@ class FindServiceInner(object):
         :return: The service mappings for the given ellipse.
         :rtype: ``list`` of ``dict``
         """
+        self._fuzzy_used = False
         # TODO: does there need to be an orientation UOM?
         # TODO: Why do the ellipse queries always return the intersection areas but others don't?
 
@@ -726,9 +869,13 @@ class FindServiceInner(object):
                 if results is None or len(results) == 0:
                     results = [{'adddatauri': ''}]
             else:
+                result_limit, order_by_area = self._polygon_result_limit(
+                    self._find_service_config.polygon_multiple_match_policy())
                 results = self._db_wrapper.get_intersecting_boundary_for_ellipse(
                     location,
-                    esb_table)
+                    esb_table,
+                    result_limit=result_limit,
+                    order_by_area=order_by_area)
 
                 if (results is None or len(results) == 0) and self._find_service_config.do_expanded_search():
                     # No results and Policy says we should buffer and research
@@ -737,7 +884,9 @@ class FindServiceInner(object):
                     location.minorAxis = location.minorAxis+proximity_buffer
                     results = self._db_wrapper.get_intersecting_boundary_for_ellipse(
                         location,
-                        esb_table)
+                        esb_table,
+                        result_limit=result_limit,
+                        order_by_area=order_by_area)
 
                 results = self._apply_polygon_multiple_match_policy(results)
             return self._apply_policies(results, return_shape)
@@ -758,6 +907,7 @@ class FindServiceInner(object):
         :return: The service mappings for the given arcband.
         :rtype: ``list`` of ``dict``
         """
+        self._fuzzy_used = False
 
         WGS84SPATIALREFERENCE = 'urn:ogc:def:crs:EPSG::4326'
 
@@ -787,6 +937,7 @@ class FindServiceInner(object):
         :return: The service mappings for the given polygon.
         :rtype: ``list`` of ``dict``
         """
+        self._fuzzy_used = False
         if self._find_service_config.polygon_search_mode_policy() is PolygonSearchModePolicyEnum.SearchUsingCentroid:
             # search using a centroid.
             ref_polygon = Polygon(location.vertices)
@@ -816,7 +967,10 @@ class FindServiceInner(object):
                 if results is None or len(results)==0:
                     results = [{'adddatauri': ''}]
             else:
-                results = self._db_wrapper.get_intersecting_boundaries_for_polygon(location, esb_table)
+                result_limit, order_by_area = self._polygon_result_limit(
+                    self._find_service_config.polygon_multiple_match_policy())
+                results = self._db_wrapper.get_intersecting_boundaries_for_polygon(
+                    location, esb_table, result_limit=result_limit, order_by_area=order_by_area)
 
                 if (results is None or len(results) == 0) and self._find_service_config.do_expanded_search():
                     proximity_buffer = self._find_service_config.expanded_search_buffer()
@@ -826,11 +980,49 @@ class FindServiceInner(object):
                         location,
                         esb_table,
                         True,
-                        proximity_buffer)
+                        proximity_buffer,
+                        result_limit=result_limit,
+                        order_by_area=order_by_area)
 
                 results = self._apply_polygon_multiple_match_policy(results)
             return self._apply_policies(results, return_shape)
 
+    def _point_result_limit(self):
+        """
+        Gets the number of rows the point multiple match policy needs from the database.
+
+        :return: The number of rows, None for all of them.
+        :rtype: ``int``
+        """
+        point_multiple_match_policy = self._find_service_config.point_multiple_match_policy()
+        if point_multiple_match_policy == PointMultipleMatchPolicyEnum.ReturnFirst:
+            return 1
+        elif point_multiple_match_policy == PointMultipleMatchPolicyEnum.ReturnLimitWarning:
+            # One past the limit so tooManyMappings can still be set.
+            return self._find_service_config.point_result_limit_policy() + 1
+        elif point_multiple_match_policy == PointMultipleMatchPolicyEnum.ReturnError:
+            # Two are enough to know there was more than one.
+            return 2
+        return None
+
+    def _polygon_result_limit(self, polygon_multiple_match_policy):
+        """
+        Gets how the database should limit the rows for the polygon multiple match policy.
+
+        :param polygon_multiple_match_policy: The polygon multiple match policy.
+        :type polygon_multiple_match_policy: :py:class:`PolygonMultipleMatchPolicyEnum`
+        :return: The number of rows (None for all of them) and whether to order them by intersection area.
+        :rtype: ``tuple``
+        """
+        if polygon_multiple_match_policy == PolygonMultipleMatchPolicyEnum.ReturnLimitWarning:
+            # One past the limit so tooManyMappings can still be set.
+            return self._find_service_config.polygon_result_limit_policy() + 1, False
+        elif polygon_multiple_match_policy == PolygonMultipleMatchPolicyEnum.ReturnFirst:
+            return 1, False
+        elif polygon_multiple_match_policy == PolygonMultipleMatchPolicyEnum.ReturnAreaMajority:
+            return 1, True
+        return None, False
+
     def _apply_point_multiple_match_policy(self, mappings):
         """
         Apply the point multiple match policy to given mappings.
@@ -941,6 +1133,81 @@ class FindServiceInner(object):
         :type return_shape: ``bool``
         :return: The mapping with fixed-up GML
         """
+        if not return_shape or self._boundary_cache is None:
+            return self._render_service_boundary(mapping, return_shape)
+
+        # The rendered boundary is the same for every request, only build it once.
+        cache_key = self._boundary_cache_key(mapping)
+        if cache_key is not None:
+            gml = self._boundary_cache.get(cache_key)
+            if gml is not None:
+                mapping['ST_AsGML_1'] = gml
+                return mapping
+
+        mapping = self._render_service_boundary(mapping, return_shape)
+        if cache_key is not None and mapping.get('ST_AsGML_1'):
+            self._boundary_cache.put(cache_key, mapping['ST_AsGML_1'])
+        return mapping
+
+    def _boundary_cache_key(self, mapping):
+        """
+        Builds the boundary cache key for a mapping, with the configured simplification tolerance.
+
+        :param mapping: A mapping returned from one of the service boundary queries.
+        :type mapping: ``dict``
+        :return: The key, or None if the boundary can't be cached.
+        :rtype: ``tuple``
+        """
+        tolerance = self._find_service_config.simplification_tolerance() \
+            if self._find_service_config.do_polygon_simplification() else None
+        return self._boundary_cache.key_for(mapping, tolerance)
+
+    def precompute_service_boundaries(self, boundary_tables=None):
+        """
+        Renders service boundaries into the boundary cache ahead of the requests that return them.
+        The entries expire like any others, run this again before the ttl is up to keep them cached.
+
+        :param boundary_tables: The service boundary tables, defaults to every mapped table.
+        :type boundary_tables: ``list`` of ``str``
+        :return: The number of boundaries rendered.
+        :rtype: ``int``
+        """
+        if self._boundary_cache is None:
+            return 0
+        if boundary_tables is None:
+            boundary_tables = sorted(set(self._mappings.values()))
+
+        count = 0
+        for boundary_table in boundary_tables:
+            for mapping in self._db_wrapper.iterate_boundaries(boundary_table):
+                cache_key = self._boundary_cache_key(mapping)
+                if cache_key is None:
+                    continue
+                try:
+                    mapping = self._render_service_boundary(mapping, True)
+                    if mapping.get('ST_AsGML_1'):
+                        self._boundary_cache.put(cache_key, mapping['ST_AsGML_1'])
+                        count += 1
+                except Exception as ex:
+                    logger.warning('Unable to render boundary {0} of {1}: {2}'
+                                   .format(mapping.get('srcunqid'), boundary_table, ex))
+
+        logger.info('Rendered {0} service boundaries into the boundary cache.'.format(count))
+        if self._boundary_cache.stats()['evictions']:
+            logger.warning('The boundary cache is too small to hold every service boundary, '
+                           'raise [BoundaryCache] max_entries.')
+        return count
+
+    def _render_service_boundary(self, mapping, return_shape):
+        """
+        Loads the GML of a mapping's boundary and fixes it up for the response.
+
+        :param mapping: A mapping returned from a point search.
+        :type mapping: ``dict``
+        :param return_shape: Whether or not to return the geometries of found mappings.
+        :type return_shape: ``bool``
+        :return: The mapping with fixed-up GML
+        """
 
         # TODO -
         # Simplify - On
@@ -952,6 +1219,10 @@ class FindServiceInner(object):
         GML_URN = 'http://www.opengis.net/gml'
         GML_URN_COORDS = '{0}{1}{2}'.format('{', GML_URN, '}')
 
+        if return_shape and 'ST_AsGML_1' not in mapping:
+            # Boundaries are found without their geometry, it is only fetched for the mappings being returned.
+            self._db_wrapper.load_boundary_shape(mapping)
+
         if return_shape and 'ST_AsGML_1' in mapping:
             gml = mapping['ST_AsGML_1']
             gml = gml.replace('>', ' xmlns:gml="http://www.opengis.net/gml">', 1)
@@ -1048,6 +1319,20 @@ class FindServiceOuter(object):
         self._inner = inner
         self._find_service_config = config
 
+    def prefetched_services(self, request, service_urns):
+        """
+        Looks up the request's location for several services in one pass when it is a point, see
+        :py:meth:`FindServiceInner.prefetched_services_for_point`.
+
+        :param request: A findService request object.
+        :type request :py:class:`lostservice.model.requests.FindServiceRequest`
+        :param service_urns: The identifiers for the services to look up.
+        :type service_urns: ``list`` of ``str``
+        """
+        if type(request.location.location) is Point:
+            return self._inner.prefetched_services_for_point(service_urns, request.location.location)
+        return contextlib.ExitStack()
+
     def _check_is_loopback(self, path):
         if self._find_service_config.source_uri() in path:
             raise LoopException("LoopError")
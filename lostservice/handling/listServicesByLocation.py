@@ -91,9 +91,17 @@ class ListServiceByLocationInner(object):
         """
         self._list_service_config = config
         self._db_wrapper = db_wrapper
-        self._mappings = self._db_wrapper.get_urn_table_mappings()
         self._query_executor = query_executor
 
+    @property
+    def _mappings(self):
+        """
+        The current service urn to table mappings.
+
+        :rtype: ``dict``
+        """
+        return self._db_wrapper.get_urn_table_mappings()
+
     def list_services_by_location_for_point(self, service, location):
         """
         List services for the given point.
@@ -108,12 +116,12 @@ class ListServiceByLocationInner(object):
         :rtype: ``list`` of ``dict``
         """
         if service is not None:
-            esb_table = [self._mappings[key] for key in self._mappings if service + '.' in key]
+            esb_table = [table_name for key, table_name in self._mappings.items() if service + '.' in key]
             result = self._db_wrapper.get_list_services_for_point(location, esb_table)
             results = [i[0].get('serviceurn') for i in result if i and i[0].get('serviceurn')]
             return results
         elif service is None:
-            esb_table = [self._mappings[key] for key in self._mappings if not '.' in key]
+            esb_table = [table_name for key, table_name in self._mappings.items() if not '.' in key]
             result = self._db_wrapper.get_list_services_for_point(location, esb_table)
             results = [i[0].get('serviceurn') for i in result if i and i[0].get('serviceurn')]
             return results
@@ -264,12 +272,12 @@ class ListServiceByLocationInner(object):
         :rtype: ``list`` of ``dict``
         """
         if service is not None:
-            esb_table = [self._mappings[key] for key in self._mappings if service + '.' in key]
+            esb_table = [table_name for key, table_name in self._mappings.items() if service + '.' in key]
             result = self._db_wrapper.get_intersecting_list_service_for_circle(location, esb_table)
             results = [i[0].get('serviceurn') for i in result if i and i[0].get('serviceurn')]
             return results
         elif service is None:
-            esb_table = [self._mappings[key] for key in self._mappings if not '.' in key]
+            esb_table = [table_name for key, table_name in self._mappings.items() if not '.' in key]
             result = self._db_wrapper.get_intersecting_list_service_for_circle(location, esb_table)
             results = [i[0].get('serviceurn') for i in result if i and i[0].get('serviceurn')]
             return results
@@ -286,12 +294,12 @@ class ListServiceByLocationInner(object):
         :rtype: ``list`` of ``dict``
         """
         if service is not None:
-            esb_table = [self._mappings[key] for key in self._mappings if service + '.' in key]
+            esb_table = [table_name for key, table_name in self._mappings.items() if service + '.' in key]
             result = self._db_wrapper.get_list_services_for_ellipse(location, esb_table)
             results = [i[0].get('serviceurn') for i in result if i and i[0].get('serviceurn')]
             return results
         elif service is None:
-            esb_table = [self._mappings[key] for key in self._mappings if not '.' in key]
+            esb_table = [table_name for key, table_name in self._mappings.items() if not '.' in key]
             result = self._db_wrapper.get_list_services_for_ellipse(location, esb_table)
             results = [i[0].get('serviceurn') for i in result if i and i[0].get('serviceurn')]
             return results
@@ -336,12 +344,12 @@ class ListServiceByLocationInner(object):
         :rtype: ``list`` of ``dict``
         """
         if service is not None:
-            esb_table = [self._mappings[key] for key in self._mappings if service + '.' in key]
+            esb_table = [table_name for key, table_name in self._mappings.items() if service + '.' in key]
             result = self._db_wrapper.get_intersecting_list_service_for_polygon(location, esb_table)
             results = [i[0].get('serviceurn') for i in result if i and i[0].get('serviceurn')]
             return results
         elif service is None:
-            esb_table = [self._mappings[key] for key in self._mappings if not '.' in key]
+            esb_table = [table_name for key, table_name in self._mappings.items() if not '.' in key]
             result = self._db_wrapper.get_intersecting_list_service_for_polygon(location, esb_table)
             results = [i[0].get('serviceurn') for i in result if i and i[0].get('serviceurn')]
             return results
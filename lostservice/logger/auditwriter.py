@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. currentmodule:: lostservice.logger.auditwriter
+.. moduleauthor:: Tom Weitzel <tweitzel@geo-comm.com>
+
+Buffered writer for the audit log tables.
+
+Audit rows are queued and written in batches by a background thread using a
+single multi-row INSERT, so logging a request costs a queue put instead of a
+database round trip.
+"""
+
+import atexit
+import queue
+import threading
+import time
+from lostservice.configuration import Configuration
+from lostservice.configuration import general_logger
+logger = general_logger()
+
+
+class AuditWriterConfigWrapper(object):
+    """
+    A wrapper object for the audit writer configuration, read from the LoggingDB section.
+    """
+    def __init__(self, config: Configuration):
+        """
+        Constructor.
+
+        :param config: The configuration object.
+        :type config: :py:class:`lostservice.configuration.Configuration`
+        """
+        self._config = config
+
+    def _get(self, option, default, convert):
+        value = self._config.get('LoggingDB', option, as_object=False, required=False)
+        if value is None:
+            value = default
+        return convert(value)
+
+    def batch_size(self) -> int:
+        """
+        Gets the maximum number of rows written in one INSERT.
+
+        :return: ``int``
+        """
+        return self._get('batch_size', 100, int)
+
+    def flush_interval(self) -> float:
+        """
+        Gets the maximum number of seconds a row waits in the queue before it is written.
+
+        :return: ``float``
+        """
+        return self._get('flush_interval_seconds', 1.0, float)
+
+    def queue_size(self) -> int:
+        """
+        Gets the maximum number of rows waiting to be written.
+
+        :return: ``int``
+        """
+        return self._get('queue_size', 10000, int)
+
+    def enqueue_timeout(self) -> float:
+        """
+        Gets the number of seconds to wait for room in a full queue before the row is dropped.
+
+        :return: ``float``
+        """
+        return self._get('enqueue_timeout_seconds', 0.05, float)
+
+    def writer_settings(self) -> dict:
+        """
+        Gets all of the settings as keyword arguments for :py:class:`BufferedAuditWriter`.
+
+        :return: ``dict``
+        """
+        return {'batch_size': self.batch_size(),
+                'flush_interval': self.flush_interval(),
+                'queue_size': self.queue_size(),
+                'enqueue_timeout': self.enqueue_timeout()}
+
+
+class BufferedAuditWriter(object):
+    """
+    Writes rows to a table in batches from a background thread.
+
+    A batch is written when it reaches batch_size rows or when flush_interval seconds have
+    passed since its first row was queued.  If the database falls behind and the queue fills
+    up, callers wait up to enqueue_timeout seconds for room and then the row is dropped.
+
+    :param engine: SQLAlchemy database engine, shared by all batches.
+    :type engine: :py:class:`sqlalchemy.engine.Engine`
+    :param table: The table to insert into.
+    :type table: :py:class:`sqlalchemy.Table`
+    :param batch_size: The maximum number of rows written in one INSERT.
+    :type batch_size: ``int``
+    :param flush_interval: The maximum number of seconds a row waits before being written.
+    :type flush_interval: ``float``
+    :param queue_size: The maximum number of rows waiting to be written.
+    :type queue_size: ``int``
+    :param enqueue_timeout: Seconds to wait for room in a full queue before dropping a row.
+    :type enqueue_timeout: ``float``
+    """
+    _STOP = object()
+
+    def __init__(self, engine, table, batch_size=100, flush_interval=1.0, queue_size=10000, enqueue_timeout=0.05):
+        """
+        Constructor.
+        """
+        super(BufferedAuditWriter, self).__init__()
+        self._engine = engine
+        self._table = table
+        self._batch_size = max(1, batch_size)
+        self._flush_interval = flush_interval
+        self._enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._reported_dropped = 0
+
+        self._thread = threading.Thread(target=self._run, name='audit-writer-{0}'.format(table.name), daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, row):
+        """
+        Queues a row to be written.
+
+        :param row: The column values for the row, every row must have the same keys.
+        :type row: ``dict``
+        :return: Whether or not the row was queued.
+        :rtype: ``bool``
+        """
+        if self._closed:
+            self._count_dropped()
+            return False
+        try:
+            self._queue.put(row, timeout=self._enqueue_timeout)
+            return True
+        except queue.Full:
+            self._count_dropped()
+            return False
+
+    def _count_dropped(self):
+        with self._lock:
+            self.dropped += 1
+
+    def _next_batch(self):
+        """
+        Waits for the next batch of rows.
+
+        :return: The rows and whether or not the writer was asked to stop.
+        :rtype: ``tuple``
+        """
+        batch = []
+        stop = False
+        # Block until there is something to write, then give the batch up to the flush interval to fill up.
+        item = self._queue.get()
+        deadline = time.monotonic() + self._flush_interval
+        while True:
+            if item is self._STOP:
+                stop = True
+                break
+            batch.append(item)
+            if len(batch) >= self._batch_size:
+                break
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+        return batch, stop
+
+    def _flush(self, batch):
+        """
+        Writes a batch of rows with a single multi-row INSERT.
+
+        :param batch: The rows.
+        :type batch: ``list`` of ``dict``
+        """
+        try:
+            with self._engine.begin() as conn:
+                conn.execute(self._table.insert().values(batch))
+            with self._lock:
+                self.written += len(batch)
+        except Exception as ex:
+            with self._lock:
+                self.failed += len(batch)
+            logger.error('Unable to write {0} rows to {1}: {2}'.format(len(batch), self._table.name, ex))
+
+        with self._lock:
+            dropped = self.dropped - self._reported_dropped
+            self._reported_dropped = self.dropped
+        if dropped:
+            logger.warning('Dropped {0} rows for {1}, the logging database is not keeping up.'.format(
+                dropped, self._table.name))
+
+    def _run(self):
+        """
+        The background thread, writes batches until the writer is closed and the queue is drained.
+        """
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            if batch:
+                self._flush(batch)
+
+        # Anything queued after the stop marker still gets written.
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not self._STOP:
+                remaining.append(item)
+        for start in range(0, len(remaining), self._batch_size):
+            self._flush(remaining[start:start + self._batch_size])
+
+    def close(self, timeout=5.0):
+        """
+        Stops accepting rows and waits for the queued rows to be written.
+
+        :param timeout: The maximum number of seconds to wait.
+        :type timeout: ``float``
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning('Audit writer for {0} did not drain before closing.'.format(self._table.name))
+            return
+        self._thread.join(timeout)
+
+    def stats(self):
+        """
+        Gets the writer counters.
+
+        :return: The written, dropped and failed row counts and the current queue depth.
+        :rtype: ``dict``
+        """
+        with self._lock:
+            return {'written': self.written,
+                    'dropped': self.dropped,
+                    'failed': self.failed,
+                    'queued': self._queue.qsize()}
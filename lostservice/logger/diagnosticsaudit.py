@@ -8,7 +8,7 @@ Diagnostic auditing.
 """
 from lostservice.configuration import Configuration
 from lostservice.logger.auditlog import AuditableEvent, AuditListener
-from sqlalchemy.orm import sessionmaker
+from lostservice.logger.auditwriter import AuditWriterConfigWrapper, BufferedAuditWriter
 from sqlalchemy.sql import func
 from sqlalchemy import Column, Integer, String, DateTime, Text
 from sqlalchemy.ext.declarative import declarative_base
@@ -76,6 +76,9 @@ class DiagnosticAuditListener(AuditListener):
         connection_string = self._config.get_logging_db_connection_string()
         engine = create_engine(connection_string)
         Diagnostic.__table__.create(bind=engine, checkfirst=True)
+        self._writer = BufferedAuditWriter(engine,
+                                           Diagnostic.__table__,
+                                           **AuditWriterConfigWrapper(config).writer_settings())
 
     def record_event(self, event: DiagnosticEvent):
         """
@@ -85,26 +88,26 @@ class DiagnosticAuditListener(AuditListener):
          :type event: :py:class:`lostservice.logging.diagnostic.AuditableEvent`
         """
         if type(event) is DiagnosticEvent:
-            connection_string = self._config.get_logging_db_connection_string()
-            engine = create_engine(connection_string)
-            session = sessionmaker()
-            session.configure(bind=engine)
-
-            diag = Diagnostic()
-            diag.qpslogid = event.qps_log_id
-            diag.eventid = event.event_id
-            diag.priority = event.priority
-            diag.severity = event.severity
-            diag.activityid = event.activity_id
-            diag.categoryname = event.category_name
-            diag.title = event.title
-            diag.timestamputc = event.timestamp_utc
-            diag.machinename = event.machine_name
-            diag.serverid = event.server_id
-            diag.machineid = event.machine_id
-            diag.message = event.message
-            diag.formattedmessage = event.formatted_message
-
-            s = session()
-            s.add(diag)
-            s.commit()
+            self._writer.write({
+                'qpslogid': event.qps_log_id,
+                'eventid': event.event_id,
+                'priority': event.priority,
+                'severity': event.severity,
+                'activityid': event.activity_id,
+                'categoryname': event.category_name,
+                'title': event.title,
+                'timestamputc': event.timestamp_utc,
+                'machinename': event.machine_name,
+                'serverid': event.server_id,
+                'machineid': event.machine_id,
+                'message': event.message,
+                'formattedmessage': event.formatted_message
+            })
+
+    def stats(self):
+        """
+        Gets the audit writer counters.
+
+        :return: ``dict``
+        """
+        return self._writer.stats()
@@ -8,9 +8,17 @@ Class to handle sending Logs to Logging Service(s)
 """
 
 
+import copy
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from injector import inject
 from lxml import etree
 import requests
+from requests.adapters import HTTPAdapter
 import uuid
+from lostservice.configuration import Configuration
 from lostservice.configuration import general_logger
 logger = general_logger()
 
@@ -45,71 +53,124 @@ wrapper_nsmap = {
 }
 
 
-def create_NENA_log_events(request_text, query_type, start_time, response_text, end_time, conf):
+
+
+class NenaLoggingConfigWrapper(object):
     """
-    Create and Send Request and Response to the list of configured logging service urls.
-    :param request_text:  request
-    :param query_type: Type of Query
-    :param start_time: UTC
-    :param response_text: response
-    :param end_time:  UTC
-    :param conf: configuration file
-    :return: 
+    A wrapper object for the NENA logging configuration.
     """
-    logger.debug('Create NENA Log Events: Begin')
-    #get settings from ini file
-    logging_service_urls = conf.get('Logging', 'logging_services', as_object=True, required=False)
-    server_id = conf.get('Service', 'source_uri', as_object=False, required=False)
-    # Check to see if NENA Logging Service has been configured (optional)
-    if len(logging_service_urls) < 1:
-        logger.info('NENA Logging: No Service configured')
-        return
+    @inject
+    def __init__(self, config: Configuration):
+        """
+        Constructor.
+
+        :param config: The configuration object.
+        :type config: :py:class:`lostservice.configuration.Configuration`
+        """
+        self._config = config
+
+    def _get(self, option, default, convert):
+        value = self._config.get('Logging', option, as_object=False, required=False)
+        if value is None or value == '':
+            value = default
+        return convert(value)
+
+    def logging_service_urls(self) -> dict:
+        """
+        Gets the logging services to send log events to, keyed by name.
+
+        :return: ``dict``
+        """
+        urls = self._config.get('Logging', 'logging_services', as_object=True, required=False)
+        return urls if isinstance(urls, dict) else {}
+
+    def server_id(self) -> str:
+        """
+        Gets the id of this server sent with every log event.
+
+        :return: ``str``
+        """
+        return self._config.get('Service', 'source_uri', as_object=False, required=False)
+
+    def max_workers(self) -> int:
+        """
+        Gets the number of threads posting log events.
+
+        :return: ``int``
+        """
+        return self._get('nena_max_workers', 4, int)
+
+    def max_pending(self) -> int:
+        """
+        Gets the maximum number of posts waiting or in flight, log events beyond that are dropped.
+
+        :return: ``int``
+        """
+        return self._get('nena_max_pending', 1000, int)
+
+    def max_retries(self) -> int:
+        """
+        Gets the number of times a failed post is retried.
 
+        :return: ``int``
+        """
+        return self._get('nena_max_retries', 3, int)
 
-    # add query_ip_port, response_ip_port  TODO get IP and Port
-    query_ip_port = '127.0.0.1:8080'
-    response_ip_port = '127.0.0.1:8080'
+    def retry_backoff(self) -> float:
+        """
+        Gets the number of seconds to wait before the first retry, doubled for each retry after that.
 
-    # Create Log ID used for both Request and Response
-    nena_log_id = 'urn:nena:uid:logEvent:%s' % str(uuid.uuid4())
+        :return: ``float``
+        """
+        return self._get('nena_retry_backoff_seconds', 0.5, float)
 
+    def max_retry_backoff(self) -> float:
+        """
+        Gets the maximum number of seconds to wait between retries.
+
+        :return: ``float``
+        """
+        return self._get('nena_max_retry_backoff_seconds', 5.0, float)
+
+    def timeout(self) -> float:
+        """
+        Gets the number of seconds to wait for a logging service to respond.
+
+        :return: ``float``
+        """
+        return self._get('nena_timeout_seconds', 5.0, float)
+
+
+def _query_validity(query_type):
+    """
+    Classifies the query type for the log event.
+
+    :param query_type: The name of the query, None if the request couldn't be parsed.
+    :type query_type: ``str``
+    :return: One of QUERYVALID, QUERYMALFROMED or QUERYOTHER.
+    :rtype: ``str``
+    """
+    if query_type is None:
+        return QUERYMALFROMED
     if (str.lower(query_type) == 'findservice') or (str.lower(query_type) == 'listservices') or (
-              str.lower(query_type) == 'listervicebylocation') or (str.lower(query_type) == 'getserviceboundary'):
-        is_valid_query = QUERYVALID
+              str.lower(query_type) == 'listservicesbylocation') or (str.lower(query_type) == 'getserviceboundary'):
+        return QUERYVALID
     elif(str.lower(query_type) == QUERYMALFROMED):
-        is_valid_query = QUERYMALFROMED
-    else:
-        is_valid_query = QUERYOTHER
-    #Soap Structure
-    #Envelope
-     #Body
-      #LogEventMessageRequest
-        #LogEventTimestamp
-        #LogEventBody
-          #LoSTQueryAdapter
-            #...Request or Response.
-        #...
-      #LogEventMessageRequest
-     #Body
-    #Envelope
-
-    _send_nenalog_request(nena_log_id, request_text, start_time, server_id, query_ip_port, is_valid_query, logging_service_urls)
-    _send_nenalog_response(nena_log_id, response_text, end_time, server_id, response_ip_port, logging_service_urls)
-
-# End of create_NENA_log_events
-
-
-def _send_nenalog_request(nena_log_id, request_text, start_time, server_id, query_ip_port, is_valid_query, logging_service_urls):
+        return QUERYMALFROMED
+    return QUERYOTHER
+
+
+def _build_nenalog_request(nena_log_id, request, request_text, start_time, server_id, query_ip_port, is_valid_query):
     """
-    Send the Request
+    Build the Request log event
     :param nena_log_id: Log_Id
+    :param request: parsed request, None if it couldn't be parsed
     :param request_text: request
     :param start_time: UTC
     :param server_id: Host Id
     :param query_ip_port: 
     :param is_valid_query: 
-    :param logging_service_urls: nena log service Url
-    :return: 
+    :return: The SOAP envelope
     """
 
     # Create the SOAP envelope.
@@ -141,14 +202,16 @@ def _send_nenalog_request(nena_log_id, request_text, start_time, server_id, quer
         lost_query_adapter = etree.SubElement(log_event_body, '{%s}LoSTQueryAdapter' % DATA_TYPES_NS)
         # Now add the the request which will be one of these
         # (findService,listServicesByLocation,listServices, getServiceBoundary) to the lost_query_adapter...
-        xml_request = etree.fromstring(request_text)
-        lost_query_adapter.append(xml_request)
+        # Appending moves an element, so add a copy and leave the caller's tree alone.
+        lost_query_adapter.append(copy.deepcopy(request))
     elif(is_valid_query == QUERYMALFROMED):
         # create LoSTQueryAdapter
         lost_malformed_query = etree.SubElement(log_event_body, '{%s}LoSTMalformedQuery' % DATA_TYPES_NS)
         # Malformed query apply text to LogEventBody
-        xml_request = etree.fromstring(request_text)
-        lost_malformed_query.append(xml_request)
+        if request is not None:
+            lost_malformed_query.append(copy.deepcopy(request))
+        else:
+            lost_malformed_query.text = request_text.decode() if isinstance(request_text, bytes) else request_text
     # Create DirectionValuesCodeType
     direction_values_code_type = etree.SubElement(log_event_body, '{%s}DirectionValuesCodeType' % CODE_LIST_NS)
     direction_values_code_type.text = 'incoming'
@@ -157,23 +220,19 @@ def _send_nenalog_request(nena_log_id, request_text, start_time, server_id, quer
     lost_query_id = etree.SubElement(log_event_body, '{%s}LoSTQueryId' % DATA_TYPES_NS)
     lost_query_id.text = nena_log_id
 
-    logger.info(etree.tostring(soap_env, pretty_print=True))
+    return soap_env
 
-    for key, url in logging_service_urls.items():
-        _post_nena_logging(soap_env, request_text, url)
+# End of _build_nenalog_request
 
-# End of _send_nenalog_request
-
-def _send_nenalog_response(nena_log_id, response_text, end_time, server_id, response_ip_port, logging_service_urls):
+def _build_nenalog_response(nena_log_id, response, end_time, server_id, response_ip_port):
     """
-    Send the Response
+    Build the Response log event
     :param nena_log_id: Log_Id
-    :param response_text: response
+    :param response: parsed response
     :param end_time:  end time UTC
     :param server_id: host Id
     :param response_ip_port:
-    :param logging_service_urls: nena log service Url
-    :return: 
+    :return: The SOAP envelope
     """
 
     # Create the SOAP envelope.
@@ -206,29 +265,174 @@ def _send_nenalog_response(nena_log_id, response_text, end_time, server_id, resp
     lost_resposne_id.text = nena_log_id
     # Now add the the response to the lost_query_adapter
     # (findService,listServicesByLocation,listServices, getServiceBoundary) ...
-    xml_response = etree.fromstring(response_text)
-    lost_query_adapter.append(xml_response)
-
-    logger.info(etree.tostring(soap_env, pretty_print=True))
+    if response is not None:
+        lost_query_adapter.append(copy.deepcopy(response))
 
-    for key, url in logging_service_urls.items():
-        _post_nena_logging(soap_env, response_text, url)
+    return soap_env
 
-# End of _send_nenalog_response
+# End of _build_nenalog_response
 
 
-def _post_nena_logging(soap_env, raw_text, url):
+class NenaLogExporter(object):
     """
+    Sends log events to the configured NENA logging services.
 
-    :param soap_env: data to be logged includes request/response
-    :param raw_text: request/response
-    :param url: url for nena logging
-    :return:
+    Posts go out concurrently to every logging service from a small thread pool over a shared
+    keep-alive session, failed posts are retried with a bounded exponential backoff.  The
+    number of posts waiting or in flight is bounded, when a logging service is slow enough
+    for that to fill up new log events are dropped (and counted) instead of queueing forever.
     """
-
-    try:
-        requests.post(url, data=etree.tostring(soap_env))
-        logger.debug('posting to Nena log')
-    except Exception as e:
-        logger.warning('%s :Raw Event: %s' % (str(e), raw_text))
-# End of _post_nena_logging
+    def __init__(self, config: NenaLoggingConfigWrapper, session: requests.Session=None):
+        """
+        Constructor.
+
+        :param config: The NENA logging configuration wrapper.
+        :type config: :py:class:`lostservice.logger.nenalogging.NenaLoggingConfigWrapper`
+        :param session: The HTTP session to post with, one is created if not given.
+        :type session: :py:class:`requests.Session`
+        """
+        super(NenaLogExporter, self).__init__()
+        self._logging_service_urls = config.logging_service_urls()
+        self._server_id = config.server_id()
+        self._max_pending = config.max_pending()
+        self._max_retries = config.max_retries()
+        self._retry_backoff = config.retry_backoff()
+        self._max_retry_backoff = config.max_retry_backoff()
+        self._timeout = config.timeout()
+
+        max_workers = max(1, config.max_workers())
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=max(1, len(self._logging_service_urls)), pool_maxsize=max_workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self._session = session
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def export(self, request, request_text, query_type, start_time, response, end_time):
+        """
+        Creates the request and response log events and queues them to be sent to every
+        configured logging service.
+
+        :param request: The parsed request, None if it couldn't be parsed.
+        :type request: :py:class:`lxml.etree.Element`
+        :param request_text: The request text, used when the request couldn't be parsed.
+        :type request_text: ``str``
+        :param query_type: Type of Query, None if the request couldn't be parsed.
+        :type query_type: ``str``
+        :param start_time: UTC
+        :param response: The parsed response.
+        :type response: :py:class:`lxml.etree.Element`
+        :param end_time: UTC
+        """
+        logger.debug('Create NENA Log Events: Begin')
+        # Check to see if NENA Logging Service has been configured (optional)
+        if len(self._logging_service_urls) < 1:
+            logger.info('NENA Logging: No Service configured')
+            return
+
+        # add query_ip_port, response_ip_port  TODO get IP and Port
+        query_ip_port = '127.0.0.1:8080'
+        response_ip_port = '127.0.0.1:8080'
+
+        # Create Log ID used for both Request and Response
+        nena_log_id = 'urn:nena:uid:logEvent:%s' % str(uuid.uuid4())
+
+        request_env = _build_nenalog_request(nena_log_id, request, request_text, start_time, self._server_id,
+                                             query_ip_port, _query_validity(query_type))
+        response_env = _build_nenalog_response(nena_log_id, response, end_time, self._server_id, response_ip_port)
+
+        for soap_env in [request_env, response_env]:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(etree.tostring(soap_env, pretty_print=True))
+            body = etree.tostring(soap_env)
+            for key, url in self._logging_service_urls.items():
+                self._submit(url, body)
+
+    def _submit(self, url, body):
+        """
+        Queues a post, or drops it if too many are already waiting.
+
+        :param url: url for nena logging
+        :param body: The serialized log event.
+        :type body: ``bytes``
+        """
+        with self._lock:
+            if self.pending >= self._max_pending:
+                self.dropped += 1
+                logger.warning('NENA logging is backed up, dropped a log event for {0}.'.format(url))
+                return
+            self.pending += 1
+        self._executor.submit(self._post, url, body)
+
+    def _post(self, url, body):
+        """
+        Posts a log event, retrying with backoff on failure.
+
+        :param url: url for nena logging
+        :param body: The serialized log event.
+        :type body: ``bytes``
+        """
+        try:
+            for attempt in range(self._max_retries + 1):
+                if attempt > 0:
+                    with self._lock:
+                        self.retried += 1
+                    time.sleep(min(self._max_retry_backoff, self._retry_backoff * (2 ** (attempt - 1))))
+                started = time.monotonic()
+                try:
+                    reply = self._session.post(url, data=body, timeout=self._timeout)
+                    reply.raise_for_status()
+                except Exception as e:
+                    logger.warning('Posting to NENA log {0} failed (attempt {1}): {2}'.format(url, attempt + 1, e))
+                    continue
+                latency = time.monotonic() - started
+                with self._lock:
+                    self.sent += 1
+                    self._latency_total += latency
+                    self._latency_max = max(self._latency_max, latency)
+                logger.debug('posting to Nena log')
+                return
+
+            with self._lock:
+                self.failed += 1
+            logger.error('Giving up posting to NENA log {0}: Raw Event: {1}'.format(url, body))
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def stats(self):
+        """
+        Gets the exporter counters.
+
+        :return: The pending (queue depth), sent, failed, retried and dropped counts and the
+                 average and maximum post latency in milliseconds.
+        :rtype: ``dict``
+        """
+        with self._lock:
+            return {'pending': self.pending,
+                    'sent': self.sent,
+                    'failed': self.failed,
+                    'retried': self.retried,
+                    'dropped': self.dropped,
+                    'latency_avg_ms': (self._latency_total / self.sent * 1000.0) if self.sent else 0.0,
+                    'latency_max_ms': self._latency_max * 1000.0}
+
+    def shutdown(self, wait=True):
+        """
+        Stops the exporter.
+
+        :param wait: Whether or not to wait for the queued posts to be sent.
+        :type wait: ``bool``
+        """
+        self._executor.shutdown(wait=wait)
+        self._session.close()
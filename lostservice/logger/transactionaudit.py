@@ -8,7 +8,7 @@ Transaction auditing.
 """
 from lostservice.configuration import Configuration
 from lostservice.logger.auditlog import AuditableEvent, AuditListener
-from sqlalchemy.orm import sessionmaker
+from lostservice.logger.auditwriter import AuditWriterConfigWrapper, BufferedAuditWriter
 from sqlalchemy.sql import func
 from sqlalchemy import Column, Integer, String, DateTime, Text
 from sqlalchemy.ext.declarative import declarative_base
@@ -111,6 +111,9 @@ class TransactionAuditListener(AuditListener):
         connection_string = self._config.get_logging_db_connection_string()
         engine = create_engine(connection_string)
         Transaction.__table__.create(bind=engine, checkfirst=True)
+        self._writer = BufferedAuditWriter(engine,
+                                           Transaction.__table__,
+                                           **AuditWriterConfigWrapper(config).writer_settings())
 
     def record_event(self, event: TransactionEvent):
         """
@@ -120,43 +123,43 @@ class TransactionAuditListener(AuditListener):
          :type event: :py:class:`lostservice.logging.transactionau.AuditableEvent`
         """
         if type(event) is TransactionEvent:
-            connection_string = self._config.get_logging_db_connection_string()
-            engine = create_engine(connection_string)
-            session = sessionmaker()
-            session.configure(bind=engine)
-
-            trans = Transaction()
-            trans.qpslogid = event.qps_log_id  # find the logging id
-            trans.activityid = event.activity_id
-            trans.serverid = event.server_id  # server id
-            trans.machineid = event.machine_id  # machine id
-            trans.clientid = event.client_id
-            trans.starttimeutc = event.start_time_utc
-            trans.endtimeutc = event.end_time_utc
-            trans.transactionms = event.transaction_ms
-            trans.request = event.request
-            trans.response = event.response
-            trans.requesttype = event.request_type  # http request type
-            trans.requestfindsvctype = event.request_find_svc_type
-            trans.requestloctype = event.request_loc_type
-            trans.requestlocfmt = event.request_loc_fmt
-            trans.requestloc = event.request_loc
-            trans.requestlocx = event.request_loc_x
-            trans.requestlocy = event.request_loc_y
-            trans.requestlocwkt = event.request_loc_wkt
-            trans.requestlocshapetype = event.request_loc_shape_type
-            trans.requestsvcurn = event.request_svc_urn
-            trans.responsetype = event.response_type
-            trans.responsesrctype = event.response_src_type
-            trans.responsewarningtype = event.response_warning_type
-            trans.responseerrortype = event.response_error_type
-            trans.responselvftype = event.response_lvf_type
-            trans.responsecivgissrctype = event.response_civ_gis_src_type
-            trans.notes = event.notes
-
             location_point = Point(event.request_loc_x, event.request_loc_y)
-            trans.wkb_geometry = shape.from_shape(location_point, srid=4326)
 
-            s = session()
-            s.add(trans)
-            s.commit()
+            self._writer.write({
+                'qpslogid': event.qps_log_id,  # find the logging id
+                'activityid': event.activity_id,
+                'serverid': event.server_id,  # server id
+                'machineid': event.machine_id,  # machine id
+                'clientid': event.client_id,
+                'starttimeutc': event.start_time_utc,
+                'endtimeutc': event.end_time_utc,
+                'transactionms': event.transaction_ms,
+                'request': event.request,
+                'response': event.response,
+                'requesttype': event.request_type,  # http request type
+                'requestfindsvctype': event.request_find_svc_type,
+                'requestloctype': event.request_loc_type,
+                'requestlocfmt': event.request_loc_fmt,
+                'requestloc': event.request_loc,
+                'requestlocx': event.request_loc_x,
+                'requestlocy': event.request_loc_y,
+                'requestlocwkt': event.request_loc_wkt,
+                'requestlocshapetype': event.request_loc_shape_type,
+                'requestsvcurn': event.request_svc_urn,
+                'responsetype': event.response_type,
+                'responsesrctype': event.response_src_type,
+                'responsewarningtype': event.response_warning_type,
+                'responseerrortype': event.response_error_type,
+                'responselvftype': event.response_lvf_type,
+                'responsecivgissrctype': event.response_civ_gis_src_type,
+                'notes': event.notes,
+                'wkb_geometry': shape.from_shape(location_point, srid=4326)
+            })
+
+    def stats(self):
+        """
+        Gets the audit writer counters.
+
+        :return: ``dict``
+        """
+        return self._writer.stats()
@@ -20,6 +20,7 @@ from shapely.geometry.base import BaseGeometry
 import shapely.geometry as shp_geom
 from shapely.wkt import loads
 from lostservice.geometry import reproject_geom, getutmsrid, calculate_orientation, calculate_arc
+import lostservice.spatialreference as spatialreference
 
 
 class Geodetic2D(object):
@@ -39,6 +40,7 @@ class Geodetic2D(object):
         self._spatial_ref: str = spatial_ref
         self._spatial_ref_id: int = Geodetic2D.trim_srid_urn(spatial_ref) if spatial_ref is not None else None
         self._shapely_internal: BaseGeometry = None
+        self._wkb_elements = {}
 
     @property
     def spatial_ref(self) -> str:
@@ -53,6 +55,7 @@ class Geodetic2D(object):
     def spatial_ref(self, value: str) -> None:
         self._spatial_ref = value
         self._spatial_ref_id = Geodetic2D.trim_srid_urn(value)
+        self._wkb_elements = {}
 
     @property
     def sr_id(self) -> int:
@@ -93,12 +96,10 @@ class Geodetic2D(object):
 
         :param srid: The well known SRID.
         :type srid: ``int``
-        :return: A SpatialReference instance for the given SRID.
+        :return: The shared SpatialReference instance for the given SRID, it must not be modified.
         :rtype: :py:class:`osr.SpatialReference`
         """
-        spatial_reference: osr.SpatialReference = osr.SpatialReference()
-        spatial_reference.ImportFromEPSG(srid)
-        return spatial_reference
+        return spatialreference.get_spatial_reference(srid)
 
     def to_ogr_geometry(self, project_to: int=None) -> ogr.Geometry:
         """
@@ -127,10 +128,14 @@ class Geodetic2D(object):
         :return: The geometry as a WKBELement.
         :rtype: :py:class:`WKBElement`
         """
+        # Every lookup for the location (coverage, each service, ...) shares the projected geometry.
+        wkb: WKBElement = self._wkb_elements.get(project_to)
+        if wkb is not None:
+            return wkb
+
         if self._shapely_internal is None:
             self._shapely_internal = self.build_shapely_geometry()
 
-        wkb: WKBElement = None
         if project_to and project_to != self.sr_id:
             ogr_geom: ogr.Geometry = ogr.CreateGeometryFromWkt(self._shapely_internal.wkt)
             ogr_geom.AssignSpatialReference(Geodetic2D.get_ogr_sr(self.sr_id))
@@ -139,6 +144,7 @@ class Geodetic2D(object):
         else:
             wkb = from_shape(self._shapely_internal, self.sr_id)
 
+        self._wkb_elements[project_to] = wkb
         return wkb
 
 
@@ -17,7 +17,7 @@ class QueryRunner(object):
     handling.
     """
 
-    def __init__(self, converter, handler):
+    def __init__(self, converter, handler, cache=None):
         """
         Constructor
 
@@ -25,9 +25,22 @@ class QueryRunner(object):
         :type converter: A subclass of :py:class:`lostservice.converter.Converter`
         :param handler: A reference to an appropriate Hander instance.
         :type handler: A subclass of :py:class:`lostservice.handler.Handler`
+        :param cache: Optional response cache consulted before the handler is called.
+        :type cache: :py:class:`lostservice.caching.ResponseCache`
         """
         self._converter = converter
         self._handler = handler
+        self._cache = cache
+
+    def parse(self, data):
+        """
+        Parses the request.
+
+        :param data: The request.
+        :type data:
+        :return: The request object.
+        """
+        return self._converter.parse(data)
 
     def run(self, data, context):
         """
@@ -39,11 +52,52 @@ class QueryRunner(object):
         :type context: ``dict``
         :return: The response xml.
         """
-        request = self._converter.parse(data)
-        response = self._handler.handle_request(request, context)
+        return self.run_request(self.parse(data), context)
+
+    def run_request(self, request, context, use_cache=True):
+        """
+        Runs an already parsed request through the handler and formats the response.
+
+        :param request: The request object.
+        :param context: The request context.
+        :type context: ``dict``
+        :param use_cache: Whether or not to consult and fill the response cache.
+        :type use_cache: ``bool``
+        :return: The response xml.
+        """
+        cache_key = self._cache.key_for(request) if self._cache is not None and use_cache else None
+        response = self._cache.get(cache_key, request) if cache_key is not None else None
+        if response is None:
+            response = self._handler.handle_request(request, context)
+            if cache_key is not None:
+                self._cache.put(cache_key, response)
+
         output = self._converter.format(response['response'])
         return_value = {'latitude': response['latitude'],
                         'longitude': response['longitude'],
                         'response': output}
 
         return return_value
+
+    def run_request_for_services(self, request, service_urns, context):
+        """
+        Runs an already parsed request through the handler once for several services at the same location,
+        see :py:meth:`lostservice.handling.core.FindServiceHandler.handle_request_for_services`.  The response
+        cache isn't used.
+
+        :param request: The request object, its service is ignored.
+        :param service_urns: The identifiers for the services to look up.
+        :type service_urns: ``list`` of ``str``
+        :param context: The request context.
+        :type context: ``dict``
+        :return: The response xml, latitude and longitude for each service by service urn, just like
+                 :py:meth:`run_request` returns them, or the exception raised handling it.
+        :rtype: ``OrderedDict``
+        """
+        results = self._handler.handle_request_for_services(request, service_urns, context)
+        for service_urn, response in results.items():
+            if not isinstance(response, Exception):
+                results[service_urn] = {'latitude': response['latitude'],
+                                        'longitude': response['longitude'],
+                                        'response': self._converter.format(response['response'])}
+        return results
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. currentmodule:: lostservice.serving
+.. moduleauthor:: Tom Weitzel <tweitzel@geo-comm.com>
+
+Pre-forking production server for the LoST web service.
+
+The application is created once in the parent process, so the configuration,
+the reflected tables, the in-memory boundary index and the spatial references
+are built once and shared copy-on-write with the workers.  The listening socket
+is also bound in the parent and inherited by every worker.  The parent closes its
+pooled database connections right before each fork.  Each worker starts its own
+per-process parts (database connections, audit writers, NENA logging, query
+runners) after the fork and serves requests with a threaded werkzeug server.
+
+On SIGTERM or SIGINT the parent asks every worker to stop; a worker stops
+accepting connections, waits up to graceful_timeout_seconds for the requests it
+is handling to finish, flushes its logging and exits.
+"""
+
+import argparse
+import atexit
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from werkzeug.serving import make_server
+import lostservice.configuration as config
+from lostservice.configuration import general_logger
+logger = general_logger()
+
+
+class ServingConfigWrapper(object):
+    """
+    A wrapper object for the server configuration, read from the Serving section.
+    """
+    def __init__(self, config: config.Configuration):
+        """
+        Constructor.
+
+        :param config: The configuration object.
+        :type config: :py:class:`lostservice.configuration.Configuration`
+        """
+        self._config = config
+
+    def _get(self, option, default, convert):
+        value = self._config.get('Serving', option, as_object=False, required=False)
+        if value is None or value == '':
+            value = default
+        return convert(value)
+
+    def workers(self) -> int:
+        """
+        Gets the number of worker processes, defaults to the number of CPUs.  0 serves
+        from a single process without forking.
+
+        :return: ``int``
+        """
+        return max(0, self._get('workers', os.cpu_count() or 1, int))
+
+    def host(self) -> str:
+        """
+        Gets the address to listen on.
+
+        :return: ``str``
+        """
+        return self._get('host', '0.0.0.0', str)
+
+    def port(self) -> int:
+        """
+        Gets the port to listen on.
+
+        :return: ``int``
+        """
+        return self._get('port', 8080, int)
+
+    def backlog(self) -> int:
+        """
+        Gets the listen backlog of the shared socket.
+
+        :return: ``int``
+        """
+        return self._get('backlog', 128, int)
+
+    def graceful_timeout(self) -> float:
+        """
+        Gets the number of seconds a stopping worker waits for the requests in flight to finish.
+
+        :return: ``float``
+        """
+        return self._get('graceful_timeout_seconds', 30.0, float)
+
+
+class _ClosingIterator(object):
+    """
+    Wraps a WSGI response so a callback runs when the server closes it.
+    """
+    def __init__(self, result, callback):
+        self._result = result
+        self._callback = callback
+
+    def __iter__(self):
+        return iter(self._result)
+
+    def close(self):
+        try:
+            if hasattr(self._result, 'close'):
+                self._result.close()
+        finally:
+            self._callback()
+
+
+class InFlightMiddleware(object):
+    """
+    WSGI middleware counting the requests being handled, so a stopping worker knows when it is idle.
+
+    :param app: The WSGI application.
+    """
+    def __init__(self, app):
+        """
+        Constructor.
+        """
+        super(InFlightMiddleware, self).__init__()
+        self._app = app
+        self._condition = threading.Condition()
+        self.in_flight = 0
+
+    def __call__(self, environ, start_response):
+        with self._condition:
+            self.in_flight += 1
+        try:
+            result = self._app(environ, start_response)
+        except BaseException:
+            self._finished()
+            raise
+        # The request is done once the server has written the response and closed it.
+        return _ClosingIterator(result, self._finished)
+
+    def _finished(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def wait_idle(self, timeout):
+        """
+        Waits for the requests in flight to finish.
+
+        :param timeout: The maximum number of seconds to wait.
+        :type timeout: ``float``
+        :return: Whether or not every request finished.
+        :rtype: ``bool``
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self.in_flight > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+
+def bind_socket(host, port, backlog=128):
+    """
+    Binds the listening socket shared by all of the workers.
+
+    :param host: The address to listen on.
+    :type host: ``str``
+    :param port: The port to listen on.
+    :type port: ``int``
+    :param backlog: The listen backlog.
+    :type backlog: ``int``
+    :return: The listening socket.
+    :rtype: :py:class:`socket.socket`
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock, host, port, graceful_timeout):
+    """
+    Serves requests in a worker process until it is asked to stop, never returns.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    status = 0
+    try:
+        app.start_worker()
+        counted = InFlightMiddleware(app)
+        server = make_server(host, port, counted, threaded=True, fd=sock.fileno())
+
+        def stop(signum, frame):
+            # shutdown() waits for serve_forever to return, so it can't run on the serving thread.
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        server.serve_forever()
+
+        if not counted.wait_idle(graceful_timeout):
+            logger.warning('Worker {0} stopped with {1} requests in flight.'.format(os.getpid(), counted.in_flight))
+        app.shutdown()
+    except Exception as ex:
+        logger.error('Worker {0} failed: {1}'.format(os.getpid(), ex))
+        status = 1
+    finally:
+        # Flush anything else registered to run at exit (the audit writers) and leave without unwinding the parent's stack.
+        try:
+            atexit._run_exitfuncs()
+        finally:
+            os._exit(status)
+
+
+def serve(app, workers, host='0.0.0.0', port=8080, backlog=128, graceful_timeout=30.0):
+    """
+    Serves the application with pre-forked worker processes until SIGTERM or SIGINT.
+
+    Workers that die are replaced.  When stopping, workers still running graceful_timeout
+    seconds (plus a little slack for flushing the logs) after being asked to stop are killed.
+
+    :param app: The application, created with ``start_worker=False``.
+    :type app: :py:class:`lostservice.web.LostService`
+    :param workers: The number of worker processes.
+    :type workers: ``int``
+    :param host: The address to listen on.
+    :type host: ``str``
+    :param port: The port to listen on.
+    :type port: ``int``
+    :param backlog: The listen backlog.
+    :type backlog: ``int``
+    :param graceful_timeout: Seconds a stopping worker waits for the requests in flight.
+    :type graceful_timeout: ``float``
+    """
+    sock = bind_socket(host, port, backlog)
+    children = set()
+    stopping = threading.Event()
+
+    def spawn():
+        app.before_fork()
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(app, sock, host, port, graceful_timeout)
+        children.add(pid)
+
+    def stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info('Serving on {0}:{1} with {2} workers.'.format(host, port, workers))
+    for _ in range(workers):
+        spawn()
+
+    while not stopping.is_set():
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid and pid in children:
+            children.discard(pid)
+            if not stopping.is_set():
+                logger.warning('Worker {0} exited with status {1}, starting a new one.'.format(pid, status))
+                spawn()
+        else:
+            stopping.wait(0.5)
+
+    logger.info('Stopping {0} workers.'.format(len(children)))
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    deadline = time.monotonic() + graceful_timeout + 10
+    while children and time.monotonic() < deadline:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            children.discard(pid)
+        else:
+            time.sleep(0.1)
+
+    for pid in children:
+        logger.warning('Worker {0} did not stop in time, killing it.'.format(pid))
+        try:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        except (ProcessLookupError, ChildProcessError):
+            pass
+    sock.close()
+
+
+def main(argv=None):
+    """
+    Entry point, the Serving section of the configuration can be overridden on the command line.
+
+    :param argv: The command line arguments, defaults to sys.argv.
+    :type argv: ``list`` of ``str``
+    """
+    from lostservice.web import create_app
+
+    settings = ServingConfigWrapper(config.Configuration())
+    parser = argparse.ArgumentParser(description='Runs the LoST service.')
+    parser.add_argument('--workers', type=int, default=settings.workers(),
+                        help='Number of worker processes, 0 serves from a single process.')
+    parser.add_argument('--host', default=settings.host())
+    parser.add_argument('--port', type=int, default=settings.port())
+    args = parser.parse_args(argv if argv is not None else sys.argv[1:])
+
+    if args.workers < 1:
+        from werkzeug.serving import run_simple
+        run_simple(args.host, args.port, create_app(), threaded=True, use_debugger=False, use_reloader=False)
+        return
+
+    app = create_app(start_worker=False)
+    serve(app, args.workers, host=args.host, port=args.port, backlog=settings.backlog(),
+          graceful_timeout=settings.graceful_timeout())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. currentmodule:: lostservice.spatialreference
+.. moduleauthor:: Tom Weitzel <tweitzel@geo-comm.com>
+
+Shared cache of OGR spatial references and coordinate transformations.
+
+Building a SpatialReference (ImportFromEPSG) or a CoordinateTransformation means a
+trip through the PROJ database, so they are built once and reused.  Spatial
+references are only read once created and are shared by all threads.
+Transformations are not safe to use from more than one thread at a time, so each
+thread gets its own, built from the shared spatial references.
+"""
+
+import threading
+from osgeo import osr
+
+#: The SRIDs used by the geometry code, WGS 84, web mercator and the northern and southern UTM zones.
+COMMON_SRIDS = [4326, 3857] + list(range(32601, 32661)) + list(range(32701, 32761))
+
+
+class SpatialReferenceCache(object):
+    """
+    Thread-safe cache of spatial references keyed by SRID and of coordinate transformations
+    keyed by (source SRID, target SRID).
+    """
+    def __init__(self):
+        """
+        Constructor.
+        """
+        super(SpatialReferenceCache, self).__init__()
+        self._lock = threading.Lock()
+        self._spatial_references = {}
+        self._local = threading.local()
+
+    def get_spatial_reference(self, srid):
+        """
+        Gets the spatial reference for an SRID, the returned object must not be modified.
+
+        :param srid: The well known SRID.
+        :type srid: ``int``
+        :return: The spatial reference.
+        :rtype: :py:class:`osr.SpatialReference`
+        """
+        srs = self._spatial_references.get(srid)
+        if srs is None:
+            with self._lock:
+                srs = self._spatial_references.get(srid)
+                if srs is None:
+                    srs = osr.SpatialReference()
+                    srs.ImportFromEPSG(srid)
+                    self._spatial_references[srid] = srs
+        return srs
+
+    def get_transformation(self, source_srid, target_srid):
+        """
+        Gets this thread's transformation between two SRIDs.
+
+        :param source_srid: The source SRID.
+        :type source_srid: ``int``
+        :param target_srid: The target SRID.
+        :type target_srid: ``int``
+        :return: The transformation.
+        :rtype: :py:class:`osr.CoordinateTransformation`
+        """
+        transformations = getattr(self._local, 'transformations', None)
+        if transformations is None:
+            transformations = self._local.transformations = {}
+
+        key = (source_srid, target_srid)
+        transform = transformations.get(key)
+        if transform is None:
+            transform = osr.CoordinateTransformation(self.get_spatial_reference(source_srid),
+                                                     self.get_spatial_reference(target_srid))
+            transformations[key] = transform
+        return transform
+
+    def warm_up(self, srids=None):
+        """
+        Builds the spatial references for the given SRIDs ahead of time, along with the calling
+        thread's transformations between them and WGS 84.
+
+        :param srids: The SRIDs, defaults to :py:data:`COMMON_SRIDS`.
+        :type srids: ``list`` of ``int``
+        """
+        for srid in srids if srids is not None else COMMON_SRIDS:
+            self.get_spatial_reference(srid)
+            if srid != 4326:
+                self.get_transformation(4326, srid)
+                self.get_transformation(srid, 4326)
+
+    def __len__(self):
+        return len(self._spatial_references)
+
+
+cache = SpatialReferenceCache()
+
+
+def get_spatial_reference(srid):
+    """
+    Gets the shared spatial reference for an SRID, the returned object must not be modified.
+
+    :param srid: The well known SRID.
+    :type srid: ``int``
+    :return: The spatial reference.
+    :rtype: :py:class:`osr.SpatialReference`
+    """
+    return cache.get_spatial_reference(srid)
+
+
+def get_transformation(source_srid, target_srid):
+    """
+    Gets the calling thread's transformation between two SRIDs.
+
+    :param source_srid: The source SRID.
+    :type source_srid: ``int``
+    :param target_srid: The target SRID.
+    :type target_srid: ``int``
+    :return: The transformation.
+    :rtype: :py:class:`osr.CoordinateTransformation`
+    """
+    return cache.get_transformation(source_srid, target_srid)
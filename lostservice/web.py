@@ -4,20 +4,42 @@
 
 from werkzeug.wrappers import Request, Response
 from lostservice.app import LostApplication, WebRequestContext
+from lostservice.bulk import BATCH_REQUEST
 
 
 class LostService(object):
     """
     The lost web service container.
     """
-    def __init__(self):
-        self._lostapp = LostApplication()
+    def __init__(self, start_worker=True):
+        self._lostapp = LostApplication(start_worker=start_worker)
+
+    def start_worker(self):
+        """
+        Starts the per-process parts of the application, see :py:meth:`LostApplication.start_worker`.
+        """
+        self._lostapp.start_worker()
+
+    def before_fork(self):
+        """
+        Closes the pooled database connections ahead of a fork, see :py:meth:`LostApplication.before_fork`.
+        """
+        self._lostapp.before_fork()
+
+    def shutdown(self):
+        """
+        Stops the background logging, see :py:meth:`LostApplication.shutdown`.
+        """
+        self._lostapp.shutdown()
 
     def dispatch_request(self, request):
         context = {}
         web_ctx = WebRequestContext()
         web_ctx.client_ip = request.access_route[0]
         context['web_ctx'] = web_ctx
+        if request.path.rstrip('/').endswith('/' + BATCH_REQUEST):
+            # Many findService requests at once, the response is streamed back item by item.
+            return self._lostapp.execute_find_service_batch(request.get_data(), context)
         result = self._lostapp.execute_query(request.data, context)
         return result
 
@@ -33,13 +55,16 @@ class LostService(object):
         return self.wsgi_app(environ, start_response)
 
 
-def create_app():
+def create_app(start_worker=True):
     """
     Create an instance of the lost web service.
 
+    :param start_worker: Whether or not to start the per-process parts of the application, a pre-forking
+                         server passes False and calls start_worker in each worker.
+    :type start_worker: ``bool``
     :return: :py:class:`lostservice.web.LostService`
     """
-    app = LostService()
+    app = LostService(start_worker=start_worker)
     return app
 
 if __name__ == '__main__':
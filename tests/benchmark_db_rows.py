@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark of the per-row cost of reading query results, the dictionary per row
+that _execute_query used to build against the tuple-backed rows of lostservice.db.rows.
+
+Run with ``python tests/benchmark_db_rows.py [rows] [repeat]``, it only needs SQLite.
+"""
+
+import sys
+import timeit
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Float
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.sql import select
+from lostservice.db.rows import ResultHeader, Row
+
+# The attributes FindServiceOuter._build_one_mapping reads from each mapping.
+MAPPING_KEYS = ('displayname', 'routeuri', 'servicenum', 'serviceurn', 'updatedate', 'srcunqid')
+
+
+def _setup(row_count):
+    engine = create_engine('sqlite://', poolclass=StaticPool)
+    metadata = MetaData()
+    table = Table('esbpsap', metadata, Column('gid', Integer, primary_key=True),
+                  *[Column(name, String) for name in MAPPING_KEYS + ('agency_notes',)] +
+                  [Column('AREA_RET', Float)])
+    metadata.create_all(engine)
+    engine.execute(table.insert(), [dict({name: '{0}-{1}'.format(name, gid) for name in MAPPING_KEYS},
+                                         gid=gid, agency_notes=None, AREA_RET=float(gid))
+                                    for gid in range(row_count)])
+    with engine.connect() as conn:
+        fetched = conn.execute(select([table])).fetchall()
+    return fetched
+
+
+def _as_dicts(fetched):
+    return [dict(zip(row.keys(), row)) for row in fetched]
+
+
+def _as_rows(fetched, keys):
+    header = ResultHeader(keys)
+    return [Row(header, tuple(row)) for row in fetched]
+
+
+def _read(mappings):
+    for mapping in mappings:
+        for key in MAPPING_KEYS:
+            mapping.get(key)
+        mapping['expiration'] = 'NO-CACHE'
+
+
+def main(argv):
+    row_count = int(argv[0]) if len(argv) > 0 else 100
+    repeat = int(argv[1]) if len(argv) > 1 else 2000
+    fetched = _setup(row_count)
+    keys = fetched[0].keys()
+
+    cases = [
+        ('dict per row', lambda: _as_dicts(fetched)),
+        ('tuple-backed rows', lambda: _as_rows(fetched, keys)),
+        ('dict per row + response reads', lambda: _read(_as_dicts(fetched))),
+        ('tuple-backed rows + response reads', lambda: _read(_as_rows(fetched, keys))),
+    ]
+    print('{0} rows, best of 5 x {1} repeats'.format(row_count, repeat))
+    for name, case in cases:
+        best = min(timeit.repeat(case, number=repeat, repeat=5))
+        print('{0:<36} {1:8.3f} us/row'.format(name, best / (repeat * row_count) * 1e6))
+
+    as_dict = _as_dicts(fetched)[0]
+    as_row = _as_rows(fetched, keys)[0]
+    print('{0:<36} {1:8d} bytes/row'.format('dict per row', sys.getsizeof(as_dict)))
+    print('{0:<36} {1:8d} bytes/row'.format('tuple-backed rows', sys.getsizeof(as_row) + sys.getsizeof(as_row._values)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
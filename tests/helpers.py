@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test doubles shared by the test modules.
+"""
+
+
+class FakeClock(object):
+    """
+    A clock that only moves when a test sets ``now``, hand it to anything that takes a ``clock``.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
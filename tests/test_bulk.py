@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import unittest
+from collections import OrderedDict
+from unittest.mock import MagicMock
+from lxml import etree
+from lostservice.bulk import FindServiceBatch, FindServiceBatchConfigWrapper
+from lostservice.exception import BadRequestException, build_error_response
+from lostservice.model.civic import CivicAddress
+from lostservice.model.geodetic import Point
+from lostservice.model.location import Location
+from lostservice.model.requests import FindServiceRequest
+
+_ITEM = '<item id="{0}"><findService xmlns="urn:ietf:params:xml:ns:lost1">{1}</findService></item>'
+
+
+def _batch(*items):
+    return ('<findServiceBatch>' + ''.join(_ITEM.format(item_id, body) for item_id, body in items) +
+            '</findServiceBatch>').encode()
+
+
+def _parse(element):
+    # The tests put the location type and service urn in the findService element, or the service in its own element.
+    if len(element):
+        location_type, service = element.text, element[0].text
+    else:
+        location_type, service = element.text.split(' ')
+    if location_type == 'bad':
+        raise BadRequestException('Invalid request.')
+    location = Point('urn:ogc:def:crs:EPSG::4326', 44.5, -68.2) if location_type == 'point' else CivicAddress()
+    return FindServiceRequest(location=Location(location=location), service=service)
+
+
+class FindServiceBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = MagicMock()
+        self.runner.parse.side_effect = _parse
+        self.runner.run_request.side_effect = self._run_request
+        self.runner.run_request_for_services.side_effect = self._run_request_for_services
+        self.grouped = []
+        self.db = MagicMock()
+        self.db.get_urn_table_mappings.return_value = {'urn:nena:service:sos.psap': 'esbpsap',
+                                                       'urn:nena:service:sos.fire': 'esbfire'}
+        self.db.get_containing_boundaries_for_points.side_effect = \
+            lambda locations, boundary_table: [[{'table': boundary_table}]] * len(locations)
+        self.prefetched = []
+        self.db.prefetched_point_boundaries.side_effect = self._prefetched_point_boundaries
+        self.active = None
+        self.tables = []
+
+    @contextlib.contextmanager
+    def _prefetched_point_boundaries(self, location, boundary_table, rows):
+        self.active = (boundary_table, rows)
+        self.tables.append(boundary_table)
+        try:
+            yield
+        finally:
+            self.active = None
+            self.tables.remove(boundary_table)
+
+    def _run_request(self, request, context, use_cache=True):
+        self.assertFalse(use_cache)
+        self.prefetched.append(self.active)
+        response = etree.Element('{urn:ietf:params:xml:ns:lost1}findServiceResponse')
+        response.text = request.service
+        return {'response': response, 'latitude': 0.0, 'longitude': 0.0}
+
+    def _run_request_for_services(self, request, service_urns, context):
+        self.grouped.append((request.location.location, service_urns, sorted(self.tables)))
+        results = OrderedDict()
+        for service_urn in service_urns:
+            if service_urn == 'urn:nena:service:sos.bad':
+                results[service_urn] = BadRequestException('no mappings')
+            else:
+                results[service_urn] = self._run_request(FindServiceRequest(service=service_urn), context, False)
+        return results
+
+    @staticmethod
+    def _error_response(ex):
+        return build_error_response(ex, 'some.uri')
+
+    def _execute(self, data, chunk_size=500, item_done=None):
+        target = FindServiceBatch(self.runner, self.db, self._error_response, chunk_size, item_done)
+        pieces = list(target.execute(data, {}))
+        return target, pieces, etree.fromstring(b''.join(pieces))
+
+    def test_items_answered_in_order(self):
+        data = _batch(('a', 'point urn:nena:service:sos.psap'),
+                      ('b', 'civic urn:nena:service:sos.psap'),
+                      ('c', 'point urn:nena:service:sos.fire'),
+                      ('d', 'point urn:nena:service:sos.psap'))
+
+        target, pieces, actual = self._execute(data)
+
+        self.assertEqual(actual.tag, 'findServiceBatchResponse')
+        self.assertEqual([item.get('id') for item in actual], ['a', 'b', 'c', 'd'])
+        self.assertEqual([item[0].text for item in actual], ['urn:nena:service:sos.psap',
+                                                             'urn:nena:service:sos.psap',
+                                                             'urn:nena:service:sos.fire',
+                                                             'urn:nena:service:sos.psap'])
+        # The response is written out an item at a time.
+        self.assertEqual(len(pieces), 6)
+        self.assertEqual(target.item_count, 4)
+        self.assertEqual(target.error_count, 0)
+
+    def test_points_looked_up_together(self):
+        data = _batch(('a', 'point urn:nena:service:sos.psap'),
+                      ('b', 'civic urn:nena:service:sos.psap'),
+                      ('c', 'point urn:nena:service:sos.fire'),
+                      ('d', 'point urn:nena:service:sos.psap'),
+                      ('e', 'point urn:nena:service:sos.police'))
+
+        self._execute(data)
+
+        calls = [(len(call[0][0]), call[0][1]) for call in self.db.get_containing_boundaries_for_points.call_args_list]
+        self.assertEqual(calls, [(2, 'esbpsap'), (1, 'esbfire')])
+        self.assertEqual(self.prefetched, [('esbpsap', [{'table': 'esbpsap'}]),
+                                           None,
+                                           ('esbfire', [{'table': 'esbfire'}]),
+                                           ('esbpsap', [{'table': 'esbpsap'}]),
+                                           None])
+
+    def test_chunks(self):
+        data = _batch(*[(str(i), 'point urn:nena:service:sos.psap') for i in range(5)])
+
+        target, pieces, actual = self._execute(data, chunk_size=2)
+
+        self.assertEqual(len(actual), 5)
+        self.assertEqual([len(call[0][0]) for call in self.db.get_containing_boundaries_for_points.call_args_list],
+                         [2, 2, 1])
+
+    def test_failed_lookup_runs_items_alone(self):
+        self.db.get_containing_boundaries_for_points.side_effect = Exception('too many points')
+        data = _batch(('a', 'point urn:nena:service:sos.psap'))
+
+        target, pieces, actual = self._execute(data)
+
+        self.assertEqual(actual[0][0].text, 'urn:nena:service:sos.psap')
+        self.assertEqual(self.prefetched, [None])
+
+    def test_item_errors(self):
+        self.runner.run_request.side_effect = \
+            lambda request, context, use_cache=True: (_ for _ in ()).throw(BadRequestException('no mappings'))
+        data = _batch(('a', 'bad urn:nena:service:sos.psap'), ('b', 'point urn:nena:service:sos.psap'))
+
+        target, pieces, actual = self._execute(data)
+
+        self.assertEqual([etree.QName(item[0]).localname for item in actual], ['errors', 'errors'])
+        self.assertEqual(actual[0][0][0].get('message'), 'Invalid request.')
+        self.assertEqual(actual[1][0][0].get('message'), 'no mappings')
+        self.assertEqual(target.error_count, 2)
+
+    def test_empty_item(self):
+        data = _batch(('a', 'point urn:nena:service:sos.psap')).replace(
+            b'</findServiceBatch>', b'<item id="b"/>' + _ITEM.format('c', 'civic urn:nena:service:sos.fire').encode() +
+            b'</findServiceBatch>')
+
+        target, pieces, actual = self._execute(data)
+
+        self.assertEqual([item.get('id') for item in actual], ['a', 'b', 'c'])
+        self.assertEqual(etree.QName(actual[1][0]).localname, 'errors')
+        self.assertEqual(actual[2][0].text, 'urn:nena:service:sos.fire')
+        self.assertEqual(target.error_count, 1)
+
+    def test_services_at_one_location_resolved_together(self):
+        item = '<item id="{0}"><findService xmlns="urn:ietf:params:xml:ns:lost1">point<service>{1}</service>' \
+               '{2}</findService></item>'
+        data = ('<findServiceBatch>' +
+                item.format('a', 'urn:nena:service:sos.psap', '<location id="1"/>') +
+                item.format('b', 'urn:nena:service:sos.fire', '<location id="1"/>') +
+                item.format('c', 'urn:nena:service:sos.psap', '<location id="2"/>') +
+                item.format('d', 'urn:nena:service:sos.bad', '<location id="1"/>') +
+                '</findServiceBatch>').encode()
+        logged = []
+
+        target, pieces, actual = self._execute(data, item_done=lambda request, *args: logged.append(args[-1]))
+
+        self.assertEqual([(item.get('id'), etree.QName(item[0]).localname) for item in actual],
+                         [('a', 'findServiceResponse'), ('b', 'findServiceResponse'), ('c', 'findServiceResponse'),
+                          ('d', 'errors')])
+        self.assertEqual(actual[1][0].text, 'urn:nena:service:sos.fire')
+        # One pass for the three services at the first location, answered from the boundaries found for the chunk.
+        self.assertEqual(len(self.grouped), 1)
+        location, service_urns, tables = self.grouped[0]
+        self.assertEqual(service_urns, ['urn:nena:service:sos.psap', 'urn:nena:service:sos.fire',
+                                        'urn:nena:service:sos.bad'])
+        self.assertEqual(tables, ['esbfire', 'esbpsap'])
+        self.assertEqual(self.runner.run_request.call_count, 1)
+        self.assertEqual(target.item_count, 4)
+        self.assertEqual(target.error_count, 1)
+        self.assertIsInstance(logged[3], BadRequestException)
+
+    def test_group_fails_together(self):
+        self.runner.run_request_for_services.side_effect = BadRequestException('not covered')
+        item = '<item id="{0}"><findService xmlns="urn:ietf:params:xml:ns:lost1">point<service>{1}</service>' \
+               '</findService></item>'
+        data = ('<findServiceBatch>' + item.format('a', 'urn:nena:service:sos.psap') +
+                item.format('b', 'urn:nena:service:sos.fire') + '</findServiceBatch>').encode()
+
+        target, pieces, actual = self._execute(data)
+
+        self.assertEqual([actual[i][0][0].get('message') for i in range(2)], ['not covered', 'not covered'])
+        self.assertEqual(target.error_count, 2)
+
+    def test_answered_items_released(self):
+        answered = []
+
+        def parse(element):
+            item = element.getparent()
+            answered.append([(previous.get('id'), len(previous)) for previous in item.itersiblings(preceding=True)])
+            return _parse(element)
+        self.runner.parse.side_effect = parse
+        data = _batch(*[(str(i), 'point urn:nena:service:sos.psap') for i in range(4)])
+
+        self._execute(data, chunk_size=1)
+
+        # Answered items are emptied and dropped from the request.
+        self.assertEqual(answered, [[], [(None, 0)], [(None, 0)], [(None, 0)]])
+
+    def test_items_logged_one_by_one(self):
+        logged = []
+
+        def item_done(request, data, starttime, response, endtime, error):
+            logged.append((request, data, response, error))
+            self.assertLessEqual(starttime, endtime)
+        data = _batch(('a', 'point urn:nena:service:sos.psap'), ('b', 'bad urn:nena:service:sos.fire'))
+        data = data.replace(b'</findServiceBatch>', b'<item id="c"/></findServiceBatch>')
+
+        self._execute(data, chunk_size=1, item_done=item_done)
+
+        self.assertEqual(len(logged), 3)
+        # The logs get the request even though the item is released once answered.
+        self.assertEqual(etree.QName(logged[0][0]).localname, 'findService')
+        self.assertEqual(logged[0][0].text, 'point urn:nena:service:sos.psap')
+        self.assertIn(b'id="a"', logged[0][1])
+        self.assertEqual(logged[0][2]['response'].text, 'urn:nena:service:sos.psap')
+        self.assertIsNone(logged[0][3])
+        self.assertEqual(logged[1][0].text, 'bad urn:nena:service:sos.fire')
+        self.assertEqual(etree.QName(logged[1][2]['response']).localname, 'errors')
+        self.assertIsInstance(logged[1][3], BadRequestException)
+        self.assertIsNone(logged[2][0])
+        self.assertEqual(etree.QName(logged[2][2]['response']).localname, 'errors')
+
+    def test_malformed_request(self):
+        data = _batch(('a', 'point urn:nena:service:sos.psap'))[:-10]
+
+        target, pieces, actual = self._execute(data)
+
+        self.assertEqual([item.tag for item in actual], ['item', '{urn:ietf:params:xml:ns:lost1}errors'])
+        self.assertEqual(actual[1][0].get('message'), 'Malformed request xml.')
+
+    def test_not_a_batch(self):
+        target, pieces, actual = self._execute(b'<findService xmlns="urn:ietf:params:xml:ns:lost1"/>')
+
+        self.assertEqual(len(actual), 1)
+        self.assertEqual(etree.QName(actual[0]).localname, 'errors')
+
+    def test_chunk_size_setting(self):
+        config = MagicMock()
+        config.get.return_value = None
+        self.assertEqual(FindServiceBatchConfigWrapper(config).chunk_size(), 500)
+        config.get.return_value = '100'
+        self.assertEqual(FindServiceBatchConfigWrapper(config).chunk_size(), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
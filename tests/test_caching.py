@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import unittest
+from unittest.mock import MagicMock
+import pytz
+import lostservice.caching
+import lostservice.model.geodetic
+import lostservice.model.location
+import lostservice.model.requests
+import lostservice.model.responses
+from tests.helpers import FakeClock
+
+
+class LruCacheTest(unittest.TestCase):
+
+    def test_get_put(self):
+        target = lostservice.caching.LruCache(max_entries=2)
+
+        self.assertIsNone(target.get('a'))
+        target.put('a', 1)
+
+        self.assertEqual(target.get('a'), 1)
+        self.assertEqual(target.stats(), {'hits': 1, 'misses': 1, 'evictions': 0, 'size': 1})
+
+    def test_eviction(self):
+        target = lostservice.caching.LruCache(max_entries=2)
+        target.put('a', 1)
+        target.put('b', 2)
+        target.get('a')
+        target.put('c', 3)
+
+        self.assertEqual(target.get('a'), 1)
+        self.assertIsNone(target.get('b'))
+        self.assertEqual(target.get('c'), 3)
+        self.assertEqual(target.evictions, 1)
+
+    def test_ttl(self):
+        clock = FakeClock()
+        target = lostservice.caching.LruCache(max_entries=10, ttl=60, clock=clock)
+        target.put('a', 1)
+        target.put('b', 2, ttl=10)
+        target.put('c', 3, ttl=600)
+
+        clock.now = 30
+        self.assertEqual(target.get('a'), 1)
+        self.assertIsNone(target.get('b'))
+
+        # The entry ttl can't exceed the cache ttl.
+        clock.now = 61
+        self.assertIsNone(target.get('a'))
+        self.assertIsNone(target.get('c'))
+
+    def test_invalidate(self):
+        target = lostservice.caching.LruCache()
+        target.put(('esbpsap', 1), 1)
+        target.put(('esbfire', 1), 2)
+
+        target.invalidate(lambda key: key[0] == 'esbpsap')
+        self.assertEqual(len(target), 1)
+
+        target.invalidate()
+        self.assertEqual(len(target), 0)
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def _target(self, precision=4):
+        config = MagicMock()
+        config.coordinate_precision.return_value = precision
+        config.max_ttl.return_value = 300.0
+        config.max_entries.return_value = 100
+        return lostservice.caching.ResponseCache(config)
+
+    def _request(self, lat, lon, location_id='abc', service='urn:nena:service:sos.police'):
+        request = lostservice.model.requests.FindServiceRequest()
+        request.service = service
+        request.serviceBoundary = 'reference'
+        request.location = lostservice.model.location.Location(id=location_id)
+        request.location.location = lostservice.model.geodetic.Point(
+            spatial_ref='urn:ogc:def:crs:EPSG::4326', lat=lat, lon=lon)
+        return request
+
+    def _result(self, expires):
+        mapping = lostservice.model.responses.ResponseMapping()
+        mapping.expires = expires
+        response = lostservice.model.responses.FindServiceResponse(
+            mappings=[mapping], path=['authoritative.example'], location_used='abc')
+        return {'latitude': 44.5, 'longitude': -68.2, 'response': response}
+
+    def test_key_for_quantizes_location(self):
+        target = self._target()
+
+        first = target.key_for(self._request(44.500001, -68.200001))
+        second = target.key_for(self._request(44.500002, -68.200002, location_id='other'))
+        third = target.key_for(self._request(44.6, -68.2))
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, third)
+
+    def test_key_for_includes_service(self):
+        target = self._target()
+
+        first = target.key_for(self._request(44.5, -68.2))
+        second = target.key_for(self._request(44.5, -68.2, service='urn:nena:service:sos.fire'))
+
+        self.assertNotEqual(first, second)
+
+    def test_key_for_ignores_projection_caches(self):
+        target = self._target()
+        request = self._request(44.5, -68.2)
+        key = target.key_for(request)
+
+        # Projecting the location memoizes geometries on it, those aren't part of the request.
+        request.location.location._wkb_elements[3857] = object()
+        request.location.location._shapely_internal = object()
+
+        self.assertEqual(target.key_for(request), key)
+        self.assertEqual(target.key_for(self._request(44.5, -68.2)), key)
+
+    def test_key_for_other_requests(self):
+        target = self._target()
+
+        self.assertIsNone(target.key_for(lostservice.model.requests.ListServicesRequest()))
+
+    def test_no_cache_not_stored(self):
+        target = self._target()
+        request = self._request(44.5, -68.2)
+        key = target.key_for(request)
+
+        target.put(key, self._result('NO-CACHE'))
+
+        self.assertIsNone(target.get(key, request))
+
+    def test_no_expiration_stored(self):
+        target = self._target()
+        request = self._request(44.5, -68.2)
+        key = target.key_for(request)
+
+        target.put(key, self._result('NO-EXPIRATION'))
+
+        actual = target.get(key, self._request(44.5, -68.2, location_id='xyz'))
+        self.assertEqual(actual['response'].location_used, 'xyz')
+        self.assertEqual(actual['latitude'], 44.5)
+        self.assertEqual(target.stats()['hits'], 1)
+
+    def test_timespan_stored(self):
+        target = self._target()
+        request = self._request(44.5, -68.2)
+        key = target.key_for(request)
+        expires = datetime.datetime.now(tz=pytz.utc) + datetime.timedelta(minutes=15)
+
+        target.put(key, self._result(expires.isoformat()))
+
+        self.assertIsNotNone(target.get(key, request))
+
+    def test_expired_timespan_not_stored(self):
+        target = self._target()
+        request = self._request(44.5, -68.2)
+        key = target.key_for(request)
+        expires = datetime.datetime.now(tz=pytz.utc) - datetime.timedelta(minutes=15)
+
+        target.put(key, self._result(expires.isoformat()))
+
+        self.assertIsNone(target.get(key, request))
+
+
+class BoundaryGmlCacheTest(unittest.TestCase):
+
+    def _target(self, enabled=True):
+        config = MagicMock()
+        config.enabled.return_value = enabled
+        config.max_entries.return_value = 100
+        config.ttl.return_value = 3600.0
+        return lostservice.caching.BoundaryGmlCache(config)
+
+    @staticmethod
+    def _mapping(srcunqid='{5D9C9865}', updatedate='2026-01-02', table='esbpsap'):
+        return {'srcunqid': srcunqid, 'updatedate': updatedate, 'boundary_ref': (table, {'gid': 7})}
+
+    def test_key_for(self):
+        target = self._target()
+
+        key = target.key_for(self._mapping(), 10.0)
+
+        self.assertEqual(key, ('esbpsap', '{5D9C9865}', '2026-01-02', 10.0, 15))
+        self.assertNotEqual(target.key_for(self._mapping(updatedate='2026-03-04'), 10.0), key)
+        self.assertNotEqual(target.key_for(self._mapping(), None), key)
+        self.assertEqual(target.key_for({'boundary_ref': ('esbpsap', {'gid': 7})}),
+                         ('esbpsap', (('gid', 7),), None, None, 15))
+        self.assertIsNone(target.key_for({}))
+        # Without the table the same srcunqid in two tables would share an entry.
+        self.assertIsNone(target.key_for({'srcunqid': '{5D9C9865}', 'updatedate': '2026-01-02'}))
+        self.assertIsNone(self._target(enabled=False).key_for(self._mapping()))
+
+    def test_precompute_setting(self):
+        config = MagicMock()
+        config.get.return_value = None
+        self.assertFalse(lostservice.caching.BoundaryCacheConfigWrapper(config).precompute())
+        config.get.return_value = True
+        self.assertTrue(lostservice.caching.BoundaryCacheConfigWrapper(config).precompute())
+
+    def test_clear_tables(self):
+        target = self._target()
+        psap = target.key_for(self._mapping())
+        fire = target.key_for(self._mapping(table='esbfire'))
+        target.put(psap, '<gml:Polygon/>')
+        target.put(fire, '<gml:Polygon/>')
+
+        target.clear(['esbpsap'])
+
+        self.assertIsNone(target.get(psap))
+        self.assertEqual(target.get(fire), '<gml:Polygon/>')
+
+
+if __name__ == '__main__':
+    unittest.main()
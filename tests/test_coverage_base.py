@@ -5,27 +5,30 @@
 import unittest
 from unittest.mock import patch
 from unittest.mock import MagicMock
-import civvy.db.postgis.query as civvy_pg
 import lostservice.coverage.base as cov_base
+import lostservice.db.spatial as spatialdb
 
 
 class CoverageBaseTest(unittest.TestCase):
 
+    @patch('lostservice.db.spatial._execute_query')
     @patch('lostservice.coverage.base.CoverageConfigWrapper')
-    @patch('civvy.db.postgis.query.PgQueryExecutor')
-    def test_build_execute(self, mock_config: cov_base.CoverageConfigWrapper, mock_pg_exec: civvy_pg.PgQueryExecutor):
+    def test_build_execute(self, mock_config: cov_base.CoverageConfigWrapper, mock_execute_query):
 
         exec_input = 'here is a thing'
-        query_string = 'select * from whatever'
+        query = 'select * from whatever'
+        params = {'param': 'value'}
         query_result = {'field1': 'value1', 'field2': 'value2'}
         expected = 'here.is.a.result'
+        mock_engine = MagicMock()
 
-        mock_pg_exec.execute = MagicMock()
-        mock_pg_exec.execute.return_value = query_result
+        mock_config.cache_regions = MagicMock()
+        mock_config.cache_regions.return_value = False
+        mock_execute_query.return_value = query_result
 
-        target = cov_base.CoverageBase(mock_config, mock_pg_exec)
+        target = cov_base.CoverageBase(mock_config, mock_engine)
         target.build_coverage_query = MagicMock()
-        target.build_coverage_query.return_value = query_string
+        target.build_coverage_query.return_value = (query, params)
         target.build_response = MagicMock()
         target.build_response.return_value = expected
 
@@ -34,14 +37,70 @@ class CoverageBaseTest(unittest.TestCase):
         target.build_coverage_query.assert_called_once()
         target.build_coverage_query.assert_called_with(exec_input)
 
-        mock_pg_exec.execute.assert_called_once()
-        mock_pg_exec.execute.assert_called_with(query_string)
+        mock_execute_query.assert_called_once()
+        mock_execute_query.assert_called_with(mock_engine, query, params)
 
         target.build_response.assert_called_once()
         target.build_response.assert_called_with(query_result)
 
         self.assertEqual(expected, actual)
 
+    @patch('lostservice.db.spatial._execute_query')
+    @patch('lostservice.coverage.base.CoverageConfigWrapper')
+    def test_execute_no_rows(self, mock_config: cov_base.CoverageConfigWrapper, mock_execute_query):
+        mock_config.cache_regions.return_value = False
+        mock_execute_query.return_value = None
+
+        target = cov_base.CoverageBase(mock_config, MagicMock())
+        target.build_coverage_query = MagicMock()
+        target.build_coverage_query.return_value = ('select * from whatever', {})
+        target.build_response = MagicMock()
+        target.build_response.return_value = 'some.parent.ecrf.example'
+
+        self.assertEqual('some.parent.ecrf.example', target.execute('outside'))
+        target.build_response.assert_called_once_with([])
+
+    @patch('lostservice.db.spatial._execute_query')
+    @patch('lostservice.coverage.base.CoverageConfigWrapper')
+    def test_execute_cached_regions(self, mock_config: cov_base.CoverageConfigWrapper, mock_execute_query):
+        mock_config.cache_regions.return_value = True
+        mock_config.cache_refresh_seconds.return_value = 300
+
+        target = cov_base.CoverageBase(mock_config, MagicMock())
+        target.load_regions = MagicMock()
+        target.load_regions.return_value = 'regions'
+        target.match_regions = MagicMock()
+        target.match_regions.return_value = ['match']
+        target.build_response = MagicMock()
+        target.build_response.return_value = 'here.is.a.result'
+
+        self.assertEqual('here.is.a.result', target.execute('one'))
+        self.assertEqual('here.is.a.result', target.execute('two'))
+
+        target.load_regions.assert_called_once()
+        target.match_regions.assert_called_with('regions', 'two')
+        target.build_response.assert_called_with(['match'])
+        mock_execute_query.assert_not_called()
+
+    @patch('lostservice.db.spatial._execute_query')
+    @patch('lostservice.coverage.base.CoverageConfigWrapper')
+    def test_execute_cached_regions_unavailable(self, mock_config: cov_base.CoverageConfigWrapper,
+                                                mock_execute_query):
+        mock_config.cache_regions.return_value = True
+        mock_config.cache_refresh_seconds.return_value = 300
+        mock_execute_query.return_value = ['row']
+
+        target = cov_base.CoverageBase(mock_config, MagicMock())
+        target.load_regions = MagicMock()
+        target.load_regions.side_effect = spatialdb.SpatialQueryException('database is down', None)
+        target.build_coverage_query = MagicMock()
+        target.build_coverage_query.return_value = ('query', {})
+        target.build_response = MagicMock()
+        target.build_response.return_value = 'here.is.a.result'
+
+        self.assertEqual('here.is.a.result', target.execute('one'))
+        target.build_response.assert_called_with(['row'])
+
 
 if __name__ == '__main__':
     unittest.main()
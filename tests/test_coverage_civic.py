@@ -2,9 +2,12 @@
 # -*- coding: utf-8 -*-
 
 
+import threading
 import unittest
 from unittest.mock import patch
 from unittest.mock import MagicMock, call
+from sqlalchemy import Column, MetaData, String, Table
+from sqlalchemy.dialects import postgresql
 import lostservice.coverage.base as cov_base
 import lostservice.coverage.civic as cov_civic
 import lostservice.model.civic as mod_civic
@@ -13,64 +16,99 @@ import lostservice.exception as lost_exp
 
 class CivicCoverageResolverTest(unittest.TestCase):
 
-    def test_build_where_clause_empty(self):
-        expected = ''
-        target = cov_civic.CivicCoverageResolver(None, None)
-        actual = target._build_where_clause()
-        self.assertEqual(expected, actual)
-
-    def test_build_where_clause_not_appending_no_value(self):
-        expected = '(field_name IS NULL)'
-        target = cov_civic.CivicCoverageResolver(None, None)
-        actual = target._build_where_clause(field_name='field_name', value=None, appending=False)
-        self.assertEqual(expected, actual)
-
-    def test_build_where_clause_not_appending_with_value(self):
-        expected = "((field_name IS NULL) OR (field_name = 'field_value'))"
-        target = cov_civic.CivicCoverageResolver(None, None)
-        actual = target._build_where_clause(field_name='field_name', value='field_value', appending=False)
-        self.assertEqual(expected, actual)
-
-    def test_build_where_clause_appending_with_value(self):
-        expected = " AND ((field_name IS NULL) OR (field_name = 'field_value'))"
-        target = cov_civic.CivicCoverageResolver(None, None)
-        actual = target._build_where_clause(field_name='field_name', value='field_value', appending=True)
-        self.assertEqual(expected, actual)
-
+    @patch('lostservice.db.tables.get_table')
     @patch('lostservice.coverage.base.CoverageConfigWrapper')
-    def test_build_coverage_query(self, mock_config: cov_base.CoverageConfigWrapper):
+    def test_build_coverage_query(self, mock_config: cov_base.CoverageConfigWrapper, mock_get_table):
 
         civ_addr = mod_civic.CivicAddress()
         civ_addr.country = 'country'
         civ_addr.a1 = 'a1'
-        civ_addr.a2 = 'a2'
-        civ_addr.a3 = 'a3'
-        civ_addr.a4 = 'a4'
-        civ_addr.a5 = 'a5'
-
-        expected = 'SELECT * FROM the_table WHERE clause clause clause clause clause clause '
+        civ_addr.a2 = ''
 
         mock_config.civic_coverage_table = MagicMock()
         mock_config.civic_coverage_table.return_value = 'the_table'
+        mock_get_table.return_value = Table('the_table', MetaData(), Column('lostserver', String),
+                                            *[Column(level, String) for level in cov_civic.CIVIC_LEVELS])
 
         target: cov_civic.CivicCoverageResolver = cov_civic.CivicCoverageResolver(mock_config, None)
-        target._build_where_clause = MagicMock()
-        target._build_where_clause.return_value = 'clause '
-
-        actual = target.build_coverage_query(civ_addr)
 
-        self.assertEqual(expected, actual)
+        query, params = target.build_coverage_query(civ_addr)
 
+        sql = str(query.compile(dialect=postgresql.dialect()))
+        self.assertIn('(the_table.country IS NULL OR the_table.country = %(country)s)', sql)
+        self.assertIn('(the_table.a5 IS NULL OR the_table.a5 = %(a5)s)', sql)
+        # The address values are only ever bound, never formatted into the statement.
+        self.assertNotIn("'a1'", sql)
+        self.assertDictEqual(params, {'country': 'country', 'a1': 'a1', 'a2': None,
+                                      'a3': None, 'a4': None, 'a5': None})
+        self.assertIs(target._civic_address, civ_addr)
         mock_config.civic_coverage_table.assert_called_once()
-        calls = [
-            call('country', 'country'),
-            call('a1', 'a1', appending=True),
-            call('a2', 'a2', appending=True),
-            call('a3', 'a3', appending=True),
-            call('a4', 'a4', appending=True),
-            call('a5', 'a5', appending=True)
+
+    def test_region_trie_match(self):
+        rows = [
+            {'country': 'US', 'a1': None, 'a2': None, 'a3': None, 'a4': None, 'a5': None, 'lostserver': 'us'},
+            {'country': 'US', 'a1': 'MN', 'a2': None, 'a3': None, 'a4': None, 'a5': None, 'lostserver': 'mn'},
+            {'country': 'US', 'a1': 'MN', 'a2': 'Stearns', 'a3': None, 'a4': None, 'a5': None, 'lostserver': 'st'},
+            {'country': 'US', 'a1': 'WI', 'a2': None, 'a3': None, 'a4': None, 'a5': None, 'lostserver': 'wi'},
+            {'country': None, 'a1': None, 'a2': None, 'a3': None, 'a4': None, 'a5': None, 'lostserver': 'all'}
         ]
-        target._build_where_clause.assert_has_calls(calls)
+        target = cov_civic.CivicRegionTrie(rows)
+
+        civ_addr = mod_civic.CivicAddress()
+        civ_addr.country = 'US'
+        civ_addr.a1 = 'MN'
+        civ_addr.a2 = 'Stearns'
+        civ_addr.a3 = 'St. Cloud'
+
+        actual = target.match(civ_addr)
+
+        self.assertEqual(len(target), 5)
+        self.assertCountEqual([row['lostserver'] for row in actual], ['all', 'us', 'mn', 'st'])
+
+        # Regions with a value only match addresses that have that value.
+        civ_addr.a1 = None
+        civ_addr.a2 = None
+        actual = target.match(civ_addr)
+        self.assertCountEqual([row['lostserver'] for row in actual], ['all', 'us'])
+
+    @patch('lostservice.coverage.base.CoverageConfigWrapper')
+    def test_execute_cached_regions(self, mock_config: cov_base.CoverageConfigWrapper):
+        rows = [
+            {'country': 'US', 'a1': None, 'a2': None, 'a3': None, 'a4': None, 'a5': None, 'lostserver': 'us'},
+            {'country': 'US', 'a1': 'MN', 'a2': None, 'a3': None, 'a4': None, 'a5': None, 'lostserver': 'mn'}
+        ]
+        mock_config.cache_regions.return_value = True
+        mock_config.cache_refresh_seconds.return_value = 0
+
+        target: cov_civic.CivicCoverageResolver = cov_civic.CivicCoverageResolver(mock_config, None)
+        target.load_regions = MagicMock()
+        target.load_regions.return_value = cov_civic.CivicRegionTrie(rows)
+
+        civ_addr = mod_civic.CivicAddress()
+        civ_addr.country = 'US'
+        civ_addr.a1 = 'MN'
+
+        self.assertEqual('mn', target.execute(civ_addr))
+        self.assertEqual('mn', target.execute(civ_addr))
+        target.load_regions.assert_called_once()
+        # The best match bookkeeping doesn't leak into the cached rows.
+        self.assertNotIn('match_depth', rows[1])
+
+    @patch('lostservice.db.spatial._execute_query')
+    @patch('lostservice.coverage.base.CoverageConfigWrapper')
+    def test_execute_outside_coverage(self, mock_config: cov_base.CoverageConfigWrapper, mock_execute_query):
+        mock_config.cache_regions.return_value = False
+        mock_config.parent_ecrf.return_value = 'some.parent.ecrf'
+        mock_execute_query.return_value = None
+
+        target: cov_civic.CivicCoverageResolver = cov_civic.CivicCoverageResolver(mock_config, None)
+        target.build_coverage_query = MagicMock()
+        target.build_coverage_query.return_value = ('select * from whatever', {})
+
+        civ_addr = mod_civic.CivicAddress()
+        civ_addr.country = 'CA'
+
+        self.assertEqual('some.parent.ecrf', target.execute(civ_addr))
 
     def test_get_address_depth_one(self):
         civ_addr = mod_civic.CivicAddress()
@@ -282,6 +320,21 @@ class CivicCoverageResolverTest(unittest.TestCase):
 
         mock_config.parent_ecrf.assert_called_once()
 
+    def test_civic_address_per_thread(self):
+        civ_addr = mod_civic.CivicAddress()
+        civ_addr.country = 'country'
+
+        target: cov_civic.CivicCoverageResolver = cov_civic.CivicCoverageResolver(None, None)
+        target._civic_address = civ_addr
+
+        other_thread = []
+        thread = threading.Thread(target=lambda: other_thread.append(target._get_address_depth()))
+        thread.start()
+        thread.join()
+
+        self.assertEqual([0], other_thread)
+        self.assertEqual(1, target._get_address_depth())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -3,21 +3,28 @@
 
 
 from osgeo import ogr
-from shapely.geometry import Point
+from shapely.geometry import Point, box
+from geoalchemy2 import Geometry
+from geoalchemy2.shape import from_shape
+from sqlalchemy import Column, Integer, MetaData, String, Table
+from sqlalchemy.dialects import postgresql
 import unittest
 from unittest.mock import patch
 from unittest.mock import MagicMock, call
 import lostservice.coverage.base as cov_base
 import lostservice.coverage.geodetic as cov_geodetic
+import lostservice.db.boundaryindex
 import lostservice.model.geodetic as mod_geodetic
 import lostservice.exception as lost_exp
 
 
 class GeodeticCoverageResolverTest(unittest.TestCase):
 
+    @patch('lostservice.db.tables.get_table')
     @patch('lostservice.coverage.base.CoverageConfigWrapper')
     @patch('lostservice.model.geodetic.Point')
-    def test_build_coverage_query(self, mock_config: cov_base.CoverageConfigWrapper, mock_point: mod_geodetic.Point):
+    def test_build_coverage_query(self, mock_point: mod_geodetic.Point, mock_config: cov_base.CoverageConfigWrapper,
+                                  mock_get_table):
 
         test_geom = Point(2.2, 1.1)
 
@@ -26,23 +33,46 @@ class GeodeticCoverageResolverTest(unittest.TestCase):
 
         mock_config.geodetic_coverage_table = MagicMock()
         mock_config.geodetic_coverage_table.return_value = 'the_table'
-
-        expected = (
-            """
-            select depth, serviceurn, lostserver, ST_Area(ST_Intersection(ST_GeomFromText('{0}', 4326), wkb_geometry))
-            from {1} 
-            where ST_Intersects(ST_GeomFromText('{0}', 4326), wkb_geometry)
-            order by depth desc, st_area desc
-            """.format(test_geom.wkt, 'the_table')
-        )
+        mock_get_table.return_value = Table('the_table', MetaData(),
+                                            Column('depth', Integer),
+                                            Column('serviceurn', String),
+                                            Column('lostserver', String),
+                                            Column('wkb_geometry', Geometry('MULTIPOLYGON', 4326)))
 
         target: cov_geodetic.GeodeticCoverageResolver = cov_geodetic.GeodeticCoverageResolver(mock_config, None)
 
-        actual = target.build_coverage_query(mock_point)
-        self.assertIsNotNone(actual)
-        self.assertEqual(expected, actual)
+        query, params = target.build_coverage_query(mock_point)
+
+        sql = str(query.compile(dialect=postgresql.dialect()))
+        # The geometry is bound once and referenced by both the intersection and the filter.
+        self.assertEqual(sql.count('ST_GeomFromText(%(wkt)s, %(ST_GeomFromText_1)s)'), 2)
+        self.assertIn('ORDER BY the_table.depth DESC, st_area DESC', sql)
+        self.assertEqual(params['wkt'], ogr.CreateGeometryFromWkt(test_geom.wkt).ExportToWkt())
         mock_config.geodetic_coverage_table.assert_called_once()
 
+    @patch('lostservice.coverage.base.CoverageConfigWrapper')
+    @patch('lostservice.model.geodetic.Point')
+    def test_match_regions(self, mock_point: mod_geodetic.Point, mock_config: cov_base.CoverageConfigWrapper):
+        rows = [
+            {'depth': 1, 'serviceurn': 'urn:nena:service:sos', 'lostserver': 'state',
+             'wkb_geometry': from_shape(box(0, 0, 10, 10), 4326)},
+            {'depth': 2, 'serviceurn': 'urn:nena:service:sos', 'lostserver': 'small',
+             'wkb_geometry': from_shape(box(0, 0, 1, 1), 4326)},
+            {'depth': 2, 'serviceurn': 'urn:nena:service:sos', 'lostserver': 'large',
+             'wkb_geometry': from_shape(box(1, 0, 5, 5), 4326)},
+            {'depth': 3, 'serviceurn': 'urn:nena:service:sos', 'lostserver': 'elsewhere',
+             'wkb_geometry': from_shape(box(20, 20, 30, 30), 4326)}
+        ]
+        mock_point.to_ogr_geometry = MagicMock()
+        mock_point.to_ogr_geometry.return_value.ExportToWkt.return_value = box(0.5, 0.5, 2, 2).wkt
+
+        target: cov_geodetic.GeodeticCoverageResolver = cov_geodetic.GeodeticCoverageResolver(mock_config, None)
+
+        actual = target.match_regions(lostservice.db.boundaryindex.BoundaryIndex(rows), mock_point)
+
+        self.assertEqual([match['lostserver'] for match in actual], ['large', 'small', 'state'])
+        self.assertEqual('large', target.build_response(actual))
+
     @patch('lostservice.coverage.base.CoverageConfigWrapper')
     def test_build_response_with_result(self, mock_config: cov_base.CoverageConfigWrapper):
         input_matches = [
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from unittest.mock import MagicMock, patch
+from shapely.geometry import Point
+from shapely.geometry import Polygon
+from geoalchemy2.shape import from_shape
+import lostservice.db.boundaryindex
+from lostservice.db.boundaryindex import SpatialIndexModeEnum
+
+
+class BoundaryIndexTest(unittest.TestCase):
+
+    def _row(self, srcunqid, polygon):
+        return {'srcunqid': srcunqid,
+                'serviceurn': 'urn:nena:service:sos.police',
+                'wkb_geometry': from_shape(polygon, 4326),
+                'ST_AsGML_1': '<gml:Polygon/>'}
+
+    def _rows(self):
+        return [
+            self._row('west', Polygon([(0, 0), (1, 0), (1, 1), (0, 1)])),
+            self._row('east', Polygon([(1, 0), (2, 0), (2, 1), (1, 1)])),
+            self._row('overlap', Polygon([(0.5, 0), (1.5, 0), (1.5, 1), (0.5, 1)]))
+        ]
+
+    def test_containing(self):
+        target = lostservice.db.boundaryindex.BoundaryIndex(self._rows())
+
+        actual = target.containing(Point(0.25, 0.5))
+
+        self.assertEqual([row['srcunqid'] for row in actual], ['west'])
+
+    def test_containing_multiple_in_load_order(self):
+        target = lostservice.db.boundaryindex.BoundaryIndex(self._rows())
+
+        actual = target.containing(Point(1.25, 0.5))
+
+        self.assertEqual([row['srcunqid'] for row in actual], ['east', 'overlap'])
+
+    def test_containing_boundary_excluded(self):
+        # ST_Contains doesn't match points on the boundary, neither should the index.
+        target = lostservice.db.boundaryindex.BoundaryIndex(self._rows())
+
+        actual = target.containing(Point(0, 0.5))
+
+        self.assertIsNone(actual)
+
+    def test_containing_returns_copies(self):
+        target = lostservice.db.boundaryindex.BoundaryIndex(self._rows())
+
+        actual = target.containing(Point(0.25, 0.5))
+        actual[0]['ST_AsGML_1'] = 'changed'
+
+        again = target.containing(Point(0.25, 0.5))
+        self.assertEqual(again[0]['ST_AsGML_1'], '<gml:Polygon/>')
+
+    def test_intersecting(self):
+        target = lostservice.db.boundaryindex.BoundaryIndex(self._rows())
+
+        actual = target.intersecting(Polygon([(0.75, 0), (1.25, 0), (1.25, 1), (0.75, 1)]))
+
+        self.assertEqual([(row['srcunqid'], area) for row, area in actual],
+                         [('west', 0.25), ('east', 0.25), ('overlap', 0.5)])
+
+    def test_containing_or_nearby_contained(self):
+        target = lostservice.db.boundaryindex.BoundaryIndex(self._rows())
+        search_area = MagicMock()
+
+        actual = target.containing_or_nearby(Point(0.25, 0.5), search_area, measure_area=MagicMock())
+
+        self.assertEqual([(row['srcunqid'], row['CONTAINED'], row['DISTANCE'], row['AREA_RET']) for row in actual],
+                         [('west', True, 0.0, None)])
+        # No proximity search when something contains the point.
+        search_area.assert_not_called()
+
+    def test_containing_or_nearby_closest_first(self):
+        target = lostservice.db.boundaryindex.BoundaryIndex(self._rows())
+        point = Point(2.25, 0.5)
+
+        actual = target.containing_or_nearby(point, lambda: point.buffer(0.8), measure_area=lambda area: area.area)
+
+        self.assertEqual([(row['srcunqid'], row['CONTAINED']) for row in actual], [('east', False), ('overlap', False)])
+        self.assertAlmostEqual(actual[0]['DISTANCE'], 0.25)
+        self.assertAlmostEqual(actual[1]['DISTANCE'], 0.75)
+        self.assertGreater(actual[0]['AREA_RET'], actual[1]['AREA_RET'])
+        self.assertNotIn('AREA_RET', target.containing_or_nearby(point, lambda: point.buffer(0.8))[0])
+
+    def test_containing_or_nearby_none(self):
+        target = lostservice.db.boundaryindex.BoundaryIndex(self._rows())
+        point = Point(5, 5)
+
+        self.assertIsNone(target.containing_or_nearby(point, lambda: point.buffer(0.1)))
+
+    def test_empty(self):
+        target = lostservice.db.boundaryindex.BoundaryIndex(None)
+
+        self.assertEqual(len(target), 0)
+        self.assertIsNone(target.containing(Point(0.25, 0.5)))
+
+    def test_in_memory_point_result_limit(self):
+        config = MagicMock()
+        config.get.return_value = None
+        target = lostservice.db.boundaryindex.InMemoryGisDbInterface(config, MagicMock())
+        target._indexes['esbpolice'] = lostservice.db.boundaryindex.BoundaryIndex(self._rows())
+
+        with patch('lostservice.db.boundaryindex.to_shape', return_value=Point(1.25, 0.5)):
+            actual = target.get_containing_boundary_for_point(MagicMock(), 'esbpolice', result_limit=1)
+
+        self.assertEqual([row['srcunqid'] for row in actual], ['east'])
+
+    @patch('lostservice.db.gisdb.GisDbInterface.get_containing_boundary_for_point')
+    def test_in_memory_nearest_result_limit(self, mock_database):
+        config = MagicMock()
+        config.get.return_value = None
+        target = lostservice.db.boundaryindex.InMemoryGisDbInterface(config, MagicMock())
+        location = MagicMock()
+
+        target.get_containing_boundary_for_point(location, 'esbpolice', add_data_requested=True, result_limit=1)
+
+        # Nearest boundary queries go to the database with the same limit.
+        mock_database.assert_called_once_with(location, 'esbpolice', add_data_requested=True, buffer_distance=None,
+                                              result_limit=1)
+
+    @patch('lostservice.db.spatial.get_containing_or_nearby_boundaries_for_point')
+    @patch('lostservice.geometry.transform_circle')
+    @patch('lostservice.geometry.getutmsrid', return_value=32615)
+    def test_in_memory_containing_or_nearby(self, mock_utm, mock_circle, mock_database):
+        config = MagicMock()
+        config.get.return_value = None
+        target = lostservice.db.boundaryindex.InMemoryGisDbInterface(config, MagicMock())
+        target._indexes['esbpolice'] = lostservice.db.boundaryindex.BoundaryIndex(self._rows())
+        point = Point(2.25, 0.5)
+
+        with patch('lostservice.db.boundaryindex.to_shape', side_effect=[point, point.buffer(0.5)]):
+            actual = target.get_containing_or_nearby_boundaries_for_point(MagicMock(), 'esbpolice', 50000)
+
+        self.assertEqual([(row['srcunqid'], row['CONTAINED']) for row in actual], [('east', False)])
+        mock_circle.assert_called_once_with(2.25, 0.5, 4326, 50000, None)
+        mock_database.assert_not_called()
+
+    def _in_memory(self, clock, refresh_seconds=None):
+        config = MagicMock()
+        config.get.side_effect = lambda section, option, as_object=False, required=True: \
+            refresh_seconds if option == 'boundary_index_refresh_seconds' else None
+        return lostservice.db.boundaryindex.InMemoryGisDbInterface(config, MagicMock(), clock=clock)
+
+    @patch('lostservice.db.spatial.iterate_boundaries')
+    def test_in_memory_rows_carry_boundary_ref(self, mock_iterate):
+        rows = self._rows()
+        for gid, row in enumerate(rows):
+            row['boundary_ref'] = ('esbpolice', {'gid': gid})
+        mock_iterate.return_value = iter(rows)
+        target = self._in_memory(lambda: 0.0)
+
+        index = target._get_index('esbpolice')
+
+        self.assertEqual(index.containing(Point(0.25, 0.5))[0]['boundary_ref'], ('esbpolice', {'gid': 0}))
+        self.assertEqual(mock_iterate.call_args[0][1], 'esbpolice')
+
+    @patch('lostservice.db.spatial.iterate_boundaries')
+    def test_in_memory_index_refreshed(self, mock_iterate):
+        clock = [0.0]
+        mock_iterate.side_effect = lambda engine, boundary_table: iter(self._rows())
+        target = self._in_memory(lambda: clock[0], refresh_seconds='60')
+
+        first = target._get_index('esbpolice')
+        self.assertIs(target._get_index('esbpolice'), first)
+        clock[0] = 61.0
+
+        # The current index keeps answering while the new one loads.
+        self.assertIs(target._get_index('esbpolice'), first)
+        with target._refresh_lock('esbpolice'):
+            pass
+
+        self.assertIsNot(target._get_index('esbpolice'), first)
+        self.assertEqual(target._loaded_at['esbpolice'], 61.0)
+        self.assertEqual(mock_iterate.call_count, 2)
+
+    @patch('lostservice.db.spatial.iterate_boundaries')
+    def test_in_memory_tables_refreshed_independently(self, mock_iterate):
+        clock = [0.0]
+        mock_iterate.side_effect = lambda engine, boundary_table: iter(self._rows())
+        target = self._in_memory(lambda: clock[0], refresh_seconds='60')
+        police = target._get_index('esbpolice')
+        fire = target._get_index('esbfire')
+        clock[0] = 61.0
+
+        # A reload under way for one table doesn't hold up the reload of another.
+        with target._refresh_lock('esbpolice'):
+            target._get_index('esbpolice')
+            target._get_index('esbfire')
+            with target._refresh_lock('esbfire'):
+                pass
+            self.assertIs(target._get_index('esbpolice'), police)
+            self.assertIsNot(target._get_index('esbfire'), fire)
+        self.assertEqual(mock_iterate.call_count, 3)
+
+    def test_spatial_index_mode(self):
+        config = MagicMock()
+        config.get = MagicMock()
+
+        config.get.return_value = 'InMemory'
+        self.assertEqual(lostservice.db.boundaryindex.spatial_index_mode(config), SpatialIndexModeEnum.InMemory)
+
+        config.get.return_value = None
+        self.assertEqual(lostservice.db.boundaryindex.spatial_index_mode(config), SpatialIndexModeEnum.Database)
+
+        config.get.return_value = 'Bogus'
+        self.assertEqual(lostservice.db.boundaryindex.spatial_index_mode(config), SpatialIndexModeEnum.Database)
+
+
+if __name__ == '__main__':
+    unittest.main()
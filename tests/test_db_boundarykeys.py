@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from unittest.mock import MagicMock, patch
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String
+from sqlalchemy.pool import StaticPool
+import lostservice.db.boundarykeys
+import lostservice.db.gisdb
+import lostservice.db.tables
+from lostservice.db.concurrency import QueryPool
+from tests.helpers import FakeClock
+
+
+class BoundaryKeyIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+        metadata = MetaData()
+        self.psap = Table('esbpsap', metadata, Column('gid', Integer, primary_key=True), Column('srcunqid', String))
+        self.fire = Table('esbfire', metadata, Column('gid', Integer, primary_key=True), Column('srcunqid', String))
+        metadata.create_all(self.engine)
+        self.engine.execute(self.psap.insert(), [{'gid': 1, 'srcunqid': 'a'}, {'gid': 2, 'srcunqid': 'b'},
+                                                 {'gid': 3, 'srcunqid': 'b'}])
+        self.engine.execute(self.fire.insert(), [{'gid': 7, 'srcunqid': 'c'}, {'gid': 8, 'srcunqid': 'a'}])
+        lostservice.db.tables.registry.invalidate()
+
+    def tearDown(self):
+        lostservice.db.tables.registry.invalidate()
+
+    def test_lookup(self):
+        target = lostservice.db.boundarykeys.BoundaryKeyIndex(self.engine)
+        target.load(['esbpsap', 'esbfire'])
+
+        self.assertEqual(target.lookup('c'), ('esbfire', [{'gid': 7}]))
+        # Keys in more than one table are found in the first one, like the table by table search.
+        self.assertEqual(target.lookup('a'), ('esbpsap', [{'gid': 1}]))
+        self.assertEqual(target.lookup('b'), ('esbpsap', [{'gid': 2}, {'gid': 3}]))
+        self.assertIsNone(target.lookup('z'))
+        self.assertEqual(len(target), 3)
+
+    def test_lookup_with_query_pool(self):
+        engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+        self.psap.metadata.create_all(engine)
+        engine.execute(self.psap.insert(), [{'gid': 1, 'srcunqid': 'a'}])
+        engine.execute(self.fire.insert(), [{'gid': 7, 'srcunqid': 'c'}, {'gid': 8, 'srcunqid': 'a'}])
+        target = lostservice.db.boundarykeys.BoundaryKeyIndex(engine, query_pool=QueryPool(2))
+        target.load(['esbpsap', 'esbfire'])
+
+        self.assertEqual(target.lookup('a'), ('esbpsap', [{'gid': 1}]))
+        self.assertEqual(target.lookup('c'), ('esbfire', [{'gid': 7}]))
+
+    def test_lookup_before_load(self):
+        target = lostservice.db.boundarykeys.BoundaryKeyIndex(self.engine)
+
+        self.assertFalse(target.loaded)
+        with self.assertRaises(LookupError):
+            target.lookup('a')
+
+    def test_refresh_when_stale(self):
+        clock = FakeClock()
+        tables = ['esbpsap']
+        target = lostservice.db.boundarykeys.BoundaryKeyIndex(self.engine, refresh_seconds=60, clock=clock,
+                                                              table_source=lambda: tables)
+        target.load(tables)
+        self.engine.execute(self.psap.insert(), [{'gid': 4, 'srcunqid': 'd'}])
+        tables.append('esbfire')
+
+        self.assertIsNone(target.lookup('d'))
+        clock.now = 61
+        # Readers keep the current index while the new one is loaded in the background.
+        target.lookup('d')
+        with target._load_lock:
+            pass
+
+        self.assertEqual(target.lookup('d'), ('esbpsap', [{'gid': 4}]))
+        # The reload picks up the tables that are current now.
+        self.assertEqual(target.lookup('c'), ('esbfire', [{'gid': 7}]))
+
+    def test_failed_refresh_keeps_index(self):
+        clock = FakeClock()
+        target = lostservice.db.boundarykeys.BoundaryKeyIndex(self.engine, refresh_seconds=60, clock=clock,
+                                                              table_source=lambda: ['missing'])
+        target.load(['esbpsap'])
+        clock.now = 61
+
+        target._load_lock.acquire()
+        target._background_refresh()
+
+        self.assertEqual(target.lookup('a'), ('esbpsap', [{'gid': 1}]))
+        self.assertFalse(target._load_lock.locked())
+
+
+class GisDbBoundaryForIdTest(unittest.TestCase):
+
+    def _target(self, entry):
+        config = MagicMock()
+        config.get.return_value = None
+        target = lostservice.db.gisdb.GisDbInterface(config, MagicMock())
+        target._boundary_keys = MagicMock()
+        target._boundary_keys.loaded = True
+        target._boundary_keys.lookup.return_value = entry
+        target.get_urn_table_mappings = MagicMock(return_value={'urn:nena:service:sos.psap': 'esbpsap',
+                                                                'urn:nena:service:sos.fire': 'esbfire'})
+        return target
+
+    @patch('lostservice.db.spatial.get_boundaries_for_previous_id')
+    @patch('lostservice.db.spatial.get_boundary_for_primary_key')
+    def test_one_query_for_known_id(self, mock_by_pk, mock_by_id):
+        mock_by_pk.return_value = [{'srcunqid': 'a'}]
+        target = self._target(('esbfire', [{'gid': 7}]))
+
+        actual = target.get_boundaries_for_id('a')
+
+        self.assertEqual(actual, [{'srcunqid': 'a'}])
+        mock_by_pk.assert_called_once_with({'gid': 7}, target._engine, 'esbfire')
+        mock_by_id.assert_not_called()
+
+    @patch('lostservice.db.spatial.get_boundaries_for_previous_id')
+    def test_unknown_id_searches_tables(self, mock_by_id):
+        mock_by_id.return_value = None
+        target = self._target(None)
+
+        self.assertIsNone(target.get_boundaries_for_id('unknown'))
+        self.assertEqual(mock_by_id.call_count, 2)
+
+    @patch('lostservice.db.spatial.get_boundaries_for_previous_id')
+    def test_id_added_since_load_found(self, mock_by_id):
+        mock_by_id.side_effect = lambda pid, engine, boundary_table: \
+            [{'srcunqid': pid}] if boundary_table == 'esbfire' else None
+        target = self._target(None)
+
+        self.assertEqual(target.get_boundaries_for_id('new'), [{'srcunqid': 'new'}])
+
+    @patch('lostservice.db.spatial.get_boundaries_for_previous_id')
+    def test_pattern_searches_tables(self, mock_by_id):
+        mock_by_id.side_effect = [None, [{'srcunqid': 'abc'}]]
+        target = self._target(None)
+
+        actual = target.get_boundaries_for_id('ab%')
+
+        self.assertEqual(actual, [{'srcunqid': 'abc'}])
+        self.assertEqual(mock_by_id.call_count, 2)
+
+    @patch('lostservice.db.spatial.get_boundaries_for_previous_id')
+    def test_pattern_first_table_wins(self, mock_by_id):
+        found = {'esbpsap': [{'srcunqid': 'abc'}], 'esbfire': [{'srcunqid': 'abd'}]}
+        mock_by_id.side_effect = lambda pid, engine, boundary_table: found[boundary_table]
+        target = self._target(None)
+
+        self.assertEqual(target.get_boundaries_for_id('ab%'), [{'srcunqid': 'abc'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from unittest.mock import MagicMock
+from lostservice.db.civvyexecutor import PooledConnection, PooledPgQueryExecutor
+from lostservice.db.connections import PoolConfigWrapper, create_pooled_engine, pool_stats
+
+
+class PooledPgQueryExecutorTest(unittest.TestCase):
+
+    def setUp(self):
+        config = MagicMock()
+        config.get.side_effect = lambda section, option, as_object=False, required=True: \
+            '1' if option == 'pool_size' else None
+        self.engine = create_pooled_engine('sqlite:///:memory:', PoolConfigWrapper(config))
+        self.target = MagicMock()
+        self.target._engine = self.engine
+
+    def test_connection_from_pool(self):
+        connection = PooledPgQueryExecutor.connect(self.target)
+
+        self.assertEqual(connection.cursor().execute('SELECT 1').fetchone(), (1,))
+        self.assertEqual(pool_stats(self.engine)['checked_out'], 1)
+        connection.close()
+        connection.close()
+        self.assertEqual(pool_stats(self.engine)['checked_out'], 0)
+        self.assertEqual(pool_stats(self.engine)['checkouts'], 1)
+
+    def test_returned_after_with_block(self):
+        with PooledPgQueryExecutor.connect(self.target) as connection:
+            connection.cursor().execute('SELECT 1')
+            self.assertEqual(pool_stats(self.engine)['checked_out'], 1)
+
+        self.assertEqual(pool_stats(self.engine)['checked_out'], 0)
+
+    def test_rolled_back_on_error(self):
+        connection = MagicMock()
+
+        with self.assertRaises(ValueError):
+            with PooledConnection(connection):
+                raise ValueError('boom')
+
+        connection.rollback.assert_called_once_with()
+        connection.commit.assert_not_called()
+        connection.close.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import functools
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+from lostservice.db.concurrency import QueryPool, QueryTimeoutException
+
+
+class QueryPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pools = []
+
+    def tearDown(self):
+        for pool in self.pools:
+            pool.shutdown(wait=False)
+
+    def _pool(self, max_workers, timeout=None, threads=None):
+        pool = QueryPool(max_workers, timeout, threads)
+        self.pools.append(pool)
+        return pool
+
+    def test_map_keeps_order(self):
+        target = self._pool(4)
+
+        def query(table_name):
+            time.sleep({'esbpsap': 0.05, 'esbfire': 0.0, 'esbems': 0.02}[table_name])
+            return table_name.upper()
+
+        self.assertEqual(target.map(query, ['esbpsap', 'esbfire', 'esbems']), ['ESBPSAP', 'ESBFIRE', 'ESBEMS'])
+
+    def test_concurrency_is_bounded(self):
+        target = self._pool(2)
+        lock = threading.Lock()
+        running = [0]
+        most = [0]
+
+        def query(item):
+            with lock:
+                running[0] += 1
+                most[0] = max(most[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return item
+
+        start = time.monotonic()
+        self.assertEqual(target.map(query, range(4)), [0, 1, 2, 3])
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(most[0], 2)
+        # Two rounds of two queries, not four queries one after another.
+        self.assertLess(elapsed, 0.19)
+
+    def test_each_set_is_bounded(self):
+        target = self._pool(2, threads=8)
+        lock = threading.Lock()
+        running = {}
+        most = {}
+
+        def query(request, item):
+            with lock:
+                running[request] = running.get(request, 0) + 1
+                most[request] = max(most.get(request, 0), running[request])
+            time.sleep(0.02)
+            with lock:
+                running[request] -= 1
+            return item
+
+        requests = [threading.Thread(target=target.map, args=(functools.partial(query, request), range(4)))
+                    for request in range(3)]
+        for request in requests:
+            request.start()
+        for request in requests:
+            request.join()
+
+        # The threads are shared, each set of queries still runs only two at once.
+        self.assertEqual(most, {0: 2, 1: 2, 2: 2})
+
+    def test_saturated_runs_on_calling_thread(self):
+        target = self._pool(4, threads=1)
+        release = threading.Event()
+
+        def query(item):
+            if item == 0:
+                release.wait(1)
+            elif item == 2:
+                release.set()
+            return threading.current_thread()
+
+        try:
+            actual = target.map(query, range(3))
+        finally:
+            release.set()
+
+        self.assertIsNot(actual[0], threading.current_thread())
+        self.assertEqual(actual[1:], [threading.current_thread()] * 2)
+
+    def test_nested_sets_do_not_deadlock(self):
+        target = self._pool(2, timeout=1, threads=2)
+
+        def outer(item):
+            return sum(target.map(lambda inner: inner * item, range(3)))
+
+        self.assertEqual(target.map(outer, range(4)), [0, 3, 6, 9])
+
+    def test_first_stops_starting_queries(self):
+        target = self._pool(2, threads=2)
+        started = []
+        second = threading.Event()
+
+        def query(item):
+            started.append(item)
+            if item == 0:
+                time.sleep(0.05)
+            if item == 1:
+                second.wait(1)
+            return [item] if item == 0 else None
+
+        try:
+            self.assertEqual(target.first([lambda item=item: query(item) for item in range(4)]), [0])
+        finally:
+            second.set()
+        # The third query would have waited for the first to finish, which answered.
+        self.assertEqual(sorted(started), [0, 1])
+
+    def test_single_worker_runs_inline(self):
+        target = self._pool(1)
+
+        threads = target.map(lambda item: threading.current_thread(), range(3))
+
+        self.assertEqual(threads, [threading.current_thread()] * 3)
+        self.assertIsNone(target._executor)
+
+    def test_timeout_cancels_pending_queries(self):
+        target = self._pool(2, timeout=0.05)
+        release = threading.Event()
+        started = []
+
+        def query(item):
+            started.append(item)
+            release.wait(1)
+            return item
+
+        try:
+            with self.assertRaises(QueryTimeoutException):
+                target.map(query, range(3))
+        finally:
+            release.set()
+        target.shutdown()
+
+        # The third query was still waiting for a thread and never ran.
+        self.assertEqual(sorted(started), [0, 1])
+
+    def test_first_failure_is_raised(self):
+        target = self._pool(3)
+
+        def query(item):
+            if item == 0:
+                time.sleep(0.05)
+                raise KeyError(item)
+            if item == 1:
+                raise ValueError(item)
+            return item
+
+        with self.assertRaises(ValueError):
+            target.map(query, range(3))
+
+    def test_first_skips_later_queries(self):
+        target = self._pool(1)
+        started = []
+
+        def query(item):
+            started.append(item)
+            return [item] if item >= 1 else None
+
+        self.assertEqual(target.first([lambda item=item: query(item) for item in range(4)]), [1])
+        self.assertEqual(started, [0, 1])
+
+    def test_first_in_call_order(self):
+        target = self._pool(2)
+
+        def query(item):
+            if item == 0:
+                time.sleep(0.05)
+            return [item]
+
+        # The second query answers first, the first still wins.
+        self.assertEqual(target.first([lambda item=item: query(item) for item in range(4)]), [0])
+
+    def test_first_without_rows(self):
+        target = self._pool(2)
+
+        self.assertIsNone(target.first([lambda: None, lambda: []]))
+
+    def test_new_threads_after_fork(self):
+        target = self._pool(2)
+        target.map(lambda item: item, range(2))
+        parent_executor = target._executor
+
+        with patch('lostservice.db.concurrency.os.getpid', return_value=-1):
+            self.assertEqual(target.map(lambda item: item, range(2)), [0, 1])
+            self.assertIsNot(target._executor, parent_executor)
+        parent_executor.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
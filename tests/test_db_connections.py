@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+from sqlalchemy import exc
+from lostservice.db.connections import PoolConfigWrapper, create_pooled_engine, pool_stats
+from lostservice.db.connections import ReplicaSet, EngineRouter, create_replica_engine, LOOKUPS, COVERAGE, MAPPINGS
+from tests.helpers import FakeClock
+
+
+def _settings(options):
+    config = MagicMock()
+    config.get.side_effect = lambda section, option, as_object=False, required=True: options.get(option)
+    return PoolConfigWrapper(config)
+
+
+class PoolConfigWrapperTest(unittest.TestCase):
+
+    def test_defaults(self):
+        target = _settings({})
+
+        self.assertEqual(target.pool_size(), 5)
+        self.assertEqual(target.max_overflow(), 10)
+        self.assertEqual(target.pool_timeout(), 30.0)
+        self.assertEqual(target.pool_recycle(), 1800)
+        self.assertTrue(target.pre_ping())
+        self.assertEqual(target.pre_ping_idle(), 30.0)
+        self.assertEqual(target.statement_timeout(), 0)
+
+    def test_configured(self):
+        target = _settings({'pool_size': '20', 'pool_max_overflow': '0', 'pool_timeout_seconds': '2.5',
+                            'pool_recycle_seconds': '600', 'pool_pre_ping': 'True', 'pool_pre_ping_idle_seconds': '60',
+                            'statement_timeout_ms': '5000'})
+
+        self.assertEqual(target.pool_size(), 20)
+        self.assertEqual(target.max_overflow(), 0)
+        self.assertEqual(target.pool_timeout(), 2.5)
+        self.assertEqual(target.pool_recycle(), 600)
+        self.assertTrue(target.pre_ping())
+        self.assertEqual(target.pre_ping_idle(), 60.0)
+        self.assertEqual(target.statement_timeout(), 5000)
+
+    def test_bad_values(self):
+        target = _settings({'pool_size': 'lots', 'pool_max_overflow': '-3'})
+
+        self.assertEqual(target.pool_size(), 5)
+        self.assertEqual(target.max_overflow(), 0)
+
+
+class InstrumentedPoolTest(unittest.TestCase):
+
+    def _engine(self, **options):
+        options.setdefault('pool_size', '1')
+        options.setdefault('pool_max_overflow', '0')
+        return create_pooled_engine('sqlite:///:memory:', _settings(options))
+
+    def test_checkouts_counted(self):
+        engine = self._engine()
+
+        with engine.connect() as conn:
+            conn.execute('SELECT 1')
+            self.assertEqual(pool_stats(engine)['checked_out'], 1)
+        with engine.connect() as conn:
+            conn.execute('SELECT 1')
+
+        stats = pool_stats(engine)
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['checked_out'], 0)
+        self.assertEqual(stats['waiting'], 0)
+        self.assertEqual(stats['size'], 1)
+
+    def test_timeout_counted(self):
+        engine = self._engine(pool_timeout_seconds='0.05')
+
+        held = engine.connect()
+        waiting = []
+
+        def wait_for_connection():
+            try:
+                engine.connect()
+            except exc.TimeoutError as ex:
+                waiting.append(ex)
+
+        waiter = threading.Thread(target=wait_for_connection)
+        waiter.start()
+        waiter.join()
+        held.close()
+
+        stats = pool_stats(engine)
+        self.assertEqual(len(waiting), 1)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertGreaterEqual(stats['max_wait_seconds'], 0.05)
+
+    def test_dead_connection_replaced(self):
+        engine = self._engine(pool_pre_ping_idle_seconds='0')
+        with engine.connect() as conn:
+            conn.execute('SELECT 1')
+        dead = engine.pool._pool.queue[0].connection
+        dead.close()
+
+        with engine.connect() as conn:
+            self.assertEqual(conn.execute('SELECT 1').scalar(), 1)
+        self.assertEqual(pool_stats(engine)['disconnects'], 1)
+
+    def test_no_ping_when_off(self):
+        engine = self._engine(pool_pre_ping='false', pool_pre_ping_idle_seconds='0')
+        with engine.connect() as conn:
+            conn.execute('SELECT 1')
+        dead = engine.pool._pool.queue[0].connection
+        dead.close()
+
+        with self.assertRaises(exc.DBAPIError):
+            with engine.connect() as conn:
+                conn.execute('SELECT 1')
+        self.assertEqual(pool_stats(engine)['disconnects'], 0)
+
+    def test_recently_used_connection_not_pinged(self):
+        engine = self._engine()
+        with engine.connect() as conn:
+            conn.execute('SELECT 1')
+        dead = engine.pool._pool.queue[0].connection
+        dead.close()
+
+        # The connection was just used, so it is handed out without a check.
+        with self.assertRaises(exc.DBAPIError):
+            with engine.connect() as conn:
+                conn.execute('SELECT 1')
+        self.assertEqual(pool_stats(engine)['disconnects'], 0)
+
+    @patch('lostservice.db.connections.create_engine')
+    def test_statement_timeout_for_postgres(self, create_engine):
+        create_pooled_engine('postgresql://lost@localhost/gis', _settings({'statement_timeout_ms': '5000'}))
+
+        self.assertEqual(create_engine.call_args[1]['connect_args'], {'options': '-c statement_timeout=5000'})
+
+    def test_no_stats_for_other_pools(self):
+        self.assertIsNone(pool_stats(MagicMock()))
+
+
+class ReplicaRoutingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.urls = {}
+        for name in ('primary', 'replica1', 'replica2'):
+            path = os.path.join(self.directory.name, name + '.db')
+            with sqlite3.connect(path) as conn:
+                conn.execute('CREATE TABLE server (name TEXT)')
+                conn.execute('INSERT INTO server VALUES (?)', (name,))
+            self.urls[name] = 'sqlite:///' + path
+        self.urls['down'] = 'sqlite:///' + os.path.join(self.directory.name, 'missing', 'down.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @staticmethod
+    def _server(connection):
+        try:
+            return connection.execute('SELECT name FROM server').fetchone()[0]
+        finally:
+            connection.close()
+
+    def test_replicas_in_turn(self):
+        target = ReplicaSet([self.urls['replica1'], self.urls['replica2']], self.urls['primary'])
+
+        servers = [self._server(target.connect()) for _ in range(4)]
+
+        self.assertEqual(servers, ['replica1', 'replica2', 'replica1', 'replica2'])
+
+    def test_unreachable_replica_left_out(self):
+        clock = FakeClock()
+        target = ReplicaSet([self.urls['down'], self.urls['replica1']], self.urls['primary'], eject_seconds=30,
+                            clock=clock)
+
+        servers = [self._server(target.connect()) for _ in range(3)]
+
+        self.assertEqual(servers, ['replica1', 'replica1', 'replica1'])
+        self.assertEqual(len(target.healthy()), 1)
+        clock.now = 31
+        self.assertEqual(len(target.healthy()), 2)
+
+    def test_primary_when_no_replica_left(self):
+        target = ReplicaSet([self.urls['down']], self.urls['primary'])
+
+        self.assertEqual(self._server(target.connect()), 'primary')
+
+    def test_replica_engine(self):
+        engine = create_replica_engine(self.urls['primary'], [self.urls['replica1']],
+                                       _settings({'pool_size': '1', 'pool_max_overflow': '0'}))
+
+        with engine.connect() as conn:
+            self.assertEqual(conn.execute('SELECT name FROM server').scalar(), 'replica1')
+        self.assertEqual(pool_stats(engine)['checkouts'], 1)
+
+    def test_router(self):
+        primary = MagicMock()
+        replica = MagicMock()
+
+        target = EngineRouter(primary, replica, {MAPPINGS})
+
+        self.assertIs(target.engine_for(LOOKUPS), replica)
+        self.assertIs(target.engine_for(COVERAGE), replica)
+        self.assertIs(target.engine_for(MAPPINGS), primary)
+        self.assertIs(EngineRouter(primary).engine_for(LOOKUPS), primary)
+        target.dispose()
+        primary.dispose.assert_called_once_with()
+        replica.dispose.assert_called_once_with()
+
+    def test_router_stats(self):
+        primary = create_pooled_engine(self.urls['primary'], _settings({}))
+        replica = create_replica_engine(self.urls['primary'], [self.urls['replica1']], _settings({}))
+        with replica.connect() as conn:
+            conn.execute('SELECT 1')
+
+        actual = EngineRouter(primary, replica).stats()
+
+        self.assertEqual(actual['primary']['checkouts'], 0)
+        self.assertEqual(actual['replica']['checkouts'], 1)
+        self.assertEqual(list(EngineRouter(primary).stats()), ['primary'])
+
+    def test_router_discard(self):
+        engine = create_pooled_engine(self.urls['primary'], _settings({'pool_size': '1'}))
+        target = EngineRouter(engine)
+        with engine.connect() as conn:
+            conn.execute('SELECT 1')
+        inherited = engine.pool._pool.queue[0].connection
+
+        target.discard()
+
+        # The inherited connection is left open, new ones come from a new pool.
+        self.assertEqual(inherited.execute('SELECT name FROM server').fetchone(), ('primary',))
+        with engine.connect() as conn:
+            self.assertIsNot(conn.connection.connection, inherited)
+        self.assertEqual(pool_stats(engine)['checkouts'], 2)
+
+    def test_pinned_setting(self):
+        self.assertEqual(_settings({}).pinned_to_primary(), {MAPPINGS})
+        self.assertEqual(_settings({'pin_to_primary': 'Coverage, mappings'}).pinned_to_primary(), {COVERAGE, MAPPINGS})
+        self.assertEqual(_settings({'pin_to_primary': ''}).pinned_to_primary(), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import copy
+import pickle
+import unittest
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.sql import select
+import lostservice.db.rows
+import lostservice.db.spatial
+
+
+class RowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.header = lostservice.db.rows.ResultHeader(['gid', 'serviceurn', 'routeuri'])
+        self.row = lostservice.db.rows.Row(self.header, (1, 'urn:nena:service:sos.psap', 'sip:psap@example.com'))
+
+    def test_mapping(self):
+        self.assertEqual(self.row['serviceurn'], 'urn:nena:service:sos.psap')
+        self.assertEqual(self.row.get('displayname', 'none'), 'none')
+        self.assertIn('routeuri', self.row)
+        self.assertNotIn('displayname', self.row)
+        self.assertEqual(list(self.row), ['gid', 'serviceurn', 'routeuri'])
+        self.assertEqual(len(self.row), 3)
+        self.assertEqual(self.row, {'gid': 1, 'serviceurn': 'urn:nena:service:sos.psap',
+                                    'routeuri': 'sip:psap@example.com'})
+        with self.assertRaises(KeyError):
+            self.row['displayname']
+
+    def test_changes(self):
+        other = lostservice.db.rows.Row(self.header, (2, 'urn:nena:service:sos.fire', None))
+
+        self.row['expiration'] = 'NO-CACHE'
+        self.row['routeuri'] = 'sip:other@example.com'
+        self.row.update({'tooManyMappings': True})
+        del self.row['gid']
+
+        self.assertEqual(self.row, {'serviceurn': 'urn:nena:service:sos.psap', 'routeuri': 'sip:other@example.com',
+                                    'expiration': 'NO-CACHE', 'tooManyMappings': True})
+        self.assertEqual(self.row.get('gid'), None)
+        self.assertEqual(len(self.row), 4)
+        # The other rows of the result are not affected.
+        self.assertEqual(other['gid'], 2)
+        self.assertNotIn('expiration', other)
+
+        del self.row['expiration']
+        self.assertNotIn('expiration', self.row)
+        with self.assertRaises(KeyError):
+            del self.row['gid']
+
+    def test_copies(self):
+        self.row['expiration'] = 'NO-CACHE'
+
+        self.assertEqual(dict(self.row), self.row.copy())
+        self.assertEqual(copy.deepcopy(self.row), self.row)
+        self.assertEqual(pickle.loads(pickle.dumps(self.row)), self.row)
+
+
+class ExecuteQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://', poolclass=StaticPool)
+        metadata = MetaData()
+        self.table = Table('esbpsap', metadata, Column('gid', Integer, primary_key=True), Column('srcunqid', String))
+        metadata.create_all(self.engine)
+        self.engine.execute(self.table.insert(), [{'gid': 1, 'srcunqid': 'a'}, {'gid': 2, 'srcunqid': 'b'}])
+
+    def test_execute_query(self):
+        actual = lostservice.db.spatial._execute_query(self.engine, select([self.table]).order_by(self.table.c.gid))
+
+        self.assertEqual(actual, [{'gid': 1, 'srcunqid': 'a'}, {'gid': 2, 'srcunqid': 'b'}])
+        self.assertIsInstance(actual[0], lostservice.db.rows.Row)
+        self.assertIsNone(lostservice.db.spatial._execute_query(
+            self.engine, select([self.table]).where(self.table.c.gid > 5)))
+
+    def test_iterate_query(self):
+        actual = lostservice.db.spatial._iterate_query(self.engine, select([self.table]).order_by(self.table.c.gid))
+
+        self.assertEqual(next(actual), {'gid': 1, 'srcunqid': 'a'})
+        self.assertEqual(list(actual), [{'gid': 2, 'srcunqid': 'b'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from unittest.mock import MagicMock, patch
+from shapely.geometry import Point
+from geoalchemy2 import Geometry
+from geoalchemy2.shape import from_shape
+from sqlalchemy import Column, Integer, MetaData, String, Table
+from sqlalchemy.dialects import postgresql
+import lostservice.db.gisdb as gisdb
+import lostservice.db.spatial as spatialdb
+import lostservice.db.statements as statements
+
+
+def _boundary_table(name):
+    return Table(name, MetaData(), Column('gid', Integer, primary_key=True), Column('serviceurn', String),
+                 Column('wkb_geometry', Geometry('MULTIPOLYGON', 4326)))
+
+
+def _full_boundary_table(name, primary_key=True):
+    return Table(name, MetaData(), Column('gid', Integer, primary_key=primary_key),
+                 *([Column(column, String) for column in spatialdb.MAPPING_COLUMNS] +
+                   [Column('agency_notes', String), Column('wkb_geometry', Geometry('MULTIPOLYGON', 4326))]))
+
+
+class MappingQueryTest(unittest.TestCase):
+
+    def test_contains_query_projects_mapping_columns(self):
+        query = spatialdb._build_contains_query(_full_boundary_table('esbpsap'))
+
+        sql = str(query.compile(dialect=postgresql.dialect()))
+        select_list = sql[:sql.index('FROM')]
+        self.assertIn('esbpsap.gid', select_list)
+        self.assertIn('esbpsap.routeuri', select_list)
+        self.assertNotIn('wkb_geometry', select_list)
+        self.assertNotIn('ST_AsGML', select_list)
+        self.assertNotIn('agency_notes', select_list)
+
+    def test_intersects_query_keeps_area(self):
+        query = spatialdb._build_intersects_query(_full_boundary_table('esbpsap'), True)
+
+        sql = str(query.compile(dialect=postgresql.dialect()))
+        self.assertIn('AS "AREA_RET"', sql)
+        self.assertNotIn('ST_AsGML', sql)
+
+    def test_no_primary_key_selects_shape(self):
+        query = spatialdb._build_contains_query(_full_boundary_table('esbpsap', primary_key=False))
+
+        sql = str(query.compile(dialect=postgresql.dialect()))
+        self.assertIn('AS "ST_AsGML_1"', sql)
+
+    @patch('lostservice.db.spatial._execute_query')
+    def test_execute_mapping_query_adds_reference(self, mock_execute):
+        mock_execute.return_value = [{'gid': 7, 'serviceurn': 'urn:nena:service:sos.psap'}]
+
+        actual = spatialdb._execute_mapping_query(None, None, {}, _full_boundary_table('esbpsap'), 'esbpsap')
+
+        self.assertEqual(actual[0][spatialdb.BOUNDARY_REF], ('esbpsap', {'gid': 7}))
+
+    @patch('lostservice.db.spatial._execute_query')
+    @patch('lostservice.db.tables.get_table')
+    def test_service_boundary_queries_add_reference(self, mock_get_table, mock_execute):
+        mock_get_table.return_value = _full_boundary_table('esbpsap')
+        mock_execute.side_effect = lambda engine, query, params: [{'gid': 7}]
+
+        by_pk = spatialdb.get_boundary_for_primary_key({'gid': 7}, None, 'esbpsap')
+        by_id = spatialdb.get_boundaries_for_previous_id('{5D9C9865}', None, 'esbpsap')
+
+        self.assertEqual(by_pk[0][spatialdb.BOUNDARY_REF], ('esbpsap', {'gid': 7}))
+        self.assertEqual(by_id[0][spatialdb.BOUNDARY_REF], ('esbpsap', {'gid': 7}))
+
+    @patch('lostservice.db.spatial.get_boundary_for_primary_key')
+    def test_load_boundary_shape(self, mock_by_pk):
+        mock_by_pk.return_value = [{'gid': 7, 'wkb_geometry': 'geometry', 'ST_AsGML_1': '<gml:MultiSurface/>'}]
+        config = MagicMock()
+        config.get.return_value = None
+        target = gisdb.GisDbInterface(config, MagicMock())
+        mapping = {'gid': 7, spatialdb.BOUNDARY_REF: ('esbpsap', {'gid': 7})}
+
+        target.load_boundary_shape(mapping)
+        target.load_boundary_shape(mapping)
+
+        self.assertEqual(mapping['ST_AsGML_1'], '<gml:MultiSurface/>')
+        self.assertEqual(mapping['wkb_geometry'], 'geometry')
+        mock_by_pk.assert_called_once_with({'gid': 7}, target._engine, 'esbpsap')
+
+
+class AllBoundariesQueryTest(unittest.TestCase):
+
+    def test_build_all_boundaries_query(self):
+        query = spatialdb._build_all_boundaries_query(_boundary_table('esbpsap'))
+
+        sql = str(query.compile(dialect=postgresql.dialect()))
+        self.assertIn('AS "ST_AsGML_1"', sql)
+        self.assertIn('ORDER BY esbpsap.gid', sql)
+
+    @patch('lostservice.db.spatial._iterate_query')
+    @patch('lostservice.db.tables.get_table')
+    def test_iterate_boundaries_adds_reference(self, mock_get_table, mock_iterate):
+        mock_get_table.return_value = _boundary_table('esbpsap')
+        mock_iterate.return_value = iter([{'gid': 7, 'serviceurn': 'urn:nena:service:sos.psap'}])
+
+        actual = list(spatialdb.iterate_boundaries(None, 'esbpsap'))
+
+        self.assertEqual(actual[0][spatialdb.BOUNDARY_REF], ('esbpsap', {'gid': 7}))
+
+
+class LimitQueryTest(unittest.TestCase):
+
+    def test_limit_query(self):
+        query = spatialdb._limit_query(spatialdb._build_ellipse_query(_full_boundary_table('esbpsap')), 6, False)
+
+        compiled = query.compile(dialect=postgresql.dialect())
+        self.assertTrue(str(compiled).endswith('LIMIT %(result_limit)s'))
+        self.assertNotIn('ORDER BY', str(compiled))
+
+    def test_limit_query_by_area(self):
+        query = spatialdb._limit_query(spatialdb._build_ellipse_query(_full_boundary_table('esbpsap')), 1, True)
+
+        sql = str(query.compile(dialect=postgresql.dialect()))
+        self.assertTrue(sql.endswith('ORDER BY "AREA_RET" DESC NULLS LAST \n LIMIT %(result_limit)s'))
+
+    def test_unlimited(self):
+        query = spatialdb._build_ellipse_query(_full_boundary_table('esbpsap'))
+
+        self.assertIs(spatialdb._limit_query(query, None, False), query)
+        self.assertEqual(spatialdb._limit_params({}, None), {})
+        self.assertEqual(spatialdb._limit_params({}, 3), {'result_limit': 3})
+
+    @patch('lostservice.db.spatial._execute_query')
+    @patch('lostservice.db.tables.get_table')
+    def test_intersecting_boundaries_limited(self, mock_get_table, mock_execute):
+        statements.statement_cache.invalidate()
+        mock_get_table.return_value = _full_boundary_table('esbpsap')
+        mock_execute.return_value = []
+
+        spatialdb._get_intersecting_boundaries_for_geom(None, 'esbpsap', from_shape(Point(-68.2, 44.5), 4326), True,
+                                                        result_limit=1, order_by_area=True)
+
+        query, params = mock_execute.call_args[0][1:]
+        self.assertIn('ORDER BY "AREA_RET" DESC', str(query.compile(dialect=postgresql.dialect())))
+        self.assertEqual(params['result_limit'], 1)
+
+
+class BufferedQueryTest(unittest.TestCase):
+
+    def _assert_prefiltered(self, query, table_name):
+        sql = str(query.compile(dialect=postgresql.dialect()))
+        where = sql[sql.index('WHERE'):]
+        # The untransformed column is compared with the search area first, so the index can be used.
+        self.assertIn('{0}.wkb_geometry && ST_Expand(ST_Transform(ST_Buffer('.format(table_name), where)
+        self.assertIn('ST_Transform({0}.wkb_geometry, %(utmsrid)s)'.format(table_name), where)
+
+    def test_intersects_with_buffer_query(self):
+        for return_area in (False, True):
+            query = spatialdb._build_intersects_with_buffer_query(_full_boundary_table('esbpsap'), return_area)
+            self._assert_prefiltered(query, 'esbpsap')
+
+    def test_list_service_with_buffer_query(self):
+        query = spatialdb._build_list_service_with_buffer_query(_boundary_table('esbpsap'), False)
+        self._assert_prefiltered(query, 'esbpsap')
+
+    def test_additional_data_with_buffer_query(self):
+        query = spatialdb._build_additional_data_with_buffer_query(_boundary_table('additionaldata'))
+        self._assert_prefiltered(query, 'additionaldata')
+
+    def test_prefilter_margin_bound(self):
+        query = spatialdb._build_additional_data_with_buffer_query(_boundary_table('additionaldata'))
+
+        params = query.compile(dialect=postgresql.dialect()).params
+        self.assertEqual(params['prefilter_margin'], spatialdb.BUFFER_PREFILTER_MARGIN)
+
+
+class ContainsOrNearbyQueryTest(unittest.TestCase):
+
+    def test_build_contains_or_nearby_query(self):
+        query = spatialdb._build_contains_or_nearby_query(_full_boundary_table('esbpsap'), True)
+
+        sql = str(query.compile(dialect=postgresql.dialect()))
+        self.assertTrue(sql.startswith('WITH contained AS'))
+        self.assertEqual(sql.count('UNION ALL'), 1)
+        self.assertIn('NOT (EXISTS (SELECT 1 \nFROM contained))', sql)
+        self.assertIn('esbpsap.wkb_geometry <-> ST_GeomFromWKB', sql)
+        self.assertTrue(sql.endswith('ORDER BY "DISTANCE"'))
+        # The distance is a number, not a geometry to read back.
+        self.assertNotIn('ST_AsEWKB', sql)
+
+    @patch('lostservice.db.spatial._execute_query')
+    @patch('lostservice.db.tables.get_table')
+    def test_get_containing_or_nearby_boundaries_for_point(self, mock_get_table, mock_execute):
+        statements.statement_cache.invalidate()
+        mock_get_table.return_value = _full_boundary_table('esbpsap')
+        mock_execute.return_value = [{'gid': 3, 'serviceurn': 'urn:nena:service:sos.psap', 'CONTAINED': False}]
+        point = MagicMock()
+        point.longitude = -68.2
+        point.latitude = 44.5
+        point.to_wkbelement.return_value = from_shape(Point(-68.2, 44.5), 4326)
+
+        actual = spatialdb.get_containing_or_nearby_boundaries_for_point(point, 'esbpsap', None, 100.0)
+
+        self.assertEqual(actual[0][spatialdb.BOUNDARY_REF], ('esbpsap', {'gid': 3}))
+        params = mock_execute.call_args[0][2]
+        self.assertEqual(params['utmsrid'], 32619)
+        self.assertEqual(params['buffer_distance'], 100.0)
+
+
+class ContainsPointsQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        statements.statement_cache.invalidate()
+
+    @staticmethod
+    def _point(x, y):
+        point = MagicMock()
+        point.to_wkbelement.return_value = from_shape(Point(x, y), 4326)
+        return point
+
+    def test_build_contains_points_query(self):
+        query = spatialdb._build_contains_points_query(_full_boundary_table('esbpsap'))
+
+        sql = str(query.compile(dialect=postgresql.dialect()))
+        self.assertIn('batch_points.item AS batch_item', sql)
+        self.assertIn('unnest(%(batch_items)s::INTEGER[], %(batch_wkbs)s::BYTEA[]) AS batch_points(item, wkb)', sql)
+        self.assertIn('ST_Contains(esbpsap.wkb_geometry, ST_GeomFromWKB(batch_points.wkb', sql)
+
+    @patch('lostservice.db.spatial._execute_query')
+    @patch('lostservice.db.tables.get_table')
+    def test_get_containing_boundaries_for_points(self, mock_get_table, mock_execute):
+        mock_get_table.return_value = _full_boundary_table('esbpsap')
+        mock_execute.return_value = [{'batch_item': 2, 'gid': 4}, {'batch_item': 0, 'gid': 3},
+                                     {'batch_item': 2, 'gid': 5}]
+
+        actual = spatialdb.get_containing_boundaries_for_points(
+            [self._point(-68.2, 44.5), self._point(-68.3, 44.6), self._point(-68.4, 44.7)], 'esbpsap', None)
+
+        self.assertEqual([[row['gid'] for row in rows] if rows is not None else None for rows in actual],
+                         [[3], None, [4, 5]])
+        self.assertNotIn(spatialdb.BATCH_ITEM, actual[0][0])
+        self.assertEqual(actual[2][1][spatialdb.BOUNDARY_REF], ('esbpsap', {'gid': 5}))
+        # One query for all of the points.
+        mock_execute.assert_called_once()
+        params = mock_execute.call_args[0][2]
+        self.assertEqual(params['batch_items'], [0, 1, 2])
+        self.assertEqual(len(params['batch_wkbs']), 3)
+        self.assertEqual(params['geom_srid'], 4326)
+
+    @patch('lostservice.db.spatial._execute_query')
+    def test_no_points(self, mock_execute):
+        self.assertEqual(spatialdb.get_containing_boundaries_for_points([], 'esbpsap', None), [])
+        mock_execute.assert_not_called()
+
+
+class PrefetchedPointBoundariesTest(unittest.TestCase):
+
+    def setUp(self):
+        config = MagicMock()
+        config.get.return_value = None
+        self.target = gisdb.GisDbInterface(config, MagicMock())
+        self.location = MagicMock()
+
+    @patch('lostservice.db.spatial.get_containing_boundary_for_point')
+    def test_prefetched_rows_answer_the_contains_query(self, mock_contains):
+        rows = [{'gid': 3}, {'gid': 4}]
+
+        with self.target.prefetched_point_boundaries(self.location, 'esbpsap', rows):
+            self.assertEqual(self.target.get_containing_boundary_for_point(self.location, 'esbpsap'), rows)
+            self.assertEqual(self.target.get_containing_boundary_for_point(self.location, 'esbpsap',
+                                                                           result_limit=1), [{'gid': 3}])
+            # Other points and tables still go to the database.
+            self.target.get_containing_boundary_for_point(MagicMock(), 'esbpsap')
+            self.target.get_containing_boundary_for_point(self.location, 'esbfire')
+        self.target.get_containing_boundary_for_point(self.location, 'esbpsap')
+
+        self.assertEqual(mock_contains.call_count, 3)
+
+    @patch('lostservice.db.spatial.get_containing_boundary_for_point')
+    def test_prefetched_nothing(self, mock_contains):
+        with self.target.prefetched_point_boundaries(self.location, 'esbpsap', None):
+            self.assertIsNone(self.target.get_containing_boundary_for_point(self.location, 'esbpsap'))
+
+        mock_contains.assert_not_called()
+
+    @patch('lostservice.db.spatial.get_containing_or_nearby_boundaries_for_point')
+    def test_prefetched_rows_answer_the_contains_or_nearby_query(self, mock_nearby):
+        with self.target.prefetched_point_boundaries(self.location, 'esbpsap', [{'gid': 3}]):
+            actual = self.target.get_containing_or_nearby_boundaries_for_point(self.location, 'esbpsap', 50.0,
+                                                                              return_area=True)
+        with self.target.prefetched_point_boundaries(self.location, 'esbpsap', None):
+            self.target.get_containing_or_nearby_boundaries_for_point(self.location, 'esbpsap', 50.0)
+
+        self.assertEqual(actual, [{'gid': 3, spatialdb.CONTAINED: True, 'DISTANCE': 0.0, 'AREA_RET': None}])
+        # Only the point nothing contains needs the proximity search.
+        mock_nearby.assert_called_once_with(self.location, 'esbpsap', self.target._engine, 50.0, False)
+
+
+    @patch('lostservice.db.spatial.get_containing_boundary_for_point')
+    def test_prefetched_tables_not_queried_again(self, mock_contains):
+        mock_contains.side_effect = lambda location, boundary_table, *args, **kwargs: [{'table': boundary_table}]
+
+        with self.target.prefetched_point_boundaries(self.location, 'esbpsap', [{'gid': 3}]):
+            actual = self.target.get_containing_boundaries_for_tables(self.location, ['esbfire', 'esbpsap', 'esbems'])
+
+        self.assertEqual(actual, [[{'table': 'esbfire'}], [{'gid': 3}], [{'table': 'esbems'}]])
+        self.assertEqual(sorted(call[0][1] for call in mock_contains.call_args_list), ['esbems', 'esbfire'])
+
+
+class ListServicesQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        statements.statement_cache.invalidate()
+        self.geom = from_shape(Point(-68.2, 44.5), 4326)
+
+    def test_build_list_services_query(self):
+        query = spatialdb._build_list_services_query((_boundary_table('esbpsap'), _boundary_table('esbfire')),
+                                                     spatialdb.LIST_SERVICES_CONTAINS)
+
+        sql = str(query.compile(dialect=postgresql.dialect()))
+        self.assertEqual(sql.count('UNION ALL'), 1)
+        self.assertEqual(sql.count('LIMIT'), 2)
+        self.assertIn('ST_Contains(esbpsap.wkb_geometry', sql)
+        self.assertIn('ST_Contains(esbfire.wkb_geometry', sql)
+
+    def test_build_list_services_view_query(self):
+        view = Table('service_availability', MetaData(), Column('source_table', String),
+                     Column('serviceurn', String), Column('wkb_geometry', Geometry('MULTIPOLYGON', 4326)))
+
+        query = spatialdb._build_list_services_view_query(view, spatialdb.LIST_SERVICES_INTERSECTS)
+
+        sql = str(query.compile(dialect=postgresql.dialect()))
+        self.assertIn('DISTINCT ON (service_availability.source_table)', sql)
+        self.assertIn('= any(%(source_tables)s)', sql)
+        self.assertIn('ST_Intersects(service_availability.wkb_geometry', sql)
+
+    @patch('lostservice.db.spatial._execute_query')
+    @patch('lostservice.db.tables.get_table')
+    def test_get_list_services_for_geom(self, mock_get_table, mock_execute):
+        mock_get_table.side_effect = lambda engine, name: _boundary_table(name)
+        mock_execute.return_value = [{'ordinal': 2, 'serviceurn': 'urn:nena:service:sos.fire'},
+                                     {'ordinal': 0, 'serviceurn': 'urn:nena:service:sos.psap'}]
+
+        actual = spatialdb.get_list_services_for_geom(None, ['esbpsap', 'esbems', 'esbfire'], self.geom,
+                                                      spatialdb.LIST_SERVICES_CONTAINS)
+
+        self.assertEqual(actual, [[{'serviceurn': 'urn:nena:service:sos.psap'}],
+                                  None,
+                                  [{'serviceurn': 'urn:nena:service:sos.fire'}]])
+        # One query for all three tables.
+        mock_execute.assert_called_once()
+
+    @patch('lostservice.db.spatial._execute_query')
+    @patch('lostservice.db.tables.get_table')
+    def test_get_list_services_for_geom_from_view(self, mock_get_table, mock_execute):
+        mock_get_table.return_value = Table('service_availability', MetaData(), Column('source_table', String),
+                                            Column('serviceurn', String),
+                                            Column('wkb_geometry', Geometry('MULTIPOLYGON', 4326)))
+        mock_execute.return_value = [{'source_table': 'esbfire', 'serviceurn': 'urn:nena:service:sos.fire'}]
+
+        actual = spatialdb.get_list_services_for_geom(None, ['esbpsap', 'esbfire'], self.geom,
+                                                      spatialdb.LIST_SERVICES_INTERSECTS,
+                                                      availability_view='service_availability')
+
+        self.assertEqual(actual, [None, [{'serviceurn': 'urn:nena:service:sos.fire'}]])
+        self.assertEqual(mock_execute.call_args[0][2]['source_tables'], ['esbpsap', 'esbfire'])
+
+    @patch('lostservice.db.spatial._execute_query')
+    def test_get_list_services_for_geom_no_tables(self, mock_execute):
+        actual = spatialdb.get_list_services_for_geom(None, [], self.geom, spatialdb.LIST_SERVICES_CONTAINS)
+
+        self.assertEqual(actual, [])
+        mock_execute.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from unittest.mock import MagicMock
+from shapely.geometry import Point
+from geoalchemy2.shape import from_shape
+import lostservice.db.statements
+
+
+class StatementCacheTest(unittest.TestCase):
+
+    def test_get_statement_builds_once(self):
+        target = lostservice.db.statements.StatementCache()
+        table = MagicMock()
+        builder = MagicMock()
+        builder.return_value = 'statement'
+
+        first = target.get_statement(('contains', 'esbpsap'), table, builder)
+        second = target.get_statement(('contains', 'esbpsap'), table, builder)
+
+        self.assertEqual(first, 'statement')
+        self.assertEqual(second, 'statement')
+        builder.assert_called_once_with(table)
+        self.assertEqual(len(target), 1)
+
+    def test_get_statement_rebuilds_for_new_table(self):
+        target = lostservice.db.statements.StatementCache()
+        builder = MagicMock()
+        builder.side_effect = ['first', 'second']
+
+        target.get_statement(('contains', 'esbpsap'), MagicMock(), builder)
+        actual = target.get_statement(('contains', 'esbpsap'), MagicMock(), builder)
+
+        self.assertEqual(actual, 'second')
+        self.assertEqual(builder.call_count, 2)
+
+    def test_get_statement_keyed_by_flags(self):
+        target = lostservice.db.statements.StatementCache()
+        table = MagicMock()
+
+        with_area = target.get_statement(('intersects', 'esbpsap', True), table, lambda t: 'with area')
+        without_area = target.get_statement(('intersects', 'esbpsap', False), table, lambda t: 'without area')
+
+        self.assertEqual(with_area, 'with area')
+        self.assertEqual(without_area, 'without area')
+
+    def test_invalidate(self):
+        target = lostservice.db.statements.StatementCache()
+        table = MagicMock()
+        target.get_statement(('contains', 'esbpsap'), table, lambda t: 'psap')
+        target.get_statement(('contains', 'esbfire'), table, lambda t: 'fire')
+
+        target.invalidate('esbpsap')
+        self.assertEqual(len(target), 1)
+
+        target.invalidate()
+        self.assertEqual(len(target), 0)
+
+    def test_get_statement_for_several_tables(self):
+        target = lostservice.db.statements.StatementCache()
+        psap = MagicMock()
+        fire = MagicMock()
+        builder = MagicMock()
+        builder.side_effect = ['first', 'second']
+        key = ('list_services', ('esbpsap', 'esbfire'), 'contains')
+
+        target.get_statement(key, (psap, fire), builder)
+        cached = target.get_statement(key, (psap, fire), builder)
+        rebuilt = target.get_statement(key, (psap, MagicMock()), builder)
+
+        self.assertEqual(cached, 'first')
+        self.assertEqual(rebuilt, 'second')
+
+        target.invalidate('esbfire')
+        self.assertEqual(len(target), 0)
+
+    def test_geometry_params(self):
+        point = Point(-68.2, 44.5)
+        geom = from_shape(point, 4326)
+
+        actual = lostservice.db.statements.geometry_params(geom)
+
+        self.assertEqual(actual['geom_srid'], 4326)
+        self.assertEqual(actual['geom_wkb'], point.wkb)
+
+
+if __name__ == '__main__':
+    unittest.main()
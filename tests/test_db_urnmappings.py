@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+from unittest.mock import patch
+from sqlalchemy import create_engine, event, MetaData, Table, Column, Integer, String
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.pool import StaticPool
+import lostservice.db.urnmappings
+import lostservice.db.utilities
+from lostservice.db.utilities import MappingDiscoveryException
+from tests.helpers import FakeClock
+
+
+class UrnMappingDiscoveryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://', poolclass=StaticPool)
+        metadata = MetaData()
+        self.tables = {}
+        for name in ('esbpsap', 'esbfire', 'esbempty'):
+            self.tables[name] = Table(name, metadata, Column('gid', Integer, primary_key=True),
+                                      Column('serviceurn', String))
+        self.mapping_table = Table('urn_mappings', metadata, Column('serviceurn', String), Column('table_name', String))
+        metadata.create_all(self.engine)
+        self.engine.execute(self.tables['esbpsap'].insert(), [{'serviceurn': 'urn:nena:service:sos.psap'}] * 3)
+        self.engine.execute(self.tables['esbfire'].insert(), [{'serviceurn': 'urn:nena:service:sos.fire'}])
+
+    @patch('lostservice.db.utilities._boundary_table_names')
+    def test_one_query_for_all_tables(self, mock_names):
+        mock_names.return_value = ['esbempty', 'esbfire', 'esbpsap']
+        statements = []
+        event.listen(self.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+
+        actual = lostservice.db.utilities.get_urn_table_mappings(self.engine)
+
+        self.assertEqual(actual, {'urn:nena:service:sos.psap': 'esbpsap', 'urn:nena:service:sos.fire': 'esbfire'})
+        self.assertEqual(len(statements), 1)
+
+    @patch('lostservice.db.utilities._boundary_table_names')
+    def test_more_than_one_urn(self, mock_names):
+        mock_names.return_value = ['esbfire']
+        self.engine.execute(self.tables['esbfire'].insert(), [{'serviceurn': 'urn:nena:service:sos.ems'}])
+
+        with self.assertRaises(MappingDiscoveryException):
+            lostservice.db.utilities.get_urn_table_mappings(self.engine)
+
+    @patch('lostservice.db.utilities._boundary_table_names')
+    def test_no_tables(self, mock_names):
+        mock_names.return_value = []
+
+        with self.assertRaises(MappingDiscoveryException):
+            lostservice.db.utilities.get_urn_table_mappings(self.engine)
+
+    @patch('lostservice.db.utilities._table_comment_urns')
+    @patch('lostservice.db.utilities._boundary_table_names')
+    def test_commented_tables_not_scanned(self, mock_names, mock_comments):
+        mock_names.return_value = ['esbempty', 'esbfire', 'esbpsap']
+        mock_comments.return_value = {'esbpsap': 'urn:nena:service:sos.psap', 'esbempty': 'urn:nena:service:sos.ems'}
+        statements = []
+        event.listen(self.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+
+        actual = lostservice.db.utilities.get_urn_table_mappings(self.engine)
+
+        self.assertEqual(actual, {'urn:nena:service:sos.psap': 'esbpsap', 'urn:nena:service:sos.fire': 'esbfire',
+                                  'urn:nena:service:sos.ems': 'esbempty'})
+        self.assertEqual(len(statements), 1)
+        self.assertIn('esbfire', statements[0])
+        self.assertNotIn('esbpsap', statements[0])
+
+    def test_table_comment_query(self):
+        sql = str(lostservice.db.utilities._table_comment_query(['esbpsap', 'esbfire']).compile(
+            dialect=postgresql.dialect()))
+
+        self.assertIn('obj_description(pg_class.oid', sql)
+        self.assertIn('pg_class.relname IN', sql)
+        # Only PostgreSQL has table comments.
+        self.assertEqual(lostservice.db.utilities._table_comment_urns(self.engine, ['esbpsap']), {})
+
+    def test_mapping_table(self):
+        self.engine.execute(self.mapping_table.insert(), [{'serviceurn': 'urn:nena:service:sos.psap',
+                                                           'table_name': 'esbpsap'}])
+
+        actual = lostservice.db.utilities.get_urn_table_mappings(self.engine, 'urn_mappings')
+
+        self.assertEqual(actual, {'urn:nena:service:sos.psap': 'esbpsap'})
+
+
+class UrnMappingServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.target = lostservice.db.urnmappings.UrnMappingService('engine', refresh_seconds=60, clock=self.clock)
+
+    @patch('lostservice.db.utilities.get_urn_table_mappings')
+    def test_loaded_on_first_use(self, mock_discover):
+        mock_discover.return_value = {'urn:nena:service:sos.psap': 'esbpsap'}
+
+        actual = self.target.get()
+
+        self.assertEqual(dict(actual), {'urn:nena:service:sos.psap': 'esbpsap'})
+        self.assertIs(self.target.get(), actual)
+        mock_discover.assert_called_once_with('engine', None)
+        with self.assertRaises(TypeError):
+            actual['urn:nena:service:sos.fire'] = 'esbfire'
+
+    @patch('lostservice.db.utilities.get_urn_table_mappings')
+    def test_refreshed_in_background(self, mock_discover):
+        mock_discover.return_value = {'urn:nena:service:sos.psap': 'esbpsap'}
+        first = self.target.get()
+        release = threading.Event()
+        discovered = {'urn:nena:service:sos.psap': 'esbpsap', 'urn:nena:service:sos.fire': 'esbfire'}
+
+        def slow_discover(engine, mapping_table):
+            release.wait(1)
+            return discovered
+        mock_discover.side_effect = slow_discover
+        self.clock.now = 61
+
+        # Readers keep the current mappings while the new ones are discovered.
+        self.assertIs(self.target.get(), first)
+        self.assertIs(self.target.get(), first)
+        release.set()
+        with self.target._load_lock:
+            pass
+
+        self.assertEqual(dict(self.target.get()), discovered)
+        self.assertEqual(mock_discover.call_count, 2)
+
+    @patch('lostservice.db.utilities.get_urn_table_mappings')
+    def test_failed_refresh_keeps_mappings(self, mock_discover):
+        mock_discover.return_value = {'urn:nena:service:sos.psap': 'esbpsap'}
+        first = self.target.get()
+        mock_discover.side_effect = MappingDiscoveryException('down')
+        self.clock.now = 61
+
+        self.target._load_lock.acquire()
+        self.target._background_refresh()
+
+        self.assertIs(self.target.get(), first)
+        self.assertFalse(self.target._load_lock.locked())
+
+    @patch('lostservice.db.utilities.get_urn_table_mappings')
+    def test_refresh_on_demand(self, mock_discover):
+        mock_discover.return_value = {'urn:nena:service:sos.psap': 'esbpsap'}
+        self.target.get()
+        mock_discover.return_value = {'urn:nena:service:sos.fire': 'esbfire'}
+
+        self.target.refresh()
+
+        self.assertEqual(dict(self.target.get()), {'urn:nena:service:sos.fire': 'esbfire'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -185,6 +185,41 @@ class FindServiceTest(unittest.TestCase):
         with self.assertRaises(lostservice.exception.BadRequestException):
             target.handle_request(model, {})
 
+    def test_handle_request_for_services(self):
+        outer = MagicMock()
+        cov = MagicMock()
+        def_route = MagicMock()
+        def_route.check_default_route.side_effect = \
+            NotFoundException('The server could not find an answer to the query.')
+        paths = []
+
+        def find_service_for_point(request):
+            paths.append(request.path)
+            request.path.append('authoritative.example')
+            response = lostservice.model.responses.FindServiceResponse()
+            response.mappings = [request.service] if request.service != 'urn:nena:service:sos.poison' else []
+            return {'response': response, 'latitude': 44.5, 'longitude': -68.2}
+        outer.find_service_for_point.side_effect = find_service_for_point
+
+        target = lostservice.handling.core.FindServiceHandler(outer, cov, def_route)
+
+        model = lostservice.model.requests.FindServiceRequest()
+        model.location = lostservice.model.location.Location()
+        model.location.location = lostservice.model.geodetic.Point()
+        service_urns = ['urn:nena:service:sos.police', 'urn:nena:service:sos.fire', 'urn:nena:service:sos.poison']
+        actual = target.handle_request_for_services(model, service_urns, {})
+
+        self.assertEqual(list(actual.keys()), service_urns)
+        self.assertEqual(actual['urn:nena:service:sos.police']['response'].mappings, ['urn:nena:service:sos.police'])
+        self.assertEqual(actual['urn:nena:service:sos.fire']['response'].mappings, ['urn:nena:service:sos.fire'])
+        self.assertIsInstance(actual['urn:nena:service:sos.poison'], NotFoundException)
+        # The location is checked once and looked up for all of the services together.
+        cov.check_coverage.assert_called_once_with(model.location.location)
+        outer.prefetched_services.assert_called_once_with(model, service_urns)
+        # Each service gets its own path, the request's is left alone.
+        self.assertEqual(model.path, [])
+        self.assertEqual(len({id(path) for path in paths}), 3)
+
 
 if __name__ == '__main__':
     unittest.main()
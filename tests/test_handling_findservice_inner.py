@@ -4,6 +4,8 @@ from civvy.db.postgis.locating.basics import PgLocatorResult
 
 from lxml import etree
 
+import lostservice.caching
+import lostservice.db.gisdb
 import lostservice.handling.core
 import lostservice.handling.findservice
 import lostservice.model.requests
@@ -200,6 +202,22 @@ class FindServiceInnerTest(unittest.TestCase):
         self.assertDictEqual(input, expected)
         self.assertEqual(input['srcunqid'], expected['srcunqid'])
 
+    @patch('lostservice.db.gisdb.GisDbInterface')
+    def test_apply_service_boundary_policy_loads_shape(self, mock_db):
+        mock_db.get_urn_table_mappings = MagicMock()
+        mock_db.get_urn_table_mappings.return_value = {'urn1': 'service1', 'urn2': 'service2'}
+        mock_db.load_boundary_shape = MagicMock()
+
+        input = {'srcunqid': '12345', 'boundary_ref': ('service1', {'gid': 1})}
+
+        target = lostservice.handling.findservice.FindServiceInner(None, mock_db)
+
+        target.apply_service_boundary_policy(input, False)
+        mock_db.load_boundary_shape.assert_not_called()
+
+        target.apply_service_boundary_policy(input, True)
+        mock_db.load_boundary_shape.assert_called_once_with(input)
+
     @patch('lostservice.db.gisdb.GisDbInterface')
     def test_apply_service_boundary_policy_return_shape_false(self, mock_db):
         mock_db.get_urn_table_mappings = MagicMock()
@@ -465,6 +483,36 @@ class FindServiceInnerTest(unittest.TestCase):
         with self.assertRaises(lostservice.exception.InternalErrorException):
             actual = target._apply_point_multiple_match_policy(input)
 
+    @patch('lostservice.handling.findservice.FindServiceConfigWrapper')
+    @patch('lostservice.db.gisdb.GisDbInterface')
+    def test_point_result_limit(self, mock_config, mock_db):
+        mock_config.point_result_limit_policy = MagicMock()
+        mock_config.point_result_limit_policy.return_value = 5
+        mock_config.point_multiple_match_policy = MagicMock()
+        target = lostservice.handling.findservice.FindServiceInner(mock_config, mock_db)
+
+        expected = {lostservice.handling.findservice.PointMultipleMatchPolicyEnum.ReturnFirst: 1,
+                    lostservice.handling.findservice.PointMultipleMatchPolicyEnum.ReturnLimitWarning: 6,
+                    lostservice.handling.findservice.PointMultipleMatchPolicyEnum.ReturnError: 2,
+                    None: None}
+        for policy, limit in expected.items():
+            mock_config.point_multiple_match_policy.return_value = policy
+            self.assertEqual(target._point_result_limit(), limit)
+
+    @patch('lostservice.handling.findservice.FindServiceConfigWrapper')
+    @patch('lostservice.db.gisdb.GisDbInterface')
+    def test_polygon_result_limit(self, mock_config, mock_db):
+        mock_config.polygon_result_limit_policy = MagicMock()
+        mock_config.polygon_result_limit_policy.return_value = 5
+        target = lostservice.handling.findservice.FindServiceInner(mock_config, mock_db)
+
+        expected = {lostservice.handling.findservice.PolygonMultipleMatchPolicyEnum.ReturnFirst: (1, False),
+                    lostservice.handling.findservice.PolygonMultipleMatchPolicyEnum.ReturnLimitWarning: (6, False),
+                    lostservice.handling.findservice.PolygonMultipleMatchPolicyEnum.ReturnAreaMajority: (1, True),
+                    None: (None, False)}
+        for policy, limit in expected.items():
+            self.assertEqual(target._polygon_result_limit(policy), limit)
+
     @patch('lostservice.handling.findservice.FindServiceConfigWrapper')
     @patch('lostservice.db.gisdb.GisDbInterface')
     def test_find_service_for_point(self, mock_config, mock_db):
@@ -493,7 +541,8 @@ class FindServiceInnerTest(unittest.TestCase):
         self.assertListEqual(actual, test_data)
         mock_db.get_containing_boundary_for_point.assert_called_with(location, 'service1',
                                                                      add_data_requested=False,
-                                                                     buffer_distance = buffer_dist)
+                                                                     buffer_distance = buffer_dist,
+                                                                     result_limit=None)
         mock_db.get_containing_boundary_for_point.assert_called_once()
         target._apply_point_multiple_match_policy.assert_called_with(test_data)
         target._apply_point_multiple_match_policy.assert_called_once()
@@ -501,6 +550,88 @@ class FindServiceInnerTest(unittest.TestCase):
         target._apply_policies.assert_called_with(test_data, False)
         target._apply_policies.assert_called_once()
 
+    @patch('lostservice.db.spatial.get_containing_boundary_for_point')
+    def test_find_service_for_point_services(self, mock_contains):
+        config = MagicMock()
+        config.get.return_value = None
+        db = lostservice.db.gisdb.GisDbInterface(config, MagicMock())
+        db._urn_mappings = MagicMock()
+        db._urn_mappings.get.return_value = {'urn:nena:service:sos.police': 'esbpolice',
+                                             'urn:nena:service:sos.fire': 'esbfire'}
+        mock_contains.side_effect = lambda location, table, engine, **kwargs: [{'table': table}]
+
+        target = lostservice.handling.findservice.FindServiceInner(MagicMock(), db)
+        target._point_result_limit = MagicMock(return_value=None)
+        target._apply_point_multiple_match_policy = MagicMock(side_effect=lambda results: results)
+        target._apply_policies = MagicMock(side_effect=lambda results, return_shape: results)
+
+        location = Point('urn:ogc:def:crs:EPSG::4326', 44.5, -68.2)
+        actual = target.find_service_for_point_services(['urn:nena:service:sos.police', 'urn:nena:service:sos.fire'],
+                                                        location)
+
+        self.assertEqual(list(actual.items()), [('urn:nena:service:sos.police', [{'table': 'esbpolice'}]),
+                                                ('urn:nena:service:sos.fire', [{'table': 'esbfire'}])])
+        # One lookup per table, the policies then run for each service just like a single request.
+        self.assertEqual(sorted(call[0][1] for call in mock_contains.call_args_list), ['esbfire', 'esbpolice'])
+        self.assertEqual(target._apply_policies.call_count, 2)
+        db.query_pool.shutdown()
+
+    def test_service_boundary_cached(self):
+        config = MagicMock()
+        config.do_polygon_simplification.return_value = False
+        db = MagicMock()
+        gml = '<gml:MultiSurface srsName="EPSG:4326"><gml:surfaceMember><gml:Polygon gml:id="p1">' \
+              '<gml:exterior><gml:LinearRing><gml:posList>0 0 0 1 1 1 0 0</gml:posList></gml:LinearRing>' \
+              '</gml:exterior></gml:Polygon></gml:surfaceMember></gml:MultiSurface>'
+        db.load_boundary_shape.side_effect = lambda mapping: mapping.update({'ST_AsGML_1': gml})
+        cache_config = MagicMock()
+        cache_config.max_entries.return_value = 10
+        cache_config.ttl.return_value = 60.0
+        cache = lostservice.caching.BoundaryGmlCache(cache_config)
+
+        target = lostservice.handling.findservice.FindServiceInner(config, db, boundary_cache=cache)
+        ref = ('esbpsap', {'gid': 1})
+        first = target.apply_service_boundary_policy({'srcunqid': 'a', 'updatedate': 1, 'boundary_ref': ref}, True)
+        second = target.apply_service_boundary_policy({'srcunqid': 'a', 'updatedate': 1, 'boundary_ref': ref}, True)
+        target.apply_service_boundary_policy({'srcunqid': 'a', 'updatedate': 2, 'boundary_ref': ref}, True)
+        # The same id in another table is a different boundary.
+        target.apply_service_boundary_policy({'srcunqid': 'a', 'updatedate': 1,
+                                              'boundary_ref': ('esbfire', {'gid': 1})}, True)
+
+        self.assertTrue(first['ST_AsGML_1'].startswith('<gml:Polygon'))
+        self.assertEqual(second['ST_AsGML_1'], first['ST_AsGML_1'])
+        # The boundary is loaded and rendered again only once it has changed.
+        self.assertEqual(db.load_boundary_shape.call_count, 3)
+
+    def test_precompute_service_boundaries(self):
+        config = MagicMock()
+        config.do_polygon_simplification.return_value = False
+        gml = '<gml:MultiSurface srsName="EPSG:4326"><gml:surfaceMember><gml:Polygon gml:id="p1">' \
+              '<gml:exterior><gml:LinearRing><gml:posList>0 0 0 1 1 1 0 0</gml:posList></gml:LinearRing>' \
+              '</gml:exterior></gml:Polygon></gml:surfaceMember></gml:MultiSurface>'
+        db = MagicMock()
+        db.get_urn_table_mappings.return_value = {'urn:nena:service:sos.psap': 'esbpsap',
+                                                  'urn:nena:service:sos.fire': 'esbfire'}
+        db.iterate_boundaries.side_effect = \
+            lambda boundary_table: iter([{'srcunqid': str(i), 'updatedate': 1, 'ST_AsGML_1': gml,
+                                          'boundary_ref': (boundary_table, {'gid': i})} for i in range(2)])
+        cache_config = MagicMock()
+        cache_config.max_entries.return_value = 10
+        cache_config.ttl.return_value = 60.0
+        cache = lostservice.caching.BoundaryGmlCache(cache_config)
+
+        target = lostservice.handling.findservice.FindServiceInner(config, db, boundary_cache=cache)
+        count = target.precompute_service_boundaries()
+        actual = target.apply_service_boundary_policy({'srcunqid': '1', 'updatedate': 1,
+                                                       'boundary_ref': ('esbfire', {'gid': 1})}, True)
+
+        self.assertEqual(count, 4)
+        self.assertEqual([call[0][0] for call in db.iterate_boundaries.call_args_list], ['esbfire', 'esbpsap'])
+        # Requests get the rendered boundary from the cache, it expires with the normal ttl.
+        self.assertTrue(actual['ST_AsGML_1'].startswith('<gml:Polygon'))
+        db.load_boundary_shape.assert_not_called()
+        self.assertTrue(all(expires is not None for gml, expires in cache._cache._entries.values()))
+
     @patch('lostservice.handling.findservice.FindServiceConfigWrapper')
     @patch('lostservice.db.gisdb.GisDbInterface')
     def test_find_service_for_point_expanded(self, mock_config, mock_db):
@@ -550,7 +681,8 @@ class FindServiceInnerTest(unittest.TestCase):
             location,
             'service1',
             add_data_requested=False,
-            buffer_distance = 5.0)
+            buffer_distance = 5.0,
+            result_limit=None)
         mock_db.get_containing_boundary_for_point.assert_called_once()
 
 
@@ -560,7 +692,9 @@ class FindServiceInnerTest(unittest.TestCase):
                                                                           boundary_table='service1',
                                                                           proximity_search=True,
                                                                           return_area=True,
-                                                                          return_shape=False)
+                                                                          return_shape=False,
+                                                                          result_limit=1,
+                                                                          order_by_area=True)
         mock_db.get_intersecting_boundaries_for_circle.assert_called_once()
 
         target._apply_point_multiple_match_policy.assert_not_called()
@@ -599,13 +733,96 @@ class FindServiceInnerTest(unittest.TestCase):
 
         self.assertListEqual(actual, test_data)
         mock_config.polygon_multiple_match_policy.assert_called_once()
-        mock_db.get_intersecting_boundaries_for_circle.assert_called_with(circle, 'service1', True, False)
+        mock_db.get_intersecting_boundaries_for_circle.assert_called_with(circle, 'service1', True, False,
+                                                                          result_limit=1, order_by_area=True)
         mock_db.get_intersecting_boundaries_for_circle.assert_called_once()
         target._apply_polygon_multiple_match_policy.assert_called_with(test_data)
         target._apply_polygon_multiple_match_policy.assert_called_once()
         target._apply_policies.assert_called_with(test_data, False)
         target._apply_policies.assert_called_once()
 
+    @patch('lostservice.handling.findservice.FindServiceConfigWrapper')
+    @patch('lostservice.db.gisdb.GisDbInterface')
+    def test_find_service_for_point_combined_nearby(self, mock_config, mock_db):
+        test_data = [{'id': 2, 'CONTAINED': False, 'AREA_RET': 10}, {'id': 1, 'CONTAINED': False, 'AREA_RET': 5}]
+
+        mock_db.get_urn_table_mappings = MagicMock()
+        mock_db.get_urn_table_mappings.return_value = {'urn1': 'service1', 'urn2': 'service2'}
+        mock_db.get_containing_boundary_for_point = MagicMock()
+        mock_db.get_containing_or_nearby_boundaries_for_point = MagicMock()
+        mock_db.get_containing_or_nearby_boundaries_for_point.return_value = test_data
+
+        mock_config.do_expanded_search = MagicMock()
+        mock_config.do_expanded_search.return_value = True
+        mock_config.proximity_search_query_mode_policy = MagicMock()
+        mock_config.proximity_search_query_mode_policy.return_value = \
+            lostservice.handling.findservice.ProximitySearchQueryModePolicyEnum.Combined
+        mock_config.polygon_multiple_match_policy = MagicMock()
+        mock_config.polygon_multiple_match_policy.return_value = \
+            lostservice.handling.findservice.PolygonMultipleMatchPolicyEnum.ReturnAreaMajority
+        mock_config.expanded_search_buffer = MagicMock()
+        mock_config.expanded_search_buffer.return_value = 10
+        mock_config.additional_data_uri = MagicMock()
+        mock_config.additional_data_uri.return_value = "additional.data.uri"
+
+        target = lostservice.handling.findservice.FindServiceInner(mock_config, mock_db)
+        target._apply_point_multiple_match_policy = MagicMock()
+        target._apply_polygon_multiple_match_policy = MagicMock()
+        target._apply_polygon_multiple_match_policy.return_value = test_data
+        target._apply_policies = MagicMock()
+        target._apply_policies.return_value = test_data
+
+        location = Point()
+        location.latitude = 0.0
+        location.longitude = 1.1
+        location.spatial_ref = 'something::1234'
+
+        actual = target.find_service_for_point('urn1', location, False)
+
+        self.assertListEqual(actual, test_data)
+        mock_db.get_containing_or_nearby_boundaries_for_point.assert_called_once_with(location, 'service1', 10,
+                                                                                      return_area=True)
+        mock_db.get_containing_boundary_for_point.assert_not_called()
+        target._apply_point_multiple_match_policy.assert_not_called()
+        target._apply_polygon_multiple_match_policy.assert_called_once_with(test_data)
+        target._apply_policies.assert_called_once_with(test_data, False)
+
+    @patch('lostservice.handling.findservice.FindServiceConfigWrapper')
+    @patch('lostservice.db.gisdb.GisDbInterface')
+    def test_find_service_for_point_combined_contained(self, mock_config, mock_db):
+        test_data = [{'id': 1, 'CONTAINED': True}]
+
+        mock_db.get_urn_table_mappings = MagicMock()
+        mock_db.get_urn_table_mappings.return_value = {'urn1': 'service1', 'urn2': 'service2'}
+        mock_db.get_containing_or_nearby_boundaries_for_point = MagicMock()
+        mock_db.get_containing_or_nearby_boundaries_for_point.return_value = test_data
+
+        mock_config.do_expanded_search = MagicMock()
+        mock_config.do_expanded_search.return_value = True
+        mock_config.proximity_search_query_mode_policy = MagicMock()
+        mock_config.proximity_search_query_mode_policy.return_value = \
+            lostservice.handling.findservice.ProximitySearchQueryModePolicyEnum.Combined
+        mock_config.additional_data_uri = MagicMock()
+        mock_config.additional_data_uri.return_value = "additional.data.uri"
+
+        target = lostservice.handling.findservice.FindServiceInner(mock_config, mock_db)
+        target._apply_point_multiple_match_policy = MagicMock()
+        target._apply_point_multiple_match_policy.return_value = test_data
+        target._apply_polygon_multiple_match_policy = MagicMock()
+        target._apply_policies = MagicMock()
+        target._apply_policies.return_value = test_data
+
+        location = Point()
+        location.latitude = 0.0
+        location.longitude = 1.1
+        location.spatial_ref = 'something::1234'
+
+        actual = target.find_service_for_point('urn1', location, False)
+
+        self.assertListEqual(actual, test_data)
+        target._apply_point_multiple_match_policy.assert_called_once_with(test_data)
+        target._apply_polygon_multiple_match_policy.assert_not_called()
+
     @patch('lostservice.handling.findservice.FindServiceConfigWrapper')
     @patch('lostservice.db.gisdb.GisDbInterface')
     def test_find_service_for_circle_expanded(self, mock_config, mock_db):
@@ -645,8 +862,8 @@ class FindServiceInnerTest(unittest.TestCase):
         mock_config.expanded_search_buffer.assert_called_once()
 
         calls = [
-            call(circle, 'service1', False, False),
-            call(circle, 'service1', False, False, True, 10)
+            call(circle, 'service1', False, False, result_limit=1, order_by_area=False),
+            call(circle, 'service1', False, False, True, 10, result_limit=1, order_by_area=False)
         ]
 
         mock_db.get_intersecting_boundaries_for_circle.assert_has_calls(calls, any_order=False)
@@ -686,9 +903,11 @@ class FindServiceInnerTest(unittest.TestCase):
         actual = target.find_service_for_ellipse('urn1',ellipse, False)
 
         self.assertListEqual(actual, test_data)
-        mock_config.polygon_multiple_match_policy.assert_not_called()
+        mock_config.polygon_multiple_match_policy.assert_called_once()
         mock_db.get_intersecting_boundary_for_ellipse.assert_called_with(ellipse,
-                                                                          'service1')
+                                                                          'service1',
+                                                                          result_limit=1,
+                                                                          order_by_area=True)
         mock_db.get_intersecting_boundary_for_ellipse.assert_called_once()
         target._apply_polygon_multiple_match_policy.assert_called_with(test_data)
         target._apply_polygon_multiple_match_policy.assert_called_once()
@@ -730,13 +949,13 @@ class FindServiceInnerTest(unittest.TestCase):
         actual = target.find_service_for_ellipse('urn1',ellipse, False)
 
         self.assertListEqual(actual, test_data)
-        mock_config.polygon_multiple_match_policy.assert_not_called()
+        mock_config.polygon_multiple_match_policy.assert_called_once()
         mock_config.do_expanded_search.assert_called_once()
         mock_config.expanded_search_buffer.assert_called_once()
 
         calls = [
-            call(ellipse, 'service1'),
-            call(ellipse, 'service1')
+            call(ellipse, 'service1', result_limit=1, order_by_area=False),
+            call(ellipse, 'service1', result_limit=1, order_by_area=False)
         ]
 
         mock_db.get_intersecting_boundary_for_ellipse.assert_has_calls(calls, any_order=False)
@@ -833,7 +1052,8 @@ class FindServiceInnerTest(unittest.TestCase):
         self.assertListEqual(actual, expected)
         mock_config.polygon_search_mode_policy.assert_called_once()
         mock_db.get_intersecting_boundaries_for_polygon.assert_called_once()
-        mock_db.get_intersecting_boundaries_for_polygon.assert_called_with(polygon, 'service1')
+        mock_db.get_intersecting_boundaries_for_polygon.assert_called_with(polygon, 'service1', result_limit=None,
+                                                                           order_by_area=False)
         target._apply_polygon_multiple_match_policy.assert_called_once()
         target._apply_polygon_multiple_match_policy.assert_called_with(expected)
         target._apply_policies.assert_called_once()
@@ -877,8 +1097,8 @@ class FindServiceInnerTest(unittest.TestCase):
         mock_config.expanded_search_buffer.assert_called_once()
 
         calls = [
-            call(polygon, 'service1'),
-            call(polygon, 'service1', True, 10.0)
+            call(polygon, 'service1', result_limit=None, order_by_area=False),
+            call(polygon, 'service1', True, 10.0, result_limit=None, order_by_area=False)
         ]
 
         mock_db.get_intersecting_boundaries_for_polygon.assert_has_calls(calls)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+from unittest.mock import MagicMock
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String
+from sqlalchemy.pool import StaticPool
+import lostservice.logger.auditwriter
+
+
+class BufferedAuditWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        # The rows are written from another thread, so every connection needs to be the same in-memory database.
+        self.engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+        self.table = Table('auditlog', MetaData(),
+                           Column('id', Integer, primary_key=True),
+                           Column('message', String(32)))
+        self.table.create(bind=self.engine)
+
+    def _messages(self):
+        return [row['message'] for row in self.engine.execute(self.table.select().order_by(self.table.c.id))]
+
+    def test_write_and_close(self):
+        target = lostservice.logger.auditwriter.BufferedAuditWriter(self.engine, self.table, batch_size=2,
+                                                                    flush_interval=10)
+        for message in ['a', 'b', 'c']:
+            self.assertTrue(target.write({'message': message}))
+
+        target.close()
+
+        self.assertEqual(self._messages(), ['a', 'b', 'c'])
+        self.assertEqual(target.stats(), {'written': 3, 'dropped': 0, 'failed': 0, 'queued': 0})
+
+    def test_write_after_close_dropped(self):
+        target = lostservice.logger.auditwriter.BufferedAuditWriter(self.engine, self.table)
+        target.close()
+
+        self.assertFalse(target.write({'message': 'a'}))
+        self.assertEqual(target.dropped, 1)
+
+    def test_full_queue_dropped(self):
+        release = threading.Event()
+        engine = MagicMock()
+        engine.begin.side_effect = lambda: release.wait(5) and MagicMock()
+
+        target = lostservice.logger.auditwriter.BufferedAuditWriter(engine, self.table, batch_size=1,
+                                                                    queue_size=1, enqueue_timeout=0.01)
+        results = [target.write({'message': str(i)}) for i in range(5)]
+        release.set()
+        target.close()
+
+        self.assertFalse(all(results))
+        self.assertEqual(target.dropped, results.count(False))
+
+    def test_failed_batch_counted(self):
+        engine = MagicMock()
+        engine.begin.side_effect = Exception('database is down')
+
+        target = lostservice.logger.auditwriter.BufferedAuditWriter(engine, self.table, flush_interval=0)
+        target.write({'message': 'a'})
+        target.close()
+
+        self.assertEqual(target.failed, 1)
+        self.assertEqual(target.written, 0)
+
+
+class AuditWriterConfigWrapperTest(unittest.TestCase):
+
+    def test_defaults(self):
+        config = MagicMock()
+        config.get.return_value = None
+
+        target = lostservice.logger.auditwriter.AuditWriterConfigWrapper(config)
+
+        self.assertEqual(target.writer_settings(), {'batch_size': 100,
+                                                    'flush_interval': 1.0,
+                                                    'queue_size': 10000,
+                                                    'enqueue_timeout': 0.05})
+
+    def test_configured(self):
+        config = MagicMock()
+        config.get.return_value = '25'
+
+        target = lostservice.logger.auditwriter.AuditWriterConfigWrapper(config)
+
+        self.assertEqual(target.batch_size(), 25)
+        self.assertEqual(target.flush_interval(), 25.0)
+        config.get.assert_called_with('LoggingDB', 'flush_interval_seconds', as_object=False, required=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import threading
+import unittest
+from unittest.mock import MagicMock
+from lxml import etree
+import lostservice.logger.nenalogging as nenalog
+
+
+REQUEST = b'<findService xmlns="urn:ietf:params:xml:ns:lost1"><service>urn:nena:service:sos</service></findService>'
+RESPONSE = b'<findServiceResponse xmlns="urn:ietf:params:xml:ns:lost1"/>'
+
+
+class NenaLogExporterTest(unittest.TestCase):
+
+    def _config(self, urls=None, max_pending=10, max_retries=2):
+        config = MagicMock()
+        config.logging_service_urls.return_value = urls if urls is not None else {'one': 'http://one',
+                                                                                  'two': 'http://two'}
+        config.server_id.return_value = 'authoritative.example'
+        config.max_workers.return_value = 2
+        config.max_pending.return_value = max_pending
+        config.max_retries.return_value = max_retries
+        config.retry_backoff.return_value = 0.0
+        config.max_retry_backoff.return_value = 0.0
+        config.timeout.return_value = 1.0
+        return config
+
+    def _export(self, target, request=None):
+        now = datetime.datetime.utcnow()
+        request = request if request is not None else etree.fromstring(REQUEST)
+        response = etree.fromstring(RESPONSE)
+        target.export(request, REQUEST, 'findService', now, response, now)
+        return request, response
+
+    def test_export_posts_to_every_service(self):
+        session = MagicMock()
+        target = nenalog.NenaLogExporter(self._config(), session=session)
+
+        request, response = self._export(target)
+        target.shutdown()
+
+        # A request and a response event for each of the two services.
+        self.assertEqual(session.post.call_count, 4)
+        urls = sorted(call[0][0] for call in session.post.call_args_list)
+        self.assertEqual(urls, ['http://one', 'http://one', 'http://two', 'http://two'])
+        self.assertEqual(target.stats()['sent'], 4)
+        # The caller's trees are left where they were.
+        self.assertIsNone(request.getparent())
+        self.assertIsNone(response.getparent())
+
+    def test_export_without_services(self):
+        session = MagicMock()
+        target = nenalog.NenaLogExporter(self._config(urls={}), session=session)
+
+        self._export(target)
+        target.shutdown()
+
+        session.post.assert_not_called()
+
+    def test_retries_then_gives_up(self):
+        session = MagicMock()
+        session.post.side_effect = Exception('connection refused')
+        target = nenalog.NenaLogExporter(self._config(urls={'one': 'http://one'}, max_retries=2), session=session)
+
+        self._export(target)
+        target.shutdown()
+
+        self.assertEqual(session.post.call_count, 6)
+        stats = target.stats()
+        self.assertEqual(stats['failed'], 2)
+        self.assertEqual(stats['retried'], 4)
+        self.assertEqual(stats['pending'], 0)
+
+    def test_retry_succeeds(self):
+        session = MagicMock()
+        session.post.side_effect = [Exception('timed out'), MagicMock()]
+        target = nenalog.NenaLogExporter(self._config(urls={'one': 'http://one'}), session=session)
+
+        target._submit('http://one', b'<event/>')
+        target.shutdown()
+
+        self.assertEqual(target.stats()['sent'], 1)
+        self.assertEqual(target.stats()['failed'], 0)
+
+    def test_drops_when_backed_up(self):
+        release = threading.Event()
+        session = MagicMock()
+        session.post.side_effect = lambda *args, **kwargs: release.wait(5) and MagicMock()
+        target = nenalog.NenaLogExporter(self._config(urls={'one': 'http://one'}, max_pending=1), session=session)
+
+        self._export(target)
+        release.set()
+        target.shutdown()
+
+        self.assertEqual(target.stats()['dropped'], 1)
+        self.assertEqual(session.post.call_count, 1)
+
+    def test_malformed_request_text(self):
+        soap_env = nenalog._build_nenalog_request('id', None, b'<findService', 'now', 'server', 'ip',
+                                                  nenalog._query_validity(None))
+
+        malformed = soap_env.find('.//{%s}LoSTMalformedQuery' % nenalog.DATA_TYPES_NS)
+        self.assertEqual(malformed.text, '<findService')
+
+
+if __name__ == '__main__':
+    unittest.main()
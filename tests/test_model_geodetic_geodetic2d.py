@@ -75,6 +75,18 @@ class Geodetic2DTest(unittest.TestCase):
         actual: WKBElement = target.to_wkbelement(project_to=2163)
         self.assertEqual(actual.srid, 2163)
 
+    def test_to_wkb_element_shared(self):
+        class GeoSub(Geodetic2D):
+            def build_shapely_geometry(self):
+                return Point(0.0, 1.1)
+
+        target: GeoSub = GeoSub('urn:ogc:def:crs:EPSG::4326')
+        actual: WKBElement = target.to_wkbelement(project_to=4326)
+
+        self.assertIs(target.to_wkbelement(project_to=4326), actual)
+        target.spatial_ref = 'urn:ogc:def:crs:EPSG::4269'
+        self.assertEqual(target.to_wkbelement().srid, 4269)
+
 
 if __name__ == '__main__':
     unittest.main()
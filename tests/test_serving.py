@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+from unittest.mock import MagicMock
+import lostservice.serving
+
+
+class InFlightMiddlewareTest(unittest.TestCase):
+
+    def test_counts_requests(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def app(environ, start_response):
+            started.set()
+            release.wait(5)
+            return [b'done']
+
+        target = lostservice.serving.InFlightMiddleware(app)
+        thread = threading.Thread(target=lambda: target({}, None).close())
+        thread.start()
+        started.wait(5)
+
+        self.assertEqual(target.in_flight, 1)
+        self.assertFalse(target.wait_idle(0.01))
+
+        release.set()
+        self.assertTrue(target.wait_idle(5))
+        thread.join(5)
+        self.assertEqual(target.in_flight, 0)
+
+    def test_counted_until_closed(self):
+        target = lostservice.serving.InFlightMiddleware(lambda environ, start_response: [b'done'])
+
+        result = target({}, None)
+        self.assertEqual(list(result), [b'done'])
+        self.assertEqual(target.in_flight, 1)
+
+        result.close()
+        self.assertEqual(target.in_flight, 0)
+
+    def test_failed_request_not_counted(self):
+        app = MagicMock(side_effect=Exception('boom'))
+        target = lostservice.serving.InFlightMiddleware(app)
+
+        with self.assertRaises(Exception):
+            target({}, None)
+
+        self.assertEqual(target.in_flight, 0)
+
+
+class ServingConfigWrapperTest(unittest.TestCase):
+
+    def test_defaults(self):
+        config = MagicMock()
+        config.get.return_value = None
+
+        target = lostservice.serving.ServingConfigWrapper(config)
+
+        self.assertGreaterEqual(target.workers(), 1)
+        self.assertEqual(target.host(), '0.0.0.0')
+        self.assertEqual(target.port(), 8080)
+        self.assertEqual(target.graceful_timeout(), 30.0)
+
+    def test_configured(self):
+        config = MagicMock()
+        config.get.return_value = '3'
+
+        target = lostservice.serving.ServingConfigWrapper(config)
+
+        self.assertEqual(target.workers(), 3)
+        config.get.assert_called_with('Serving', 'workers', as_object=False, required=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
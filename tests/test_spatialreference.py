@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+from unittest.mock import patch
+from unittest.mock import MagicMock
+import lostservice.spatialreference
+
+
+class SpatialReferenceCacheTest(unittest.TestCase):
+
+    @patch('lostservice.spatialreference.osr')
+    def test_get_spatial_reference(self, mock_osr):
+        mock_osr.SpatialReference.side_effect = lambda: MagicMock()
+        target = lostservice.spatialreference.SpatialReferenceCache()
+
+        first = target.get_spatial_reference(4326)
+        second = target.get_spatial_reference(4326)
+        other = target.get_spatial_reference(32615)
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+        first.ImportFromEPSG.assert_called_once_with(4326)
+        self.assertEqual(len(target), 2)
+
+    @patch('lostservice.spatialreference.osr')
+    def test_get_transformation(self, mock_osr):
+        mock_osr.SpatialReference.side_effect = lambda: MagicMock()
+        mock_osr.CoordinateTransformation.side_effect = lambda source, target: MagicMock()
+        target = lostservice.spatialreference.SpatialReferenceCache()
+
+        first = target.get_transformation(4326, 32615)
+        second = target.get_transformation(4326, 32615)
+        reverse = target.get_transformation(32615, 4326)
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, reverse)
+        mock_osr.CoordinateTransformation.assert_called_with(target.get_spatial_reference(32615),
+                                                             target.get_spatial_reference(4326))
+
+    @patch('lostservice.spatialreference.osr')
+    def test_get_transformation_per_thread(self, mock_osr):
+        mock_osr.SpatialReference.side_effect = lambda: MagicMock()
+        mock_osr.CoordinateTransformation.side_effect = lambda source, target: MagicMock()
+        target = lostservice.spatialreference.SpatialReferenceCache()
+
+        mine = target.get_transformation(4326, 3857)
+        other_thread = []
+        thread = threading.Thread(target=lambda: other_thread.append(target.get_transformation(4326, 3857)))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(mine, other_thread[0])
+        # The spatial references themselves are shared.
+        self.assertEqual(mock_osr.SpatialReference.call_count, 2)
+
+    @patch('lostservice.spatialreference.osr')
+    def test_warm_up(self, mock_osr):
+        target = lostservice.spatialreference.SpatialReferenceCache()
+
+        target.warm_up()
+
+        self.assertEqual(len(target), 122)
+        self.assertEqual(mock_osr.CoordinateTransformation.call_count, 242)
+
+
+if __name__ == '__main__':
+    unittest.main()